@@ -0,0 +1,12 @@
+#!/usr/bin/env python3
+
+# Hydrus is released under WTFPL
+# You just DO WHAT THE FUCK YOU WANT TO.
+# https://github.com/sirkris/WTFPL/blob/master/WTFPL.md
+
+from hydrus import hydrus_benchmark
+
+if __name__ == '__main__':
+    
+    hydrus_benchmark.boot()
+    
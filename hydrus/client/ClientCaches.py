@@ -1,4 +1,5 @@
 import collections
+import hashlib
 import json
 import os
 import threading
@@ -167,6 +168,14 @@ class DataCache( object ):
             
         
     
+    def GetTotalEstimatedMemoryFootprint( self ):
+        
+        with self._lock:
+            
+            return self._total_estimated_memory_footprint
+            
+        
+    
     def HasData( self, key ):
         
         with self._lock:
@@ -213,6 +222,59 @@ class DataCache( object ):
         self.MaintainCache()
         
     
+class DecoratedThumbnailCache( object ):
+    
+    def __init__( self, controller ):
+        
+        self._controller = controller
+        
+        # a decorated thumb is about the same size as the raw one, so we share the thumbnail cache's limits
+        cache_size = self._controller.options[ 'thumbnail_cache_size' ]
+        cache_timeout = self._controller.new_options.GetInteger( 'thumbnail_cache_timeout' )
+        
+        self._data_cache = DataCache( self._controller, 'decorated thumbnail cache', cache_size, timeout = cache_timeout )
+        
+        self._controller.sub( self, 'Clear', 'notify_complete_thumbnail_reset' )
+        self._controller.sub( self, 'Clear', 'notify_new_services_gui' )
+        self._controller.sub( self, 'Clear', 'refresh_all_tag_presentation_gui' )
+        self._controller.sub( self, 'NotifyNewOptions', 'notify_new_options' )
+        
+    
+    def AddQtImage( self, key, qt_image ):
+        
+        decorated_thumbnail = ClientRendering.DecoratedThumbnail( qt_image )
+        
+        self._data_cache.AddData( key, decorated_thumbnail )
+        
+    
+    def Clear( self ):
+        
+        self._data_cache.Clear()
+        
+    
+    def GetQtImage( self, key ):
+        
+        result = self._data_cache.GetIfHasData( key )
+        
+        if result is None:
+            
+            return None
+            
+        
+        return result.qt_image
+        
+    
+    def NotifyNewOptions( self ):
+        
+        cache_size = self._controller.options[ 'thumbnail_cache_size' ]
+        cache_timeout = self._controller.new_options.GetInteger( 'thumbnail_cache_timeout' )
+        
+        self._data_cache.SetCacheSizeAndTimeout( cache_size, cache_timeout )
+        
+        # colours, borders and tag summaries may have changed
+        self._data_cache.Clear()
+        
+    
 class LocalBooruCache( object ):
     
     def __init__( self, controller ):
@@ -366,109 +428,180 @@ class LocalBooruCache( object ):
             
         
     
+PARSING_CACHE_SOUP = 0
+PARSING_CACHE_LXML = 1
+PARSING_CACHE_JSON = 2
+
+parsing_cache_type_str_lookup = {
+    PARSING_CACHE_SOUP : 'soup',
+    PARSING_CACHE_LXML : 'lxml',
+    PARSING_CACHE_JSON : 'json'
+}
+
+# rough multiples of the raw text size
+parsing_cache_type_memory_multipliers = {
+    PARSING_CACHE_SOUP : 40,
+    PARSING_CACHE_LXML : 10,
+    PARSING_CACHE_JSON : 6
+}
+
+class ParsedDocument( object ):
+    
+    def __init__( self, parsed_object, estimated_memory_footprint ):
+        
+        self._parsed_object = parsed_object
+        self._estimated_memory_footprint = estimated_memory_footprint
+        
+    
+    def GetEstimatedMemoryFootprint( self ):
+        
+        return self._estimated_memory_footprint
+        
+    
+    def GetParsedObject( self ):
+        
+        return self._parsed_object
+        
+    
 class ParsingCache( object ):
     
-    def __init__( self ):
+    def __init__( self, controller ):
         
-        self._next_clean_cache_time = HydrusData.GetNow()
+        self._controller = controller
         
-        self._html_to_soups = {}
-        self._json_to_jsons = {}
+        self._data_cache = DataCache( self._controller, 'parsing cache', 128 * 1048576, timeout = 60 )
         
         self._lock = threading.Lock()
         
+        self._parse_types_to_hits = collections.Counter()
+        self._parse_types_to_misses = collections.Counter()
+        
     
-    def _CleanCache( self ):
+    def _GetKey( self, parse_type, text ):
+        
+        return ( parse_type, hashlib.sha256( text.encode( 'utf-8' ) ).digest() )
+        
+    
+    def _GetParsedObject( self, parse_type, text, parse_callable ):
+        
+        key = self._GetKey( parse_type, text )
         
-        if HydrusData.TimeHasPassed( self._next_clean_cache_time ):
+        parsed_document = self._data_cache.GetIfHasData( key )
+        
+        with self._lock:
             
-            for cache in ( self._html_to_soups, self._json_to_jsons ):
+            if parsed_document is None:
                 
-                dead_datas = set()
+                self._parse_types_to_misses[ parse_type ] += 1
                 
-                for ( data, ( last_accessed, parsed_object ) ) in cache.items():
-                    
-                    if HydrusData.TimeHasPassed( last_accessed + 10 ):
-                        
-                        dead_datas.add( data )
-                        
-                    
+            else:
                 
-                for dead_data in dead_datas:
-                    
-                    del cache[ dead_data ]
-                    
+                self._parse_types_to_hits[ parse_type ] += 1
                 
             
-            self._next_clean_cache_time = HydrusData.GetNow() + 5
+        
+        if parsed_document is None:
+            
+            # we parse outside of any lock so threads can parse different pages at the same time
+            
+            parsed_object = parse_callable( text )
+            
+            self._AddParsedObject( key, text, parsed_object )
+            
+            return parsed_object
             
         
+        return parsed_document.GetParsedObject()
+        
     
-    def CleanCache( self ):
+    def _AddParsedObject( self, key, text, parsed_object ):
         
-        with self._lock:
+        ( parse_type, text_hash ) = key
+        
+        if parsed_object is None:
+            
+            estimated_memory_footprint = 64
             
-            self._CleanCache()
+        else:
             
+            estimated_memory_footprint = len( text ) * parsing_cache_type_memory_multipliers[ parse_type ]
+            
+        
+        self._data_cache.AddData( key, ParsedDocument( parsed_object, estimated_memory_footprint ) )
         
     
-    def GetJSON( self, json_text ):
+    def AddLXMLDocument( self, html, document ):
         
-        with self._lock:
+        # for when we already have the tree for this html, e.g. a post node out of a whole page
+        
+        key = self._GetKey( PARSING_CACHE_LXML, html )
+        
+        if not self._data_cache.HasData( key ):
             
-            now = HydrusData.GetNow()
+            self._AddParsedObject( key, html, document )
             
-            if json_text not in self._json_to_jsons:
-                
-                json_object = json.loads( json_text )
-                
-                self._json_to_jsons[ json_text ] = ( now, json_object )
-                
-            
-            ( last_accessed, json_object ) = self._json_to_jsons[ json_text ]
+        
+    
+    def CleanCache( self ):
+        
+        self._data_cache.MaintainCache()
+        
+    
+    def Clear( self ):
+        
+        self._data_cache.Clear()
+        
+    
+    def GetJSON( self, json_text ):
+        
+        return self._GetParsedObject( PARSING_CACHE_JSON, json_text, json.loads )
+        
+    
+    def GetLXMLDocument( self, html ):
+        
+        # returns None if the html cannot go in an lxml document unaltered, in which case use the soup
+        
+        def parse_callable( text ):
             
-            if last_accessed != now:
+            try:
                 
-                self._json_to_jsons[ json_text ] = ( now, json_object )
+                return ClientParsing.GetLXMLDocument( text )
                 
-            
-            if len( self._json_to_jsons ) > 10:
+            except Exception:
                 
-                self._CleanCache()
+                return None
                 
             
-            return json_object
-            
+        
+        return self._GetParsedObject( PARSING_CACHE_LXML, html, parse_callable )
         
     
-    def GetSoup( self, html ):
+    def GetMetrics( self ):
         
         with self._lock:
             
-            now = HydrusData.GetNow()
-            
-            if html not in self._html_to_soups:
-                
-                soup = ClientParsing.GetSoup( html )
-                
-                self._html_to_soups[ html ] = ( now, soup )
-                
-            
-            ( last_accessed, soup ) = self._html_to_soups[ html ]
-            
-            if last_accessed != now:
-                
-                self._html_to_soups[ html ] = ( now, soup )
-                
+            return { parse_type : ( self._parse_types_to_hits[ parse_type ], self._parse_types_to_misses[ parse_type ] ) for parse_type in parsing_cache_type_str_lookup.keys() }
             
-            if len( self._html_to_soups ) > 10:
-                
-                self._CleanCache()
-                
+        
+    
+    def GetSoup( self, html ):
+        
+        return self._GetParsedObject( PARSING_CACHE_SOUP, html, ClientParsing.GetSoup )
+        
+    
+    def ShowMetrics( self ):
+        
+        lines = []
+        
+        lines.append( 'parsing cache size: {}'.format( HydrusData.ConvertValueRangeToBytes( self._data_cache.GetTotalEstimatedMemoryFootprint(), self._data_cache.GetSizeLimit() ) ) )
+        
+        for ( parse_type, ( num_hits, num_misses ) ) in self.GetMetrics().items():
             
-            return soup
+            lines.append( '{}: {} hits, {} misses'.format( parsing_cache_type_str_lookup[ parse_type ], HydrusData.ToHumanInt( num_hits ), HydrusData.ToHumanInt( num_misses ) ) )
             
         
+        HydrusData.ShowText( '\n'.join( lines ) )
+        
     
 class ImageRendererCache( object ):
     
@@ -547,8 +680,14 @@ class ImageRendererCache( object ):
             
         
     
+TILE_PREFETCH_PRIORITY_CURRENT = 0
+TILE_PREFETCH_PRIORITY_NEIGHBOUR = 1
+
 class ImageTileCache( object ):
     
+    PREFETCH_JOB_TIMEOUT = 10
+    PREFETCH_QUEUE_MAX_SIZE = 256
+    
     def __init__( self, controller ):
         
         self._controller = controller
@@ -558,19 +697,26 @@ class ImageTileCache( object ):
         
         self._data_cache = DataCache( self._controller, 'image tile cache', cache_size, timeout = cache_timeout )
         
-        self._controller.sub( self, 'NotifyNewOptions', 'notify_new_options' )
+        self._prefetch_lock = threading.Lock()
+        self._prefetch_work_condition = threading.Condition( self._prefetch_lock )
         
-    
-    def Clear( self ):
+        self._prefetch_queue = []
+        self._prefetch_generation = 0
         
-        self._data_cache.Clear()
+        # tile rendering is mostly cv2 resize, which releases the GIL, so a couple of threads can go wide
+        num_prefetch_workers = max( 1, min( 4, ( os.cpu_count() or 2 ) - 1 ) )
         
-    
-    def GetTile( self, image_renderer: ClientRendering.ImageRenderer, media, clip_rect, target_resolution ):
+        for i in range( num_prefetch_workers ):
+            
+            self._controller.CallToThreadLongRunning( self.PrefetchWorkerLoop )
+            
         
-        hash = media.GetHash()
+        self._controller.sub( self, 'NotifyNewOptions', 'notify_new_options' )
         
-        key = (
+    
+    def _GetKey( self, hash, clip_rect, target_resolution ):
+        
+        return (
             hash,
             clip_rect.left(),
             clip_rect.top(),
@@ -580,13 +726,60 @@ class ImageTileCache( object ):
             target_resolution.height()
         )
         
+    
+    def _RenderPrefetchTile( self, job ):
+        
+        ( sort_key, slot, key, image_renderer, hash, clip_rect, target_resolution, time_queued ) = job
+        
+        timeout = time_queued + self.PREFETCH_JOB_TIMEOUT
+        
+        # neighbour renderers are often still loading off disk when their tiles are queued
+        
+        while not image_renderer.IsReady():
+            
+            if HydrusData.TimeHasPassedFloat( timeout ) or HydrusThreading.IsThreadShuttingDown():
+                
+                return
+                
+            
+            time.sleep( 0.05 )
+            
+        
+        if HydrusData.TimeHasPassedFloat( timeout ) or self._data_cache.HasData( key ):
+            
+            return
+            
+        
+        qt_image = image_renderer.GetQtImage( clip_rect = clip_rect, target_resolution = target_resolution )
+        
+        tile = ClientRendering.ImageTile( hash, clip_rect, qt_image = qt_image )
+        
+        self._data_cache.AddData( key, tile )
+        
+    
+    def Clear( self ):
+        
+        with self._prefetch_lock:
+            
+            self._prefetch_queue = []
+            
+        
+        self._data_cache.Clear()
+        
+    
+    def GetTile( self, image_renderer: ClientRendering.ImageRenderer, media, clip_rect, target_resolution ):
+        
+        hash = media.GetHash()
+        
+        key = self._GetKey( hash, clip_rect, target_resolution )
+        
         result = self._data_cache.GetIfHasData( key )
         
         if result is None:
             
             qt_pixmap = image_renderer.GetQtPixmap( clip_rect = clip_rect, target_resolution = target_resolution )
             
-            tile = ClientRendering.ImageTile( hash, clip_rect, qt_pixmap )
+            tile = ClientRendering.ImageTile( hash, clip_rect, qt_pixmap = qt_pixmap )
             
             self._data_cache.AddData( key, tile )
             
@@ -606,6 +799,89 @@ class ImageTileCache( object ):
         self._data_cache.SetCacheSizeAndTimeout( cache_size, cache_timeout )
         
     
+    def PrefetchTiles( self, image_renderer: ClientRendering.ImageRenderer, media, clip_rects_and_target_resolutions, priority ):
+        
+        hash = media.GetHash()
+        
+        slot = ( priority, hash )
+        
+        time_queued = HydrusData.GetNowFloat()
+        
+        # prefetch is a guess, so it only gets a slice of the cache. we don't want it shunting out the tiles that are actually on screen
+        prefetch_byte_budget = self._data_cache.GetSizeLimit() // 4
+        
+        with self._prefetch_lock:
+            
+            self._prefetch_generation += 1
+            
+            # a new request for the same media at the same priority means the view moved or the zoom changed, so the old one is stale
+            
+            self._prefetch_queue = [ job for job in self._prefetch_queue if job[1] != slot ]
+            
+            num_bytes = 0
+            
+            for ( i, ( clip_rect, target_resolution ) ) in enumerate( clip_rects_and_target_resolutions ):
+                
+                key = self._GetKey( hash, clip_rect, target_resolution )
+                
+                if self._data_cache.HasData( key ):
+                    
+                    continue
+                    
+                
+                num_bytes += target_resolution.width() * target_resolution.height() * 3
+                
+                if num_bytes > prefetch_byte_budget:
+                    
+                    break
+                    
+                
+                sort_key = ( priority, - self._prefetch_generation, i )
+                
+                self._prefetch_queue.append( ( sort_key, slot, key, image_renderer, hash, clip_rect, target_resolution, time_queued ) )
+                
+            
+            # we pop off the end, so reverse
+            self._prefetch_queue.sort( key = lambda job: job[0], reverse = True )
+            
+            if len( self._prefetch_queue ) > self.PREFETCH_QUEUE_MAX_SIZE:
+                
+                del self._prefetch_queue[ : len( self._prefetch_queue ) - self.PREFETCH_QUEUE_MAX_SIZE ]
+                
+            
+            self._prefetch_work_condition.notify_all()
+            
+        
+    
+    def PrefetchWorkerLoop( self ):
+        
+        while not HydrusThreading.IsThreadShuttingDown():
+            
+            with self._prefetch_lock:
+                
+                if len( self._prefetch_queue ) == 0:
+                    
+                    self._prefetch_work_condition.wait( 1 )
+                    
+                    continue
+                    
+                
+                job = self._prefetch_queue.pop()
+                
+            
+            try:
+                
+                self._RenderPrefetchTile( job )
+                
+            except Exception as e:
+                
+                # no worries, the canvas will render it on demand and report properly if it is really broken
+                
+                HydrusData.PrintException( e, do_wait = False )
+                
+            
+        
+    
 class ThumbnailCache( object ):
     
     def __init__( self, controller ):
@@ -625,15 +901,22 @@ class ThumbnailCache( object ):
         
         self._thumbnail_error_occurred = False
         
-        self._waterfall_queue_quick = set()
+        # ( page_key, media ) -> priority
+        self._waterfall_queue_quick = {}
         self._waterfall_queue = []
         
+        self._waterfall_generation = 0
+        
         self._waterfall_queue_empty_event = threading.Event()
         
         self._delayed_regeneration_queue_quick = set()
         self._delayed_regeneration_queue = []
         
         self._waterfall_event = threading.Event()
+        self._waterfall_work_condition = threading.Condition( self._lock )
+        
+        self._num_decodes_in_flight = 0
+        self._page_keys_to_rendered_medias = collections.defaultdict( list )
         
         self._special_thumbs = {}
         
@@ -641,6 +924,14 @@ class ThumbnailCache( object ):
         
         self._controller.CallToThreadLongRunning( self.MainLoop )
         
+        # thumb decode is mostly file read and libjpeg/libpng, which release the GIL, so a few threads actually go wide
+        num_decode_workers = max( 1, min( 8, ( os.cpu_count() or 2 ) - 1 ) )
+        
+        for i in range( num_decode_workers ):
+            
+            self._controller.CallToThreadLongRunning( self.DecodeWorkerLoop )
+            
+        
         self._controller.sub( self, 'Clear', 'reset_thumbnail_cache' )
         self._controller.sub( self, 'ClearThumbnails', 'clear_thumbnails' )
         self._controller.sub( self, 'NotifyNewOptions', 'notify_new_options' )
@@ -664,7 +955,7 @@ class ThumbnailCache( object ):
         
         try:
             
-            path = self._controller.client_files_manager.GetThumbnailPath( display_media )
+            thumbnail_bytes = self._controller.client_files_manager.GetThumbnailBytes( display_media )
             
         except HydrusExceptions.FileMissingException as e:
             
@@ -680,7 +971,7 @@ class ThumbnailCache( object ):
         
         try:
             
-            numpy_image = ClientImageHandling.GenerateNumPyImage( path, thumbnail_mime )
+            numpy_image = ClientImageHandling.GenerateNumPyImageFromBytes( thumbnail_bytes, thumbnail_mime )
             
         except Exception as e:
             
@@ -700,7 +991,9 @@ class ThumbnailCache( object ):
             
             try:
                 
-                numpy_image = ClientImageHandling.GenerateNumPyImage( path, thumbnail_mime )
+                thumbnail_bytes = self._controller.client_files_manager.GetThumbnailBytes( display_media )
+                
+                numpy_image = ClientImageHandling.GenerateNumPyImageFromBytes( thumbnail_bytes, thumbnail_mime )
                 
             except Exception as e:
                 
@@ -839,42 +1132,17 @@ class ThumbnailCache( object ):
     
     def _RecalcQueues( self ):
         
-        # here we sort by the hash since this is both breddy random and more likely to access faster on a well defragged hard drive!
-        # and now with the magic mime order
+        # the waterfall goes in viewport order: what is on screen first, then the most recent request first, then top-left to bottom-right
         
-        def sort_waterfall( item ):
-            
-            ( page_key, media ) = item
-            
-            display_media = media.GetDisplayMedia()
-            
-            if display_media is None:
-                
-                magic_score = self._magic_mime_thumbnail_ease_score_lookup[ None ]
-                hash = ''
-                
-            else:
-                
-                magic_score = self._magic_mime_thumbnail_ease_score_lookup[ display_media.GetMime() ]
-                hash = display_media.GetHash()
-                
-            
-            return ( magic_score, hash )
-            
-        
-        self._waterfall_queue = list( self._waterfall_queue_quick )
+        self._waterfall_queue = list( self._waterfall_queue_quick.keys() )
         
         # we pop off the end, so reverse
-        self._waterfall_queue.sort( key = sort_waterfall, reverse = True )
+        self._waterfall_queue.sort( key = lambda item: self._waterfall_queue_quick[ item ], reverse = True )
         
-        if len( self._waterfall_queue ) == 0:
-            
-            self._waterfall_queue_empty_event.set()
-            
-        else:
-            
-            self._waterfall_queue_empty_event.clear()
-            
+        self._RecalcWaterfallEmptyEvent()
+        
+        # here we sort by the hash since this is both breddy random and more likely to access faster on a well defragged hard drive!
+        # and now with the magic mime order
         
         def sort_regen( item ):
             
@@ -894,6 +1162,18 @@ class ThumbnailCache( object ):
         self._delayed_regeneration_queue.sort( key = sort_regen, reverse = True )
         
     
+    def _RecalcWaterfallEmptyEvent( self ):
+        
+        if len( self._waterfall_queue ) == 0 and self._num_decodes_in_flight == 0:
+            
+            self._waterfall_queue_empty_event.set()
+            
+        else:
+            
+            self._waterfall_queue_empty_event.clear()
+            
+        
+    
     def _ShouldBeAbleToProvideThumb( self, media ):
         
         locations_manager = media.GetLocationsManager()
@@ -905,7 +1185,11 @@ class ThumbnailCache( object ):
         
         with self._lock:
             
-            self._waterfall_queue_quick.difference_update( ( ( page_key, media ) for media in medias ) )
+            for media in medias:
+                
+                self._waterfall_queue_quick.pop( ( page_key, media ), None )
+                
+            
             
             cancelled_display_medias = { media.GetDisplayMedia() for media in medias }
             
@@ -963,7 +1247,7 @@ class ThumbnailCache( object ):
             
             self._controller.pub( 'notify_complete_thumbnail_reset' )
             
-            self._waterfall_queue_quick = set()
+            self._waterfall_queue_quick = {}
             self._delayed_regeneration_queue_quick = set()
             
             self._RecalcQueues()
@@ -981,6 +1265,58 @@ class ThumbnailCache( object ):
             
         
     
+    def DecodeWorkerLoop( self ):
+        
+        while not HydrusThreading.IsThreadShuttingDown():
+            
+            with self._lock:
+                
+                if len( self._waterfall_queue ) == 0:
+                    
+                    self._waterfall_work_condition.wait( 1 )
+                    
+                    continue
+                    
+                
+                result = self._waterfall_queue.pop()
+                
+                del self._waterfall_queue_quick[ result ]
+                
+                self._num_decodes_in_flight += 1
+                
+            
+            ( page_key, media ) = result
+            
+            rendered = False
+            
+            try:
+                
+                if media.GetDisplayMedia() is not None:
+                    
+                    self.GetThumbnail( media )
+                    
+                    rendered = True
+                    
+                
+            finally:
+                
+                with self._lock:
+                    
+                    self._num_decodes_in_flight -= 1
+                    
+                    if rendered:
+                        
+                        self._page_keys_to_rendered_medias[ page_key ].append( media )
+                        
+                    
+                    self._RecalcWaterfallEmptyEvent()
+                    
+                
+                self._waterfall_event.set()
+                
+            
+        
+    
     def WaitUntilFree( self ):
         
         while True:
@@ -1095,27 +1431,39 @@ class ThumbnailCache( object ):
         self._data_cache.SetCacheSizeAndTimeout( cache_size, cache_timeout )
         
     
-    def Waterfall( self, page_key, medias ):
+    def Waterfall( self, page_key, medias, in_viewport = True ):
         
         with self._lock:
             
-            self._waterfall_queue_quick.update( ( ( page_key, media ) for media in medias ) )
+            self._waterfall_generation += 1
+            
+            # newer requests are what the user just scrolled to, so they beat older ones
+            priority_group = ( 0 if in_viewport else 1, - self._waterfall_generation )
+            
+            for ( i, media ) in enumerate( medias ):
+                
+                self._waterfall_queue_quick[ ( page_key, media ) ] = ( priority_group, i )
+                
             
             self._RecalcQueues()
             
+            self._waterfall_work_condition.notify_all()
+            
         
         self._waterfall_event.set()
         
     
     def MainLoop( self ):
         
+        last_pub_time = 0
+        
         while not HydrusThreading.IsThreadShuttingDown():
             
-            time.sleep( 0.00001 )
-            
             with self._lock:
                 
-                do_wait = len( self._waterfall_queue ) == 0 and len( self._delayed_regeneration_queue ) == 0
+                waterfall_busy = len( self._waterfall_queue ) > 0 or self._num_decodes_in_flight > 0
+                
+                do_wait = len( self._page_keys_to_rendered_medias ) == 0 and ( len( self._delayed_regeneration_queue ) == 0 or waterfall_busy )
                 
             
             if do_wait:
@@ -1125,43 +1473,20 @@ class ThumbnailCache( object ):
                 self._waterfall_event.clear()
                 
             
-            start_time = HydrusData.GetNowPrecise()
-            stop_time = start_time + 0.005 # a bit of a typical frame
-            
-            page_keys_to_rendered_medias = collections.defaultdict( list )
+            # the decode workers fill up the results, and we send them out no more than once a typical frame, so the gui gets a few big pubs rather than many small ones
             
-            num_done = 0
-            max_at_once = 16
+            time_to_next_pub = last_pub_time + 0.005 - HydrusData.GetNowPrecise()
             
-            while not HydrusData.TimeHasPassedPrecise( stop_time ) and num_done <= max_at_once:
+            if time_to_next_pub > 0:
                 
-                with self._lock:
-                    
-                    if len( self._waterfall_queue ) == 0:
-                        
-                        break
-                        
-                    
-                    result = self._waterfall_queue.pop()
-                    
-                    if len( self._waterfall_queue ) == 0:
-                        
-                        self._waterfall_queue_empty_event.set()
-                        
-                    
-                    self._waterfall_queue_quick.discard( result )
-                    
+                time.sleep( time_to_next_pub )
                 
-                ( page_key, media ) = result
+            
+            with self._lock:
                 
-                if media.GetDisplayMedia() is not None:
-                    
-                    self.GetThumbnail( media )
-                    
-                    page_keys_to_rendered_medias[ page_key ].append( media )
-                    
+                page_keys_to_rendered_medias = self._page_keys_to_rendered_medias
                 
-                num_done += 1
+                self._page_keys_to_rendered_medias = collections.defaultdict( list )
                 
             
             if len( page_keys_to_rendered_medias ) > 0:
@@ -1171,6 +1496,8 @@ class ThumbnailCache( object ):
                     self._controller.pub( 'waterfall_thumbnails', page_key, rendered_medias )
                     
                 
+                last_pub_time = HydrusData.GetNowPrecise()
+                
                 time.sleep( 0.00001 )
                 
             
@@ -1179,7 +1506,7 @@ class ThumbnailCache( object ):
             with self._lock:
                 
                 # got more important work or no work to do
-                if len( self._waterfall_queue ) > 0 or len( self._delayed_regeneration_queue ) == 0 or HG.client_controller.CurrentlyPubSubbing():
+                if len( self._waterfall_queue ) > 0 or self._num_decodes_in_flight > 0 or len( self._delayed_regeneration_queue ) == 0 or HG.client_controller.CurrentlyPubSubbing():
                     
                     continue
                     
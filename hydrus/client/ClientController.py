@@ -16,6 +16,7 @@ from hydrus.core import HydrusController
 from hydrus.core import HydrusData
 from hydrus.core import HydrusExceptions
 from hydrus.core import HydrusGlobals as HG
+from hydrus.core import HydrusPubSub
 from hydrus.core import HydrusSerialisable
 from hydrus.core import HydrusTemp
 from hydrus.core import HydrusThreading
@@ -29,6 +30,7 @@ from hydrus.client import ClientConstants as CC
 from hydrus.client import ClientDaemons
 from hydrus.client import ClientDefaults
 from hydrus.client import ClientDownloading
+from hydrus.client import ClientExporting
 from hydrus.client import ClientFiles
 from hydrus.client import ClientManagers
 from hydrus.client import ClientOptions
@@ -206,6 +208,17 @@ class Controller( HydrusController.HydrusController ):
         self.client_files_manager = None
         self.services_manager = None
         
+        # storms of these can come in during big imports and content changes, so merge them down to one call per frame
+        
+        self._pubsub.SetCoalesceCallable( 'content_updates_data', HydrusPubSub.CoalesceDictsOfLists )
+        self._pubsub.SetCoalesceCallable( 'content_updates_gui', HydrusPubSub.CoalesceDictsOfLists )
+        self._pubsub.SetCoalesceCallable( 'waterfall_thumbnails', HydrusPubSub.CoalesceListsByFirstArg )
+        
+        for topic in ( 'refresh_page_name', 'notify_new_pending', 'notify_new_undo', 'set_status_bar_dirty', 'important_dirt_to_clean' ):
+            
+            self._pubsub.SetCoalesceCallable( topic, HydrusPubSub.CoalesceIdenticalCalls )
+            
+        
         Controller.my_instance = self
         
     
@@ -991,6 +1004,9 @@ class Controller( HydrusController.HydrusController ):
         
         self.frame_splash_status.SetTitleText( 'booting db\u2026' )
         
+        # the db writes to this as it goes, so it has to exist before the db boots
+        self.known_content_filter_manager = ClientManagers.KnownContentFilterManager( self )
+        
         HydrusController.HydrusController.InitModel( self )
         
         self.frame_splash_status.SetText( 'initialising managers' )
@@ -1042,7 +1058,7 @@ class Controller( HydrusController.HydrusController ):
             HG.client_controller.new_options.SetBoolean( 'pause_all_new_network_traffic', True )
             
         
-        self.parsing_cache = ClientCaches.ParsingCache()
+        self.parsing_cache = ClientCaches.ParsingCache( self )
         
         client_api_manager = self.Read( 'serialisable', HydrusSerialisable.SERIALISABLE_TYPE_CLIENT_API_MANAGER )
         
@@ -1135,6 +1151,10 @@ class Controller( HydrusController.HydrusController ):
         
         self.file_viewing_stats_manager = ClientManagers.FileViewingStatsManager( self )
         
+        self.export_folder_change_tracker = ClientExporting.ExportFolderChangeTracker( self )
+        
+        self.known_content_filter_manager.Start()
+        
         #
         
         self.frame_splash_status.SetSubtext( 'tag display' )
@@ -1187,6 +1207,7 @@ class Controller( HydrusController.HydrusController ):
         self._caches[ 'images' ] = ClientCaches.ImageRendererCache( self )
         self._caches[ 'image_tiles' ] = ClientCaches.ImageTileCache( self )
         self._caches[ 'thumbnail' ] = ClientCaches.ThumbnailCache( self )
+        self._caches[ 'decorated_thumbnail' ] = ClientCaches.DecoratedThumbnailCache( self )
         self.bitmap_manager = ClientManagers.BitmapManager( self )
         
         self.sub( self, 'ToClipboard', 'clipboard' )
@@ -1375,6 +1396,10 @@ class Controller( HydrusController.HydrusController ):
             return
             
         
+        stop_hook = lambda: self.ShouldStopThisWork( maintenance_mode, stop_time = stop_time )
+        
+        self.client_files_manager.MaintainThumbnailStorage( stop_hook = stop_hook )
+        
     
     def MaintainHashedSerialisables( self ):
         
@@ -1,6 +1,9 @@
 import collections
+import hashlib
 import os
+import queue
 import re
+import threading
 
 from hydrus.core import HydrusConstants as HC
 from hydrus.core import HydrusData
@@ -386,13 +389,58 @@ class ExportFolder( HydrusSerialisable.SerialisableBaseNamed ):
         
         query_hash_ids = HG.client_controller.Read( 'file_query_ids', self._file_search_context )
         
+        # the manifest is every file we have exported here and where we put it. a file's content never changes under its hash, so if its path has not changed, it is done
+        # we only recompute the paths of files that are new to the search or have had tag changes since the last run
+        
+        manifest_settings_hash = self._GetManifestSettingsHash()
+        
+        hash_ids_to_manifest_paths = HG.client_controller.Read( 'export_folder_manifest', self._name, manifest_settings_hash )
+        
+        change_tracker = HG.client_controller.export_folder_change_tracker
+        
+        ( run_generation, changed_hashes ) = change_tracker.GetChangedHashes( self._name )
+        
+        have_manifest = hash_ids_to_manifest_paths is not None
+        
+        if not have_manifest:
+            
+            hash_ids_to_manifest_paths = {}
+            
+        
+        query_hash_ids_set = set( query_hash_ids )
+        
+        # without a change history, we have to recompute everything, and we mirror all the manifest's files while we are at it, which puts back anything changed or deleted in the folder
+        verify_manifest_paths = changed_hashes is None
+        
+        missing_hash_ids = set()
+        
+        if not have_manifest or changed_hashes is None or self._delete_from_client_after_export:
+            
+            hash_ids_to_examine = query_hash_ids
+            
+        else:
+            
+            # otherwise a stat of each manifest path is cheap, and catches files deleted from the folder between full checks
+            
+            missing_hash_ids = { hash_id for ( hash_id, manifest_path ) in hash_ids_to_manifest_paths.items() if hash_id in query_hash_ids_set and not os.path.exists( manifest_path ) }
+            
+            changed_hash_ids = set()
+            
+            if len( changed_hashes ) > 0:
+                
+                changed_hash_ids = set( HG.client_controller.Read( 'hash_ids_to_hashes', hashes = changed_hashes ).keys() )
+                
+            
+            hash_ids_to_examine = [ hash_id for hash_id in query_hash_ids if hash_id not in hash_ids_to_manifest_paths or hash_id in changed_hash_ids or hash_id in missing_hash_ids ]
+            
+        
         media_results = []
         
         i = 0
         
         base = 256
         
-        while i < len( query_hash_ids ):
+        while i < len( hash_ids_to_examine ):
             
             if HC.options[ 'pause_export_folders_sync' ] or HydrusThreading.IsThreadShuttingDown():
                 
@@ -402,7 +450,7 @@ class ExportFolder( HydrusSerialisable.SerialisableBaseNamed ):
             if i == 0: ( last_i, i ) = ( 0, base )
             else: ( last_i, i ) = ( i, i + base )
             
-            sub_query_hash_ids = query_hash_ids[ last_i : i ]
+            sub_query_hash_ids = hash_ids_to_examine[ last_i : i ]
             
             more_media_results = HG.client_controller.Read( 'media_results_from_ids', sub_query_hash_ids )
             
@@ -417,16 +465,25 @@ class ExportFolder( HydrusSerialisable.SerialisableBaseNamed ):
         
         previous_paths = set()
         
-        for ( root, dirnames, filenames ) in os.walk( self._path ):
+        if not have_manifest:
             
-            previous_paths.update( ( os.path.join( root, filename ) for filename in filenames ) )
+            for ( root, dirnames, filenames ) in os.walk( self._path ):
+                
+                previous_paths.update( ( os.path.join( root, filename ) for filename in filenames ) )
+                
             
         
-        sync_paths = set()
+        removed_hash_ids = { hash_id for hash_id in hash_ids_to_manifest_paths.keys() if hash_id not in query_hash_ids_set }
+        
+        previous_paths.update( ( hash_ids_to_manifest_paths[ hash_id ] for hash_id in removed_hash_ids ) )
+        
+        sync_paths = { path for ( hash_id, path ) in hash_ids_to_manifest_paths.items() if hash_id not in removed_hash_ids }
+        
+        hash_ids_to_new_manifest_paths = {}
         
         client_files_manager = HG.client_controller.client_files_manager
         
-        num_copied = 0
+        copy_jobs = []
         
         for media_result in media_results:
             
@@ -435,18 +492,9 @@ class ExportFolder( HydrusSerialisable.SerialisableBaseNamed ):
                 return
                 
             
+            hash_id = media_result.GetHashId()
             hash = media_result.GetHash()
             mime = media_result.GetMime()
-            size = media_result.GetSize()
-            
-            try:
-                
-                source_path = client_files_manager.GetFilePath( hash, mime )
-                
-            except HydrusExceptions.FileMissingException:
-                
-                raise Exception( 'A file to be exported, hash "{}", was missing! You should run file maintenance (under database->maintenance->files) to check the files for the export folder\'s search, and possibly all your files.' )
-                
             
             filename = GenerateExportFilename( self._path, media_result, terms )
             
@@ -457,24 +505,55 @@ class ExportFolder( HydrusSerialisable.SerialisableBaseNamed ):
                 raise Exception( 'It seems a destination path for export folder "{}" was above the main export directory! The file was "{}" and its destination path was "{}".'.format( self._path, hash.hex(), dest_path ) )
                 
             
-            dest_path_dir = os.path.dirname( dest_path )
-            
-            HydrusPaths.MakeSureDirectoryExists( dest_path_dir )
+            manifest_path = hash_ids_to_manifest_paths.get( hash_id, None )
             
-            if dest_path not in sync_paths:
+            if manifest_path == dest_path:
                 
-                copied = HydrusPaths.MirrorFile( source_path, dest_path )
+                # when verifying, the mirror only copies if the size or date differ
                 
-                if copied:
+                if not verify_manifest_paths and hash_id not in missing_hash_ids:
                     
-                    num_copied += 1
+                    continue
                     
-                    HydrusPaths.TryToGiveFileNicePermissionBits( dest_path )
+                
+            else:
+                
+                if dest_path in sync_paths:
+                    
+                    continue # another file already has this name
+                    
+                
+                if manifest_path is not None:
+                    
+                    # it got retagged, so it has a new name
+                    
+                    sync_paths.discard( manifest_path )
+                    previous_paths.add( manifest_path )
                     
                 
             
+            try:
+                
+                source_path = client_files_manager.GetFilePath( hash, mime )
+                
+            except HydrusExceptions.FileMissingException:
+                
+                raise Exception( 'A file to be exported, hash "{}", was missing! You should run file maintenance (under database->maintenance->files) to check the files for the export folder\'s search, and possibly all your files.' )
+                
+            
+            copy_jobs.append( ( source_path, dest_path ) )
+            
             sync_paths.add( dest_path )
             
+            hash_ids_to_new_manifest_paths[ hash_id ] = dest_path
+            
+        
+        num_copied = self._MirrorFiles( copy_jobs )
+        
+        if num_copied is None:
+            
+            return
+            
         
         if num_copied > 0:
             
@@ -485,37 +564,65 @@ class ExportFolder( HydrusSerialisable.SerialisableBaseNamed ):
             
             deletee_paths = previous_paths.difference( sync_paths )
             
+            deletee_dirs = set()
+            
             for deletee_path in deletee_paths:
                 
                 ClientPaths.DeletePath( deletee_path )
                 
             
-            deletee_dirs = set()
-            
-            for ( root, dirnames, filenames ) in os.walk( self._path, topdown = False ):
+            if have_manifest:
                 
-                if root == self._path:
-                    
-                    continue
-                    
+                # we know exactly what we removed, so we only need to look at those folders
                 
-                no_files = len( filenames ) == 0
+                possibly_empty_dirs = { os.path.dirname( deletee_path ) for deletee_path in deletee_paths }
                 
-                useful_dirnames = [ dirname for dirname in dirnames if os.path.join( root, dirname ) not in deletee_dirs ]
+                while len( possibly_empty_dirs ) > 0:
+                    
+                    dir = possibly_empty_dirs.pop()
+                    
+                    if dir == self._path or not dir.startswith( self._path ) or not os.path.isdir( dir ):
+                        
+                        continue
+                        
+                    
+                    if len( os.listdir( dir ) ) == 0:
+                        
+                        HydrusPaths.DeletePath( dir )
+                        
+                        deletee_dirs.add( dir )
+                        
+                        possibly_empty_dirs.add( os.path.dirname( dir ) )
+                        
+                    
                 
-                no_useful_dirs = len( useful_dirnames ) == 0
+            else:
                 
-                if no_useful_dirs and no_files:
+                for ( root, dirnames, filenames ) in os.walk( self._path, topdown = False ):
                     
-                    deletee_dirs.add( root )
+                    if root == self._path:
+                        
+                        continue
+                        
+                    
+                    no_files = len( filenames ) == 0
+                    
+                    useful_dirnames = [ dirname for dirname in dirnames if os.path.join( root, dirname ) not in deletee_dirs ]
+                    
+                    no_useful_dirs = len( useful_dirnames ) == 0
+                    
+                    if no_useful_dirs and no_files:
+                        
+                        deletee_dirs.add( root )
+                        
                     
                 
-            
-            for deletee_dir in deletee_dirs:
-                
-                if os.path.exists( deletee_dir ):
+                for deletee_dir in deletee_dirs:
                     
-                    HydrusPaths.DeletePath( deletee_dir )
+                    if os.path.exists( deletee_dir ):
+                        
+                        HydrusPaths.DeletePath( deletee_dir )
+                        
                     
                 
             
@@ -525,6 +632,10 @@ class ExportFolder( HydrusSerialisable.SerialisableBaseNamed ):
                 
             
         
+        HG.client_controller.WriteSynchronous( 'export_folder_manifest', self._name, manifest_settings_hash, hash_ids_to_new_manifest_paths, removed_hash_ids )
+        
+        change_tracker.NotifyRunDone( self._name, run_generation, changed_hashes is None )
+        
         if self._delete_from_client_after_export:
             
             local_file_service_keys = HG.client_controller.services_manager.GetServiceKeys( ( HC.LOCAL_FILE_DOMAIN, ) )
@@ -566,6 +677,117 @@ class ExportFolder( HydrusSerialisable.SerialisableBaseNamed ):
             
         
     
+    def _GetManifestSettingsHash( self ):
+        
+        # if any of these change, the manifest no longer describes what is on disk, so we start again
+        
+        return hashlib.sha256( repr( ( self._path, self._export_type, self._phrase ) ).encode( 'utf-8' ) ).digest()
+        
+    
+    def _MirrorFiles( self, copy_jobs ):
+        
+        # returns the number copied, or None if we were interrupted
+        
+        num_workers = max( 1, HG.client_controller.new_options.GetInteger( 'export_folder_num_copy_workers' ) )
+        
+        results_queue = queue.Queue()
+        
+        def work_callable( source_path, dest_path ):
+            
+            try:
+                
+                HydrusPaths.MakeSureDirectoryExists( os.path.dirname( dest_path ) )
+                
+                copied = HydrusPaths.MirrorFile( source_path, dest_path )
+                
+                if copied:
+                    
+                    HydrusPaths.TryToGiveFileNicePermissionBits( dest_path )
+                    
+                
+                results_queue.put( ( copied, None ) )
+                
+            except Exception as e:
+                
+                results_queue.put( ( False, e ) )
+                
+            
+        
+        num_copied = 0
+        num_in_flight = 0
+        error = None
+        
+        def process_result( result ):
+            
+            nonlocal num_copied
+            nonlocal error
+            
+            ( copied, e ) = result
+            
+            if copied:
+                
+                num_copied += 1
+                
+            
+            if e is not None and error is None:
+                
+                error = e
+                
+            
+        
+        try:
+            
+            for ( source_path, dest_path ) in copy_jobs:
+                
+                if HC.options[ 'pause_export_folders_sync' ] or HydrusThreading.IsThreadShuttingDown() or error is not None:
+                    
+                    break
+                    
+                
+                if num_workers == 1:
+                    
+                    work_callable( source_path, dest_path )
+                    
+                    process_result( results_queue.get() )
+                    
+                else:
+                    
+                    while num_in_flight >= num_workers:
+                        
+                        process_result( results_queue.get() )
+                        
+                        num_in_flight -= 1
+                        
+                    
+                    HG.client_controller.CallToThread( work_callable, source_path, dest_path )
+                    
+                    num_in_flight += 1
+                    
+                
+            
+        finally:
+            
+            while num_in_flight > 0:
+                
+                process_result( results_queue.get() )
+                
+                num_in_flight -= 1
+                
+            
+        
+        if error is not None:
+            
+            raise error
+            
+        
+        if HC.options[ 'pause_export_folders_sync' ] or HydrusThreading.IsThreadShuttingDown():
+            
+            return None
+            
+        
+        return num_copied
+        
+    
     def DoWork( self ):
         
         regular_run_due = self._run_regularly and HydrusData.TimeHasPassed( self._last_checked + self._period )
@@ -635,6 +857,132 @@ class ExportFolder( HydrusSerialisable.SerialisableBaseNamed ):
     
 HydrusSerialisable.SERIALISABLE_TYPES_TO_OBJECT_TYPES[ HydrusSerialisable.SERIALISABLE_TYPE_EXPORT_FOLDER ] = ExportFolder
 
+class ExportFolderChangeTracker( object ):
+    
+    # remembers which files have had tag changes, so an export folder run only has to recompute the filenames of those
+    # it only lives as long as the client, so the first run of each export folder after boot looks at everything
+    # a folder also gets a full check every so often, so files changed in the folder behind our back get put back
+    
+    FULL_CHECK_PERIOD = 86400
+    MAX_TRACKED_HASHES = 1000000
+    
+    def __init__( self, controller ):
+        
+        self._controller = controller
+        
+        self._lock = threading.Lock()
+        
+        self._generation = 1
+        self._everything_changed_generation = 0
+        
+        self._hashes_to_generations = {}
+        self._names_to_last_run_generations = {}
+        self._names_to_last_full_check_times = {}
+        
+        # the db only publishes its content updates on the gui topic
+        self._controller.sub( self, 'ProcessContentUpdates', 'content_updates_gui' )
+        self._controller.sub( self, 'NotifyEverythingChanged', 'service_updates_data' )
+        self._controller.sub( self, 'NotifyEverythingChanged', 'notify_new_tag_display_application' )
+        self._controller.sub( self, 'NotifyEverythingChanged', 'notify_new_force_refresh_tags_data' )
+        
+    
+    def GetChangedHashes( self, name ):
+        
+        # returns the generation to report when the run is done, and the changed hashes, or None if we cannot say
+        
+        with self._lock:
+            
+            run_generation = self._generation
+            
+            self._generation += 1
+            
+            if name not in self._names_to_last_run_generations or HydrusData.TimeHasPassed( self._names_to_last_full_check_times.get( name, 0 ) + self.FULL_CHECK_PERIOD ):
+                
+                return ( run_generation, None )
+                
+            
+            last_run_generation = self._names_to_last_run_generations[ name ]
+            
+            if self._everything_changed_generation >= last_run_generation:
+                
+                return ( run_generation, None )
+                
+            
+            changed_hashes = { hash for ( hash, generation ) in self._hashes_to_generations.items() if generation >= last_run_generation }
+            
+            return ( run_generation, changed_hashes )
+            
+        
+    
+    def NotifyEverythingChanged( self, *args, **kwargs ):
+        
+        with self._lock:
+            
+            self._everything_changed_generation = self._generation
+            
+            self._hashes_to_generations = {}
+            
+        
+    
+    def NotifyRunDone( self, name, run_generation, was_full_check ):
+        
+        with self._lock:
+            
+            if was_full_check:
+                
+                self._names_to_last_full_check_times[ name ] = HydrusData.GetNow()
+                
+            
+            # changes stamped with the run's generation happened before it started, so the next run wants those after it
+            self._names_to_last_run_generations[ name ] = run_generation + 1
+            
+            # nothing older than every folder's last run is useful any more
+            
+            oldest_useful_generation = min( self._names_to_last_run_generations.values() )
+            
+            self._hashes_to_generations = { hash : generation for ( hash, generation ) in self._hashes_to_generations.items() if generation >= oldest_useful_generation }
+            
+        
+    
+    def ProcessContentUpdates( self, service_keys_to_content_updates ):
+        
+        with self._lock:
+            
+            for content_updates in service_keys_to_content_updates.values():
+                
+                for content_update in content_updates:
+                    
+                    data_type = content_update.GetDataType()
+                    
+                    if data_type in ( HC.CONTENT_TYPE_TAG_SIBLINGS, HC.CONTENT_TYPE_TAG_PARENTS ) or ( data_type == HC.CONTENT_TYPE_MAPPINGS and content_update.GetAction() == HC.CONTENT_UPDATE_ADVANCED ):
+                        
+                        self._everything_changed_generation = self._generation
+                        
+                        self._hashes_to_generations = {}
+                        
+                        return
+                        
+                    
+                    if data_type == HC.CONTENT_TYPE_MAPPINGS:
+                        
+                        for hash in content_update.GetHashes():
+                            
+                            self._hashes_to_generations[ hash ] = self._generation
+                            
+                        
+                    
+                
+            
+            if len( self._hashes_to_generations ) > self.MAX_TRACKED_HASHES:
+                
+                self._everything_changed_generation = self._generation
+                
+                self._hashes_to_generations = {}
+                
+            
+        
+    
+
 class SidecarExporter( HydrusSerialisable.SerialisableBase ):
     
     SERIALISABLE_TYPE = HydrusSerialisable.SERIALISABLE_TYPE_SIDECAR_EXPORTER
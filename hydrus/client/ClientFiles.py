@@ -15,12 +15,14 @@ from hydrus.core import HydrusGlobals as HG
 from hydrus.core import HydrusImageHandling
 from hydrus.core import HydrusPaths
 from hydrus.core import HydrusThreading
+from hydrus.core import HydrusVideoHandling
 from hydrus.core.networking import HydrusNetworking
 
 from hydrus.client import ClientConstants as CC
 from hydrus.client import ClientImageHandling
 from hydrus.client import ClientPaths
 from hydrus.client import ClientThreading
+from hydrus.client import ClientThumbnailPacks
 from hydrus.client.gui import QtPorting as QP
 
 REGENERATE_FILE_DATA_JOB_FILE_METADATA = 0
@@ -41,6 +43,7 @@ REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_PRESENCE_TRY_URL_ELSE_REMOVE_RECORD = 14
 REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA_TRY_URL_ELSE_REMOVE_RECORD = 15
 REGENERATE_FILE_DATA_JOB_FILE_HAS_ICC_PROFILE = 16
 REGENERATE_FILE_DATA_JOB_PIXEL_HASH = 17
+REGENERATE_FILE_DATA_JOB_VIDEO_KEYFRAMES = 18
 
 regen_file_enum_to_str_lookup = {}
 
@@ -62,6 +65,7 @@ regen_file_enum_to_str_lookup[ REGENERATE_FILE_DATA_JOB_SIMILAR_FILES_METADATA ]
 regen_file_enum_to_str_lookup[ REGENERATE_FILE_DATA_JOB_FILE_MODIFIED_TIMESTAMP ] = 'regenerate file modified date'
 regen_file_enum_to_str_lookup[ REGENERATE_FILE_DATA_JOB_FILE_HAS_ICC_PROFILE ] = 'determine if the file has an icc profile'
 regen_file_enum_to_str_lookup[ REGENERATE_FILE_DATA_JOB_PIXEL_HASH ] = 'calculate file pixel hash'
+regen_file_enum_to_str_lookup[ REGENERATE_FILE_DATA_JOB_VIDEO_KEYFRAMES ] = 'index video keyframes'
 
 regen_file_enum_to_description_lookup = {}
 
@@ -83,6 +87,7 @@ regen_file_enum_to_description_lookup[ REGENERATE_FILE_DATA_JOB_SIMILAR_FILES_ME
 regen_file_enum_to_description_lookup[ REGENERATE_FILE_DATA_JOB_FILE_MODIFIED_TIMESTAMP ] = 'This rechecks the file\'s modified timestamp and saves it to the database.'
 regen_file_enum_to_description_lookup[ REGENERATE_FILE_DATA_JOB_FILE_HAS_ICC_PROFILE ] = 'This loads the file to see if it has an ICC profile, which is used in "system:has icc profile" search.'
 regen_file_enum_to_description_lookup[ REGENERATE_FILE_DATA_JOB_PIXEL_HASH ] = 'This generates a fast unique identifier for the pixels in a still image, which is used in duplicate pixel searches.'
+regen_file_enum_to_description_lookup[ REGENERATE_FILE_DATA_JOB_VIDEO_KEYFRAMES ] = 'This scans a video for its keyframe timestamps, which the native video renderer uses to decide how to seek quickly.'
 
 NORMALISED_BIG_JOB_WEIGHT = 100
 
@@ -106,6 +111,7 @@ regen_file_enum_to_job_weight_lookup[ REGENERATE_FILE_DATA_JOB_SIMILAR_FILES_MET
 regen_file_enum_to_job_weight_lookup[ REGENERATE_FILE_DATA_JOB_FILE_MODIFIED_TIMESTAMP ] = 10
 regen_file_enum_to_job_weight_lookup[ REGENERATE_FILE_DATA_JOB_FILE_HAS_ICC_PROFILE ] = 100
 regen_file_enum_to_job_weight_lookup[ REGENERATE_FILE_DATA_JOB_PIXEL_HASH ] = 100
+regen_file_enum_to_job_weight_lookup[ REGENERATE_FILE_DATA_JOB_VIDEO_KEYFRAMES ] = 50
 
 regen_file_enum_to_overruled_jobs = {}
 
@@ -127,9 +133,72 @@ regen_file_enum_to_overruled_jobs[ REGENERATE_FILE_DATA_JOB_SIMILAR_FILES_METADA
 regen_file_enum_to_overruled_jobs[ REGENERATE_FILE_DATA_JOB_FILE_MODIFIED_TIMESTAMP ] = []
 regen_file_enum_to_overruled_jobs[ REGENERATE_FILE_DATA_JOB_FILE_HAS_ICC_PROFILE ] = []
 regen_file_enum_to_overruled_jobs[ REGENERATE_FILE_DATA_JOB_PIXEL_HASH ] = []
+regen_file_enum_to_overruled_jobs[ REGENERATE_FILE_DATA_JOB_VIDEO_KEYFRAMES ] = []
 
-ALL_REGEN_JOBS_IN_PREFERRED_ORDER = [ REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_PRESENCE_TRY_URL_ELSE_REMOVE_RECORD, REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_PRESENCE_TRY_URL, REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA_TRY_URL_ELSE_REMOVE_RECORD, REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA_TRY_URL, REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_PRESENCE_REMOVE_RECORD, REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA_REMOVE_RECORD, REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA_SILENT_DELETE, REGENERATE_FILE_DATA_JOB_FILE_METADATA, REGENERATE_FILE_DATA_JOB_REFIT_THUMBNAIL, REGENERATE_FILE_DATA_JOB_FORCE_THUMBNAIL, REGENERATE_FILE_DATA_JOB_SIMILAR_FILES_METADATA, REGENERATE_FILE_DATA_JOB_CHECK_SIMILAR_FILES_MEMBERSHIP, REGENERATE_FILE_DATA_JOB_FIX_PERMISSIONS, REGENERATE_FILE_DATA_JOB_FILE_MODIFIED_TIMESTAMP, REGENERATE_FILE_DATA_JOB_OTHER_HASHES, REGENERATE_FILE_DATA_JOB_FILE_HAS_ICC_PROFILE, REGENERATE_FILE_DATA_JOB_PIXEL_HASH, REGENERATE_FILE_DATA_JOB_DELETE_NEIGHBOUR_DUPES ]
+regen_file_integrity_jobs = { REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_PRESENCE_REMOVE_RECORD, REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_PRESENCE_TRY_URL, REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_PRESENCE_TRY_URL_ELSE_REMOVE_RECORD, REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA_REMOVE_RECORD, REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA_TRY_URL, REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA_TRY_URL_ELSE_REMOVE_RECORD, REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA_SILENT_DELETE }
 
+# cpu jobs are mostly ffmpeg subprocesses, PIL/OpenCV decodes and hashing, all of which release the GIL, so a thread per worker is plenty
+REGEN_FILE_WORK_TYPE_CPU = 0
+REGEN_FILE_WORK_TYPE_IO = 1
+
+regen_file_enum_to_work_type_lookup = {}
+
+regen_file_enum_to_work_type_lookup[ REGENERATE_FILE_DATA_JOB_FILE_METADATA ] = REGEN_FILE_WORK_TYPE_CPU
+regen_file_enum_to_work_type_lookup[ REGENERATE_FILE_DATA_JOB_FORCE_THUMBNAIL ] = REGEN_FILE_WORK_TYPE_CPU
+regen_file_enum_to_work_type_lookup[ REGENERATE_FILE_DATA_JOB_REFIT_THUMBNAIL ] = REGEN_FILE_WORK_TYPE_CPU
+regen_file_enum_to_work_type_lookup[ REGENERATE_FILE_DATA_JOB_OTHER_HASHES ] = REGEN_FILE_WORK_TYPE_CPU
+regen_file_enum_to_work_type_lookup[ REGENERATE_FILE_DATA_JOB_DELETE_NEIGHBOUR_DUPES ] = REGEN_FILE_WORK_TYPE_IO
+regen_file_enum_to_work_type_lookup[ REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_PRESENCE_REMOVE_RECORD ] = REGEN_FILE_WORK_TYPE_IO
+regen_file_enum_to_work_type_lookup[ REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_PRESENCE_TRY_URL ] = REGEN_FILE_WORK_TYPE_IO
+regen_file_enum_to_work_type_lookup[ REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_PRESENCE_TRY_URL_ELSE_REMOVE_RECORD ] = REGEN_FILE_WORK_TYPE_IO
+regen_file_enum_to_work_type_lookup[ REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA_REMOVE_RECORD ] = REGEN_FILE_WORK_TYPE_IO
+regen_file_enum_to_work_type_lookup[ REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA_TRY_URL ] = REGEN_FILE_WORK_TYPE_IO
+regen_file_enum_to_work_type_lookup[ REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA_TRY_URL_ELSE_REMOVE_RECORD ] = REGEN_FILE_WORK_TYPE_IO
+regen_file_enum_to_work_type_lookup[ REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA_SILENT_DELETE ] = REGEN_FILE_WORK_TYPE_IO
+regen_file_enum_to_work_type_lookup[ REGENERATE_FILE_DATA_JOB_FIX_PERMISSIONS ] = REGEN_FILE_WORK_TYPE_IO
+regen_file_enum_to_work_type_lookup[ REGENERATE_FILE_DATA_JOB_CHECK_SIMILAR_FILES_MEMBERSHIP ] = REGEN_FILE_WORK_TYPE_IO
+regen_file_enum_to_work_type_lookup[ REGENERATE_FILE_DATA_JOB_SIMILAR_FILES_METADATA ] = REGEN_FILE_WORK_TYPE_CPU
+regen_file_enum_to_work_type_lookup[ REGENERATE_FILE_DATA_JOB_FILE_MODIFIED_TIMESTAMP ] = REGEN_FILE_WORK_TYPE_IO
+regen_file_enum_to_work_type_lookup[ REGENERATE_FILE_DATA_JOB_FILE_HAS_ICC_PROFILE ] = REGEN_FILE_WORK_TYPE_CPU
+regen_file_enum_to_work_type_lookup[ REGENERATE_FILE_DATA_JOB_PIXEL_HASH ] = REGEN_FILE_WORK_TYPE_CPU
+regen_file_enum_to_work_type_lookup[ REGENERATE_FILE_DATA_JOB_VIDEO_KEYFRAMES ] = REGEN_FILE_WORK_TYPE_CPU
+
+ALL_REGEN_JOBS_IN_PREFERRED_ORDER = [ REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_PRESENCE_TRY_URL_ELSE_REMOVE_RECORD, REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_PRESENCE_TRY_URL, REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA_TRY_URL_ELSE_REMOVE_RECORD, REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA_TRY_URL, REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_PRESENCE_REMOVE_RECORD, REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA_REMOVE_RECORD, REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA_SILENT_DELETE, REGENERATE_FILE_DATA_JOB_FILE_METADATA, REGENERATE_FILE_DATA_JOB_REFIT_THUMBNAIL, REGENERATE_FILE_DATA_JOB_FORCE_THUMBNAIL, REGENERATE_FILE_DATA_JOB_SIMILAR_FILES_METADATA, REGENERATE_FILE_DATA_JOB_CHECK_SIMILAR_FILES_MEMBERSHIP, REGENERATE_FILE_DATA_JOB_FIX_PERMISSIONS, REGENERATE_FILE_DATA_JOB_FILE_MODIFIED_TIMESTAMP, REGENERATE_FILE_DATA_JOB_OTHER_HASHES, REGENERATE_FILE_DATA_JOB_FILE_HAS_ICC_PROFILE, REGENERATE_FILE_DATA_JOB_PIXEL_HASH, REGENERATE_FILE_DATA_JOB_VIDEO_KEYFRAMES, REGENERATE_FILE_DATA_JOB_DELETE_NEIGHBOUR_DUPES ]
+
+# a prefix is 'f' or 't' and then two or three hex chars, so 256 or 4096 folders each
+# during a reshard the two lengths can be mixed, so we always look for the prefix that actually exists
+
+CLIENT_FILES_PREFIX_LENGTHS = ( 2, 3 )
+
+def GetClientFilesPrefix( prefix_type, hash_encoded, prefixes ):
+    
+    for length in CLIENT_FILES_PREFIX_LENGTHS:
+        
+        prefix = prefix_type + hash_encoded[ : length ]
+        
+        if prefix in prefixes:
+            
+            return prefix
+            
+        
+    
+    return prefix_type + hash_encoded[ : CLIENT_FILES_PREFIX_LENGTHS[0] ]
+    
+def GetClientFilesPrefixWeight( prefix ):
+    
+    # what fraction of all hashes this prefix covers, 1/256 for 'f00'
+    
+    return 1.0 / ( 16 ** ( len( prefix ) - 1 ) )
+    
+def IsClientFilesPrefix( name ):
+    
+    if len( name ) - 1 not in CLIENT_FILES_PREFIX_LENGTHS or name[0] not in ( 'f', 't' ):
+        
+        return False
+        
+    
+    return False not in ( c in '0123456789abcdef' for c in name[1:] )
+    
 def GetAllFilePaths( raw_paths, do_human_sort = True ):
     
     file_paths = []
@@ -178,6 +247,9 @@ class ClientFilesManager( object ):
         self._rwlock = ClientThreading.FileRWLock()
         
         self._prefixes_to_locations = {}
+        self._prefixes_to_thumbnail_packs = {}
+        
+        self._resharding_prefixes = set()
         
         self._new_physical_file_deletes = threading.Event()
         
@@ -209,27 +281,42 @@ class ClientFilesManager( object ):
         
         dest_path = self._GenerateExpectedThumbnailPath( hash )
         
+        thumbnail_pack = self._GetThumbnailPack( hash )
+        
         if HG.file_report_mode:
             
-            HydrusData.ShowText( 'Adding thumbnail: ' + str( ( len( thumbnail_bytes ), dest_path ) ) )
+            HydrusData.ShowText( 'Adding thumbnail: ' + str( ( len( thumbnail_bytes ), dest_path if thumbnail_pack is None else 'pack' ) ) )
             
         
         try:
             
-            HydrusPaths.TryToGiveFileNicePermissionBits( dest_path )
-            
-            with open( dest_path, 'wb' ) as f:
+            if thumbnail_pack is None:
+                
+                HydrusPaths.TryToGiveFileNicePermissionBits( dest_path )
+                
+                with open( dest_path, 'wb' ) as f:
+                    
+                    f.write( thumbnail_bytes )
+                    
+                
+            else:
+                
+                thumbnail_pack.AddThumbnails( [ ( hash, thumbnail_bytes ) ] )
                 
-                f.write( thumbnail_bytes )
+                if os.path.exists( dest_path ):
+                    
+                    # an old loose copy from before this prefix was packed
+                    HydrusPaths.DeletePath( dest_path )
+                    
                 
             
         except Exception as e:
             
             hash_encoded = hash.hex()
             
-            prefix = 't' + hash_encoded[:2]
+            prefix = GetClientFilesPrefix( 't', hash_encoded, self._prefixes_to_locations )
             
-            location = self._prefixes_to_locations[ prefix ]    
+            location = self._prefixes_to_locations[ prefix ]
             
             thumb_dir = os.path.join( location, prefix )
             
@@ -370,13 +457,65 @@ class ClientFilesManager( object ):
         return needed_to_copy_file
         
     
+    def _CloseThumbnailPacks( self ):
+        
+        for thumbnail_pack in self._prefixes_to_thumbnail_packs.values():
+            
+            thumbnail_pack.Close()
+            
+        
+        self._prefixes_to_thumbnail_packs = {}
+        
+    
+    def _DeleteThumbnail( self, hash ):
+        
+        deleted = False
+        
+        thumbnail_pack = self._GetThumbnailPack( hash )
+        
+        if thumbnail_pack is not None:
+            
+            deleted = thumbnail_pack.DeleteThumbnail( hash )
+            
+        
+        path = self._GenerateExpectedThumbnailPath( hash )
+        
+        if os.path.exists( path ):
+            
+            ClientPaths.DeletePath( path, always_delete_fully = True )
+            
+            deleted = True
+            
+        
+        return deleted
+        
+    
+    def _DrainStrayPrefixDirectory( self, dir ):
+        
+        # a folder that is no longer a prefix, probably from an interrupted reshard. push everything to where it belongs now
+        
+        for ( source, dest ) in self._GetPrefixDirectoryMoves( dir, self._prefixes_to_locations ).items():
+            
+            HydrusPaths.MergeFile( source, dest )
+            
+        
+        try:
+            
+            os.rmdir( dir )
+            
+        except OSError:
+            
+            HydrusData.Print( 'Could not remove the old file storage folder {}, it may have some unexpected files in it.'.format( dir ) )
+            
+        
+    
     def _GenerateExpectedFilePath( self, hash, mime ):
         
         self._WaitOnWakeup()
         
         hash_encoded = hash.hex()
         
-        prefix = 'f' + hash_encoded[:2]
+        prefix = GetClientFilesPrefix( 'f', hash_encoded, self._prefixes_to_locations )
         
         location = self._prefixes_to_locations[ prefix ]
         
@@ -391,7 +530,7 @@ class ClientFilesManager( object ):
         
         hash_encoded = hash.hex()
         
-        prefix = 't' + hash_encoded[:2]
+        prefix = GetClientFilesPrefix( 't', hash_encoded, self._prefixes_to_locations )
         
         location = self._prefixes_to_locations[ prefix ]
         
@@ -451,6 +590,49 @@ class ClientFilesManager( object ):
         return None
         
     
+    def _GetThumbnailBytes( self, hash ):
+        
+        thumbnail_pack = self._GetThumbnailPack( hash )
+        
+        if thumbnail_pack is not None:
+            
+            try:
+                
+                return thumbnail_pack.GetThumbnailBytes( hash )
+                
+            except HydrusExceptions.FileMissingException:
+                
+                pass # we may be halfway through a migration, so it might still be loose
+                
+            
+        
+        path = self._GenerateExpectedThumbnailPath( hash )
+        
+        try:
+            
+            with open( path, 'rb' ) as f:
+                
+                return f.read()
+                
+            
+        except FileNotFoundError:
+            
+            raise HydrusExceptions.FileMissingException( 'The thumbnail for file {} was not found!'.format( hash.hex() ) )
+            
+        
+    
+    def _GetThumbnailPack( self, hash ):
+        
+        prefix = GetClientFilesPrefix( 't', hash.hex(), self._prefixes_to_locations )
+        
+        if prefix in self._prefixes_to_thumbnail_packs:
+            
+            return self._prefixes_to_thumbnail_packs[ prefix ]
+            
+        
+        return None
+        
+    
     def _GetRebalanceTuple( self ):
         
         ( locations_to_ideal_weights, thumbnail_override ) = self._controller.Read( 'ideal_client_files_locations' )
@@ -467,9 +649,12 @@ class ClientFilesManager( object ):
             
             location = self._prefixes_to_locations[ file_prefix ]
             
-            current_locations_to_normalised_weights[ location ] += 1.0 / 256
+            current_locations_to_normalised_weights[ location ] += GetClientFilesPrefixWeight( file_prefix )
             
         
+        # moving one prefix shifts this much weight, so don't call anything overweight by less than that
+        biggest_prefix_weight = max( ( GetClientFilesPrefixWeight( file_prefix ) for file_prefix in file_prefixes ) )
+        
         for location in list(current_locations_to_normalised_weights.keys()):
             
             if location not in ideal_locations_to_normalised_weights:
@@ -493,7 +678,7 @@ class ClientFilesManager( object ):
                     
                     underweight_locations.append( location )
                     
-                elif current_weight >= ideal_weight + 1.0 / 256:
+                elif current_weight >= ideal_weight + biggest_prefix_weight:
                     
                     overweight_locations.append( location )
                     
@@ -525,13 +710,14 @@ class ClientFilesManager( object ):
             
         else:
             
-            for hex_prefix in HydrusData.IterateHexPrefixes():
-                
-                thumbnail_prefix = 't' + hex_prefix
+            thumbnail_prefixes = sorted( ( prefix for prefix in self._prefixes_to_locations if prefix.startswith( 't' ) ) )
+            
+            for thumbnail_prefix in thumbnail_prefixes:
                 
                 if thumbnail_override is None:
                     
-                    file_prefix = 'f' + hex_prefix
+                    # mid-reshard, 't00' may be covered by 'f000' to 'f00f', so we pad and take the first
+                    file_prefix = GetClientFilesPrefix( 'f', thumbnail_prefix[1:] + '0', self._prefixes_to_locations )
                     
                     correct_location = self._prefixes_to_locations[ file_prefix ]
                     
@@ -552,6 +738,105 @@ class ClientFilesManager( object ):
         return None
         
     
+    def _GetPrefixDirectoryMoves( self, dir, prefixes_to_locations ):
+        
+        # where each file in this folder would go under these prefixes
+        
+        ( location, dir_prefix ) = os.path.split( dir )
+        
+        prefix_type = dir_prefix[0]
+        
+        sources_to_dests = {}
+        
+        for filename in os.listdir( dir ):
+            
+            if ClientThumbnailPacks.IsThumbnailPackFilename( filename ):
+                
+                continue
+                
+            
+            hash_encoded = filename[:64]
+            
+            if len( hash_encoded ) != 64 or False in ( c in '0123456789abcdef' for c in hash_encoded ):
+                
+                continue
+                
+            
+            prefix = GetClientFilesPrefix( prefix_type, hash_encoded, prefixes_to_locations )
+            
+            if prefix not in prefixes_to_locations:
+                
+                continue
+                
+            
+            sources_to_dests[ os.path.join( dir, filename ) ] = os.path.join( prefixes_to_locations[ prefix ], prefix, filename )
+            
+        
+        return sources_to_dests
+        
+    
+    def _GetReshardTuple( self ):
+        
+        target_length = self._controller.new_options.GetInteger( 'client_files_prefix_length' )
+        
+        if target_length not in CLIENT_FILES_PREFIX_LENGTHS:
+            
+            return None
+            
+        
+        for prefix in sorted( self._prefixes_to_locations.keys() ):
+            
+            location = self._prefixes_to_locations[ prefix ]
+            
+            hex_length = len( prefix ) - 1
+            
+            if hex_length < target_length:
+                
+                new_prefixes_to_locations = { prefix + c : location for c in '0123456789abcdef' }
+                
+                return ( [ prefix ], new_prefixes_to_locations )
+                
+            elif hex_length > target_length:
+                
+                parent_prefix = prefix[ : target_length + 1 ]
+                
+                old_prefixes = sorted( ( p for p in self._prefixes_to_locations if p.startswith( parent_prefix ) ) )
+                
+                return ( old_prefixes, { parent_prefix : location } )
+                
+            
+        
+        return None
+        
+    
+    def _GetStrayPrefixDirectories( self ):
+        
+        stray_dirs = []
+        
+        for location in set( self._prefixes_to_locations.values() ):
+            
+            if not os.path.exists( location ):
+                
+                continue
+                
+            
+            for name in os.listdir( location ):
+                
+                if IsClientFilesPrefix( name ) and name not in self._prefixes_to_locations:
+                    
+                    dir = os.path.join( location, name )
+                    
+                    if os.path.isdir( dir ):
+                        
+                        stray_dirs.append( dir )
+                        
+                    
+                
+            
+        
+        return stray_dirs
+        
+    
     def _IterateAllFilePaths( self ):
         
         for ( prefix, location ) in list(self._prefixes_to_locations.items()):
@@ -570,6 +855,25 @@ class ClientFilesManager( object ):
             
         
     
+    def _HasThumbnail( self, hash ):
+        
+        thumbnail_pack = self._GetThumbnailPack( hash )
+        
+        if thumbnail_pack is not None and thumbnail_pack.HasThumbnail( hash ):
+            
+            return True
+            
+        
+        path = self._GenerateExpectedThumbnailPath( hash )
+        
+        if HG.file_report_mode:
+            
+            HydrusData.ShowText( 'Thumbnail path test: ' + path )
+            
+        
+        return os.path.exists( path )
+        
+    
     def _IterateAllThumbnailPaths( self ):
         
         for ( prefix, location ) in list(self._prefixes_to_locations.items()):
@@ -582,6 +886,11 @@ class ClientFilesManager( object ):
                 
                 for filename in filenames:
                     
+                    if ClientThumbnailPacks.IsThumbnailPackFilename( filename ):
+                        
+                        continue
+                        
+                    
                     yield os.path.join( dir, filename )
                     
                 
@@ -602,7 +911,7 @@ class ClientFilesManager( object ):
         
         hash_encoded = hash.hex()
         
-        prefix = 'f' + hash_encoded[:2]
+        prefix = GetClientFilesPrefix( 'f', hash_encoded, self._prefixes_to_locations )
         
         location = self._prefixes_to_locations[ prefix ]
         
@@ -616,6 +925,84 @@ class ClientFilesManager( object ):
         raise HydrusExceptions.FileMissingException( 'File for ' + hash.hex() + ' not found!' )
         
     
+    def _PackThumbnailPrefix( self, prefix, stop_hook ):
+        
+        with self._rwlock.write:
+            
+            if prefix not in self._prefixes_to_locations or prefix in self._resharding_prefixes:
+                
+                return False
+                
+            
+            location = self._prefixes_to_locations[ prefix ]
+            
+            dir = os.path.join( location, prefix )
+            
+            if prefix not in self._prefixes_to_thumbnail_packs:
+                
+                thumbnail_pack = ClientThumbnailPacks.ThumbnailPack( dir )
+                
+                thumbnail_pack.GetNumThumbnails() # creates the index, so this prefix now counts as packed
+                
+                self._prefixes_to_thumbnail_packs[ prefix ] = thumbnail_pack
+                
+            
+            thumbnail_pack = self._prefixes_to_thumbnail_packs[ prefix ]
+            
+            filenames = [ filename for filename in os.listdir( dir ) if filename.endswith( '.thumbnail' ) ]
+            
+        
+        for block_of_filenames in HydrusData.SplitListIntoChunks( filenames, 256 ):
+            
+            if stop_hook():
+                
+                return False
+                
+            
+            with self._rwlock.write:
+                
+                if self._prefixes_to_thumbnail_packs.get( prefix, None ) is not thumbnail_pack:
+                    
+                    return False # a rebalance or reshard got in the way
+                    
+                
+                rows = []
+                paths = []
+                
+                for filename in block_of_filenames:
+                    
+                    path = os.path.join( dir, filename )
+                    
+                    try:
+                        
+                        hash = bytes.fromhex( filename[:64] )
+                        
+                        with open( path, 'rb' ) as f:
+                            
+                            thumbnail_bytes = f.read()
+                            
+                        
+                    except:
+                        
+                        continue # orphan clearing can sort this out
+                        
+                    
+                    rows.append( ( hash, thumbnail_bytes ) )
+                    paths.append( path )
+                    
+                
+                thumbnail_pack.AddThumbnails( rows )
+                
+                for path in paths:
+                    
+                    HydrusPaths.DeletePath( path )
+                    
+                
+            
+        
+        return True
+        
+    
     def _Reinit( self ):
         
         self._prefixes_to_locations = self._controller.Read( 'client_files_locations' )
@@ -705,6 +1092,8 @@ class ClientFilesManager( object ):
                 
             
         
+        self._ReinitThumbnailPacks()
+        
     
     def _ReinitMissingLocations( self ):
         
@@ -724,6 +1113,254 @@ class ClientFilesManager( object ):
             
         
     
+    def _ReinitThumbnailPacks( self ):
+        
+        self._CloseThumbnailPacks()
+        
+        for ( prefix, location ) in self._prefixes_to_locations.items():
+            
+            if prefix.startswith( 't' ):
+                
+                dir = os.path.join( location, prefix )
+                
+                if ClientThumbnailPacks.DirectoryHasThumbnailPack( dir ):
+                    
+                    self._prefixes_to_thumbnail_packs[ prefix ] = ClientThumbnailPacks.ThumbnailPack( dir )
+                    
+                
+            
+        
+    
+    def _ReshardFile( self, source, dest ):
+        
+        # a hard link is instant, and since it shares the file, something rewritten in place (like a regenerated thumbnail) is seen through both names
+        # returns False if we had to copy instead
+        
+        if os.path.exists( dest ):
+            
+            if os.path.samefile( source, dest ):
+                
+                return True
+                
+            
+            os.remove( dest )
+            
+        
+        try:
+            
+            os.link( source, dest )
+            
+            return True
+            
+        except OSError:
+            
+            HydrusPaths.safe_copy2( source, dest )
+            
+            return False
+            
+        
+    
+    def _ReshardPrefixes( self, old_prefixes, new_prefixes_to_locations, stop_hook ):
+        
+        # the old folders are what everything reads until the db swap, so we fill the new folders alongside them in small batches
+        # file access only ever waits on one batch, and the write lock is only held to catch up and swap
+        
+        with self._rwlock.write:
+            
+            self._resharding_prefixes.update( old_prefixes )
+            
+        
+        try:
+            
+            # packs are per folder, so unpack first. idle maintenance will pack the new folders later
+            
+            for old_prefix in old_prefixes:
+                
+                if old_prefix in self._prefixes_to_thumbnail_packs:
+                    
+                    self._UnpackThumbnailPrefix( old_prefix, stop_hook )
+                    
+                
+                if stop_hook():
+                    
+                    return False
+                    
+                
+            
+            with self._rwlock.read:
+                
+                old_dirs = [ os.path.join( self._prefixes_to_locations[ old_prefix ], old_prefix ) for old_prefix in old_prefixes ]
+                
+            
+            for ( new_prefix, location ) in new_prefixes_to_locations.items():
+                
+                HydrusPaths.MakeSureDirectoryExists( os.path.join( location, new_prefix ) )
+                
+            
+            sources_to_dests = {}
+            copied_sources = set()
+            
+            for old_dir in old_dirs:
+                
+                for block_of_moves in HydrusData.SplitListIntoChunks( list( self._GetPrefixDirectoryMoves( old_dir, new_prefixes_to_locations ).items() ), 256 ):
+                    
+                    if stop_hook():
+                        
+                        for dest in sources_to_dests.values():
+                            
+                            HydrusPaths.DeletePath( dest )
+                            
+                        
+                        return False
+                        
+                    
+                    # readers can carry on, but adds, deletes and renames wait for this batch
+                    
+                    with self._rwlock.read:
+                        
+                        for ( source, dest ) in block_of_moves:
+                            
+                            if not os.path.exists( source ):
+                                
+                                continue
+                                
+                            
+                            if not self._ReshardFile( source, dest ):
+                                
+                                copied_sources.add( source )
+                                
+                            
+                            sources_to_dests[ source ] = dest
+                            
+                        
+                    
+                
+            
+            with self._rwlock.write:
+                
+                # catch up on whatever was added, deleted, renamed or rewritten in the old folders while we worked
+                
+                current_sources_to_dests = {}
+                
+                for old_dir in old_dirs:
+                    
+                    current_sources_to_dests.update( self._GetPrefixDirectoryMoves( old_dir, new_prefixes_to_locations ) )
+                    
+                
+                for ( source, dest ) in sources_to_dests.items():
+                    
+                    if source not in current_sources_to_dests:
+                        
+                        HydrusPaths.DeletePath( dest )
+                        
+                    
+                
+                for ( source, dest ) in current_sources_to_dests.items():
+                    
+                    if source not in sources_to_dests:
+                        
+                        self._ReshardFile( source, dest )
+                        
+                    elif source in copied_sources:
+                        
+                        HydrusPaths.MirrorFile( source, dest )
+                        
+                    
+                
+                self._controller.WriteSynchronous( 'reshard_client_files', old_prefixes, new_prefixes_to_locations )
+                
+                self._Reinit()
+                
+            
+            # nothing looks in the old folders now, so clearing them out needs no lock. if we are interrupted, whatever is left is a stray that the next rebalance will drain
+            
+            for source in current_sources_to_dests:
+                
+                HydrusPaths.DeletePath( source )
+                
+            
+            for old_dir in old_dirs:
+                
+                try:
+                    
+                    os.rmdir( old_dir )
+                    
+                except OSError:
+                    
+                    HydrusData.Print( 'Could not remove the old file storage folder {}, it may have some unexpected files in it.'.format( old_dir ) )
+                    
+                
+            
+            return True
+            
+        finally:
+            
+            with self._rwlock.write:
+                
+                self._resharding_prefixes.difference_update( old_prefixes )
+                
+            
+        
+    
+    def _UnpackThumbnailPrefix( self, prefix, stop_hook ):
+        
+        with self._rwlock.write:
+            
+            if prefix not in self._prefixes_to_thumbnail_packs:
+                
+                return False
+                
+            
+            thumbnail_pack = self._prefixes_to_thumbnail_packs[ prefix ]
+            
+            hashes = thumbnail_pack.GetHashes()
+            
+        
+        for block_of_hashes in HydrusData.SplitListIntoChunks( hashes, 256 ):
+            
+            if stop_hook():
+                
+                return False
+                
+            
+            with self._rwlock.write:
+                
+                if self._prefixes_to_thumbnail_packs.get( prefix, None ) is not thumbnail_pack:
+                    
+                    return False
+                    
+                
+                for hash in block_of_hashes:
+                    
+                    thumbnail_bytes = thumbnail_pack.GetThumbnailBytes( hash )
+                    
+                    path = self._GenerateExpectedThumbnailPath( hash )
+                    
+                    with open( path, 'wb' ) as f:
+                        
+                        f.write( thumbnail_bytes )
+                        
+                    
+                    thumbnail_pack.DeleteThumbnail( hash )
+                    
+                
+            
+        
+        with self._rwlock.write:
+            
+            if self._prefixes_to_thumbnail_packs.get( prefix, None ) is not thumbnail_pack:
+                
+                return False
+                
+            
+            thumbnail_pack.Obliterate()
+            
+            del self._prefixes_to_thumbnail_packs[ prefix ]
+            
+        
+        return True
+        
+    
     def _WaitOnWakeup( self ):
         
         if HG.client_controller.new_options.GetBoolean( 'file_system_waits_on_wakeup' ):
@@ -789,6 +1426,39 @@ class ClientFilesManager( object ):
             
         
     
+    def BackupThumbnailPacks( self, client_files_dir, client_files_backup_dir, is_cancelled_hook = None ):
+        
+        # packs change in place, so a plain file copy can catch an index and its segments at different moments. each pack copies itself under its own lock instead
+        
+        client_files_dir = os.path.abspath( client_files_dir )
+        
+        with self._rwlock.read:
+            
+            prefixes_to_thumbnail_packs = { prefix : self._prefixes_to_thumbnail_packs.get( prefix, None ) for ( prefix, location ) in self._prefixes_to_locations.items() if prefix.startswith( 't' ) and os.path.abspath( location ) == client_files_dir }
+            
+        
+        for ( prefix, thumbnail_pack ) in prefixes_to_thumbnail_packs.items():
+            
+            if is_cancelled_hook is not None and is_cancelled_hook():
+                
+                raise HydrusExceptions.CancelledException( 'Backup cancelled!' )
+                
+            
+            dest_dir = os.path.join( client_files_backup_dir, prefix )
+            
+            if thumbnail_pack is None:
+                
+                # not packed (any more), so anything pack-like in the backup is stale
+                
+                ClientThumbnailPacks.DeleteThumbnailPackFiles( dest_dir )
+                
+            else:
+                
+                thumbnail_pack.BackupTo( dest_dir )
+                
+            
+        
+    
     def ChangeFileExt( self, hash, old_mime, mime ):
         
         with self._rwlock.write:
@@ -810,6 +1480,7 @@ class ClientFilesManager( object ):
             
             orphan_paths = []
             orphan_thumbnails = []
+            orphan_packed_thumbnail_hashes = []
             
             for ( i, path ) in enumerate( self._IterateAllFilePaths() ):
                 
@@ -904,6 +1575,28 @@ class ClientFilesManager( object ):
                     
                 
             
+            for ( prefix, thumbnail_pack ) in list( self._prefixes_to_thumbnail_packs.items() ):
+                
+                ( i_paused, should_quit ) = job_key.WaitIfNeeded()
+                
+                if should_quit:
+                    
+                    return
+                    
+                
+                status = 'reviewing thumbnail pack ' + prefix + ', found ' + HydrusData.ToHumanInt( len( orphan_thumbnails ) + len( orphan_packed_thumbnail_hashes ) ) + ' orphans'
+                
+                job_key.SetVariable( 'popup_text_1', status )
+                
+                for hash in thumbnail_pack.GetHashes():
+                    
+                    if HG.client_controller.Read( 'is_an_orphan', 'thumbnail', hash ):
+                        
+                        orphan_packed_thumbnail_hashes.append( hash )
+                        
+                    
+                
+            
             time.sleep( 2 )
             
             if move_location is None and len( orphan_paths ) > 0:
@@ -960,13 +1653,27 @@ class ClientFilesManager( object ):
                     
                 
             
-            if len( orphan_paths ) == 0 and len( orphan_thumbnails ) == 0:
+            if len( orphan_packed_thumbnail_hashes ) > 0:
+                
+                job_key.SetVariable( 'popup_text_1', 'deleting orphan thumbnails from packs' )
+                
+                for hash in orphan_packed_thumbnail_hashes:
+                    
+                    HydrusData.Print( 'Deleting the orphan packed thumbnail ' + hash.hex() )
+                    
+                    self._GetThumbnailPack( hash ).DeleteThumbnail( hash )
+                    
+                
+            
+            num_orphan_thumbnails = len( orphan_thumbnails ) + len( orphan_packed_thumbnail_hashes )
+            
+            if len( orphan_paths ) == 0 and num_orphan_thumbnails == 0:
                 
                 final_text = 'no orphans found!'
                 
             else:
                 
-                final_text = HydrusData.ToHumanInt( len( orphan_paths ) ) + ' orphan files and ' + HydrusData.ToHumanInt( len( orphan_thumbnails ) ) + ' orphan thumbnails cleared!'
+                final_text = HydrusData.ToHumanInt( len( orphan_paths ) ) + ' orphan files and ' + HydrusData.ToHumanInt( num_orphan_thumbnails ) + ' orphan thumbnails cleared!'
                 
             
             job_key.SetVariable( 'popup_text_1', final_text )
@@ -1048,11 +1755,7 @@ class ClientFilesManager( object ):
                 
                 if thumbnail_hash is not None:
                     
-                    path = self._GenerateExpectedThumbnailPath( thumbnail_hash )
-                    
-                    if os.path.exists( path ):
-                        
-                        ClientPaths.DeletePath( path, always_delete_fully = True )
+                    if self._DeleteThumbnail( thumbnail_hash ):
                         
                         num_thumbnails_deleted += 1
                         
@@ -1140,41 +1843,112 @@ class ClientFilesManager( object ):
         return self._missing_locations
         
     
-    def GetThumbnailPath( self, media ):
+    def GetThumbnailBytes( self, media ):
         
         hash = media.GetHash()
         mime = media.GetMime()
         
         if HG.file_report_mode:
             
-            HydrusData.ShowText( 'Thumbnail path request: ' + str( ( hash, mime ) ) )
+            HydrusData.ShowText( 'Thumbnail request: ' + str( ( hash, mime ) ) )
             
         
-        with self._rwlock.read:
-            
-            path = self._GenerateExpectedThumbnailPath( hash )
+        try:
             
-            thumb_missing = not os.path.exists( path )
+            with self._rwlock.read:
+                
+                return self._GetThumbnailBytes( hash )
+                
             
-        
-        if thumb_missing:
+        except HydrusExceptions.FileMissingException:
             
             self.RegenerateThumbnail( media )
             
         
-        return path
+        with self._rwlock.read:
+            
+            return self._GetThumbnailBytes( hash )
+            
         
     
     def LocklessHasThumbnail( self, hash ):
         
-        path = self._GenerateExpectedThumbnailPath( hash )
+        return self._HasThumbnail( hash )
         
-        if HG.file_report_mode:
+    
+    def MaintainThumbnailStorage( self, stop_hook = None ):
+        
+        if stop_hook is None:
             
-            HydrusData.ShowText( 'Thumbnail path test: ' + path )
+            stop_hook = lambda: False
             
         
-        return os.path.exists( path )
+        if self._bad_error_occurred or len( self._missing_locations ) > 0:
+            
+            return
+            
+        
+        want_packed = self._controller.new_options.GetBoolean( 'thumbnail_storage_packed' )
+        
+        num_prefixes_migrated = 0
+        
+        with self._rwlock.read:
+            
+            thumbnail_prefixes = sorted( ( prefix for prefix in self._prefixes_to_locations if prefix.startswith( 't' ) ) )
+            
+        
+        for prefix in thumbnail_prefixes:
+            
+            if stop_hook() or HG.started_shutdown:
+                
+                break
+                
+            
+            with self._rwlock.read:
+                
+                if prefix not in self._prefixes_to_locations:
+                    
+                    break # a reshard happened
+                    
+                
+                is_packed = prefix in self._prefixes_to_thumbnail_packs
+                
+            
+            if want_packed and not is_packed:
+                
+                if self._PackThumbnailPrefix( prefix, stop_hook ):
+                    
+                    num_prefixes_migrated += 1
+                    
+                
+            elif is_packed and not want_packed:
+                
+                if self._UnpackThumbnailPrefix( prefix, stop_hook ):
+                    
+                    num_prefixes_migrated += 1
+                    
+                
+            
+        
+        if num_prefixes_migrated > 0:
+            
+            HydrusData.Print( '{} thumbnails in {} folders.'.format( 'Packed' if want_packed else 'Unpacked', HydrusData.ToHumanInt( num_prefixes_migrated ) ) )
+            
+        
+        with self._rwlock.read:
+            
+            thumbnail_packs = list( self._prefixes_to_thumbnail_packs.values() )
+            
+        
+        for thumbnail_pack in thumbnail_packs:
+            
+            if stop_hook() or HG.started_shutdown:
+                
+                return
+                
+            
+            # the pack does its own locking, and compaction keeps the index valid at every step, so readers can carry on
+            thumbnail_pack.Compact( stop_hook = stop_hook )
         
     
     def NotifyNewPhysicalFileDeletes( self ):
@@ -1186,15 +1960,61 @@ class ClientFilesManager( object ):
         
         try:
             
-            if self._bad_error_occurred:
+            if self._bad_error_occurred:
+                
+                QW.QMessageBox.warning( None, 'Warning', 'A serious file error has previously occurred during this session, so further file moving will not be reattempted. Please restart the client before trying again.' )
+                
+                return
+                
+            
+            # resharding only takes the lock for small batches of files and the final swap, so the client can keep loading files while it works
+            
+            with self._rwlock.read:
+                
+                reshard_tuple = self._GetReshardTuple()
+                
+            
+            while reshard_tuple is not None:
                 
-                QW.QMessageBox.warning( None, 'Warning', 'A serious file error has previously occurred during this session, so further file moving will not be reattempted. Please restart the client before trying again.' )
+                if job_key.IsCancelled() or HG.started_shutdown:
+                    
+                    break
+                    
                 
-                return
+                ( old_prefixes, new_prefixes_to_locations ) = reshard_tuple
+                
+                text = 'Resharding \'' + ', '.join( old_prefixes ) + '\' into \'' + ', '.join( sorted( new_prefixes_to_locations.keys() ) ) + '\''
+                
+                HydrusData.Print( text )
+                
+                job_key.SetVariable( 'popup_text_1', text )
+                
+                if not self._ReshardPrefixes( old_prefixes, new_prefixes_to_locations, lambda: job_key.IsCancelled() or HG.started_shutdown ):
+                    
+                    break
+                    
+                
+                with self._rwlock.read:
+                    
+                    reshard_tuple = self._GetReshardTuple()
+                    
+                
+                time.sleep( 0.01 )
                 
             
             with self._rwlock.write:
                 
+                for stray_dir in self._GetStrayPrefixDirectories():
+                    
+                    text = 'Clearing out the old folder ' + stray_dir
+                    
+                    HydrusData.Print( text )
+                    
+                    job_key.SetVariable( 'popup_text_1', text )
+                    
+                    self._DrainStrayPrefixDirectory( stray_dir )
+                    
+                
                 rebalance_tuple = self._GetRebalanceTuple()
                 
                 while rebalance_tuple is not None:
@@ -1212,6 +2032,8 @@ class ClientFilesManager( object ):
                     
                     job_key.SetVariable( 'popup_text_1', text )
                     
+                    self._CloseThumbnailPacks()
+                    
                     # these two lines can cause a deadlock because the db sometimes calls stuff in here.
                     self._controller.WriteSynchronous( 'relocate_client_files', prefix, overweight_location, underweight_location )
                     
@@ -1242,8 +2064,12 @@ class ClientFilesManager( object ):
                     recoverable_path = os.path.join( recoverable_location, prefix )
                     correct_path = os.path.join( correct_location, prefix )
                     
+                    self._CloseThumbnailPacks()
+                    
                     HydrusPaths.MergeTree( recoverable_path, correct_path )
                     
+                    self._ReinitThumbnailPacks()
+                    
                     recover_tuple = self._GetRecoverTuple()
                     
                     time.sleep( 0.01 )
@@ -1264,7 +2090,7 @@ class ClientFilesManager( object ):
         
         with self._rwlock.read:
             
-            return self._GetRebalanceTuple() is not None
+            return self._GetReshardTuple() is not None or len( self._GetStrayPrefixDirectories() ) > 0 or self._GetRebalanceTuple() is not None
             
         
     
@@ -1312,9 +2138,12 @@ class ClientFilesManager( object ):
             
             ( media_width, media_height ) = media.GetResolution()
             
-            path = self._GenerateExpectedThumbnailPath( hash )
+            with self._rwlock.read:
+                
+                thumbnail_bytes = self._GetThumbnailBytes( hash )
+                
             
-            numpy_image = ClientImageHandling.GenerateNumPyImage( path, mime )
+            numpy_image = ClientImageHandling.GenerateNumPyImageFromBytes( thumbnail_bytes, mime )
             
             ( current_width, current_height ) = HydrusImageHandling.GetResolutionNumPy( numpy_image )
             
@@ -1345,6 +2174,10 @@ class ClientFilesManager( object ):
         
         self._new_physical_file_deletes.set()
         
+        with self._rwlock.write:
+            
+            self._CloseThumbnailPacks()
+        
     
 class FilesMaintenanceManager( object ):
     
@@ -1360,6 +2193,9 @@ class FilesMaintenanceManager( object ):
         self._idle_work_rules = HydrusNetworking.BandwidthRules()
         self._active_work_rules = HydrusNetworking.BandwidthRules()
         
+        self._num_cpu_workers = 1
+        self._num_io_workers = 1
+        
         self._ReInitialiseWorkRules()
         
         self._maintenance_lock = threading.Lock()
@@ -1640,6 +2476,18 @@ class FilesMaintenanceManager( object ):
             
         
     
+    def _GetNumWorkers( self, job_type ):
+        
+        if regen_file_enum_to_work_type_lookup[ job_type ] == REGEN_FILE_WORK_TYPE_IO:
+            
+            return self._num_io_workers
+            
+        else:
+            
+            return self._num_cpu_workers
+            
+        
+    
     def _HasICCProfile( self, media_result ):
         
         hash = media_result.GetHash()
@@ -1870,6 +2718,39 @@ class FilesMaintenanceManager( object ):
         return perceptual_hashes
         
     
+    def _RegenVideoKeyframes( self, media_result ):
+        
+        hash = media_result.GetHash()
+        mime = media_result.GetMime()
+        
+        if mime not in HC.VIDEO:
+            
+            return None
+            
+        
+        try:
+            
+            path = self._controller.client_files_manager.GetFilePath( hash, mime )
+            
+            try:
+                
+                keyframe_timestamps = HydrusVideoHandling.GetVideoKeyframeTimestamps( path )
+                
+            except:
+                
+                return None
+                
+            
+            additional_data = keyframe_timestamps
+            
+            return additional_data
+            
+        except HydrusExceptions.FileMissingException:
+            
+            return None
+            
+        
+    
     def _ReInitialiseWorkRules( self ):
         
         file_maintenance_idle_throttle_files = self._controller.new_options.GetInteger( 'file_maintenance_idle_throttle_files' )
@@ -1886,165 +2767,244 @@ class FilesMaintenanceManager( object ):
         
         self._active_work_rules.AddRule( HC.BANDWIDTH_TYPE_REQUESTS, file_maintenance_active_throttle_time_delta, file_maintenance_active_throttle_files * NORMALISED_BIG_JOB_WEIGHT )
         
+        self._num_cpu_workers = max( 1, self._controller.new_options.GetInteger( 'file_maintenance_num_cpu_workers' ) )
+        self._num_io_workers = max( 1, self._controller.new_options.GetInteger( 'file_maintenance_num_io_workers' ) )
+        
     
-    def _RunJob( self, media_results, job_type, job_key, job_done_hook = None ):
+    def _RunJob( self, media_results, job_type, job_key, job_done_hook = None, work_gate = None ):
+        
+        num_workers = self._GetNumWorkers( job_type )
+        
+        results_queue = queue.Queue()
+        
+        def work_callable( media_result ):
+            
+            result = ( media_result.GetHash(), None, False )
+            
+            try:
+                
+                result = self._RunJobOnMediaResult( media_result, job_type )
+                
+            finally:
+                
+                results_queue.put( result )
+                
+            
+        
+        # in a dict so the nested funcs have scope to alter it
+        status = {}
+        
+        status[ 'last_time_jobs_were_cleared' ] = HydrusData.GetNow()
+        status[ 'cleared_jobs' ] = []
+        
+        def process_result( result ):
+            
+            ( hash, additional_data, file_was_flagged ) = result
+            
+            if job_type == REGENERATE_FILE_DATA_JOB_REFIT_THUMBNAIL:
+                
+                num_thumb_refits = job_key.GetIfHasVariable( 'num_thumb_refits' )
+                
+                if num_thumb_refits is None:
+                    
+                    num_thumb_refits = 0
+                    
+                
+                if file_was_flagged:
+                    
+                    num_thumb_refits += 1
+                    
+                
+                job_key.SetVariable( 'num_thumb_refits', num_thumb_refits )
+                
+                job_key.SetVariable( 'popup_text_2', 'thumbs needing regen: {}'.format( HydrusData.ToHumanInt( num_thumb_refits ) ) )
+                
+            elif job_type in regen_file_integrity_jobs:
+                
+                num_bad_files = job_key.GetIfHasVariable( 'num_bad_files' )
+                
+                if num_bad_files is None:
+                    
+                    num_bad_files = 0
+                    
+                
+                if file_was_flagged:
+                    
+                    num_bad_files += 1
+                    
+                
+                job_key.SetVariable( 'num_bad_files', num_bad_files )
+                
+                job_key.SetVariable( 'popup_text_2', 'missing or invalid files: {}'.format( HydrusData.ToHumanInt( num_bad_files ) ) )
+                
+            
+            status[ 'cleared_jobs' ].append( ( hash, job_type, additional_data ) )
+            
+            # all the results of a batch go to the db in one transaction, rather than a write per file
+            
+            if HydrusData.TimeHasPassed( status[ 'last_time_jobs_were_cleared' ] + 10 ) or len( status[ 'cleared_jobs' ] ) > 256:
+                
+                self._controller.WriteSynchronous( 'file_maintenance_clear_jobs', status[ 'cleared_jobs' ] )
+                
+                status[ 'last_time_jobs_were_cleared' ] = HydrusData.GetNow()
+                status[ 'cleared_jobs' ] = []
+                
+            
         
-        next_gc_collect = HydrusData.GetNow() + 10
+        num_in_flight = 0
         
         try:
             
             big_pauser = HydrusData.BigJobPauser( wait_time = 0.8 )
             
-            last_time_jobs_were_cleared = HydrusData.GetNow()
-            cleared_jobs = []
-            
             num_to_do = len( media_results )
             
             if HG.file_report_mode:
                 
-                HydrusData.ShowText( 'file maintenance: {} for {} files'.format( regen_file_enum_to_str_lookup[ job_type ], HydrusData.ToHumanInt( num_to_do ) ) )
+                HydrusData.ShowText( 'file maintenance: {} for {} files, {} workers'.format( regen_file_enum_to_str_lookup[ job_type ], HydrusData.ToHumanInt( num_to_do ), num_workers ) )
                 
             
-            for ( i, media_result ) in enumerate( media_results ):
+            for media_result in media_results:
                 
                 big_pauser.Pause()
                 
-                hash = media_result.GetHash()
-                
                 if job_key.IsCancelled():
                     
                     return
                     
                 
-                if job_done_hook is not None:
+                if work_gate is not None and not work_gate():
                     
-                    job_done_hook( job_type )
+                    return
                     
                 
-                additional_data = None
-                
-                try:
-                    
-                    if job_type == REGENERATE_FILE_DATA_JOB_FILE_METADATA:
-                        
-                        additional_data = self._RegenFileMetadata( media_result )
-                        
-                    elif job_type == REGENERATE_FILE_DATA_JOB_FILE_MODIFIED_TIMESTAMP:
-                        
-                        additional_data = self._RegenFileModifiedTimestamp( media_result )
-                        
-                    elif job_type == REGENERATE_FILE_DATA_JOB_OTHER_HASHES:
-                        
-                        additional_data = self._RegenFileOtherHashes( media_result )
-                        
-                    elif job_type == REGENERATE_FILE_DATA_JOB_FILE_HAS_ICC_PROFILE:
-                        
-                        additional_data = self._HasICCProfile( media_result )
-                        
-                    elif job_type == REGENERATE_FILE_DATA_JOB_PIXEL_HASH:
-                        
-                        additional_data = self._RegenPixelHash( media_result )
-                        
-                    elif job_type == REGENERATE_FILE_DATA_JOB_FORCE_THUMBNAIL:
-                        
-                        self._RegenFileThumbnailForce( media_result )
-                        
-                    elif job_type == REGENERATE_FILE_DATA_JOB_REFIT_THUMBNAIL:
-                        
-                        if not job_key.HasVariable( 'num_thumb_refits' ):
-                            
-                            job_key.SetVariable( 'num_thumb_refits', 0 ) 
-                            
-                        
-                        num_thumb_refits = job_key.GetIfHasVariable( 'num_thumb_refits' )
-                        
-                        was_regenerated = self._RegenFileThumbnailRefit( media_result )
-                        
-                        if was_regenerated:
-                            
-                            num_thumb_refits += 1
-                            
-                            job_key.SetVariable( 'num_thumb_refits', num_thumb_refits )
-                            
-                        
-                        job_key.SetVariable( 'popup_text_2', 'thumbs needing regen: {}'.format( HydrusData.ToHumanInt( num_thumb_refits ) ) )
-                        
-                    elif job_type == REGENERATE_FILE_DATA_JOB_DELETE_NEIGHBOUR_DUPES:
-                        
-                        self._DeleteNeighbourDupes( media_result )
-                        
-                    elif job_type == REGENERATE_FILE_DATA_JOB_CHECK_SIMILAR_FILES_MEMBERSHIP:
-                        
-                        additional_data = self._CheckSimilarFilesMembership( media_result )
-                        
-                    elif job_type == REGENERATE_FILE_DATA_JOB_SIMILAR_FILES_METADATA:
-                        
-                        additional_data = self._RegenSimilarFilesMetadata( media_result )
-                        
-                    elif job_type == REGENERATE_FILE_DATA_JOB_FIX_PERMISSIONS:
-                        
-                        self._FixFilePermissions( media_result )
-                        
-                    elif job_type in ( REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_PRESENCE_REMOVE_RECORD, REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_PRESENCE_TRY_URL, REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_PRESENCE_TRY_URL_ELSE_REMOVE_RECORD, REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA_REMOVE_RECORD, REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA_TRY_URL, REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA_TRY_URL_ELSE_REMOVE_RECORD, REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA_SILENT_DELETE ):
-                        
-                        if not job_key.HasVariable( 'num_bad_files' ):
-                            
-                            job_key.SetVariable( 'num_bad_files', 0 ) 
-                            
-                        
-                        num_bad_files = job_key.GetIfHasVariable( 'num_bad_files' )
-                        
-                        file_was_bad = self._CheckFileIntegrity( media_result, job_type )
-                        
-                        if file_was_bad:
-                            
-                            num_bad_files += 1
-                            
-                            job_key.SetVariable( 'num_bad_files', num_bad_files ) 
-                            
-                        
-                        job_key.SetVariable( 'popup_text_2', 'missing or invalid files: {}'.format( HydrusData.ToHumanInt( num_bad_files ) ) )
-                        
-                    
-                except HydrusExceptions.ShutdownException:
-                    
-                    # no worries
-                    
-                    pass
-                    
-                except Exception as e:
-                    
-                    HydrusData.PrintException( e )
+                if job_done_hook is not None:
                     
-                    message = 'There was a problem performing maintenance task "{}" on file {}! The job will not be reattempted. A full traceback of this error should be written to the log.'.format( regen_file_enum_to_str_lookup[ job_type ], hash.hex() )
-                    message += os.linesep * 2
-                    message += str( e )
+                    job_done_hook( job_type )
                     
-                    HydrusData.ShowText( message )
+                
+                if num_workers == 1:
                     
-                finally:
+                    work_callable( media_result )
                     
-                    self._work_tracker.ReportRequestUsed( num_requests = regen_file_enum_to_job_weight_lookup[ job_type ] )
+                    process_result( results_queue.get() )
                     
-                    cleared_jobs.append( ( hash, job_type, additional_data ) )
+                else:
                     
-                
-                if HydrusData.TimeHasPassed( last_time_jobs_were_cleared + 10 ) or len( cleared_jobs ) > 256:
+                    while num_in_flight >= num_workers:
+                        
+                        process_result( results_queue.get() )
+                        
+                        num_in_flight -= 1
+                        
                     
-                    self._controller.WriteSynchronous( 'file_maintenance_clear_jobs', cleared_jobs )
+                    self._controller.CallToThread( work_callable, media_result )
                     
-                    cleared_jobs = []
+                    num_in_flight += 1
                     
                 
             
         finally:
             
-            if len( cleared_jobs ) > 0:
+            while num_in_flight > 0:
+                
+                process_result( results_queue.get() )
+                
+                num_in_flight -= 1
+                
+            
+            if len( status[ 'cleared_jobs' ] ) > 0:
+                
+                self._controller.Write( 'file_maintenance_clear_jobs', status[ 'cleared_jobs' ] )
+                
+            
+        
+    
+    def _RunJobOnMediaResult( self, media_result, job_type ):
+        
+        hash = media_result.GetHash()
+        
+        additional_data = None
+        file_was_flagged = False
+        
+        try:
+            
+            if job_type == REGENERATE_FILE_DATA_JOB_FILE_METADATA:
+                
+                additional_data = self._RegenFileMetadata( media_result )
+                
+            elif job_type == REGENERATE_FILE_DATA_JOB_FILE_MODIFIED_TIMESTAMP:
+                
+                additional_data = self._RegenFileModifiedTimestamp( media_result )
+                
+            elif job_type == REGENERATE_FILE_DATA_JOB_OTHER_HASHES:
+                
+                additional_data = self._RegenFileOtherHashes( media_result )
+                
+            elif job_type == REGENERATE_FILE_DATA_JOB_FILE_HAS_ICC_PROFILE:
+                
+                additional_data = self._HasICCProfile( media_result )
+                
+            elif job_type == REGENERATE_FILE_DATA_JOB_PIXEL_HASH:
+                
+                additional_data = self._RegenPixelHash( media_result )
+                
+            elif job_type == REGENERATE_FILE_DATA_JOB_VIDEO_KEYFRAMES:
+                
+                additional_data = self._RegenVideoKeyframes( media_result )
                 
-                self._controller.Write( 'file_maintenance_clear_jobs', cleared_jobs )
+            elif job_type == REGENERATE_FILE_DATA_JOB_FORCE_THUMBNAIL:
                 
+                self._RegenFileThumbnailForce( media_result )
+                
+            elif job_type == REGENERATE_FILE_DATA_JOB_REFIT_THUMBNAIL:
+                
+                file_was_flagged = self._RegenFileThumbnailRefit( media_result )
+                
+            elif job_type == REGENERATE_FILE_DATA_JOB_DELETE_NEIGHBOUR_DUPES:
+                
+                self._DeleteNeighbourDupes( media_result )
+                
+            elif job_type == REGENERATE_FILE_DATA_JOB_CHECK_SIMILAR_FILES_MEMBERSHIP:
+                
+                additional_data = self._CheckSimilarFilesMembership( media_result )
+                
+            elif job_type == REGENERATE_FILE_DATA_JOB_SIMILAR_FILES_METADATA:
+                
+                additional_data = self._RegenSimilarFilesMetadata( media_result )
+                
+            elif job_type == REGENERATE_FILE_DATA_JOB_FIX_PERMISSIONS:
+                
+                self._FixFilePermissions( media_result )
+                
+            elif job_type in regen_file_integrity_jobs:
+                
+                file_was_flagged = self._CheckFileIntegrity( media_result, job_type )
+                
+            
+        except HydrusExceptions.ShutdownException:
+            
+            # no worries
+            
+            pass
+            
+        except Exception as e:
+            
+            HydrusData.PrintException( e )
+            
+            message = 'There was a problem performing maintenance task "{}" on file {}! The job will not be reattempted. A full traceback of this error should be written to the log.'.format( regen_file_enum_to_str_lookup[ job_type ], hash.hex() )
+            message += os.linesep * 2
+            message += str( e )
+            
+            HydrusData.ShowText( message )
+            
+        finally:
+            
+            self._work_tracker.ReportRequestUsed( num_requests = regen_file_enum_to_job_weight_lookup[ job_type ] )
             
         
+        return ( hash, additional_data, file_was_flagged )
+        
     
     def CancelJobs( self, job_type ):
         
@@ -2229,7 +3189,31 @@ class FilesMaintenanceManager( object ):
                         
                         job_key = ClientThreading.JobKey()
                         
-                        i = 0
+                        # in a dict so the gate has scope to alter it
+                        gate_status = {}
+                        
+                        gate_status[ 'num_started' ] = 0
+                        
+                        def work_gate():
+                            
+                            # the idle/active work rules are checked before each file is handed to a worker, so the throttle applies to the pool as a whole
+                            
+                            wait_on_maintenance()
+                            
+                            if should_reset():
+                                
+                                return False
+                                
+                            
+                            gate_status[ 'num_started' ] += 1
+                            
+                            if gate_status[ 'num_started' ] % 100 == 0:
+                                
+                                self._controller.pub( 'notify_files_maintenance_done' )
+                                
+                            
+                            return True
+                            
                         
                         try:
                             
@@ -2243,29 +3227,9 @@ class FilesMaintenanceManager( object ):
                             
                             self._ClearJobs( missing_hashes, job_type )
                             
-                            for media_result in media_results:
-                                
-                                wait_on_maintenance()
-                                
-                                if should_reset():
-                                    
-                                    break
-                                    
-                                
-                                with self._lock:
-                                    
-                                    self._RunJob( ( media_result, ), job_type, job_key )
-                                    
-                                
-                                time.sleep( 0.0001 )
-                                
-                                i += 1
-                                
-                                if i % 100 == 0:
-                                    
-                                    self._controller.pub( 'notify_files_maintenance_done' )
-                                    
-                                
+                            # we don't hold self._lock for the whole batch here, since the gate can wait a long time for idle
+                            
+                            self._RunJob( media_results, job_type, job_key, work_gate = work_gate )
                             
                         finally:
                             
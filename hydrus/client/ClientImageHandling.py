@@ -30,6 +30,12 @@ def GenerateNumPyImage( path, mime ):
     
     return HydrusImageHandling.GenerateNumPyImage( path, mime, force_pil = force_pil )
     
+def GenerateNumPyImageFromBytes( image_bytes, mime ):
+    
+    force_pil = HG.client_controller.new_options.GetBoolean( 'load_images_with_pil' )
+    
+    return HydrusImageHandling.GenerateNumPyImageFromBytes( image_bytes, mime, force_pil = force_pil )
+    
 def GenerateShapePerceptualHashes( path, mime ):
     
     if HG.phash_generation_report_mode:
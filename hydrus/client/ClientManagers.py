@@ -1,15 +1,21 @@
 import collections
+import hashlib
+import math
 import threading
 import typing
 
+import numpy
+
 from qtpy import QtGui as QG
 
 from hydrus.core import HydrusConstants as HC
 from hydrus.core import HydrusData
+from hydrus.core import HydrusExceptions
 from hydrus.core import HydrusGlobals as HG
 
 from hydrus.client import ClientConstants as CC
 from hydrus.client import ClientData
+from hydrus.client.networking import ClientNetworkingFunctions
 
 # now let's fill out grandparents
 def BuildServiceKeysToChildrenToParents( service_keys_to_simple_children_to_parents ):
@@ -238,6 +244,100 @@ class BitmapManager( object ):
         return self._media_background_pixmap
         
     
+class BloomFilter( object ):
+    
+    # a set that can only say 'definitely not in here' or 'maybe in here', but in about ten bits an item
+    # positions are the usual double hashing trick off one 128-bit digest, ( h1 + i * h2 ) mod 2^64 mod num_bits
+    
+    def __init__( self, capacity: int, false_positive_rate = 0.01 ):
+        
+        capacity = max( 1, capacity )
+        
+        self._capacity = capacity
+        self._num_items = 0
+        
+        self._num_bits = max( 64, int( - capacity * math.log( false_positive_rate ) / ( math.log( 2 ) ** 2 ) ) )
+        self._num_hashes = max( 1, int( round( ( self._num_bits / capacity ) * math.log( 2 ) ) ) )
+        
+        self._bits = numpy.zeros( ( self._num_bits + 7 ) // 8, dtype = numpy.uint8 )
+        
+    
+    def _GetDigest( self, item ) -> bytes:
+        
+        if isinstance( item, str ):
+            
+            item = item.encode( 'utf-8' )
+            
+        
+        return hashlib.blake2b( item, digest_size = 16 ).digest()
+        
+    
+    def AddItems( self, items ):
+        
+        digests = b''.join( ( self._GetDigest( item ) for item in items ) )
+        
+        if len( digests ) == 0:
+            
+            return
+            
+        
+        h = numpy.frombuffer( digests, dtype = '<u8' ).reshape( ( -1, 2 ) )
+        
+        h1 = h[ :, 0 ].astype( numpy.uint64 )
+        h2 = h[ :, 1 ].astype( numpy.uint64 ) | numpy.uint64( 1 )
+        
+        num_bits = numpy.uint64( self._num_bits )
+        
+        for i in range( self._num_hashes ):
+            
+            positions = ( h1 + numpy.uint64( i ) * h2 ) % num_bits
+            
+            numpy.bitwise_or.at( self._bits, ( positions >> numpy.uint64( 3 ) ).astype( numpy.intp ), numpy.left_shift( 1, positions & numpy.uint64( 7 ) ).astype( numpy.uint8 ) )
+            
+        
+        self._num_items += len( h )
+        
+    
+    def GetCapacity( self ) -> int:
+        
+        return self._capacity
+        
+    
+    def GetEstimatedMemoryFootprint( self ) -> int:
+        
+        return self._bits.nbytes
+        
+    
+    def GetNumItems( self ) -> int:
+        
+        return self._num_items
+        
+    
+    def IsFull( self ) -> bool:
+        
+        return self._num_items > self._capacity
+        
+    
+    def MayHaveItem( self, item ) -> bool:
+        
+        digest = self._GetDigest( item )
+        
+        h1 = int.from_bytes( digest[:8], 'little' )
+        h2 = int.from_bytes( digest[8:], 'little' ) | 1
+        
+        for i in range( self._num_hashes ):
+            
+            position = ( ( h1 + i * h2 ) % 2 ** 64 ) % self._num_bits
+            
+            if not self._bits[ position >> 3 ] & ( 1 << ( position & 7 ) ):
+                
+                return False
+                
+            
+        
+        return True
+        
+    
 class FileViewingStatsManager( object ):
     
     def __init__( self, controller ):
@@ -387,6 +487,198 @@ class FileViewingStatsManager( object ):
         self.Flush()
         
     
+class KnownContentFilterManager( object ):
+    
+    # in-memory bloom filters over every url the client knows and every sha256 that has ever been in 'all local files'
+    # if the filter says 'no', the db's url_statuses or hash_status would have said 'unknown', so importers and the client api can skip asking
+    # the db adds to this as it writes new urls and files, so it never gives a false 'definitely new'. things are never removed, which only means a few more 'maybe's
+    
+    BLOCK_SIZE = 65536
+    
+    def __init__( self, controller ):
+        
+        self._controller = controller
+        
+        self._lock = threading.Lock()
+        
+        self._url_filter = None
+        self._hash_filter = None
+        
+        self._building = False
+        
+        self._pending_urls = []
+        self._pending_hashes = []
+        
+    
+    def _AddItems( self, bloom_filter: typing.Optional[ BloomFilter ], pending: list, items ):
+        
+        if self._building:
+            
+            pending.extend( items )
+            
+        
+        if bloom_filter is not None:
+            
+            bloom_filter.AddItems( items )
+            
+            if bloom_filter.IsFull() and not self._building:
+                
+                # we are getting more false positives than we want, so let's start over with more room
+                self._building = True
+                
+                self._controller.CallToThreadLongRunning( self._THREADRebuild )
+                
+            
+        
+    
+    def _GenerateFilter( self, sources, num_items ) -> BloomFilter:
+        
+        bloom_filter = BloomFilter( max( self.BLOCK_SIZE, num_items * 2 ) )
+        
+        for source in sources:
+            
+            last_id = -1
+            
+            while True:
+                
+                if HG.model_shutdown:
+                    
+                    raise HydrusExceptions.ShutdownException()
+                    
+                
+                rows = self._controller.Read( 'known_content_filter_block', source, last_id, self.BLOCK_SIZE )
+                
+                if len( rows ) == 0:
+                    
+                    break
+                    
+                
+                bloom_filter.AddItems( [ item for ( item_id, item ) in rows ] )
+                
+                last_id = rows[-1][0]
+                
+            
+        
+        return bloom_filter
+        
+    
+    def _THREADRebuild( self ):
+        
+        try:
+            
+            ( num_urls, num_hashes ) = self._controller.Read( 'known_content_filter_counts' )
+            
+            url_filter = self._GenerateFilter( ( 'urls', ), num_urls )
+            hash_filter = self._GenerateFilter( ( 'current_local_hashes', 'deleted_local_hashes' ), num_hashes )
+            
+            with self._lock:
+                
+                # anything the db wrote while we were reading
+                url_filter.AddItems( self._pending_urls )
+                hash_filter.AddItems( self._pending_hashes )
+                
+                self._url_filter = url_filter
+                self._hash_filter = hash_filter
+                
+            
+        except HydrusExceptions.ShutdownException:
+            
+            pass
+            
+        except Exception as e:
+            
+            HydrusData.Print( 'Could not build the known url and hash filter:' )
+            HydrusData.PrintException( e )
+            
+        finally:
+            
+            with self._lock:
+                
+                self._building = False
+                
+                self._pending_urls = []
+                self._pending_hashes = []
+                
+            
+        
+    
+    def AddHashes( self, hashes ):
+        
+        with self._lock:
+            
+            self._AddItems( self._hash_filter, self._pending_hashes, hashes )
+            
+        
+    
+    def AddURLs( self, urls ):
+        
+        with self._lock:
+            
+            self._AddItems( self._url_filter, self._pending_urls, urls )
+            
+        
+    
+    def HashIsDefinitelyNew( self, hash: bytes ) -> bool:
+        
+        hash_filter = self._hash_filter
+        
+        if hash_filter is None:
+            
+            return False
+            
+        
+        return not hash_filter.MayHaveItem( hash )
+        
+    
+    def IsReady( self ) -> bool:
+        
+        return self._url_filter is not None and self._hash_filter is not None
+        
+    
+    def Rebuild( self ):
+        
+        with self._lock:
+            
+            if self._building:
+                
+                return
+                
+            
+            self._building = True
+            
+        
+        self._THREADRebuild()
+        
+    
+    def Start( self ):
+        
+        with self._lock:
+            
+            if self._building:
+                
+                return
+                
+            
+            self._building = True
+            
+        
+        self._controller.CallToThreadLongRunning( self._THREADRebuild )
+        
+    
+    def URLIsDefinitelyNew( self, url: str ) -> bool:
+        
+        url_filter = self._url_filter
+        
+        if url_filter is None:
+            
+            return False
+            
+        
+        search_urls = ClientNetworkingFunctions.GetSearchURLs( url )
+        
+        return True not in ( url_filter.MayHaveItem( search_url ) for search_url in search_urls )
+        
+    
 class UndoManager( object ):
     
     def __init__( self, controller ):
@@ -1,7 +1,10 @@
 import os
+import queue
+import threading
 
 from hydrus.core import HydrusConstants as HC
 from hydrus.core import HydrusData
+from hydrus.core import HydrusGlobals as HG
 from hydrus.core import HydrusTagArchive
 
 from hydrus.client import ClientConstants as CC
@@ -17,6 +20,9 @@ content_types_to_pair_types = {}
 content_types_to_pair_types[ HC.CONTENT_TYPE_TAG_PARENTS ] = HydrusTagArchive.TAG_PAIR_TYPE_PARENTS
 content_types_to_pair_types[ HC.CONTENT_TYPE_TAG_SIBLINGS ] = HydrusTagArchive.TAG_PAIR_TYPE_SIBLINGS
 
+# past this many rows, a local tag service add switches to writing the storage tables directly and regenerates its caches at the end
+BULK_MAPPINGS_ADD_THRESHOLD = 1000000
+
 def GetBasicSpeedStatement( num_done, time_started_precise ):
     
     if num_done == 0:
@@ -118,7 +124,7 @@ class MigrationDestinationHTA( MigrationDestination ):
         
         self._hta.SetHashType( hta_hash_type )
         
-        self._hta.BeginBigJob()
+        self._hta.BeginBigJob( bulk = True )
         
     
 class MigrationDestinationHTPA( MigrationDestination ):
@@ -248,12 +254,51 @@ class MigrationDestinationTagService( MigrationDestination ):
     
 class MigrationDestinationTagServiceMappings( MigrationDestinationTagService ):
     
+    def __init__( self, controller, tag_service_key, content_action ):
+        
+        MigrationDestinationTagService.__init__( self, controller, tag_service_key, content_action )
+        
+        self._bulk_add_threshold = BULK_MAPPINGS_ADD_THRESHOLD
+        
+        self._num_rows_done = 0
+        self._doing_bulk_add = False
+        
+    
+    def _CanBulkAdd( self ):
+        
+        return self._content_action == HC.CONTENT_UPDATE_ADD and self._tag_service_type == HC.LOCAL_TAG
+        
+    
+    def CleanUp( self ):
+        
+        if self._doing_bulk_add:
+            
+            self._controller.WriteSynchronous( 'migration_finish_bulk_mappings', self._tag_service_key )
+            
+        
+    
     def DoSomeWork( self, source ):
         
         time_started_precise = HydrusData.GetNowPrecise()
         
         data = source.GetSomeData()
         
+        if not self._doing_bulk_add and self._CanBulkAdd() and self._num_rows_done >= self._bulk_add_threshold:
+            
+            self._doing_bulk_add = True
+            
+        
+        if self._doing_bulk_add:
+            
+            self._controller.WriteSynchronous( 'migration_bulk_add_mappings', self._tag_service_key, data )
+            
+            num_done = sum( ( len( tags ) for ( hash, tags ) in data ) )
+            
+            self._num_rows_done += num_done
+            
+            return 'bulk adding, caches will regenerate at the end: {}'.format( GetBasicSpeedStatement( num_done, time_started_precise ) )
+            
+        
         content_updates = []
         
         pairs = []
@@ -285,6 +330,8 @@ class MigrationDestinationTagServiceMappings( MigrationDestinationTagService ):
         
         self._controller.WriteSynchronous( 'content_updates', service_keys_to_content_updates )
         
+        self._num_rows_done += num_done
+        
         return GetBasicSpeedStatement( num_done, time_started_precise )
         
     
@@ -343,9 +390,12 @@ class MigrationJob( object ):
         
         self._controller.pub( 'message', job_key )
         
+        # the source reads in its own thread, a few chunks ahead, while the destination writes in this one
+        source = MigrationSourcePipeline( self._controller, self._source )
+        
         job_key.SetVariable( 'popup_text_1', 'preparing source' )
         
-        self._source.Prepare()
+        source.Prepare()
         
         job_key.SetVariable( 'popup_text_1', 'preparing destination' )
         
@@ -355,9 +405,9 @@ class MigrationJob( object ):
         
         try:
             
-            while self._source.StillWorkToDo():
+            while source.StillWorkToDo():
                 
-                progress_statement = self._destination.DoSomeWork( self._source )
+                progress_statement = self._destination.DoSomeWork( source )
                 
                 job_key.SetVariable( 'popup_text_1', progress_statement )
                 
@@ -373,7 +423,7 @@ class MigrationJob( object ):
             
             job_key.SetVariable( 'popup_text_1', 'done, cleaning up source' )
             
-            self._source.CleanUp()
+            source.CleanUp()
             
             job_key.SetVariable( 'popup_text_1', 'done, cleaning up destination' )
             
@@ -520,7 +570,7 @@ class MigrationSourceHTA( MigrationSource ):
     
     def GetSomeData( self ):
         
-        data = HydrusData.PullNFromIterator( self._iterator, 256 )
+        data = next( self._iterator, [] )
         
         if len( data ) == 0:
             
@@ -585,7 +635,7 @@ class MigrationSourceHTA( MigrationSource ):
         
         self._source_hash_type = HydrusTagArchive.hash_type_to_str_lookup[ self._hta.GetHashType() ]
         
-        self._iterator = self._hta.IterateMappings()
+        self._iterator = self._hta.IterateMappingsInChunks( chunk_size = 1024 )
         
     
 class MigrationSourceHTPA( MigrationSource ):
@@ -671,6 +721,131 @@ class MigrationSourceList( MigrationSource ):
         self._iterator = iter( self._data )
         
     
+class MigrationSourcePipeline( MigrationSource ):
+    
+    def __init__( self, controller, source, max_chunks_ahead = 4 ):
+        
+        MigrationSource.__init__( self, controller, source.GetName() )
+        
+        self._source = source
+        
+        self._chunks = queue.Queue( maxsize = max_chunks_ahead )
+        self._stop_event = threading.Event()
+        self._done_event = None
+        
+        self._next_data = None
+        self._error = None
+        
+    
+    def _PutChunk( self, chunk ):
+        
+        while not self._stop_event.is_set():
+            
+            try:
+                
+                self._chunks.put( chunk, timeout = 0.5 )
+                
+                return
+                
+            except queue.Full:
+                
+                continue
+                
+            
+        
+    
+    def _THREADReadSource( self ):
+        
+        # the source does all its work in this thread, since some of them hold sqlite connections
+        
+        try:
+            
+            self._source.Prepare()
+            
+            try:
+                
+                while self._source.StillWorkToDo() and not self._stop_event.is_set():
+                    
+                    data = self._source.GetSomeData()
+                    
+                    if len( data ) > 0:
+                        
+                        self._PutChunk( data )
+                        
+                    
+                
+            finally:
+                
+                self._source.CleanUp()
+                
+            
+        except Exception as e:
+            
+            self._error = e
+            
+        finally:
+            
+            self._PutChunk( None )
+            
+            self._done_event.set()
+            
+        
+    
+    def CleanUp( self ):
+        
+        self._stop_event.set()
+        
+        if self._done_event is not None:
+            
+            self._done_event.wait()
+            
+        
+    
+    def GetSomeData( self ):
+        
+        if not self.StillWorkToDo():
+            
+            return []
+            
+        
+        data = self._next_data
+        
+        self._next_data = None
+        
+        return data
+        
+    
+    def Prepare( self ):
+        
+        self._done_event = threading.Event()
+        
+        HG.client_controller.CallToThreadLongRunning( self._THREADReadSource )
+        
+    
+    def StillWorkToDo( self ):
+        
+        if self._next_data is None and self._work_to_do:
+            
+            data = self._chunks.get()
+            
+            if data is None:
+                
+                self._work_to_do = False
+                
+                if self._error is not None:
+                    
+                    raise self._error
+                    
+                
+            else:
+                
+                self._next_data = data
+                
+            
+        
+        return self._work_to_do
+        
+    
 class MigrationSourceTagServiceMappings( MigrationSource ):
     
     def __init__( self, controller, tag_service_key, file_service_key, desired_hash_type, hashes, tag_filter, content_statuses ):
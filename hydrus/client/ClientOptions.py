@@ -172,6 +172,10 @@ class ClientOptions( HydrusSerialisable.SerialisableBase ):
         self._dictionary[ 'booleans' ][ 'tag_display_maintenance_during_idle' ] = True
         self._dictionary[ 'booleans' ][ 'tag_display_maintenance_during_active' ] = True
         
+        self._dictionary[ 'booleans' ][ 'video_fast_downscale' ] = False
+        
+        self._dictionary[ 'booleans' ][ 'thumbnail_storage_packed' ] = False
+        
         self._dictionary[ 'booleans' ][ 'save_page_sort_on_change' ] = False
         
         self._dictionary[ 'booleans' ][ 'pause_all_new_network_traffic' ] = False
@@ -389,6 +393,13 @@ class ClientOptions( HydrusSerialisable.SerialisableBase ):
         self._dictionary[ 'integers' ][ 'file_maintenance_active_throttle_files' ] = 1
         self._dictionary[ 'integers' ][ 'file_maintenance_active_throttle_time_delta' ] = 20
         
+        self._dictionary[ 'integers' ][ 'file_maintenance_num_cpu_workers' ] = 2
+        self._dictionary[ 'integers' ][ 'file_maintenance_num_io_workers' ] = 4
+        
+        self._dictionary[ 'integers' ][ 'export_folder_num_copy_workers' ] = 2
+        
+        self._dictionary[ 'integers' ][ 'client_files_prefix_length' ] = 2
+        
         self._dictionary[ 'integers' ][ 'subscription_network_error_delay' ] = 12 * 3600
         self._dictionary[ 'integers' ][ 'subscription_other_error_delay' ] = 36 * 3600
         self._dictionary[ 'integers' ][ 'downloader_network_error_delay' ] = 90 * 60
@@ -1,6 +1,7 @@
 import base64
 import bs4
 import collections
+import copy
 import json
 import os
 import re
@@ -32,6 +33,7 @@ except ImportError:
 try:
     
     import lxml
+    import lxml.etree
     
     LXML_IS_OK = True
     
@@ -39,6 +41,24 @@ except ImportError:
     
     LXML_IS_OK = False
     
+
+# the compiled engine has to see the exact same tree as the soup, so it uses html5lib to build an lxml tree
+LXML_ENGINE_IS_OK = HTML5LIB_IS_OK and LXML_IS_OK
+
+# these are the attributes bs4 splits into lists of values
+HTML_MULTI_VALUED_ATTRIBUTES = bs4.builder.HTMLTreeBuilder.DEFAULT_CDATA_LIST_ATTRIBUTES
+
+# and these are the tags bs4 renders as '<br/>' when they have no contents
+HTML_EMPTY_ELEMENT_TAG_NAMES = bs4.builder.HTMLTreeBuilder.DEFAULT_EMPTY_ELEMENT_TAGS
+
+if LXML_ENGINE_IS_OK:
+    
+    LXML_REGEX_NAMESPACES = { 're' : 'http://exslt.org/regular-expressions' }
+    
+    # html5lib escapes xml-invalid names as 'U0003A' and so on
+    LXML_COERCED_NAMES_XPATH = lxml.etree.XPath( '//*[re:test( name(), "U[0-9A-F]{5}" )] | //@*[re:test( name(), "U[0-9A-F]{5}" )]', namespaces = LXML_REGEX_NAMESPACES )
+    LXML_COERCED_COMMENTS_XPATH = lxml.etree.XPath( '//comment()[contains( ., "- -" ) or re:test( ., "- $" )]', namespaces = LXML_REGEX_NAMESPACES )
+    
 def ConvertParseResultToPrettyString( result ):
     
     ( ( name, content_type, additional_info ), parsed_text ) = result
@@ -338,6 +358,344 @@ def GetHTMLTagString( tag: bs4.Tag ):
     
     return ''.join( all_strings )
     
+def GetLXMLDocument( html ):
+    
+    # this gives the lxml equivalent of the BeautifulSoup object, a document root with the <html> tag under it
+    
+    if not LXML_ENGINE_IS_OK:
+        
+        raise HydrusExceptions.ParseException( 'This client does not have access to both lxml and html5lib, so it cannot use the fast html parser.' )
+        
+    
+    if '\x0c' in html:
+        
+        raise HydrusExceptions.ParseException( 'This HTML has form feed characters, which lxml cannot hold.' )
+        
+    
+    try:
+        
+        html_node = html5lib.parse( html, treebuilder = 'lxml', namespaceHTMLElements = False ).getroot()
+        
+    except ValueError as e:
+        
+        # lxml will not take control characters and similar
+        
+        raise HydrusExceptions.ParseException( 'This HTML could not be held in lxml: {}'.format( e ) )
+        
+    
+    # html5lib quietly alters some things xml cannot hold. we want to be identical to the soup, so no dice
+    
+    if len( LXML_COERCED_NAMES_XPATH( html_node ) ) > 0 or len( LXML_COERCED_COMMENTS_XPATH( html_node ) ) > 0:
+        
+        raise HydrusExceptions.ParseException( 'This HTML had content that lxml could not hold unaltered.' )
+        
+    
+    return html_node.getroottree()
+    
+
+# html5lib treats these specially, so a copied subtree may not match how its rendered html would parse
+LXML_POST_DOCUMENT_UNSAFE_TAG_NAMES = {
+    'html', 'head', 'body', 'frameset', 'frame', 'template', 'script', 'style', 'noscript', 'textarea', 'title', 'plaintext', 'xmp', 'iframe', 'noembed', 'noframes', 'pre', 'listing',
+    'table', 'caption', 'colgroup', 'col', 'tbody', 'thead', 'tfoot', 'tr', 'td', 'th', 'select', 'option', 'optgroup', 'form'
+}
+
+# and these would go in the head if they were the post itself
+LXML_POST_DOCUMENT_UNSAFE_ROOT_TAG_NAMES = { 'base', 'basefont', 'bgsound', 'link', 'meta' }
+
+def GetLXMLPostDocument( node ):
+    
+    # a sub-page parser gets the rendered html of each post, newlines removed, and would otherwise parse it all over again
+    # this makes the document that parse would produce straight from the node we already have, or None if we can't be sure it would match
+    
+    if node.tag in LXML_POST_DOCUMENT_UNSAFE_ROOT_TAG_NAMES:
+        
+        return None
+        
+    
+    for sub_node in node.iter():
+        
+        if not isinstance( sub_node.tag, str ):
+            
+            continue
+            
+        
+        q_name = lxml.etree.QName( sub_node )
+        
+        if q_name.namespace is not None or q_name.localname in LXML_POST_DOCUMENT_UNSAFE_TAG_NAMES:
+            
+            return None
+            
+        
+    
+    node = copy.deepcopy( node )
+    
+    node.tail = None
+    
+    for sub_node in node.iter():
+        
+        if sub_node.text is not None:
+            
+            text = HydrusText.RemoveNewlines( sub_node.text )
+            
+            if isinstance( sub_node.tag, str ):
+                
+                sub_node.text = text if len( text ) > 0 else None
+                
+            else:
+                
+                # html5lib would split up a '--' to keep the comment xml-legal
+                
+                if '--' in text or text.endswith( '-' ):
+                    
+                    return None
+                    
+                
+                sub_node.text = text
+                
+            
+        
+        if sub_node.tail is not None:
+            
+            tail = HydrusText.RemoveNewlines( sub_node.tail )
+            
+            sub_node.tail = tail if len( tail ) > 0 else None
+            
+        
+        if isinstance( sub_node.tag, str ):
+            
+            for ( key, value ) in sub_node.attrib.items():
+                
+                # bs4 renders multi-valued attributes with single spaces
+                
+                multi_values = GetLXMLMultiValuedAttributeValues( sub_node, key )
+                
+                if multi_values is None:
+                    
+                    sub_node.set( key, HydrusText.RemoveNewlines( value ) )
+                    
+                else:
+                    
+                    sub_node.set( key, ' '.join( multi_values ) )
+                    
+                
+            
+        
+    
+    html_node = lxml.etree.Element( 'html' )
+    
+    lxml.etree.SubElement( html_node, 'head' )
+    
+    body_node = lxml.etree.SubElement( html_node, 'body' )
+    
+    body_node.append( node )
+    
+    return html_node.getroottree()
+    
+
+def GetLXMLNodeString( node ):
+    
+    # the lxml equivalent of GetHTMLTagString, which includes comment text
+    
+    strings = []
+    
+    AppendLXMLNodeStrings( node, strings )
+    
+    return ''.join( strings )
+    
+
+# bs4 does not escape the text in these when it renders them
+LXML_HTML_UNESCAPED_TAG_NAMES = { 'script', 'style' }
+
+# bs4 swaps the output encoding into meta charsets, and html5lib holds template contents apart from the template
+LXML_HTML_UNSAFE_TAG_NAMES = { 'meta', 'template' }
+
+def GetLXMLNodeHTML( node ):
+    
+    # the lxml equivalent of str( tag ), as bs4's default 'minimal' formatter renders it, or None if we can't be sure it would match
+    
+    strings = []
+    
+    if not AppendLXMLNodeHTML( node, strings ):
+        
+        return None
+        
+    
+    return ''.join( strings )
+    
+
+def AppendLXMLNodeHTML( node, strings ):
+    
+    if not isinstance( node.tag, str ):
+        
+        if node.tag is lxml.etree.Comment:
+            
+            strings.append( '<!--{}-->'.format( '' if node.text is None else node.text ) )
+            
+            return True
+            
+        
+        return False
+        
+    
+    q_name = lxml.etree.QName( node )
+    
+    if q_name.namespace is not None or q_name.localname in LXML_HTML_UNSAFE_TAG_NAMES:
+        
+        return False
+        
+    
+    tag_name = q_name.localname
+    
+    attribute_strings = []
+    
+    for key in sorted( node.attrib.keys() ):
+        
+        if key.startswith( '{' ):
+            
+            return False
+            
+        
+        multi_values = GetLXMLMultiValuedAttributeValues( node, key )
+        
+        if multi_values is None:
+            
+            value = node.get( key )
+            
+        else:
+            
+            value = ' '.join( multi_values )
+            
+        
+        attribute_strings.append( ' {}={}'.format( key, QuoteLXMLHTMLAttributeValue( EscapeLXMLHTMLText( value ) ) ) )
+        
+    
+    if len( node ) == 0 and node.text is None and tag_name in HTML_EMPTY_ELEMENT_TAG_NAMES:
+        
+        strings.append( '<{}{}/>'.format( tag_name, ''.join( attribute_strings ) ) )
+        
+        return True
+        
+    
+    strings.append( '<{}{}>'.format( tag_name, ''.join( attribute_strings ) ) )
+    
+    escape_text = tag_name not in LXML_HTML_UNESCAPED_TAG_NAMES
+    
+    if node.text is not None:
+        
+        strings.append( EscapeLXMLHTMLText( node.text ) if escape_text else node.text )
+        
+    
+    for child in node:
+        
+        if not AppendLXMLNodeHTML( child, strings ):
+            
+            return False
+            
+        
+        if child.tail is not None:
+            
+            strings.append( EscapeLXMLHTMLText( child.tail ) if escape_text else child.tail )
+            
+        
+    
+    strings.append( '</{}>'.format( tag_name ) )
+    
+    return True
+    
+
+def EscapeLXMLHTMLText( text ):
+    
+    return text.replace( '&', '&amp;' ).replace( '<', '&lt;' ).replace( '>', '&gt;' )
+    
+
+def QuoteLXMLHTMLAttributeValue( value ):
+    
+    # same quote choice as bs4
+    
+    if '"' in value:
+        
+        if "'" in value:
+            
+            return '"{}"'.format( value.replace( '"', '&quot;' ) )
+            
+        
+        return "'{}'".format( value )
+        
+    
+    return '"{}"'.format( value )
+    
+
+def AppendLXMLNodeStrings( node, strings ):
+    
+    if node.text is not None:
+        
+        strings.append( node.text )
+        
+    
+    for child in node:
+        
+        AppendLXMLNodeStrings( child, strings )
+        
+        if child.tail is not None:
+            
+            strings.append( child.tail )
+            
+        
+    
+
+def GetLXMLMultiValuedAttributeValues( node, attribute ):
+    
+    tag_name = lxml.etree.QName( node ).localname
+    
+    if attribute in HTML_MULTI_VALUED_ATTRIBUTES[ '*' ] or attribute in HTML_MULTI_VALUED_ATTRIBUTES.get( tag_name, () ):
+        
+        value = node.get( attribute )
+        
+        if value is None:
+            
+            return None
+            
+        
+        return re.findall( r'\S+', value )
+        
+    
+    return None
+    
+
+def LXMLNodeMatchesAttributes( node, attribute_tests ):
+    
+    # this replicates how bs4 matches attrs in find_all
+    
+    for ( key, value ) in attribute_tests:
+        
+        node_value = node.get( key )
+        
+        if node_value is None:
+            
+            return False
+            
+        
+        multi_values = GetLXMLMultiValuedAttributeValues( node, key )
+        
+        if multi_values is None:
+            
+            if node_value != value:
+                
+                return False
+                
+            
+        else:
+            
+            if value not in multi_values and ' '.join( multi_values ) != value:
+                
+                return False
+                
+            
+        
+    
+    return True
+    
+
 def GetNamespacesFromParsableContent( parsable_content ):
     
     content_type_to_additional_infos = HydrusData.BuildKeyToSetDict( ( ( content_type, additional_infos ) for ( name, content_type, additional_infos ) in parsable_content ) )
@@ -955,6 +1313,17 @@ class ParseFormulaHTML( ParseFormula ):
         
         return tags
         
+    def _FindLXMLNodes( self, document ):
+        
+        nodes = ( document, )
+        
+        for tag_rule in self._tag_rules:
+            
+            nodes = tag_rule.GetLXMLNodes( nodes )
+            
+        
+        return nodes
+        
     
     def _GetParsePrettySeparator( self ):
         
@@ -1019,6 +1388,67 @@ class ParseFormulaHTML( ParseFormula ):
         return result
         
     
+    def _GetRawTextFromLXMLNode( self, node ):
+        
+        if self._content_to_fetch == HTML_CONTENT_ATTRIBUTE:
+            
+            result = node.get( self._attribute_to_fetch )
+            
+            if result is None:
+                
+                raise HydrusExceptions.ParseException( 'Attribute ' + self._attribute_to_fetch + ' not found!' )
+                
+            
+            multi_values = GetLXMLMultiValuedAttributeValues( node, self._attribute_to_fetch )
+            
+            if multi_values is not None:
+                
+                if len( multi_values ) == 0:
+                    
+                    raise HydrusExceptions.ParseException( 'Attribute ' + self._attribute_to_fetch + ' not found!' )
+                    
+                
+                result = ' '.join( multi_values )
+                
+            
+        elif self._content_to_fetch == HTML_CONTENT_STRING:
+            
+            result = GetLXMLNodeString( node )
+            
+        else:
+            
+            raise HydrusExceptions.ParseException( 'The fast parser cannot fetch html!' )
+            
+        
+        if result is None or result == '':
+            
+            raise HydrusExceptions.ParseException( 'Empty/No results found!' )
+            
+        
+        return result
+        
+    
+    def _GetRawTextsFromLXMLNodes( self, nodes ):
+        
+        raw_texts = []
+        
+        for node in nodes:
+            
+            try:
+                
+                raw_text = self._GetRawTextFromLXMLNode( node )
+                
+                raw_texts.append( raw_text )
+                
+            except HydrusExceptions.ParseException:
+                
+                continue
+                
+            
+        
+        return raw_texts
+        
+    
     def _GetRawTextsFromTags( self, tags ):
         
         raw_texts = []
@@ -1040,6 +1470,18 @@ class ParseFormulaHTML( ParseFormula ):
         return raw_texts
         
     
+    def _GetSoup( self, parsing_text ):
+        
+        try:
+            
+            return HG.client_controller.parsing_cache.GetSoup( parsing_text )
+            
+        except Exception as e:
+            
+            raise HydrusExceptions.ParseException( 'Unable to parse that HTML: {}. HTML Sample: {}'.format( str( e ), parsing_text[:1024] ) )
+            
+        
+    
     def _GetSerialisableInfo( self ):
         
         serialisable_tag_rules = self._tag_rules.GetSerialisableTuple()
@@ -1058,17 +1500,87 @@ class ParseFormulaHTML( ParseFormula ):
         self._string_processor = HydrusSerialisable.CreateFromSerialisableTuple( serialisable_string_processor )
         
     
+    def _CanUseLXML( self ):
+        
+        # serialising html is done differently in bs4 and lxml, so that stays with the soup
+        
+        if not LXML_ENGINE_IS_OK or self._content_to_fetch == HTML_CONTENT_HTML or len( self._tag_rules ) == 0:
+            
+            return False
+            
+        
+        if self._content_to_fetch == HTML_CONTENT_ATTRIBUTE and ':' in self._attribute_to_fetch:
+            
+            return False
+            
+        
+        return False not in ( tag_rule.IsOKForLXML() for tag_rule in self._tag_rules )
+        
+    
+    def _CanSeedPostDocuments( self ):
+        
+        # posts for a sub-page parser. if we can find and render the same nodes in lxml, the page is only parsed once and the post documents can be copied rather than parsed again
+        
+        if not LXML_ENGINE_IS_OK or self._content_to_fetch != HTML_CONTENT_HTML or len( self._tag_rules ) == 0:
+            
+            return False
+            
+        
+        if len( self._string_processor.GetProcessingSteps() ) > 0:
+            
+            return False
+            
+        
+        return False not in ( tag_rule.IsOKForLXML() for tag_rule in self._tag_rules )
+        
+    
     def _ParseRawTexts( self, parsing_context, parsing_text ):
         
-        try:
+        if self._CanUseLXML():
             
-            root = HG.client_controller.parsing_cache.GetSoup( parsing_text )
+            document = HG.client_controller.parsing_cache.GetLXMLDocument( parsing_text )
             
-        except Exception as e:
+            if document is not None:
+                
+                return self._ParseRawTextsLXML( document )
+                
             
-            raise HydrusExceptions.ParseException( 'Unable to parse that HTML: {}. HTML Sample: {}'.format( str( e ), parsing_text[:1024] ) )
+        
+        if self._CanSeedPostDocuments():
+            
+            document = HG.client_controller.parsing_cache.GetLXMLDocument( parsing_text )
+            
+            if document is not None:
+                
+                nodes = self._FindLXMLNodes( document )
+                
+                raw_texts = [ GetLXMLNodeHTML( node ) for node in nodes ]
+                
+                if None not in raw_texts:
+                    
+                    self._SeedPostDocuments( nodes, raw_texts )
+                    
+                    return raw_texts
+                    
+                
             
         
+        return self._ParseRawTextsSoup( parsing_text )
+        
+    
+    def _ParseRawTextsLXML( self, document ):
+        
+        nodes = self._FindLXMLNodes( document )
+        
+        raw_texts = self._GetRawTextsFromLXMLNodes( nodes )
+        
+        return raw_texts
+        
+    
+    def _ParseRawTextsSoup( self, parsing_text ):
+        
+        root = self._GetSoup( parsing_text )
+        
         tags = self._FindHTMLTags( root )
         
         raw_texts = self._GetRawTextsFromTags( tags )
@@ -1076,6 +1588,21 @@ class ParseFormulaHTML( ParseFormula ):
         return raw_texts
         
     
+    def _SeedPostDocuments( self, nodes, raw_texts ):
+        
+        for ( node, raw_text ) in zip( nodes, raw_texts ):
+            
+            post_html = HydrusText.RemoveNewlines( raw_text )
+            
+            post_document = GetLXMLPostDocument( node )
+            
+            if post_document is not None:
+                
+                HG.client_controller.parsing_cache.AddLXMLDocument( post_html, post_document )
+                
+            
+        
+    
     def _UpdateSerialisableInfo( self, version, old_serialisable_info ):
         
         if version == 1:
@@ -1311,6 +1838,63 @@ class ParseRuleHTML( HydrusSerialisable.SerialisableBase ):
         self._should_test_tag_string = should_test_tag_string
         self._tag_string_string_match = tag_string_string_match
         
+        self._lxml_program = None
+        
+    
+    def _CompileLXMLProgram( self ):
+        
+        # we match bs4's find_all here. for most attributes that is a plain equality test we can do in xpath
+        # but bs4 splits multi-valued attributes like 'class' and matches any single value or the rejoined whole, so those are tested in python
+        
+        predicates = []
+        variables = {}
+        python_attribute_tests = []
+        
+        if self._tag_name is None:
+            
+            multi_valued_attributes = set().union( *HTML_MULTI_VALUED_ATTRIBUTES.values() )
+            
+        else:
+            
+            multi_valued_attributes = set( HTML_MULTI_VALUED_ATTRIBUTES[ '*' ] ).union( HTML_MULTI_VALUED_ATTRIBUTES.get( self._tag_name, () ) )
+            
+        
+        if self._tag_name is not None:
+            
+            predicates.append( '[local-name() = $tag_name]' )
+            
+            variables[ 'tag_name' ] = self._tag_name
+            
+        
+        for ( i, ( key, value ) ) in enumerate( self._tag_attributes.items() ):
+            
+            key_is_xpath_safe = re.match( r'^[A-Za-z_][\w\-\.]*$', key ) is not None
+            
+            if key in multi_valued_attributes or not key_is_xpath_safe:
+                
+                python_attribute_tests.append( ( key, value ) )
+                
+                if key_is_xpath_safe:
+                    
+                    # still cut down the candidates to those that have it at all
+                    
+                    predicates.append( '[@{}]'.format( key ) )
+                    
+                
+            else:
+                
+                variable_name = 'attribute_{}'.format( i )
+                
+                predicates.append( '[@{} = ${}]'.format( key, variable_name ) )
+                
+                variables[ variable_name ] = value
+                
+            
+        
+        xpath = lxml.etree.XPath( 'descendant::*' + ''.join( predicates ) )
+        document_xpath = lxml.etree.XPath( 'descendant-or-self::*' + ''.join( predicates ) )
+        
+        return ( xpath, document_xpath, variables, python_attribute_tests )
         
     
     def _GetSerialisableInfo( self ):
@@ -1326,6 +1910,8 @@ class ParseRuleHTML( HydrusSerialisable.SerialisableBase ):
         
         self._tag_string_string_match = HydrusSerialisable.CreateFromSerialisableTuple( serialisable_tag_string_string_match )
         
+        self._lxml_program = None
+        
     
     def _UpdateSerialisableInfo( self, version, old_serialisable_info ):
         
@@ -1438,6 +2024,110 @@ class ParseRuleHTML( HydrusSerialisable.SerialisableBase ):
         return new_nodes
         
     
+    def GetLXMLNodes( self, nodes ):
+        
+        # this should give exactly what GetNodes does on the equivalent soup
+        
+        new_nodes = []
+        
+        for node in nodes:
+            
+            if self._rule_type == HTML_RULE_TYPE_DESCENDING:
+                
+                if self._lxml_program is None:
+                    
+                    self._lxml_program = self._CompileLXMLProgram()
+                    
+                
+                ( xpath, document_xpath, variables, python_attribute_tests ) = self._lxml_program
+                
+                if isinstance( node, lxml.etree._ElementTree ):
+                    
+                    # the document itself, like the BeautifulSoup object, so the <html> tag is a descendant
+                    
+                    found_nodes = document_xpath( node.getroot(), **variables )
+                    
+                else:
+                    
+                    found_nodes = xpath( node, **variables )
+                    
+                
+                if len( python_attribute_tests ) > 0:
+                    
+                    found_nodes = [ found_node for found_node in found_nodes if LXMLNodeMatchesAttributes( found_node, python_attribute_tests ) ]
+                    
+                
+                if self._tag_index is not None:
+                    
+                    try:
+                        
+                        indexed_node = found_nodes[ self._tag_index ]
+                        
+                    except IndexError:
+                        
+                        continue
+                        
+                    
+                    found_nodes = [ indexed_node ]
+                    
+                
+            elif self._rule_type == HTML_RULE_TYPE_ASCENDING:
+                
+                found_nodes = []
+                
+                if isinstance( node, lxml.etree._ElementTree ):
+                    
+                    continue
+                    
+                
+                num_found = 0
+                
+                for potential_parent in node.iterancestors():
+                    
+                    if self._tag_name is None:
+                        
+                        num_found += 1
+                        
+                    else:
+                        
+                        if lxml.etree.QName( potential_parent ).localname == self._tag_name:
+                            
+                            num_found += 1
+                            
+                        
+                    
+                    if num_found == self._tag_depth:
+                        
+                        found_nodes = [ potential_parent ]
+                        
+                        break
+                        
+                    
+                
+            
+            new_nodes.extend( found_nodes )
+            
+        
+        if self._should_test_tag_string:
+            
+            new_nodes = [ node for node in new_nodes if self._tag_string_string_match.Matches( GetLXMLNodeString( node ) ) ]
+            
+        
+        return new_nodes
+        
+    
+    def IsOKForLXML( self ):
+        
+        # namespaced attributes are named differently in lxml and bs4
+        
+        if self._rule_type == HTML_RULE_TYPE_ASCENDING:
+            
+            return True
+            
+        
+        return True not in ( ':' in key for key in self._tag_attributes.keys() )
+        
+    
     def ToString( self ):
         
         if self._rule_type == HTML_RULE_TYPE_DESCENDING:
@@ -2078,6 +2768,11 @@ class ContentParser( HydrusSerialisable.SerialisableBase ):
             
         
     
+    def GetFormula( self ):
+        
+        return self._formula
+        
+    
     def GetName( self ):
         
         return self._name
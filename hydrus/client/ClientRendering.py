@@ -1,6 +1,7 @@
 import os
 import threading
 import time
+import typing
 
 from qtpy import QtCore as QC
 from qtpy import QtWidgets as QW
@@ -45,6 +46,12 @@ def GenerateHydrusBitmap( path, mime, compressed = True ):
     
     return GenerateHydrusBitmapFromNumPyImage( numpy_image, compressed = compressed )
     
+def GenerateHydrusBitmapFromBytes( image_bytes, mime, compressed = True ):
+    
+    numpy_image = ClientImageHandling.GenerateNumPyImageFromBytes( image_bytes, mime )
+    
+    return GenerateHydrusBitmapFromNumPyImage( numpy_image, compressed = compressed )
+    
 def GenerateHydrusBitmapFromNumPyImage( numpy_image, compressed = True ):
     
     ( y, x, depth ) = numpy_image.shape
@@ -372,15 +379,39 @@ class ImageRenderer( object ):
         return self._numpy_image is not None
         
     
+class DecoratedThumbnail( object ):
+    
+    def __init__( self, qt_image: QG.QImage ):
+        
+        self.qt_image = qt_image
+        
+        self._num_bytes = self.qt_image.width() * self.qt_image.height() * 3
+        
+    
+    def GetEstimatedMemoryFootprint( self ):
+        
+        return self._num_bytes
+        
+    
 class ImageTile( object ):
     
-    def __init__( self, hash: bytes, clip_rect: QC.QRect, qt_pixmap: QG.QPixmap ):
+    def __init__( self, hash: bytes, clip_rect: QC.QRect, qt_pixmap: typing.Optional[ QG.QPixmap ] = None, qt_image: typing.Optional[ QG.QImage ] = None ):
         
         self.hash = hash
         self.clip_rect = clip_rect
         self.qt_pixmap = qt_pixmap
         
-        self._num_bytes = self.qt_pixmap.width() * self.qt_pixmap.height() * 3
+        # pixmaps can only be made in the Qt thread, so a tile rendered in the background holds a QImage until it is first drawn
+        self._qt_image = qt_image
+        
+        if self.qt_pixmap is None:
+            
+            self._num_bytes = self._qt_image.width() * self._qt_image.height() * 3
+            
+        else:
+            
+            self._num_bytes = self.qt_pixmap.width() * self.qt_pixmap.height() * 3
+            
         
     
     def GetEstimatedMemoryFootprint( self ):
@@ -388,6 +419,18 @@ class ImageTile( object ):
         return self._num_bytes
         
     
+    def GetQtPixmap( self ) -> QG.QPixmap:
+        
+        if self.qt_pixmap is None:
+            
+            self.qt_pixmap = QG.QPixmap.fromImage( self._qt_image )
+            
+            self._qt_image = None
+            
+        
+        return self.qt_pixmap
+        
+    
 class RasterContainer( object ):
     
     def __init__( self, media, target_resolution = None ):
@@ -552,7 +595,28 @@ class RasterContainerVideo( RasterContainer ):
             
         else:
             
-            self._renderer = HydrusVideoHandling.VideoRendererFFMPEG( self._path, mime, duration, num_frames_in_video, self._target_resolution )
+            keyframe_timestamps = None
+            
+            if mime in HC.VIDEO:
+                
+                try:
+                    
+                    keyframe_timestamps = HG.client_controller.Read( 'video_keyframe_timestamps', hash )
+                    
+                except Exception as e:
+                    
+                    HydrusData.PrintException( e, do_wait = False )
+                    
+                
+            
+            ( media_width, media_height ) = self._media.GetResolution()
+            ( target_width, target_height ) = self._target_resolution
+            
+            we_are_downscaling = target_width < media_width or target_height < media_height
+            
+            fast_scale = we_are_downscaling and HG.client_controller.new_options.GetBoolean( 'video_fast_downscale' )
+            
+            self._renderer = HydrusVideoHandling.VideoRendererFFMPEG( self._path, mime, duration, num_frames_in_video, self._target_resolution, keyframe_timestamps = keyframe_timestamps, fast_scale = fast_scale )
             
         
         # give ui a chance to draw a blank frame rather than hard-charge right into CPUland
@@ -258,6 +258,29 @@ class NumberTest( HydrusSerialisable.SerialisableBase ):
             
         
     
+    def GetSQLitePredicates( self, variable_name ):
+        
+        if self.operator == NUMBER_TEST_OPERATOR_LESS_THAN:
+            
+            return [ '{} < {}'.format( variable_name, self.value ) ]
+            
+        elif self.operator == NUMBER_TEST_OPERATOR_GREATER_THAN:
+            
+            return [ '{} > {}'.format( variable_name, self.value ) ]
+            
+        elif self.operator == NUMBER_TEST_OPERATOR_EQUAL:
+            
+            return [ '{} = {}'.format( variable_name, self.value ) ]
+            
+        elif self.operator == NUMBER_TEST_OPERATOR_APPROXIMATE:
+            
+            lower = self.value * 0.85
+            upper = self.value * 1.15
+            
+            return [ '{} > {}'.format( variable_name, lower ), '{} < {}'.format( variable_name, upper ) ]
+            
+        
+    
     def IsAnythingButZero( self ):
         
         return self.operator == NUMBER_TEST_OPERATOR_GREATER_THAN and self.value == 0
@@ -0,0 +1,492 @@
+import mmap
+import os
+import sqlite3
+import struct
+import threading
+
+from hydrus.core import HydrusData
+from hydrus.core import HydrusExceptions
+from hydrus.core import HydrusPaths
+
+# a thumbnail pack replaces the thousands of tiny .thumbnail files in a t?? folder with a handful of big append-only segment files and a little sqlite index
+# each record in a segment is ( hash, length, bytes ), so the index can always be rebuilt from the segments if it goes wrong
+
+THUMBNAIL_PACK_FILENAME_PREFIX = 'thumbnails'
+THUMBNAIL_PACK_INDEX_FILENAME = 'thumbnails.db'
+THUMBNAIL_PACK_SEGMENT_EXT = '.pack'
+
+THUMBNAIL_PACK_MAX_SEGMENT_SIZE = 64 * 1048576
+
+THUMBNAIL_PACK_COMPACTION_DEAD_RATIO = 0.5
+
+THUMBNAIL_PACK_RECORD_HEADER = struct.Struct( '>32sI' )
+
+def DeleteThumbnailPackFiles( directory, filenames_to_keep = () ):
+    
+    for filename in GetThumbnailPackFilenames( directory ):
+        
+        if filename not in filenames_to_keep:
+            
+            HydrusPaths.DeletePath( os.path.join( directory, filename ) )
+            
+        
+    
+def DirectoryHasThumbnailPack( directory ):
+    
+    return os.path.exists( os.path.join( directory, THUMBNAIL_PACK_INDEX_FILENAME ) )
+    
+def GetThumbnailPackDataFilenames( directory ):
+    
+    # just the index and the segments, no journals
+    
+    return [ filename for filename in GetThumbnailPackFilenames( directory ) if filename == THUMBNAIL_PACK_INDEX_FILENAME or filename.endswith( THUMBNAIL_PACK_SEGMENT_EXT ) ]
+    
+def GetThumbnailPackFilenames( directory ):
+    
+    if not os.path.exists( directory ):
+        
+        return []
+        
+    
+    return [ filename for filename in os.listdir( directory ) if IsThumbnailPackFilename( filename ) ]
+    
+def IsThumbnailPackFilename( filename ):
+    
+    # hex hashes never start with 't', so this is safe to test against everything in a t?? folder
+    
+    return filename.startswith( THUMBNAIL_PACK_FILENAME_PREFIX )
+    
+class ThumbnailPack( object ):
+    
+    def __init__( self, directory ):
+        
+        self._directory = directory
+        
+        self._lock = threading.Lock()
+        
+        self._db = None
+        
+        self._segment_ids_to_mmaps = {}
+        
+        self._active_segment_id = None
+        self._active_segment_file = None
+        self._active_segment_size = 0
+        
+    
+    def _AppendRecord( self, hash, thumbnail_bytes ):
+        
+        if self._active_segment_file is None or self._active_segment_size >= THUMBNAIL_PACK_MAX_SEGMENT_SIZE:
+            
+            self._StartNewSegment()
+            
+        
+        header = THUMBNAIL_PACK_RECORD_HEADER.pack( hash, len( thumbnail_bytes ) )
+        
+        offset = self._active_segment_size + len( header )
+        
+        self._active_segment_file.write( header )
+        self._active_segment_file.write( thumbnail_bytes )
+        
+        self._active_segment_size += len( header ) + len( thumbnail_bytes )
+        
+        return ( self._active_segment_id, offset, len( thumbnail_bytes ) )
+        
+    
+    def _CloseSegmentMMap( self, segment_id ):
+        
+        if segment_id in self._segment_ids_to_mmaps:
+            
+            self._segment_ids_to_mmaps[ segment_id ].close()
+            
+            del self._segment_ids_to_mmaps[ segment_id ]
+            
+        
+    
+    def _GenerateSegmentPath( self, segment_id ):
+        
+        return os.path.join( self._directory, '{}_{:05}{}'.format( THUMBNAIL_PACK_FILENAME_PREFIX, segment_id, THUMBNAIL_PACK_SEGMENT_EXT ) )
+        
+    
+    def _GetDB( self ):
+        
+        if self._db is None:
+            
+            path = os.path.join( self._directory, THUMBNAIL_PACK_INDEX_FILENAME )
+            
+            self._db = sqlite3.connect( path, isolation_level = None, check_same_thread = False )
+            
+            self._db.execute( 'CREATE TABLE IF NOT EXISTS thumbnails ( hash BLOB_BYTES PRIMARY KEY, segment_id INTEGER, offset INTEGER, length INTEGER ) WITHOUT ROWID;' )
+            
+        
+        return self._db
+        
+    
+    def _GetExistingSegmentIds( self ):
+        
+        segment_ids = []
+        
+        for filename in os.listdir( self._directory ):
+            
+            if IsThumbnailPackFilename( filename ) and filename.endswith( THUMBNAIL_PACK_SEGMENT_EXT ):
+                
+                try:
+                    
+                    segment_ids.append( int( filename[ len( THUMBNAIL_PACK_FILENAME_PREFIX ) + 1 : - len( THUMBNAIL_PACK_SEGMENT_EXT ) ] ) )
+                    
+                except ValueError:
+                    
+                    continue
+                    
+                
+            
+        
+        segment_ids.sort()
+        
+        return segment_ids
+        
+    
+    def _GetSegmentMMap( self, segment_id, needed_length ):
+        
+        if segment_id in self._segment_ids_to_mmaps:
+            
+            segment_mmap = self._segment_ids_to_mmaps[ segment_id ]
+            
+            if len( segment_mmap ) >= needed_length:
+                
+                return segment_mmap
+                
+            
+            # the active segment has grown since we mapped it
+            
+            self._CloseSegmentMMap( segment_id )
+            
+        
+        path = self._GenerateSegmentPath( segment_id )
+        
+        if not os.path.exists( path ):
+            
+            raise HydrusExceptions.FileMissingException( 'The thumbnail pack segment {} was not found!'.format( path ) )
+            
+        
+        with open( path, 'rb' ) as f:
+            
+            segment_mmap = mmap.mmap( f.fileno(), 0, access = mmap.ACCESS_READ )
+            
+        
+        if len( segment_mmap ) < needed_length:
+            
+            segment_mmap.close()
+            
+            raise HydrusExceptions.FileMissingException( 'The thumbnail pack segment {} was truncated!'.format( path ) )
+            
+        
+        self._segment_ids_to_mmaps[ segment_id ] = segment_mmap
+        
+        return segment_mmap
+        
+    
+    def _InitialiseActiveSegment( self ):
+        
+        if self._active_segment_file is not None:
+            
+            return
+            
+        
+        segment_ids = self._GetExistingSegmentIds()
+        
+        if len( segment_ids ) == 0:
+            
+            self._StartNewSegment()
+            
+        else:
+            
+            self._OpenActiveSegment( segment_ids[-1] )
+            
+        
+    
+    def _OpenActiveSegment( self, segment_id ):
+        
+        if self._active_segment_file is not None:
+            
+            self._active_segment_file.close()
+            
+        
+        path = self._GenerateSegmentPath( segment_id )
+        
+        self._active_segment_file = open( path, 'ab' )
+        self._active_segment_id = segment_id
+        self._active_segment_size = self._active_segment_file.tell()
+        
+    
+    def _ReadRecord( self, segment_id, offset, length ):
+        
+        segment_mmap = self._GetSegmentMMap( segment_id, offset + length )
+        
+        return segment_mmap[ offset : offset + length ]
+        
+    
+    def _StartNewSegment( self ):
+        
+        segment_ids = self._GetExistingSegmentIds()
+        
+        if len( segment_ids ) == 0:
+            
+            segment_id = 0
+            
+        else:
+            
+            segment_id = segment_ids[-1] + 1
+            
+        
+        self._OpenActiveSegment( segment_id )
+        
+    
+    def AddThumbnails( self, rows ):
+        
+        with self._lock:
+            
+            self._InitialiseActiveSegment()
+            
+            # data goes to disk before the index points at it, so a crash at worst leaves some dead bytes for compaction to clear up
+            
+            index_rows = [ ( hash, ) + self._AppendRecord( hash, thumbnail_bytes ) for ( hash, thumbnail_bytes ) in rows ]
+            
+            self._active_segment_file.flush()
+            
+            db = self._GetDB()
+            
+            db.execute( 'BEGIN IMMEDIATE;' )
+            
+            db.executemany( 'REPLACE INTO thumbnails ( hash, segment_id, offset, length ) VALUES ( ?, ?, ?, ? );', index_rows )
+            
+            db.execute( 'COMMIT;' )
+            
+        
+    
+    def BackupTo( self, dest_directory ):
+        
+        # appends and compaction both hold the lock, so the index snapshot and the segments we copy here agree with each other
+        # this blocks thumbnail reads for this one folder while it works, but the mirror only copies segments that changed
+        
+        with self._lock:
+            
+            filenames_to_keep = set()
+            
+            if DirectoryHasThumbnailPack( self._directory ):
+                
+                HydrusPaths.MakeSureDirectoryExists( dest_directory )
+                
+                dest_db = sqlite3.connect( os.path.join( dest_directory, THUMBNAIL_PACK_INDEX_FILENAME ) )
+                
+                try:
+                    
+                    self._GetDB().backup( dest_db )
+                    
+                finally:
+                    
+                    dest_db.close()
+                    
+                
+                filenames_to_keep.add( THUMBNAIL_PACK_INDEX_FILENAME )
+                
+                for segment_id in self._GetExistingSegmentIds():
+                    
+                    source = self._GenerateSegmentPath( segment_id )
+                    
+                    filename = os.path.basename( source )
+                    
+                    HydrusPaths.MirrorFile( source, os.path.join( dest_directory, filename ) )
+                    
+                    filenames_to_keep.add( filename )
+                    
+                
+            
+            # compaction deletes segments, so the backup has to lose them too
+            
+            DeleteThumbnailPackFiles( dest_directory, filenames_to_keep = filenames_to_keep )
+            
+        
+    
+    def Close( self ):
+        
+        with self._lock:
+            
+            for segment_id in list( self._segment_ids_to_mmaps.keys() ):
+                
+                self._CloseSegmentMMap( segment_id )
+                
+            
+            if self._active_segment_file is not None:
+                
+                self._active_segment_file.close()
+                
+                self._active_segment_file = None
+                self._active_segment_id = None
+                self._active_segment_size = 0
+                
+            
+            if self._db is not None:
+                
+                self._db.close()
+                
+                self._db = None
+                
+            
+        
+    
+    def Compact( self, stop_hook = None ):
+        
+        # rewrites segments that are mostly dead records (regenerated or deleted thumbnails) into the active segment and then deletes them
+        
+        num_segments_compacted = 0
+        
+        with self._lock:
+            
+            self._InitialiseActiveSegment()
+            
+            db = self._GetDB()
+            
+            segment_ids_to_live_bytes = { segment_id : live_bytes for ( segment_id, live_bytes ) in db.execute( 'SELECT segment_id, SUM( length ) + COUNT( * ) * ? FROM thumbnails GROUP BY segment_id;', ( THUMBNAIL_PACK_RECORD_HEADER.size, ) ) }
+            
+            segment_ids_to_compact = []
+            
+            for segment_id in self._GetExistingSegmentIds():
+                
+                if segment_id == self._active_segment_id:
+                    
+                    size = self._active_segment_size
+                    
+                else:
+                    
+                    size = os.path.getsize( self._GenerateSegmentPath( segment_id ) )
+                    
+                
+                if size == 0:
+                    
+                    continue
+                    
+                
+                live_bytes = segment_ids_to_live_bytes.get( segment_id, 0 )
+                
+                if ( size - live_bytes ) / size >= THUMBNAIL_PACK_COMPACTION_DEAD_RATIO:
+                    
+                    segment_ids_to_compact.append( segment_id )
+                    
+                
+            
+            if self._active_segment_id in segment_ids_to_compact:
+                
+                self._StartNewSegment()
+                
+            
+            for segment_id in segment_ids_to_compact:
+                
+                if stop_hook is not None and stop_hook():
+                    
+                    break
+                    
+                
+                rows = db.execute( 'SELECT hash, offset, length FROM thumbnails WHERE segment_id = ?;', ( segment_id, ) ).fetchall()
+                
+                for block_of_rows in HydrusData.SplitListIntoChunks( rows, 256 ):
+                    
+                    index_rows = []
+                    
+                    for ( hash, offset, length ) in block_of_rows:
+                        
+                        thumbnail_bytes = self._ReadRecord( segment_id, offset, length )
+                        
+                        index_rows.append( ( hash, ) + self._AppendRecord( hash, thumbnail_bytes ) )
+                        
+                    
+                    self._active_segment_file.flush()
+                    
+                    db.execute( 'BEGIN IMMEDIATE;' )
+                    
+                    db.executemany( 'REPLACE INTO thumbnails ( hash, segment_id, offset, length ) VALUES ( ?, ?, ?, ? );', index_rows )
+                    
+                    db.execute( 'COMMIT;' )
+                    
+                
+                self._CloseSegmentMMap( segment_id )
+                
+                HydrusPaths.DeletePath( self._GenerateSegmentPath( segment_id ) )
+                
+                num_segments_compacted += 1
+                
+            
+        
+        return num_segments_compacted
+        
+    
+    def DeleteThumbnail( self, hash ):
+        
+        with self._lock:
+            
+            db = self._GetDB()
+            
+            result = db.execute( 'SELECT 1 FROM thumbnails WHERE hash = ?;', ( sqlite3.Binary( hash ), ) ).fetchone()
+            
+            db.execute( 'DELETE FROM thumbnails WHERE hash = ?;', ( sqlite3.Binary( hash ), ) )
+            
+            return result is not None
+            
+        
+    
+    def GetHashes( self ):
+        
+        with self._lock:
+            
+            return [ hash for ( hash, ) in self._GetDB().execute( 'SELECT hash FROM thumbnails;' ) ]
+            
+        
+    
+    def GetNumThumbnails( self ):
+        
+        with self._lock:
+            
+            ( count, ) = self._GetDB().execute( 'SELECT COUNT( * ) FROM thumbnails;' ).fetchone()
+            
+            return count
+            
+        
+    
+    def GetThumbnailBytes( self, hash ):
+        
+        with self._lock:
+            
+            result = self._GetDB().execute( 'SELECT segment_id, offset, length FROM thumbnails WHERE hash = ?;', ( sqlite3.Binary( hash ), ) ).fetchone()
+            
+            if result is None:
+                
+                raise HydrusExceptions.FileMissingException( 'The thumbnail for file {} was not in its pack!'.format( hash.hex() ) )
+                
+            
+            ( segment_id, offset, length ) = result
+            
+            return self._ReadRecord( segment_id, offset, length )
+            
+        
+    
+    def HasThumbnail( self, hash ):
+        
+        with self._lock:
+            
+            result = self._GetDB().execute( 'SELECT 1 FROM thumbnails WHERE hash = ?;', ( sqlite3.Binary( hash ), ) ).fetchone()
+            
+            return result is not None
+            
+        
+    
+    def Obliterate( self ):
+        
+        # only call this once everything has been unpacked!
+        
+        self.Close()
+        
+        with self._lock:
+            
+            DeleteThumbnailPackFiles( self._directory )
+            
+        
+    
@@ -18,6 +18,7 @@ from hydrus.core import HydrusDB
 from hydrus.core import HydrusDBBase
 from hydrus.core import HydrusExceptions
 from hydrus.core import HydrusGlobals as HG
+from hydrus.core import HydrusIntegerSets
 from hydrus.core import HydrusPaths
 from hydrus.core import HydrusSerialisable
 from hydrus.core import HydrusTags
@@ -155,6 +156,32 @@ from hydrus.client.networking import ClientNetworkingBandwidthLegacy
 #▒▒▒▒▒▒▒▒▒▒▒▒▒▒▒▒▒▒▒▒▒▒▒▒▒▒▒▒▒▒▒▒▒▒▒▒▒▓▓██▓▓▓▒▒▓▓▓▓▒▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▒▒▒▒▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▓▒▒▒▓▓        ▒░▓░  ░░ ▒▓▒▒▒▒▒▒
 #▒▒▒▒▒▒▒▒▒▒▒▒▒▒▒▒▒▒▒▒▒▒▒▒▒▒▒▒▒▒▒▒▒▒▒▒▒░░░░▒▒░░▓▓▒▓▓▓▒▒▒▒▒▒▒▒▒▒▒▒▒▒▓▒▒▒▒▒▒▒▒▒▒▒▒▒▒▒▒▓▓▓▓▓  ░▒▒▒▒       ▓████▒     ▒▒▒▒▒▒▒▒
 
+# an incremental file backup misses regenerated thumbnails and manual moves, so every so often we walk the whole tree
+BACKUP_FULL_FILES_MIRROR_PERIOD = 86400 * 30
+
+# a limited search can walk one of these in sort order and stop early
+TOP_K_SORT_COLUMNS = {
+    CC.SORT_FILES_BY_FILESIZE : 'size',
+    CC.SORT_FILES_BY_DURATION : 'duration',
+    CC.SORT_FILES_BY_WIDTH : 'width',
+    CC.SORT_FILES_BY_HEIGHT : 'height',
+    CC.SORT_FILES_BY_NUM_FRAMES : 'num_frames'
+}
+
+# these are all files_info tests, which are cheap to do on a small batch of files
+TOP_K_SIMPLE_PREDICATE_KEYS = {
+    'min_size', 'size', 'not_size', 'max_size',
+    'mimes', 'has_audio',
+    'min_width', 'width', 'not_width', 'max_width',
+    'min_height', 'height', 'not_height', 'max_height',
+    'min_num_pixels', 'num_pixels', 'not_num_pixels', 'max_num_pixels',
+    'min_ratio', 'ratio', 'not_ratio', 'max_ratio',
+    'min_num_words', 'num_words', 'not_num_words', 'max_num_words',
+    'min_duration', 'duration', 'not_duration', 'max_duration',
+    'min_framerate', 'framerate', 'not_framerate', 'max_framerate',
+    'min_num_frames', 'num_frames', 'not_num_frames', 'max_num_frames'
+}
+
 def BlockingSafeShowMessage( message ):
     
     HydrusData.DebugPrint( message )
@@ -275,7 +302,7 @@ class JobDatabaseClient( HydrusData.JobDatabase ):
     
 class DB( HydrusDB.HydrusDB ):
     
-    READ_WRITE_ACTIONS = [ 'service_info', 'system_predicates', 'missing_thumbnail_hashes' ]
+    READ_WRITE_ACTIONS = [ 'service_info', 'system_predicates', 'missing_thumbnail_hashes', 'duplicate_pairs_for_filtering_from_queue', 'client_files_locations' ]
     
     def __init__( self, controller, db_dir, db_name ):
         
@@ -289,6 +316,8 @@ class DB( HydrusDB.HydrusDB ):
         self._regen_tags_managers_hash_ids = set()
         self._regen_tags_managers_tag_ids = set()
         
+        self._online_backup_running = False
+        
         HydrusDB.HydrusDB.__init__( self, controller, db_dir, db_name )
         
     
@@ -353,6 +382,8 @@ class DB( HydrusDB.HydrusDB ):
                 
                 self.modules_hashes_local_cache.AddHashIdsToCache( new_hash_ids )
                 
+                self._controller.known_content_filter_manager.AddHashes( self.modules_hashes_local_cache.GetHashes( new_hash_ids ) )
+                
             
             # if adding an update file, repo manager wants to know
             
@@ -488,6 +519,18 @@ class DB( HydrusDB.HydrusDB ):
     
     def _Backup( self, path ):
         
+        if self._CanDoOnlineBackup():
+            
+            self._BackupOnline( path )
+            
+        else:
+            
+            self._BackupOffline( path )
+            
+        
+    
+    def _BackupOffline( self, path ):
+        
         self._CloseDBConnection()
         
         try:
@@ -546,6 +589,11 @@ class DB( HydrusDB.HydrusDB ):
                 
                 HydrusPaths.MirrorTree( client_files_default, os.path.join( path, 'client_files' ), text_update_hook = text_update_hook, is_cancelled_hook = is_cancelled_hook )
                 
+                if not job_key.IsCancelled():
+                    
+                    self._controller.client_files_manager.BackupThumbnailPacks( client_files_default, os.path.join( path, 'client_files' ) )
+                    
+                
             
         finally:
             
@@ -557,6 +605,216 @@ class DB( HydrusDB.HydrusDB ):
             
         
     
+    def _BackupOnline( self, path ):
+        
+        if self._online_backup_running:
+            
+            HydrusData.ShowText( 'A backup is already running!' )
+            
+            return
+            
+        
+        job_key = ClientThreading.JobKey( cancellable = True )
+        
+        job_key.SetStatusTitle( 'backing up db' )
+        
+        self._controller.pub( 'modal_message', job_key )
+        
+        job_key.SetVariable( 'popup_text_1', 'preparing backup' )
+        
+        HydrusPaths.MakeSureDirectoryExists( path )
+        
+        manifest = HydrusDB.ReadBackupManifest( path )
+        
+        previous_db_change_tokens = manifest.get( 'db_change_tokens', {} )
+        
+        db_change_tokens = self._GetDBChangeTokens()
+        
+        names_to_backup = []
+        
+        for ( name, filename ) in self._db_filenames.items():
+            
+            db_change_token = db_change_tokens[ filename ]
+            
+            if db_change_token is None or db_change_token != previous_db_change_tokens.get( filename, None ) or not os.path.exists( os.path.join( path, filename ) ):
+                
+                names_to_backup.append( name )
+                
+            
+        
+        # the db knows what was added and deleted since the last backup, so we only need to walk the whole file store now and then
+        
+        client_files_default = os.path.join( self._db_dir, 'client_files' )
+        client_files_backup = os.path.join( path, 'client_files' )
+        
+        now = HydrusData.GetNow()
+        
+        last_files_timestamp = manifest.get( 'files_timestamp', None )
+        last_full_files_timestamp = manifest.get( 'full_files_timestamp', None )
+        
+        do_full_files_mirror = last_files_timestamp is None or last_full_files_timestamp is None or HydrusData.TimeHasPassed( last_full_files_timestamp + BACKUP_FULL_FILES_MIRROR_PERIOD ) or not os.path.exists( client_files_backup )
+        
+        if do_full_files_mirror:
+            
+            added_relative_paths = []
+            deleted_relative_paths = []
+            
+        else:
+            
+            added_hash_ids = self.modules_files_storage.GetCurrentHashIdsAddedSince( self.modules_services.combined_local_file_service_id, last_files_timestamp )
+            deleted_hash_ids = self.modules_files_storage.GetDeletedHashIdsDeletedSince( self.modules_services.combined_local_file_service_id, last_files_timestamp )
+            
+            added_relative_paths = self._GetBackupFileRelativePaths( added_hash_ids )
+            deleted_relative_paths = self._GetBackupFileRelativePaths( deleted_hash_ids )
+            
+        
+        try:
+            
+            online_backup = HydrusDB.OnlineBackup( self._db_dir, self._db_filenames )
+            
+        except:
+            
+            job_key.SetVariable( 'popup_text_1', 'could not start the backup!' )
+            
+            job_key.Finish()
+            
+            raise
+            
+        
+        self._online_backup_running = True
+        
+        def is_cancelled_hook():
+            
+            return job_key.IsCancelled() or HG.started_shutdown
+            
+        
+        def text_update_hook( text ):
+            
+            job_key.SetVariable( 'popup_text_1', text )
+            
+        
+        def do_it():
+            
+            try:
+                
+                for name in names_to_backup:
+                    
+                    filename = self._db_filenames[ name ]
+                    
+                    online_backup.BackupDB( name, os.path.join( path, filename ), text_update_hook = text_update_hook, is_cancelled_hook = is_cancelled_hook )
+                    
+                    previous_db_change_tokens[ filename ] = db_change_tokens[ filename ]
+                    
+                    manifest[ 'db_change_tokens' ] = previous_db_change_tokens
+                    
+                    HydrusDB.WriteBackupManifest( path, manifest )
+                    
+                
+                online_backup.Close()
+                
+                for additional_filename in self._GetPossibleAdditionalDBFilenames():
+                    
+                    source = os.path.join( self._db_dir, additional_filename )
+                    dest = os.path.join( path, additional_filename )
+                    
+                    if os.path.exists( source ):
+                        
+                        HydrusPaths.MirrorFile( source, dest )
+                        
+                    
+                
+                if os.path.exists( client_files_default ):
+                    
+                    if do_full_files_mirror:
+                        
+                        HydrusPaths.MirrorTree( client_files_default, client_files_backup, text_update_hook = text_update_hook, is_cancelled_hook = is_cancelled_hook )
+                        
+                    else:
+                        
+                        pauser = HydrusData.BigJobPauser()
+                        
+                        for ( i, relative_path ) in enumerate( added_relative_paths ):
+                            
+                            if is_cancelled_hook():
+                                
+                                raise HydrusExceptions.CancelledException( 'Backup cancelled!' )
+                                
+                            
+                            if i % 100 == 0:
+                                
+                                text_update_hook( 'copying new files: {}'.format( HydrusData.ConvertValueRangeToPrettyString( i, len( added_relative_paths ) ) ) )
+                                
+                            
+                            pauser.Pause()
+                            
+                            source = os.path.join( client_files_default, relative_path )
+                            dest = os.path.join( client_files_backup, relative_path )
+                            
+                            # files in other locations are not part of the backup, and a file may have been deleted since we looked
+                            
+                            if os.path.exists( source ):
+                                
+                                HydrusPaths.MakeSureDirectoryExists( os.path.dirname( dest ) )
+                                
+                                HydrusPaths.MirrorFile( source, dest )
+                                
+                            
+                        
+                        text_update_hook( 'removing deleted files' )
+                        
+                        for relative_path in deleted_relative_paths:
+                            
+                            pauser.Pause()
+                            
+                            dest = os.path.join( client_files_backup, relative_path )
+                            
+                            if os.path.exists( dest ):
+                                
+                                HydrusPaths.DeletePath( dest )
+                                
+                            
+                        
+                    
+                    # thumbnail packs change in place while we work, so they get a consistent copy of their own. after a full mirror, this tidies up whatever it caught mid-write
+                    
+                    text_update_hook( 'copying thumbnail packs' )
+                    
+                    self._controller.client_files_manager.BackupThumbnailPacks( client_files_default, client_files_backup, is_cancelled_hook = is_cancelled_hook )
+                    
+                    if is_cancelled_hook():
+                        
+                        raise HydrusExceptions.CancelledException( 'Backup cancelled!' )
+                        
+                    
+                    manifest[ 'files_timestamp' ] = now
+                    
+                    if do_full_files_mirror:
+                        
+                        manifest[ 'full_files_timestamp' ] = now
+                        
+                    
+                    HydrusDB.WriteBackupManifest( path, manifest )
+                    
+                
+                job_key.SetVariable( 'popup_text_1', 'backup complete!' )
+                
+            except HydrusExceptions.CancelledException:
+                
+                job_key.SetVariable( 'popup_text_1', 'backup cancelled' )
+                
+            finally:
+                
+                online_backup.Close()
+                
+                self._online_backup_running = False
+                
+                job_key.Finish()
+                
+            
+        
+        self._controller.CallToThread( do_it )
+        
+    
     def _CacheCombinedFilesDisplayMappingsAddImplications( self, tag_service_id, implication_tag_ids, tag_id, status_hook = None ):
         
         if len( implication_tag_ids ) == 0:
@@ -2372,6 +2630,11 @@ class DB( HydrusDB.HydrusDB ):
                 
                 num_new_deleted_files = self.modules_files_storage.RecordDeleteFiles( service_id, insert_rows )
                 
+                if service_id == self.modules_services.combined_local_file_service_id:
+                    
+                    self._controller.known_content_filter_manager.AddHashes( self.modules_hashes_local_cache.GetHashes( deletee_hash_ids ) )
+                    
+                
                 service_info_updates.append( ( num_new_deleted_files, service_id, HC.SERVICE_INFO_NUM_DELETED_FILES ) )
                 
             
@@ -2844,6 +3107,56 @@ class DB( HydrusDB.HydrusDB ):
             result = self._Execute( 'SELECT DISTINCT smaller_media_id, larger_media_id, distance FROM {} LIMIT 2500;'.format( table_join ) ).fetchall()
             
         
+        ( batch_of_pairs_of_media_ids, batch_of_pairs_of_hashes ) = self._DuplicatesGetPotentialDuplicatePairsBatch( result, db_location_context, allowed_hash_ids, preferred_hash_ids )
+        
+        return batch_of_pairs_of_hashes
+        
+    
+    def _DuplicatesGetPotentialDuplicatePairsForFilteringFromQueue( self, queue_key ):
+        
+        # the queue is filled in the background as the user works, so normally this is just an indexed read of the front of the queue
+        
+        queue = self.modules_files_duplicates.DuplicatesGetPotentialDuplicatePairsQueue( queue_key )
+        
+        pass_restarted = False
+        
+        while True:
+            
+            result = self.modules_files_duplicates.DuplicatesGetPotentialDuplicatePairsQueueRows( queue_key, 2500 )
+            
+            if len( result ) >= 2500:
+                
+                break
+                
+            
+            if queue.scan_is_done:
+                
+                if len( result ) == 0 and not pass_restarted:
+                    
+                    # pairs made by recent merges may be behind where we have scanned, so let's have one more look
+                    
+                    self.modules_files_duplicates.DuplicatesRestartPotentialDuplicatePairsQueue( queue_key )
+                    
+                    pass_restarted = True
+                    
+                else:
+                    
+                    break
+                    
+                
+            
+            self.modules_files_duplicates.DuplicatesFillPotentialDuplicatePairsQueue( queue_key, max_queue_size = 2500 )
+            
+        
+        ( batch_of_pairs_of_media_ids, batch_of_pairs_of_hashes ) = self._DuplicatesGetPotentialDuplicatePairsBatch( result, queue.db_location_context, queue.allowed_hash_ids, queue.preferred_hash_ids )
+        
+        self.modules_files_duplicates.DuplicatesRemoveFromPotentialDuplicatePairsQueue( queue_key, batch_of_pairs_of_media_ids )
+        
+        return batch_of_pairs_of_hashes
+        
+    
+    def _DuplicatesGetPotentialDuplicatePairsBatch( self, result, db_location_context: ClientDBFilesStorage.DBLocationContext, allowed_hash_ids, preferred_hash_ids ):
+        
         MAX_BATCH_SIZE = HG.client_controller.new_options.GetInteger( 'duplicate_filter_max_batch_size' )
         
         batch_of_pairs_of_media_ids = []
@@ -2947,7 +3260,23 @@ class DB( HydrusDB.HydrusDB ):
         
         batch_of_pairs_of_hashes = [ ( hash_ids_to_hashes[ hash_id_a ], hash_ids_to_hashes[ hash_id_b ] ) for ( hash_id_a, hash_id_b ) in batch_of_pairs_of_hash_ids ]
         
-        return batch_of_pairs_of_hashes
+        return ( batch_of_pairs_of_media_ids, batch_of_pairs_of_hashes )
+        
+    
+    def _DuplicatesStartPotentialDuplicatePairsQueue( self, file_search_context: ClientSearch.FileSearchContext, both_files_match, pixel_dupes_preference, max_hamming_distance ):
+        
+        db_location_context = self.modules_files_storage.GetDBLocationContext( file_search_context.GetLocationContext() )
+        
+        if file_search_context.IsJustSystemEverything() or file_search_context.HasNoPredicates():
+            
+            query_hash_ids = None
+            
+        else:
+            
+            query_hash_ids = self._GetHashIdsFromQuery( file_search_context, apply_implicit_limit = False )
+            
+        
+        return self.modules_files_duplicates.DuplicatesStartPotentialDuplicatePairsQueue( db_location_context, query_hash_ids, both_files_match, pixel_dupes_preference, max_hamming_distance )
         
     
     def _DuplicatesGetPotentialDuplicatesCount( self, file_search_context, both_files_match, pixel_dupes_preference, max_hamming_distance ):
@@ -3938,9 +4267,16 @@ class DB( HydrusDB.HydrusDB ):
     
     def _GetClientFilesLocations( self ):
         
-        result = { prefix : HydrusPaths.ConvertPortablePathToAbsPath( location ) for ( prefix, location ) in self._Execute( 'SELECT prefix, location FROM client_files_locations;' ) }
+        get_result = lambda: { prefix : HydrusPaths.ConvertPortablePathToAbsPath( location ) for ( prefix, location ) in self._Execute( 'SELECT prefix, location FROM client_files_locations;' ) }
+        
+        result = get_result()
+        
+        # prefixes may be two or three hex chars, so rather than counting rows, we check every hash is covered
+        
+        file_coverage = sum( ( ClientFiles.GetClientFilesPrefixWeight( prefix ) for prefix in result if prefix.startswith( 'f' ) ) )
+        thumbnail_coverage = sum( ( ClientFiles.GetClientFilesPrefixWeight( prefix ) for prefix in result if prefix.startswith( 't' ) ) )
         
-        if len( result ) < 512:
+        if file_coverage < 1.0 or thumbnail_coverage < 1.0:
             
             message = 'When fetching the directories where your files are stored, the database discovered some entries were missing!'
             message += os.linesep * 2
@@ -3956,12 +4292,33 @@ class DB( HydrusDB.HydrusDB ):
             
             location = HydrusPaths.ConvertAbsPathToPortablePath( client_files_default )
             
-            for prefix in HydrusData.IterateHexPrefixes():
+            for hex_prefix in HydrusData.IterateHexPrefixes():
                 
-                self._Execute( 'INSERT OR IGNORE INTO client_files_locations ( prefix, location ) VALUES ( ?, ? );', ( 'f' + prefix, location ) )
-                self._Execute( 'INSERT OR IGNORE INTO client_files_locations ( prefix, location ) VALUES ( ?, ? );', ( 't' + prefix, location ) )
+                for prefix in ( 'f' + hex_prefix, 't' + hex_prefix ):
+                    
+                    if prefix in result:
+                        
+                        continue
+                        
+                    
+                    child_prefixes = [ prefix + c for c in '0123456789abcdef' ]
+                    
+                    if True in ( child_prefix in result for child_prefix in child_prefixes ):
+                        
+                        # this one was resharded, so we fill the holes at that depth
+                        missing_prefixes = [ child_prefix for child_prefix in child_prefixes if child_prefix not in result ]
+                        
+                    else:
+                        
+                        missing_prefixes = [ prefix ]
+                        
+                    
+                    self._ExecuteMany( 'INSERT INTO client_files_locations ( prefix, location ) VALUES ( ?, ? );', ( ( missing_prefix, location ) for missing_prefix in missing_prefixes ) )
+                    
                 
             
+            result = get_result()
+            
         
         return result
         
@@ -4021,6 +4378,36 @@ class DB( HydrusDB.HydrusDB ):
         return ClientDBServices.FileSearchContextBranch( file_search_context, search_file_service_ids, search_tag_service_ids, file_location_is_cross_referenced )
         
     
+    def _GetFileSearchDomainSizeEstimate( self, file_search_context_branch: ClientDBServices.FileSearchContextBranch ):
+        
+        num_files = 0
+        
+        for file_service_id in file_search_context_branch.file_service_ids:
+            
+            if file_service_id == self.modules_services.combined_file_service_id:
+                
+                # no files table for all known files, but the master hash table is about that size
+                
+                ( max_hash_id, ) = self._Execute( 'SELECT MAX( hash_id ) FROM hashes;' ).fetchone()
+                
+                if max_hash_id is not None:
+                    
+                    num_files += max_hash_id
+                    
+                
+            else:
+                
+                service_type = self.modules_services.GetServiceType( file_service_id )
+                
+                service_info = self._GetServiceInfoSpecific( file_service_id, service_type, { HC.SERVICE_INFO_NUM_FILES } )
+                
+                num_files += service_info[ HC.SERVICE_INFO_NUM_FILES ]
+                
+            
+        
+        return num_files
+        
+    
     def _GetFileSystemPredicates( self, file_search_context: ClientSearch.FileSearchContext, force_system_everything = False ):
         
         location_context = file_search_context.GetLocationContext()
@@ -4255,33 +4642,98 @@ class DB( HydrusDB.HydrusDB ):
         return predicates
         
     
-    def _GetForceRefreshTagsManagers( self, hash_ids, hash_ids_to_current_file_service_ids = None ):
+    def _GetFileTagCountsTableNamesAndColumn( self, tag_display_type: int, location_context: ClientLocation.LocationContext, tag_search_context: ClientSearch.TagSearchContext, namespace_wildcard = None ):
         
-        with self._MakeTemporaryIntegerTable( hash_ids, 'hash_id' ) as temp_table_name:
+        # the specific display caches keep a tag count per file, so 'how many tags does this file have' is a primary key or index lookup
+        # that count is for one real tag service and all namespaces, so combined tags or a namespace search goes the long way
+        
+        if tag_display_type != ClientTags.TAG_DISPLAY_ACTUAL:
             
-            self._AnalyzeTempTable( temp_table_name )
+            return None
             
-            return self._GetForceRefreshTagsManagersWithTableHashIds( hash_ids, temp_table_name, hash_ids_to_current_file_service_ids = hash_ids_to_current_file_service_ids )
+        
+        if namespace_wildcard not in ( None, '*' ):
+            
+            return None
             
         
-    
-    def _GetForceRefreshTagsManagersWithTableHashIds( self, hash_ids, hash_ids_table_name, hash_ids_to_current_file_service_ids = None ):
+        tag_service_key = tag_search_context.service_key
         
-        if hash_ids_to_current_file_service_ids is None:
+        if tag_service_key == CC.COMBINED_TAG_SERVICE_KEY:
             
-            hash_ids_to_current_file_service_ids = self.modules_files_storage.GetHashIdsToCurrentServiceIds( hash_ids_table_name )
+            return None
             
         
-        common_file_service_ids_to_hash_ids = self._GroupHashIdsByTagCachedFileServiceId( hash_ids, hash_ids_table_name, hash_ids_to_current_file_service_ids = hash_ids_to_current_file_service_ids )
+        if tag_search_context.include_current_tags and tag_search_context.include_pending_tags:
+            
+            count_column_name = 'current_or_pending_count'
+            
+        elif tag_search_context.include_current_tags:
+            
+            count_column_name = 'current_count'
+            
+        elif tag_search_context.include_pending_tags:
+            
+            count_column_name = 'pending_count'
+            
+        else:
+            
+            return None
+            
         
-        #
+        tag_service_id = self.modules_services.GetServiceId( tag_service_key )
         
-        tag_service_ids = self.modules_services.GetServiceIds( HC.REAL_TAG_SERVICES )
+        ( file_service_keys, file_location_is_cross_referenced ) = location_context.GetCoveringCurrentFileServiceKeys()
         
-        storage_tag_data = []
-        display_tag_data = []
+        file_tag_counts_table_names = []
         
-        for ( common_file_service_id, batch_of_hash_ids ) in common_file_service_ids_to_hash_ids.items():
+        for file_service_key in file_service_keys:
+            
+            file_service_id = self.modules_services.GetServiceId( file_service_key )
+            
+            if self.modules_services.GetServiceType( file_service_id ) not in HC.FILE_SERVICES_WITH_SPECIFIC_MAPPING_CACHES:
+                
+                return None
+                
+            
+            file_tag_counts_table_names.append( ClientDBMappingsCacheSpecificDisplay.GenerateSpecificDisplayFileTagCountsTableName( file_service_id, tag_service_id ) )
+            
+        
+        if len( file_tag_counts_table_names ) == 0:
+            
+            return None
+            
+        
+        return ( file_tag_counts_table_names, count_column_name )
+        
+    
+    def _GetForceRefreshTagsManagers( self, hash_ids, hash_ids_to_current_file_service_ids = None ):
+        
+        with self._MakeTemporaryIntegerTable( hash_ids, 'hash_id' ) as temp_table_name:
+            
+            self._AnalyzeTempTable( temp_table_name )
+            
+            return self._GetForceRefreshTagsManagersWithTableHashIds( hash_ids, temp_table_name, hash_ids_to_current_file_service_ids = hash_ids_to_current_file_service_ids )
+            
+        
+    
+    def _GetForceRefreshTagsManagersWithTableHashIds( self, hash_ids, hash_ids_table_name, hash_ids_to_current_file_service_ids = None ):
+        
+        if hash_ids_to_current_file_service_ids is None:
+            
+            hash_ids_to_current_file_service_ids = self.modules_files_storage.GetHashIdsToCurrentServiceIds( hash_ids_table_name )
+            
+        
+        common_file_service_ids_to_hash_ids = self._GroupHashIdsByTagCachedFileServiceId( hash_ids, hash_ids_table_name, hash_ids_to_current_file_service_ids = hash_ids_to_current_file_service_ids )
+        
+        #
+        
+        tag_service_ids = self.modules_services.GetServiceIds( HC.REAL_TAG_SERVICES )
+        
+        storage_tag_data = []
+        display_tag_data = []
+        
+        for ( common_file_service_id, batch_of_hash_ids ) in common_file_service_ids_to_hash_ids.items():
             
             if len( batch_of_hash_ids ) == len( hash_ids ):
                 
@@ -4390,13 +4842,48 @@ class DB( HydrusDB.HydrusDB ):
         return ( storage_tag_data, display_tag_data )
         
     
-    def _GetHashIdsAndNonZeroTagCounts( self, tag_display_type: int, location_context: ClientLocation.LocationContext, tag_search_context: ClientSearch.TagSearchContext, hash_ids, namespace_wildcard = None, job_key = None ):
+    def _GetHashIdsAndNonZeroTagCounts( self, tag_display_type: int, location_context: ClientLocation.LocationContext, tag_search_context: ClientSearch.TagSearchContext, hash_ids, namespace_wildcard = None, hash_ids_table_name = None, job_key = None ):
         
         if namespace_wildcard == '*':
             
             namespace_wildcard = None
             
         
+        file_tag_counts_lookup = self._GetFileTagCountsTableNamesAndColumn( tag_display_type, location_context, tag_search_context, namespace_wildcard = namespace_wildcard )
+        
+        if file_tag_counts_lookup is not None:
+            
+            if hash_ids_table_name is None:
+                
+                with self._MakeTemporaryIntegerTable( hash_ids, 'hash_id' ) as temp_hash_ids_table_name:
+                    
+                    return self._GetHashIdsAndNonZeroTagCounts( tag_display_type, location_context, tag_search_context, hash_ids, namespace_wildcard = namespace_wildcard, hash_ids_table_name = temp_hash_ids_table_name, job_key = job_key )
+                    
+                
+            
+            ( file_tag_counts_table_names, count_column_name ) = file_tag_counts_lookup
+            
+            cancelled_hook = None
+            
+            if job_key is not None:
+                
+                cancelled_hook = job_key.IsCancelled
+                
+            
+            hash_ids_to_counts = {}
+            
+            for file_tag_counts_table_name in file_tag_counts_table_names:
+                
+                # temp hashes to counts
+                cursor = self._Execute( 'SELECT hash_id, {} FROM {} CROSS JOIN {} USING ( hash_id ) WHERE {} > 0;'.format( count_column_name, hash_ids_table_name, file_tag_counts_table_name, count_column_name ) )
+                
+                # a file in several of these domains has the same tags in each
+                hash_ids_to_counts.update( HydrusDB.ReadFromCancellableCursor( cursor, 1024, cancelled_hook = cancelled_hook ) )
+                
+            
+            return list( hash_ids_to_counts.items() )
+            
+        
         if namespace_wildcard is None:
             
             namespace_ids = []
@@ -4472,6 +4959,33 @@ class DB( HydrusDB.HydrusDB ):
             
         
     
+    def _GetHashIdsFromFileTagCounts( self, file_tag_counts_table_names, count_column_name, number_tests, job_key = None ):
+        
+        # walks the count index, so cost is proportional to the matching files, not the search domain
+        
+        predicates = list( itertools.chain.from_iterable( ( number_test.GetSQLitePredicates( count_column_name ) for number_test in number_tests ) ) )
+        
+        predicates_phrase = ' AND '.join( predicates )
+        
+        cancelled_hook = None
+        
+        if job_key is not None:
+            
+            cancelled_hook = job_key.IsCancelled
+            
+        
+        hash_ids = HydrusIntegerSets.IntegerSet()
+        
+        for file_tag_counts_table_name in file_tag_counts_table_names:
+            
+            cursor = self._Execute( 'SELECT hash_id FROM {} WHERE {};'.format( file_tag_counts_table_name, predicates_phrase ) )
+            
+            hash_ids.update( self._STI( HydrusDB.ReadFromCancellableCursor( cursor, 1024, cancelled_hook = cancelled_hook ) ) )
+            
+        
+        return hash_ids
+        
+    
     def _GetHashIdsFromFileViewingStatistics( self, view_type, viewing_locations, operator, viewing_value ):
         
         # only works for positive values like '> 5'. won't work for '= 0' or '< 1' since those are absent from the table
@@ -4616,9 +5130,72 @@ class DB( HydrusDB.HydrusDB ):
             job_key = ClientThreading.JobKey( cancellable = True )
             
         
+        location_context = file_search_context.GetLocationContext()
+        
+        limit = file_search_context.GetSystemPredicates().GetLimit( apply_implicit_limit = apply_implicit_limit )
+        
+        # all the search steps that filter through a temp table share this one, which only gets written to as the results change
+        
+        with self._MakeSyncedTemporaryIntegerTable( 'hash_id' ) as query_hash_ids_table:
+            
+            if limit is not None and query_hash_ids is None:
+                
+                top_k_hash_ids = self._TryToGetTopKHashIdsFromQuery( query_hash_ids_table, file_search_context, job_key, limit, sort_by if sort_by is not None else limit_sort_by )
+                
+                if top_k_hash_ids is not None:
+                    
+                    return top_k_hash_ids
+                    
+                
+            
+            query_hash_ids = self._DoGetHashIdsFromQuery( query_hash_ids_table, file_search_context, job_key = job_key, query_hash_ids = query_hash_ids )
+            
+        
+        query_hash_ids = list( query_hash_ids )
+        
+        #
+        
+        we_are_applying_limit = limit is not None and limit < len( query_hash_ids )
+        
+        if we_are_applying_limit and limit_sort_by is not None and sort_by is None:
+            
+            sort_by = limit_sort_by
+            
+        
+        did_sort = False
+        
+        if sort_by is not None and not location_context.IsAllKnownFiles():
+            
+            ( did_sort, query_hash_ids ) = self._TryToSortHashIds( location_context, query_hash_ids, sort_by )
+            
+        
+        #
+        
+        if we_are_applying_limit:
+            
+            if not did_sort:
+                
+                query_hash_ids = random.sample( query_hash_ids, limit )
+                
+            else:
+                
+                query_hash_ids = query_hash_ids[:limit]
+                
+            
+        
+        return query_hash_ids
+        
+    
+    def _DoGetHashIdsFromQuery( self, query_hash_ids_table: HydrusDBBase.SyncedTemporaryIntegerTable, file_search_context: ClientSearch.FileSearchContext, job_key = None, query_hash_ids = None ):
+        
+        if job_key is None:
+            
+            job_key = ClientThreading.JobKey( cancellable = True )
+            
+        
         if query_hash_ids is not None:
             
-            query_hash_ids = set( query_hash_ids )
+            query_hash_ids = HydrusIntegerSets.IntegerSet( query_hash_ids )
             
         
         have_cross_referenced_file_locations = False
@@ -4908,9 +5485,9 @@ class DB( HydrusDB.HydrusDB ):
             
             if query_hash_ids is None:
                 
-                if not isinstance( some_hash_ids, set ) or force_create_new_set:
+                if not isinstance( some_hash_ids, HydrusIntegerSets.IntegerSet ) or force_create_new_set:
                     
-                    some_hash_ids = set( some_hash_ids )
+                    some_hash_ids = HydrusIntegerSets.IntegerSet( some_hash_ids )
                     
                 
                 return some_hash_ids
@@ -4923,6 +5500,16 @@ class DB( HydrusDB.HydrusDB ):
                 
             
         
+        def get_query_hash_ids_table_name( query_hash_ids ):
+            
+            if query_hash_ids_table.Sync( query_hash_ids ):
+                
+                self._AnalyzeTempTable( query_hash_ids_table.GetTableName() )
+                
+            
+            return query_hash_ids_table.GetTableName()
+            
+        
         #
         
         def do_or_preds( or_predicates, query_hash_ids ):
@@ -4939,7 +5526,7 @@ class DB( HydrusDB.HydrusDB ):
                 
                 # blue eyes OR green eyes
                 
-                or_query_hash_ids = set()
+                or_query_hash_ids = HydrusIntegerSets.IntegerSet()
                 
                 for or_subpredicate in or_predicate.GetValue():
                     
@@ -4980,11 +5567,15 @@ class DB( HydrusDB.HydrusDB ):
         
         #
         
-        if 'hash' in simple_preds:
-            
-            specific_hash_ids = set()
-            
-            ( search_hashes, search_hash_type ) = simple_preds[ 'hash' ]
+        # now the planner. each of these steps gives us a set of hash_ids that all our results must be in
+        # we estimate how many hash_ids each will produce and run the most selective first, so the later steps, particularly tag searches, only have to work inside a small temp table
+        # we don't keep histograms, so range preds get a sqlite-style guess of a fraction of the search domain
+        
+        file_search_context_branch = self._GetFileSearchContextBranch( file_search_context )
+        
+        domain_size_estimate = self._GetFileSearchDomainSizeEstimate( file_search_context_branch )
+        
+        def get_hashes_hash_ids( query_hash_ids, search_hashes, search_hash_type ):
             
             if search_hash_type == 'sha256':
                 
@@ -4995,12 +5586,114 @@ class DB( HydrusDB.HydrusDB ):
                 matching_sha256_hashes = self.modules_hashes.GetFileHashes( search_hashes, search_hash_type, 'sha256' )
                 
             
-            specific_hash_ids = self.modules_hashes_local_cache.GetHashIds( matching_sha256_hashes )
+            return self.modules_hashes_local_cache.GetHashIds( matching_sha256_hashes )
+            
+        
+        def get_import_timestamp_hash_ids( query_hash_ids, pred_string ):
+            
+            table_names = []
+            table_names.extend( ( ClientDBFilesStorage.GenerateFilesTableName( self.modules_services.GetServiceId( service_key ), HC.CONTENT_STATUS_CURRENT ) for service_key in location_context.current_service_keys ) )
+            table_names.extend( ( ClientDBFilesStorage.GenerateFilesTableName( self.modules_services.GetServiceId( service_key ), HC.CONTENT_STATUS_DELETED ) for service_key in location_context.deleted_service_keys ) )
+            
+            import_timestamp_hash_ids = HydrusIntegerSets.IntegerSet()
+            
+            for table_name in table_names:
+                
+                import_timestamp_hash_ids.update( self._STIS( self._Execute( 'SELECT hash_id FROM {} WHERE {};'.format( table_name, pred_string ) ) ) )
+                
+            
+            return import_timestamp_hash_ids
+            
+        
+        def get_select_hash_ids( query_hash_ids, select, select_args ):
             
-            query_hash_ids = intersection_update_qhi( query_hash_ids, specific_hash_ids )
+            return self._STIS( self._Execute( select, select_args ) )
             
         
-        #
+        def get_similar_to_hash_ids( query_hash_ids, similar_to_hashes, max_hamming ):
+            
+            all_similar_hash_ids = set()
+            
+            for similar_to_hash in similar_to_hashes:
+                
+                hash_id = self.modules_hashes_local_cache.GetHashId( similar_to_hash )
+                
+                similar_hash_ids_and_distances = self.modules_similar_files.Search( hash_id, max_hamming )
+                
+                similar_hash_ids = [ similar_hash_id for ( similar_hash_id, distance ) in similar_hash_ids_and_distances ]
+                
+                all_similar_hash_ids.update( similar_hash_ids )
+                
+            
+            return all_similar_hash_ids
+            
+        
+        def get_inbox_hash_ids( query_hash_ids ):
+            
+            return self.modules_files_metadata_basic.inbox_hash_ids
+            
+        
+        def get_duplicate_count_hash_ids( query_hash_ids, operator, num_relationships, dupe_type ):
+            
+            return self.modules_files_duplicates.DuplicatesGetHashIdsFromDuplicateCountPredicate( db_location_context, operator, num_relationships, dupe_type )
+            
+        
+        def get_file_viewing_stats_hash_ids( query_hash_ids, view_type, viewing_locations, operator, viewing_value ):
+            
+            return self._GetHashIdsFromFileViewingStatistics( view_type, viewing_locations, operator, viewing_value )
+            
+        
+        def get_tag_hash_ids( query_hash_ids, tag ):
+            
+            if query_hash_ids is None:
+                
+                return self._GetHashIdsFromTag( ClientTags.TAG_DISPLAY_ACTUAL, location_context, tag_search_context, tag, job_key = job_key )
+                
+            else:
+                
+                temp_table_name = get_query_hash_ids_table_name( query_hash_ids )
+                
+                return self._GetHashIdsFromTag( ClientTags.TAG_DISPLAY_ACTUAL, location_context, tag_search_context, tag, hash_ids = query_hash_ids, hash_ids_table_name = temp_table_name, job_key = job_key )
+                
+            
+        
+        def get_namespace_hash_ids( query_hash_ids, namespace ):
+            
+            if query_hash_ids is None:
+                
+                return self._GetHashIdsThatHaveTagsComplexLocation( ClientTags.TAG_DISPLAY_ACTUAL, location_context, tag_search_context, namespace_wildcard = namespace, job_key = job_key )
+                
+            else:
+                
+                temp_table_name = get_query_hash_ids_table_name( query_hash_ids )
+                
+                return self._GetHashIdsThatHaveTagsComplexLocation( ClientTags.TAG_DISPLAY_ACTUAL, location_context, tag_search_context, namespace_wildcard = namespace, hash_ids_table_name = temp_table_name, job_key = job_key )
+                
+            
+        
+        def get_wildcard_hash_ids( query_hash_ids, wildcard ):
+            
+            if query_hash_ids is None:
+                
+                return self._GetHashIdsFromWildcardComplexLocation( ClientTags.TAG_DISPLAY_ACTUAL, location_context, tag_search_context, wildcard, job_key = job_key )
+                
+            else:
+                
+                temp_table_name = get_query_hash_ids_table_name( query_hash_ids )
+                
+                return self._GetHashIdsFromWildcardComplexLocation( ClientTags.TAG_DISPLAY_ACTUAL, location_context, tag_search_context, wildcard, hash_ids = query_hash_ids, hash_ids_table_name = temp_table_name, job_key = job_key )
+                
+            
+        
+        # ( description, estimated count, cross-references file domain, call, args )
+        search_steps = []
+        
+        if 'hash' in simple_preds:
+            
+            ( search_hashes, search_hash_type ) = simple_preds[ 'hash' ]
+            
+            search_steps.append( ( 'system:hash', len( search_hashes ), False, get_hashes_hash_ids, ( search_hashes, search_hash_type ) ) )
+            
         
         if need_file_domain_cross_reference:
             
@@ -5016,20 +5709,7 @@ class DB( HydrusDB.HydrusDB ):
                 
                 pred_string = ' AND '.join( import_timestamp_predicates )
                 
-                table_names = []
-                table_names.extend( ( ClientDBFilesStorage.GenerateFilesTableName( self.modules_services.GetServiceId( service_key ), HC.CONTENT_STATUS_CURRENT ) for service_key in location_context.current_service_keys ) )
-                table_names.extend( ( ClientDBFilesStorage.GenerateFilesTableName( self.modules_services.GetServiceId( service_key ), HC.CONTENT_STATUS_DELETED ) for service_key in location_context.deleted_service_keys ) )
-                
-                import_timestamp_hash_ids = set()
-                
-                for table_name in table_names:
-                    
-                    import_timestamp_hash_ids.update( self._STS( self._Execute( 'SELECT hash_id FROM {} WHERE {};'.format( table_name, pred_string ) ) ) )
-                    
-                
-                query_hash_ids = intersection_update_qhi( query_hash_ids, import_timestamp_hash_ids )
-                
-                have_cross_referenced_file_locations = True
+                search_steps.append( ( 'system:import time', domain_size_estimate // 4, True, get_import_timestamp_hash_ids, ( pred_string, ) ) )
                 
             
         
@@ -5042,9 +5722,7 @@ class DB( HydrusDB.HydrusDB ):
             
             pred_string = ' AND '.join( modified_timestamp_predicates )
             
-            modified_timestamp_hash_ids = self._STS( self._Execute( 'SELECT hash_id FROM file_modified_timestamps WHERE {};'.format( pred_string ) ) )
-            
-            query_hash_ids = intersection_update_qhi( query_hash_ids, modified_timestamp_hash_ids )
+            search_steps.append( ( 'system:modified time', domain_size_estimate // 4, False, get_select_hash_ids, ( 'SELECT hash_id FROM file_modified_timestamps WHERE {};'.format( pred_string ), () ) ) )
             
         
         last_viewed_timestamp_predicates = []
@@ -5056,31 +5734,14 @@ class DB( HydrusDB.HydrusDB ):
             
             pred_string = ' AND '.join( last_viewed_timestamp_predicates )
             
-            last_viewed_timestamp_hash_ids = self._STS( self._Execute( 'SELECT hash_id FROM file_viewing_stats WHERE canvas_type = ? AND {};'.format( pred_string ), ( CC.CANVAS_MEDIA_VIEWER, ) ) )
+            search_steps.append( ( 'system:last viewed time', domain_size_estimate // 4, False, get_select_hash_ids, ( 'SELECT hash_id FROM file_viewing_stats WHERE canvas_type = ? AND {};'.format( pred_string ), ( CC.CANVAS_MEDIA_VIEWER, ) ) ) )
             
-            query_hash_ids = intersection_update_qhi( query_hash_ids, last_viewed_timestamp_hash_ids )
-            
-        
-        #
         
         if system_predicates.HasSimilarTo():
             
             ( similar_to_hashes, max_hamming ) = system_predicates.GetSimilarTo()
             
-            all_similar_hash_ids = set()
-            
-            for similar_to_hash in similar_to_hashes:
-                
-                hash_id = self.modules_hashes_local_cache.GetHashId( similar_to_hash )
-                
-                similar_hash_ids_and_distances = self.modules_similar_files.Search( hash_id, max_hamming )
-                
-                similar_hash_ids = [ similar_hash_id for ( similar_hash_id, distance ) in similar_hash_ids_and_distances ]
-                
-                all_similar_hash_ids.update( similar_hash_ids )
-                
-            
-            query_hash_ids = intersection_update_qhi( query_hash_ids, all_similar_hash_ids )
+            search_steps.append( ( 'system:similar to', len( similar_to_hashes ) * 16, False, get_similar_to_hash_ids, ( similar_to_hashes, max_hamming ) ) )
             
         
         for ( operator, value, rating_service_key ) in system_predicates.GetRatingsPredicates():
@@ -5092,11 +5753,11 @@ class DB( HydrusDB.HydrusDB ):
                 continue
                 
             
+            ( num_rated, ) = self._Execute( 'SELECT COUNT( * ) FROM local_ratings WHERE service_id = ?;', ( service_id, ) ).fetchone()
+            
             if value == 'rated':
                 
-                rating_hash_ids = self._STI( self._Execute( 'SELECT hash_id FROM local_ratings WHERE service_id = ?;', ( service_id, ) ) )
-                
-                query_hash_ids = intersection_update_qhi( query_hash_ids, rating_hash_ids )
+                search_steps.append( ( 'system:rating', num_rated, False, get_select_hash_ids, ( 'SELECT hash_id FROM local_ratings WHERE service_id = ?;', ( service_id, ) ) ) )
                 
             else:
                 
@@ -5137,9 +5798,7 @@ class DB( HydrusDB.HydrusDB ):
                     predicate = str( value - half_a_star_value ) + ' < rating AND rating <= ' + str( value + half_a_star_value )
                     
                 
-                rating_hash_ids = self._STI( self._Execute( 'SELECT hash_id FROM local_ratings WHERE service_id = ? AND ' + predicate + ';', ( service_id, ) ) )
-                
-                query_hash_ids = intersection_update_qhi( query_hash_ids, rating_hash_ids )
+                search_steps.append( ( 'system:rating', num_rated // 2, False, get_select_hash_ids, ( 'SELECT hash_id FROM local_ratings WHERE service_id = ? AND ' + predicate + ';', ( service_id, ) ) ) )
                 
             
         
@@ -5147,7 +5806,7 @@ class DB( HydrusDB.HydrusDB ):
         
         if is_inbox:
             
-            query_hash_ids = intersection_update_qhi( query_hash_ids, self.modules_files_metadata_basic.inbox_hash_ids, force_create_new_set = True )
+            search_steps.append( ( 'system:inbox', len( self.modules_files_metadata_basic.inbox_hash_ids ), False, get_inbox_hash_ids, () ) )
             
         
         for ( operator, num_relationships, dupe_type ) in system_predicates.GetDuplicateRelationshipCountPredicates():
@@ -5155,22 +5814,12 @@ class DB( HydrusDB.HydrusDB ):
             only_do_zero = ( operator in ( '=', CC.UNICODE_ALMOST_EQUAL_TO ) and num_relationships == 0 ) or ( operator == '<' and num_relationships == 1 )
             include_zero = operator == '<'
             
-            if only_do_zero:
-                
-                continue
-                
-            elif include_zero:
+            if only_do_zero or include_zero:
                 
                 continue
                 
-            else:
-                
-                dupe_hash_ids = self.modules_files_duplicates.DuplicatesGetHashIdsFromDuplicateCountPredicate( db_location_context, operator, num_relationships, dupe_type )
-                
-                query_hash_ids = intersection_update_qhi( query_hash_ids, dupe_hash_ids )
-                
-                have_cross_referenced_file_locations = True
-                
+            
+            search_steps.append( ( 'system:num file relationships', domain_size_estimate // 4, True, get_duplicate_count_hash_ids, ( operator, num_relationships, dupe_type ) ) )
             
         
         for ( view_type, viewing_locations, operator, viewing_value ) in system_predicates.GetFileViewingStatsPredicates():
@@ -5178,23 +5827,13 @@ class DB( HydrusDB.HydrusDB ):
             only_do_zero = ( operator in ( '=', CC.UNICODE_ALMOST_EQUAL_TO ) and viewing_value == 0 ) or ( operator == '<' and viewing_value == 1 )
             include_zero = operator == '<'
             
-            if only_do_zero:
-                
-                continue
-                
-            elif include_zero:
+            if only_do_zero or include_zero:
                 
                 continue
                 
-            else:
-                
-                viewing_hash_ids = self._GetHashIdsFromFileViewingStatistics( view_type, viewing_locations, operator, viewing_value )
-                
-                query_hash_ids = intersection_update_qhi( query_hash_ids, viewing_hash_ids )
-                
             
-        
-        # first tags
+            search_steps.append( ( 'system:file viewing stats', domain_size_estimate // 4, False, get_file_viewing_stats_hash_ids, ( view_type, viewing_locations, operator, viewing_value ) ) )
+            
         
         if there_are_tags_to_search:
             
@@ -5209,85 +5848,61 @@ class DB( HydrusDB.HydrusDB ):
             
             for tag in tags_to_include:
                 
-                if query_hash_ids is None:
-                    
-                    tag_query_hash_ids = self._GetHashIdsFromTag( ClientTags.TAG_DISPLAY_ACTUAL, location_context, tag_search_context, tag, job_key = job_key )
-                    
-                elif is_inbox and len( query_hash_ids ) == len( self.modules_files_metadata_basic.inbox_hash_ids ):
-                    
-                    tag_query_hash_ids = self._GetHashIdsFromTag( ClientTags.TAG_DISPLAY_ACTUAL, location_context, tag_search_context, tag, hash_ids = self.modules_files_metadata_basic.inbox_hash_ids, hash_ids_table_name = 'file_inbox', job_key = job_key )
-                    
-                else:
-                    
-                    with self._MakeTemporaryIntegerTable( query_hash_ids, 'hash_id' ) as temp_table_name:
-                        
-                        tag_query_hash_ids = self._GetHashIdsFromTag( ClientTags.TAG_DISPLAY_ACTUAL, location_context, tag_search_context, tag, hash_ids = query_hash_ids, hash_ids_table_name = temp_table_name, job_key = job_key )
-                        
-                    
-                
-                query_hash_ids = intersection_update_qhi( query_hash_ids, tag_query_hash_ids )
-                
-                have_cross_referenced_file_locations = True
-                
-                if query_hash_ids == set():
-                    
-                    return query_hash_ids
-                    
+                search_steps.append( ( tag, self._GetTagSearchCountEstimate( file_search_context_branch, tag ), True, get_tag_hash_ids, ( tag, ) ) )
                 
             
             for namespace in namespaces_to_include:
                 
-                if query_hash_ids is None or ( is_inbox and len( query_hash_ids ) == len( self.modules_files_metadata_basic.inbox_hash_ids ) ):
-                    
-                    namespace_query_hash_ids = self._GetHashIdsThatHaveTagsComplexLocation( ClientTags.TAG_DISPLAY_ACTUAL, location_context, tag_search_context, namespace_wildcard = namespace, job_key = job_key )
-                    
-                else:
-                    
-                    with self._MakeTemporaryIntegerTable( query_hash_ids, 'hash_id' ) as temp_table_name:
-                        
-                        self._AnalyzeTempTable( temp_table_name )
-                        
-                        namespace_query_hash_ids = self._GetHashIdsThatHaveTagsComplexLocation( ClientTags.TAG_DISPLAY_ACTUAL, location_context, tag_search_context, namespace_wildcard = namespace, hash_ids_table_name = temp_table_name, job_key = job_key )
-                        
-                    
-                
-                query_hash_ids = intersection_update_qhi( query_hash_ids, namespace_query_hash_ids )
-                
-                have_cross_referenced_file_locations = True
-                
-                if query_hash_ids == set():
-                    
-                    return query_hash_ids
-                    
+                search_steps.append( ( '{}:*anything*'.format( namespace ), domain_size_estimate // 2, True, get_namespace_hash_ids, ( namespace, ) ) )
                 
             
             for wildcard in wildcards_to_include:
                 
-                if query_hash_ids is None:
-                    
-                    wildcard_query_hash_ids = self._GetHashIdsFromWildcardComplexLocation( ClientTags.TAG_DISPLAY_ACTUAL, location_context, tag_search_context, wildcard, job_key = job_key )
-                    
-                else:
-                    
-                    with self._MakeTemporaryIntegerTable( query_hash_ids, 'hash_id' ) as temp_table_name:
-                        
-                        self._AnalyzeTempTable( temp_table_name )
-                        
-                        wildcard_query_hash_ids = self._GetHashIdsFromWildcardComplexLocation( ClientTags.TAG_DISPLAY_ACTUAL, location_context, tag_search_context, wildcard, hash_ids = query_hash_ids, hash_ids_table_name = temp_table_name, job_key = job_key )
-                        
-                    
+                search_steps.append( ( wildcard, domain_size_estimate // 4, True, get_wildcard_hash_ids, ( wildcard, ) ) )
                 
-                query_hash_ids = intersection_update_qhi( query_hash_ids, wildcard_query_hash_ids )
+            
+        
+        search_steps = self._OrderSearchSteps( search_steps )
+        
+        search_plan_report_rows = []
+        
+        for ( step_description, step_estimate, step_cross_references_file_locations, step_call, step_args ) in search_steps:
+            
+            time_started = HydrusData.GetNowPrecise()
+            
+            step_hash_ids = step_call( query_hash_ids, *step_args )
+            
+            # some steps hand back live cached sets, so we never adopt them
+            query_hash_ids = intersection_update_qhi( query_hash_ids, step_hash_ids, force_create_new_set = True )
+            
+            if step_cross_references_file_locations:
                 
                 have_cross_referenced_file_locations = True
                 
-                if query_hash_ids == set():
-                    
-                    return query_hash_ids
-                    
+            
+            search_plan_report_rows.append( ( step_description, step_estimate, len( step_hash_ids ), len( query_hash_ids ), HydrusData.GetNowPrecise() - time_started ) )
+            
+            if len( query_hash_ids ) == 0 or job_key.IsCancelled():
+                
+                break
                 
             
         
+        if HG.db_report_mode and len( search_plan_report_rows ) > 0:
+            
+            self._ReportSearchPlan( file_search_context, search_plan_report_rows )
+            
+        
+        if job_key.IsCancelled():
+            
+            return set()
+            
+        
+        if query_hash_ids is not None and len( query_hash_ids ) == 0:
+            
+            return query_hash_ids
+            
+        
         #
         
         # OR round two--if file preds will not be fast, let's step in to reduce the file domain search space
@@ -5329,22 +5944,19 @@ class DB( HydrusDB.HydrusDB ):
                 
                 if query_hash_ids is None:
                     
-                    query_hash_ids = intersection_update_qhi( query_hash_ids, self._STS( self._Execute( 'SELECT hash_id FROM {} WHERE {};'.format( files_table_name, ' AND '.join( files_info_predicates ) ) ) ) )
+                    query_hash_ids = intersection_update_qhi( query_hash_ids, self._STIS( self._Execute( 'SELECT hash_id FROM {} WHERE {};'.format( files_table_name, ' AND '.join( files_info_predicates ) ) ) ) )
                     
                 else:
                     
                     if is_inbox and len( query_hash_ids ) == len( self.modules_files_metadata_basic.inbox_hash_ids ):
                         
-                        query_hash_ids = intersection_update_qhi( query_hash_ids, self._STS( self._Execute( 'SELECT hash_id FROM {} NATURAL JOIN {} WHERE {};'.format( 'file_inbox', files_table_name, ' AND '.join( files_info_predicates ) ) ) ) )
+                        query_hash_ids = intersection_update_qhi( query_hash_ids, self._STIS( self._Execute( 'SELECT hash_id FROM {} NATURAL JOIN {} WHERE {};'.format( 'file_inbox', files_table_name, ' AND '.join( files_info_predicates ) ) ) ) )
                         
                     else:
                         
-                        with self._MakeTemporaryIntegerTable( query_hash_ids, 'hash_id' ) as temp_table_name:
-                            
-                            self._AnalyzeTempTable( temp_table_name )
-                            
-                            query_hash_ids = intersection_update_qhi( query_hash_ids, self._STS( self._Execute( 'SELECT hash_id FROM {} NATURAL JOIN {} WHERE {};'.format( temp_table_name, files_table_name, ' AND '.join( files_info_predicates ) ) ) ) )
-                            
+                        temp_table_name = get_query_hash_ids_table_name( query_hash_ids )
+                        
+                        query_hash_ids = intersection_update_qhi( query_hash_ids, self._STIS( self._Execute( 'SELECT hash_id FROM {} NATURAL JOIN {} WHERE {};'.format( temp_table_name, files_table_name, ' AND '.join( files_info_predicates ) ) ) ) )
                         
                     
                 
@@ -5385,18 +5997,15 @@ class DB( HydrusDB.HydrusDB ):
         
         if there_are_simple_files_info_preds_to_search_for and not done_files_info_predicates:
             
-            with self._MakeTemporaryIntegerTable( query_hash_ids, 'hash_id' ) as temp_table_name:
-                
-                self._AnalyzeTempTable( temp_table_name )
-                
-                predicate_string = ' AND '.join( files_info_predicates )
-                
-                select = 'SELECT hash_id FROM {} NATURAL JOIN files_info WHERE {};'.format( temp_table_name, predicate_string )
-                
-                files_info_hash_ids = self._STI( self._Execute( select ) )
-                
-                query_hash_ids = intersection_update_qhi( query_hash_ids, files_info_hash_ids )
-                
+            temp_table_name = get_query_hash_ids_table_name( query_hash_ids )
+            
+            predicate_string = ' AND '.join( files_info_predicates )
+            
+            select = 'SELECT hash_id FROM {} NATURAL JOIN files_info WHERE {};'.format( temp_table_name, predicate_string )
+            
+            files_info_hash_ids = self._STI( self._Execute( select ) )
+            
+            query_hash_ids = intersection_update_qhi( query_hash_ids, files_info_hash_ids )
             
             done_files_info_predicates = True
             
@@ -5429,14 +6038,11 @@ class DB( HydrusDB.HydrusDB ):
         
         for tag in tags_to_exclude:
             
-            with self._MakeTemporaryIntegerTable( query_hash_ids, 'hash_id' ) as temp_table_name:
-                
-                self._AnalyzeTempTable( temp_table_name )
-                
-                unwanted_hash_ids = self._GetHashIdsFromTag( ClientTags.TAG_DISPLAY_ACTUAL, location_context, tag_search_context, tag, hash_ids = query_hash_ids, hash_ids_table_name = temp_table_name, job_key = job_key )
-                
-                query_hash_ids.difference_update( unwanted_hash_ids )
-                
+            temp_table_name = get_query_hash_ids_table_name( query_hash_ids )
+            
+            unwanted_hash_ids = self._GetHashIdsFromTag( ClientTags.TAG_DISPLAY_ACTUAL, location_context, tag_search_context, tag, hash_ids = query_hash_ids, hash_ids_table_name = temp_table_name, job_key = job_key )
+            
+            query_hash_ids.difference_update( unwanted_hash_ids )
             
             if len( query_hash_ids ) == 0:
                 
@@ -5446,14 +6052,11 @@ class DB( HydrusDB.HydrusDB ):
         
         for namespace in namespaces_to_exclude:
             
-            with self._MakeTemporaryIntegerTable( query_hash_ids, 'hash_id' ) as temp_table_name:
-                
-                self._AnalyzeTempTable( temp_table_name )
-                
-                unwanted_hash_ids = self._GetHashIdsThatHaveTagsComplexLocation( ClientTags.TAG_DISPLAY_ACTUAL, location_context, tag_search_context, namespace_wildcard = namespace, hash_ids_table_name = temp_table_name, job_key = job_key )
-                
-                query_hash_ids.difference_update( unwanted_hash_ids )
-                
+            temp_table_name = get_query_hash_ids_table_name( query_hash_ids )
+            
+            unwanted_hash_ids = self._GetHashIdsThatHaveTagsComplexLocation( ClientTags.TAG_DISPLAY_ACTUAL, location_context, tag_search_context, namespace_wildcard = namespace, hash_ids_table_name = temp_table_name, job_key = job_key )
+            
+            query_hash_ids.difference_update( unwanted_hash_ids )
             
             if len( query_hash_ids ) == 0:
                 
@@ -5463,14 +6066,11 @@ class DB( HydrusDB.HydrusDB ):
         
         for wildcard in wildcards_to_exclude:
             
-            with self._MakeTemporaryIntegerTable( query_hash_ids, 'hash_id' ) as temp_table_name:
-                
-                self._AnalyzeTempTable( temp_table_name )
-                
-                unwanted_hash_ids = self._GetHashIdsFromWildcardComplexLocation( ClientTags.TAG_DISPLAY_ACTUAL, location_context, tag_search_context, wildcard, hash_ids = query_hash_ids, hash_ids_table_name = temp_table_name, job_key = job_key )
-                
-                query_hash_ids.difference_update( unwanted_hash_ids )
-                
+            temp_table_name = get_query_hash_ids_table_name( query_hash_ids )
+            
+            unwanted_hash_ids = self._GetHashIdsFromWildcardComplexLocation( ClientTags.TAG_DISPLAY_ACTUAL, location_context, tag_search_context, wildcard, hash_ids = query_hash_ids, hash_ids_table_name = temp_table_name, job_key = job_key )
+            
+            query_hash_ids.difference_update( unwanted_hash_ids )
             
             if len( query_hash_ids ) == 0:
                 
@@ -5577,14 +6177,11 @@ class DB( HydrusDB.HydrusDB ):
         
         if min_num_notes is not None or max_num_notes is not None:
             
-            with self._MakeTemporaryIntegerTable( query_hash_ids, 'hash_id' ) as temp_table_name:
-                
-                self._AnalyzeTempTable( temp_table_name )
-                
-                num_notes_hash_ids = self._GetHashIdsFromNumNotes( min_num_notes, max_num_notes, temp_table_name )
-                
-                query_hash_ids = intersection_update_qhi( query_hash_ids, num_notes_hash_ids )
-                
+            temp_table_name = get_query_hash_ids_table_name( query_hash_ids )
+            
+            num_notes_hash_ids = self._GetHashIdsFromNumNotes( min_num_notes, max_num_notes, temp_table_name )
+            
+            query_hash_ids = intersection_update_qhi( query_hash_ids, num_notes_hash_ids )
             
         
         if 'has_note_names' in simple_preds:
@@ -5593,14 +6190,11 @@ class DB( HydrusDB.HydrusDB ):
             
             for note_name in inclusive_note_names:
                 
-                with self._MakeTemporaryIntegerTable( query_hash_ids, 'hash_id' ) as temp_table_name:
-                    
-                    self._AnalyzeTempTable( temp_table_name )
-                    
-                    notes_hash_ids = self._GetHashIdsFromNoteName( note_name, temp_table_name )
-                    
-                    query_hash_ids = intersection_update_qhi( query_hash_ids, notes_hash_ids )
-                    
+                temp_table_name = get_query_hash_ids_table_name( query_hash_ids )
+                
+                notes_hash_ids = self._GetHashIdsFromNoteName( note_name, temp_table_name )
+                
+                query_hash_ids = intersection_update_qhi( query_hash_ids, notes_hash_ids )
                 
             
         
@@ -5610,14 +6204,11 @@ class DB( HydrusDB.HydrusDB ):
             
             for note_name in exclusive_note_names:
                 
-                with self._MakeTemporaryIntegerTable( query_hash_ids, 'hash_id' ) as temp_table_name:
-                    
-                    self._AnalyzeTempTable( temp_table_name )
-                    
-                    notes_hash_ids = self._GetHashIdsFromNoteName( note_name, temp_table_name )
-                    
-                    query_hash_ids.difference_update( notes_hash_ids )
-                    
+                temp_table_name = get_query_hash_ids_table_name( query_hash_ids )
+                
+                notes_hash_ids = self._GetHashIdsFromNoteName( note_name, temp_table_name )
+                
+                query_hash_ids.difference_update( notes_hash_ids )
                 
             
         
@@ -5665,21 +6256,21 @@ class DB( HydrusDB.HydrusDB ):
             
             if must_not_be_local:
                 
-                query_hash_ids = set()
+                query_hash_ids = HydrusIntegerSets.IntegerSet()
                 
             
         elif file_location_is_all_combined_local_files_deleted:
             
             if must_be_local:
                 
-                query_hash_ids = set()
+                query_hash_ids = HydrusIntegerSets.IntegerSet()
                 
             
         elif must_be_local or must_not_be_local:
             
             if must_be_local:
                 
-                query_hash_ids = self.modules_files_storage.FilterHashIdsToStatus( self.modules_services.combined_local_file_service_id, query_hash_ids, HC.CONTENT_STATUS_CURRENT )
+                query_hash_ids = HydrusIntegerSets.IntegerSet( self.modules_files_storage.FilterHashIdsToStatus( self.modules_services.combined_local_file_service_id, query_hash_ids, HC.CONTENT_STATUS_CURRENT ) )
                 
             elif must_not_be_local:
                 
@@ -5701,12 +6292,9 @@ class DB( HydrusDB.HydrusDB ):
                     
                 else:
                     
-                    with self._MakeTemporaryIntegerTable( query_hash_ids, 'hash_id' ) as temp_table_name:
-                        
-                        self._AnalyzeTempTable( temp_table_name )
-                        
-                        url_hash_ids = self._GetHashIdsFromURLRule( rule_type, rule, hash_ids = query_hash_ids, hash_ids_table_name = temp_table_name )
-                        
+                    temp_table_name = get_query_hash_ids_table_name( query_hash_ids )
+                    
+                    url_hash_ids = self._GetHashIdsFromURLRule( rule_type, rule, hash_ids = query_hash_ids, hash_ids_table_name = temp_table_name )
                     
                 
                 if operator: # inclusive
@@ -5735,33 +6323,44 @@ class DB( HydrusDB.HydrusDB ):
             
             megalambda = lambda x: False not in ( l( x ) for l in lambdas )
             
-            with self._MakeTemporaryIntegerTable( query_hash_ids, 'hash_id' ) as temp_table_name:
-                
-                self._AnalyzeTempTable( temp_table_name )
+            temp_table_name = get_query_hash_ids_table_name( query_hash_ids )
+            
+            nonzero_tag_query_hash_ids = set()
+            nonzero_tag_query_hash_ids_populated = False
+            
+            if is_zero or is_anything_but_zero:
                 
-                nonzero_tag_query_hash_ids = set()
-                nonzero_tag_query_hash_ids_populated = False
+                nonzero_tag_query_hash_ids = self._GetHashIdsThatHaveTagsComplexLocation( ClientTags.TAG_DISPLAY_ACTUAL, location_context, tag_search_context, hash_ids_table_name = temp_table_name, namespace_wildcard = namespace, job_key = job_key )
+                nonzero_tag_query_hash_ids_populated = True
                 
-                if is_zero or is_anything_but_zero:
+                if is_zero:
                     
-                    nonzero_tag_query_hash_ids = self._GetHashIdsThatHaveTagsComplexLocation( ClientTags.TAG_DISPLAY_ACTUAL, location_context, tag_search_context, hash_ids_table_name = temp_table_name, namespace_wildcard = namespace, job_key = job_key )
-                    nonzero_tag_query_hash_ids_populated = True
+                    query_hash_ids.difference_update( nonzero_tag_query_hash_ids )
                     
-                    if is_zero:
-                        
-                        query_hash_ids.difference_update( nonzero_tag_query_hash_ids )
-                        
+                
+                if is_anything_but_zero:
                     
-                    if is_anything_but_zero:
-                        
-                        query_hash_ids = intersection_update_qhi( query_hash_ids, nonzero_tag_query_hash_ids )
-                        
+                    query_hash_ids = intersection_update_qhi( query_hash_ids, nonzero_tag_query_hash_ids )
                     
                 
             
-            if len( specific_number_tests ) > 0:
+            file_tag_counts_lookup = self._GetFileTagCountsTableNamesAndColumn( ClientTags.TAG_DISPLAY_ACTUAL, location_context, tag_search_context, namespace_wildcard = namespace )
+            
+            # when we are still looking at most of the domain and zero is not wanted, a range lookup on the count index beats looking up every file
+            
+            if len( specific_number_tests ) > 0 and file_tag_counts_lookup is not None and not megalambda( 0 ) and len( query_hash_ids ) > domain_size_estimate // 4:
+                
+                ( file_tag_counts_table_names, count_column_name ) = file_tag_counts_lookup
+                
+                good_tag_count_hash_ids = self._GetHashIdsFromFileTagCounts( file_tag_counts_table_names, count_column_name, specific_number_tests, job_key = job_key )
+                
+                query_hash_ids = intersection_update_qhi( query_hash_ids, good_tag_count_hash_ids )
+                
+            elif len( specific_number_tests ) > 0:
+                
+                temp_table_name = get_query_hash_ids_table_name( query_hash_ids )
                 
-                hash_id_tag_counts = self._GetHashIdsAndNonZeroTagCounts( ClientTags.TAG_DISPLAY_ACTUAL, location_context, tag_search_context, query_hash_ids, namespace_wildcard = namespace, job_key = job_key )
+                hash_id_tag_counts = self._GetHashIdsAndNonZeroTagCounts( ClientTags.TAG_DISPLAY_ACTUAL, location_context, tag_search_context, query_hash_ids, namespace_wildcard = namespace, hash_ids_table_name = temp_table_name, job_key = job_key )
                 
                 good_tag_count_hash_ids = { hash_id for ( hash_id, count ) in hash_id_tag_counts if megalambda( count ) }
                 
@@ -5793,12 +6392,9 @@ class DB( HydrusDB.HydrusDB ):
             
             ( namespace, num ) = simple_preds[ 'min_tag_as_number' ]
             
-            with self._MakeTemporaryIntegerTable( query_hash_ids, 'hash_id' ) as temp_table_name:
-                
-                self._AnalyzeTempTable( temp_table_name )
-                
-                good_hash_ids = self._GetHashIdsThatHaveTagAsNumComplexLocation( ClientTags.TAG_DISPLAY_ACTUAL, location_context, tag_search_context, namespace, num, '>', hash_ids = query_hash_ids, hash_ids_table_name = temp_table_name, job_key = job_key )
-                
+            temp_table_name = get_query_hash_ids_table_name( query_hash_ids )
+            
+            good_hash_ids = self._GetHashIdsThatHaveTagAsNumComplexLocation( ClientTags.TAG_DISPLAY_ACTUAL, location_context, tag_search_context, namespace, num, '>', hash_ids = query_hash_ids, hash_ids_table_name = temp_table_name, job_key = job_key )
             
             query_hash_ids = intersection_update_qhi( query_hash_ids, good_hash_ids )
             
@@ -5807,12 +6403,9 @@ class DB( HydrusDB.HydrusDB ):
             
             ( namespace, num ) = simple_preds[ 'max_tag_as_number' ]
             
-            with self._MakeTemporaryIntegerTable( query_hash_ids, 'hash_id' ) as temp_table_name:
-                
-                self._AnalyzeTempTable( temp_table_name )
-                
-                good_hash_ids = self._GetHashIdsThatHaveTagAsNumComplexLocation( ClientTags.TAG_DISPLAY_ACTUAL, location_context, tag_search_context, namespace, num, '<', hash_ids = query_hash_ids, hash_ids_table_name = temp_table_name, job_key = job_key )
-                
+            temp_table_name = get_query_hash_ids_table_name( query_hash_ids )
+            
+            good_hash_ids = self._GetHashIdsThatHaveTagAsNumComplexLocation( ClientTags.TAG_DISPLAY_ACTUAL, location_context, tag_search_context, namespace, num, '<', hash_ids = query_hash_ids, hash_ids_table_name = temp_table_name, job_key = job_key )
             
             query_hash_ids = intersection_update_qhi( query_hash_ids, good_hash_ids )
             
@@ -5824,40 +6417,6 @@ class DB( HydrusDB.HydrusDB ):
         
         #
         
-        query_hash_ids = list( query_hash_ids )
-        
-        #
-        
-        limit = system_predicates.GetLimit( apply_implicit_limit = apply_implicit_limit )
-        
-        we_are_applying_limit = limit is not None and limit < len( query_hash_ids )
-        
-        if we_are_applying_limit and limit_sort_by is not None and sort_by is None:
-            
-            sort_by = limit_sort_by
-            
-        
-        did_sort = False
-        
-        if sort_by is not None and not location_context.IsAllKnownFiles():
-            
-            ( did_sort, query_hash_ids ) = self._TryToSortHashIds( location_context, query_hash_ids, sort_by )
-            
-        
-        #
-        
-        if we_are_applying_limit:
-            
-            if not did_sort:
-                
-                query_hash_ids = random.sample( query_hash_ids, limit )
-                
-            else:
-                
-                query_hash_ids = query_hash_ids[:limit]
-                
-            
-        
         return query_hash_ids
         
     
@@ -5901,7 +6460,7 @@ class DB( HydrusDB.HydrusDB ):
         
         tag_service_id = self.modules_services.GetServiceId( tag_search_context.service_key )
         
-        results = set()
+        results = HydrusIntegerSets.IntegerSet()
         
         for file_service_key in file_service_keys:
             
@@ -5962,7 +6521,7 @@ class DB( HydrusDB.HydrusDB ):
                 
             
         
-        result_hash_ids = set()
+        result_hash_ids = HydrusIntegerSets.IntegerSet()
         
         table_names = self._GetMappingTables( tag_display_type, file_service_key, tag_search_context )
         
@@ -5991,7 +6550,7 @@ class DB( HydrusDB.HydrusDB ):
                 
                 cursor = self._Execute( query, ( tag_id, ) )
                 
-                result_hash_ids.update( self._STI( HydrusDB.ReadFromCancellableCursor( cursor, 1024, cancelled_hook ) ) )
+                result_hash_ids.update( self._STIS( HydrusDB.ReadFromCancellableCursor( cursor, 1024, cancelled_hook ) ) )
                 
             
         else:
@@ -6016,7 +6575,7 @@ class DB( HydrusDB.HydrusDB ):
                     
                     cursor = self._Execute( query )
                     
-                    result_hash_ids.update( self._STI( HydrusDB.ReadFromCancellableCursor( cursor, 1024, cancelled_hook ) ) )
+                    result_hash_ids.update( self._STIS( HydrusDB.ReadFromCancellableCursor( cursor, 1024, cancelled_hook ) ) )
                     
                 
             
@@ -6157,7 +6716,7 @@ class DB( HydrusDB.HydrusDB ):
             return self._GetHashIdsThatHaveTagsComplexLocation( tag_display_type, location_context, tag_search_context, namespace_wildcard = namespace_wildcard, hash_ids_table_name = hash_ids_table_name, job_key = job_key )
             
         
-        results = set()
+        results = HydrusIntegerSets.IntegerSet()
         
         ( file_service_keys, file_location_is_cross_referenced ) = location_context.GetCoveringCurrentFileServiceKeys()
         
@@ -6260,7 +6819,7 @@ class DB( HydrusDB.HydrusDB ):
                 
             
         
-        results = set()
+        results = HydrusIntegerSets.IntegerSet()
         
         with self._MakeTemporaryIntegerTable( possible_namespace_ids, 'namespace_id' ) as temp_namespace_ids_table_name:
             
@@ -6342,13 +6901,13 @@ class DB( HydrusDB.HydrusDB ):
             cancelled_hook = job_key.IsCancelled
             
         
-        nonzero_tag_hash_ids = set()
+        nonzero_tag_hash_ids = HydrusIntegerSets.IntegerSet()
         
         for query in queries:
             
             cursor = self._Execute( query )
             
-            nonzero_tag_hash_ids.update( self._STI( HydrusDB.ReadFromCancellableCursor( cursor, 10240, cancelled_hook ) ) )
+            nonzero_tag_hash_ids.update( self._STIS( HydrusDB.ReadFromCancellableCursor( cursor, 10240, cancelled_hook ) ) )
             
             if job_key is not None and job_key.IsCancelled():
                 
@@ -6373,7 +6932,7 @@ class DB( HydrusDB.HydrusDB ):
             file_location_is_cross_referenced = True
             
         
-        results = set()
+        results = HydrusIntegerSets.IntegerSet()
         
         for file_service_key in file_service_keys:
             
@@ -6550,6 +7109,33 @@ class DB( HydrusDB.HydrusDB ):
         return ( locations_to_ideal_weights, abs_ideal_thumbnail_override_location )
         
     
+    def _GetKnownContentFilterBlock( self, source, last_id, limit ):
+        
+        if source == 'urls':
+            
+            query = 'SELECT url_id, url FROM urls WHERE url_id > ? ORDER BY url_id ASC LIMIT ?;'
+            
+        else:
+            
+            status = HC.CONTENT_STATUS_CURRENT if source == 'current_local_hashes' else HC.CONTENT_STATUS_DELETED
+            
+            files_table_name = ClientDBFilesStorage.GenerateFilesTableName( self.modules_services.combined_local_file_service_id, status )
+            
+            query = 'SELECT hash_id, hash FROM {} CROSS JOIN hashes USING ( hash_id ) WHERE hash_id > ? ORDER BY hash_id ASC LIMIT ?;'.format( files_table_name )
+            
+        
+        return self._Execute( query, ( last_id, limit ) ).fetchall()
+        
+    
+    def _GetKnownContentFilterCounts( self ):
+        
+        ( num_urls, ) = self._Execute( 'SELECT COUNT( * ) FROM urls;' ).fetchone()
+        
+        num_hashes = self.modules_files_storage.GetCurrentFilesCount( self.modules_services.combined_local_file_service_id ) + self.modules_files_storage.GetDeletedFilesCount( self.modules_services.combined_local_file_service_id )
+        
+        return ( num_urls, num_hashes )
+        
+    
     def _GetMaintenanceDue( self, stop_time ):
         
         jobs_to_do = []
@@ -7241,6 +7827,26 @@ class DB( HydrusDB.HydrusDB ):
         return None
         
     
+    def _GetBackupFileRelativePaths( self, hash_ids ):
+        
+        hash_ids_to_hashes = self.modules_hashes.GetHashIdsToHashes( hash_ids = hash_ids )
+        hash_ids_to_mimes = self.modules_files_metadata_basic.GetHashIdsToMimes( hash_ids )
+        
+        prefixes = self._GetClientFilesLocations()
+        
+        relative_paths = []
+        
+        for ( hash_id, mime ) in hash_ids_to_mimes.items():
+            
+            hash_encoded = hash_ids_to_hashes[ hash_id ].hex()
+            
+            relative_paths.append( os.path.join( ClientFiles.GetClientFilesPrefix( 'f', hash_encoded, prefixes ), hash_encoded + HC.mime_ext_lookup[ mime ] ) )
+            relative_paths.append( os.path.join( ClientFiles.GetClientFilesPrefix( 't', hash_encoded, prefixes ), hash_encoded + '.thumbnail' ) )
+            
+        
+        return relative_paths
+        
+    
     def _GetPossibleAdditionalDBFilenames( self ):
         
         paths = HydrusDB.HydrusDB._GetPossibleAdditionalDBFilenames( self )
@@ -7666,6 +8272,29 @@ class DB( HydrusDB.HydrusDB ):
         return site_id
         
     
+    def _GetTagSearchCountEstimate( self, file_search_context_branch: ClientDBServices.FileSearchContextBranch, tag ):
+        
+        # this is the count of the tag itself. a search for a worse sibling will get more than this, but it is only an estimate
+        
+        if not self.modules_tags.TagExists( tag ):
+            
+            return 0
+            
+        
+        tag_id = self.modules_tags.GetTagId( tag )
+        
+        tag_search_context = file_search_context_branch.GetFileSearchContext().GetTagSearchContext()
+        
+        count = 0
+        
+        for leaf in file_search_context_branch.IterateLeaves():
+            
+            count += self._GetAutocompleteCountEstimate( ClientTags.TAG_DISPLAY_ACTUAL, leaf.tag_service_id, leaf.file_service_id, ( tag_id, ), tag_search_context.include_current_tags, tag_search_context.include_pending_tags )
+            
+        
+        return count
+        
+    
     def _GetTagIdsFromNamespaceIds( self, leaf: ClientDBServices.FileSearchContextLeaf, namespace_ids: typing.Collection[ int ], job_key = None ):
         
         if len( namespace_ids ) == 0:
@@ -7885,6 +8514,77 @@ class DB( HydrusDB.HydrusDB ):
         return self.modules_hashes_local_cache.GetHashes( hash_ids )
         
     
+    def _GetURLAndHashStatuses( self, urls, hash_types_and_hashes ):
+        
+        # a bulk version of url_statuses and hash_status, so an importer can predict a whole chunk of its queue in one job
+        
+        urls_to_search_urls = { url : ClientNetworkingFunctions.GetSearchURLs( url ) for url in urls }
+        
+        search_urls_to_url_ids = {}
+        
+        for search_url in set( itertools.chain.from_iterable( urls_to_search_urls.values() ) ):
+            
+            result = self._Execute( 'SELECT url_id FROM urls WHERE url = ?;', ( search_url, ) ).fetchone()
+            
+            if result is not None:
+                
+                ( url_id, ) = result
+                
+                search_urls_to_url_ids[ search_url ] = url_id
+                
+            
+        
+        url_ids_to_hash_ids = collections.defaultdict( set )
+        
+        with self._MakeTemporaryIntegerTable( set( search_urls_to_url_ids.values() ), 'url_id' ) as temp_url_ids_table_name:
+            
+            for ( url_id, hash_id ) in self._Execute( 'SELECT url_id, hash_id FROM {} CROSS JOIN url_map USING ( url_id );'.format( temp_url_ids_table_name ) ):
+                
+                url_ids_to_hash_ids[ url_id ].add( hash_id )
+                
+            
+        
+        hash_ids_to_statuses = {}
+        
+        urls_to_statuses = {}
+        
+        for ( url, search_urls ) in urls_to_search_urls.items():
+            
+            hash_ids = set()
+            
+            for search_url in search_urls:
+                
+                if search_url in search_urls_to_url_ids:
+                    
+                    hash_ids.update( url_ids_to_hash_ids[ search_urls_to_url_ids[ search_url ] ] )
+                    
+                
+            
+            try:
+                
+                for hash_id in hash_ids:
+                    
+                    if hash_id not in hash_ids_to_statuses:
+                        
+                        hash_ids_to_statuses[ hash_id ] = self._GetHashIdStatus( hash_id, prefix = 'url recognised' )
+                        
+                    
+                
+                results = [ hash_ids_to_statuses[ hash_id ].Duplicate() for hash_id in hash_ids ]
+                
+            except:
+                
+                results = []
+                
+            
+            urls_to_statuses[ url ] = results
+            
+        
+        hash_types_and_hashes_to_statuses = { ( hash_type, hash ) : self._GetHashStatus( hash_type, hash, prefix = '{} hash recognised'.format( hash_type ) ) for ( hash_type, hash ) in hash_types_and_hashes }
+        
+        return ( urls_to_statuses, hash_types_and_hashes_to_statuses )
+        
+    
     def _GetURLStatuses( self, url ) -> typing.List[ ClientImportFiles.FileImportStatus ]:
         
         search_urls = ClientNetworkingFunctions.GetSearchURLs( url )
@@ -7910,6 +8610,13 @@ class DB( HydrusDB.HydrusDB ):
         return results
         
     
+    def _GetVideoKeyframeTimestamps( self, hash ):
+        
+        hash_id = self.modules_hashes_local_cache.GetHashId( hash )
+        
+        return self.modules_files_metadata_basic.GetVideoKeyframeTimestamps( hash_id )
+        
+    
     def _GetWithAndWithoutTagsForFilesFileCount( self, status, tag_service_id, with_these_tag_ids, without_these_tag_ids, hash_ids, hash_ids_table_name, file_service_ids_to_hash_ids ):
         
         # ok, given this selection of files, how many of them on current/pending have any of these tags but not any these, real fast?
@@ -8331,6 +9038,15 @@ class DB( HydrusDB.HydrusDB ):
             
             self._Execute( 'REPLACE INTO file_modified_timestamps ( hash_id, file_modified_timestamp ) VALUES ( ?, ? );', ( hash_id, file_modified_timestamp ) )
             
+            #
+            
+            if mime in HC.VIDEO:
+                
+                # this needs a full demux, so we leave it for file maintenance rather than slow the import down
+                
+                self.modules_files_maintenance_queue.AddJobs( { hash_id }, ClientFiles.REGENERATE_FILE_DATA_JOB_VIDEO_KEYFRAMES )
+                
+            
             #
             
             file_import_options = file_import_job.GetFileImportOptions()
@@ -8666,11 +9382,55 @@ class DB( HydrusDB.HydrusDB ):
             
         
     
+    def _MigrationBulkAddMappings( self, tag_service_key, data ):
+        
+        # for big migrations. this goes straight into the storage tables and leaves every cache and count alone, so no per-row cache work
+        # the caches are wrong until _MigrationFinishBulkMappings regenerates them all in one go at the end
+        
+        tag_service_id = self.modules_services.GetServiceId( tag_service_key )
+        
+        ( current_mappings_table_name, deleted_mappings_table_name, pending_mappings_table_name, petitioned_mappings_table_name ) = ClientDBMappingsStorage.GenerateMappingsTableNames( tag_service_id )
+        
+        tags_to_tag_ids = {}
+        
+        for tag in { tag for ( hash, tags ) in data for tag in tags }:
+            
+            try:
+                
+                tags_to_tag_ids[ tag ] = self.modules_tags.GetTagId( tag )
+                
+            except HydrusExceptions.TagSizeException:
+                
+                continue
+                
+            
+        
+        hashes_to_hash_ids = { hash : self.modules_hashes_local_cache.GetHashId( hash ) for ( hash, tags ) in data }
+        
+        mappings_ids = { ( tags_to_tag_ids[ tag ], hashes_to_hash_ids[ hash ] ) for ( hash, tags ) in data for tag in tags if tag in tags_to_tag_ids }
+        
+        # insert in index order, so sqlite is appending to pages rather than jumping around
+        mappings_ids = sorted( mappings_ids )
+        
+        self._ExecuteMany( 'DELETE FROM {} WHERE tag_id = ? AND hash_id = ?;'.format( deleted_mappings_table_name ), mappings_ids )
+        self._ExecuteMany( 'DELETE FROM {} WHERE tag_id = ? AND hash_id = ?;'.format( pending_mappings_table_name ), mappings_ids )
+        self._ExecuteMany( 'INSERT OR IGNORE INTO {} ( tag_id, hash_id ) VALUES ( ?, ? );'.format( current_mappings_table_name ), mappings_ids )
+        
+    
     def _MigrationClearJob( self, database_temp_job_name ):
         
         self._Execute( 'DROP TABLE {};'.format( database_temp_job_name ) )
         
     
+    def _MigrationFinishBulkMappings( self, tag_service_key ):
+        
+        tag_service_id = self.modules_services.GetServiceId( tag_service_key )
+        
+        self._Execute( 'DELETE FROM service_info WHERE service_id = ?;', ( tag_service_id, ) )
+        
+        self._RegenerateTagMappingsCache( tag_service_key = tag_service_key )
+        
+    
     def _MigrationGetMappings( self, database_temp_job_name, file_service_key, tag_service_key, hash_type, tag_filter, content_statuses ):
         
         time_started_precise = HydrusData.GetNowPrecise()
@@ -8916,6 +9676,13 @@ class DB( HydrusDB.HydrusDB ):
             
         
     
+    def _OrderSearchSteps( self, search_steps ):
+        
+        # most selective first. sort is stable, so ties keep the order they were made in, which is the old fixed order
+        
+        return sorted( search_steps, key = lambda step: step[1] )
+        
+    
     def _PerceptualHashesResetSearchFromHashes( self, hashes ):
         
         hash_ids = self.modules_hashes_local_cache.GetHashIds( hashes )
@@ -9208,6 +9975,8 @@ class DB( HydrusDB.HydrusDB ):
                             
                             self._ExecuteMany( 'INSERT OR IGNORE INTO url_map ( hash_id, url_id ) VALUES ( ?, ? );', itertools.product( hash_ids, url_ids ) )
                             
+                            self._controller.known_content_filter_manager.AddURLs( urls )
+                            
                         elif action == HC.CONTENT_UPDATE_DELETE:
                             
                             ( urls, hashes ) = row
@@ -10034,6 +10803,8 @@ class DB( HydrusDB.HydrusDB ):
         elif action == 'client_files_locations': result = self._GetClientFilesLocations( *args, **kwargs )
         elif action == 'deferred_physical_delete': result = self.modules_files_storage.GetDeferredPhysicalDelete( *args, **kwargs )
         elif action == 'duplicate_pairs_for_filtering': result = self._DuplicatesGetPotentialDuplicatePairsForFiltering( *args, **kwargs )
+        elif action == 'duplicate_pairs_for_filtering_from_queue': result = self._DuplicatesGetPotentialDuplicatePairsForFilteringFromQueue( *args, **kwargs )
+        elif action == 'export_folder_manifest': result = self.modules_serialisable.GetExportFolderManifest( *args, **kwargs )
         elif action == 'file_duplicate_hashes': result = self.modules_files_duplicates.DuplicatesGetFileHashesByDuplicateType( *args, **kwargs )
         elif action == 'file_duplicate_info': result = self.modules_files_duplicates.DuplicatesGetFileDuplicateInfo( *args, **kwargs )
         elif action == 'file_hashes': result = self.modules_hashes.GetFileHashes( *args, **kwargs )
@@ -10052,6 +10823,8 @@ class DB( HydrusDB.HydrusDB ):
         elif action == 'imageboards': result = self.modules_serialisable.GetYAMLDump( ClientDBSerialisable.YAML_DUMP_ID_IMAGEBOARD, *args, **kwargs )
         elif action == 'inbox_hashes': result = self._FilterInboxHashes( *args, **kwargs )
         elif action == 'is_an_orphan': result = self._IsAnOrphan( *args, **kwargs )
+        elif action == 'known_content_filter_block': result = self._GetKnownContentFilterBlock( *args, **kwargs )
+        elif action == 'known_content_filter_counts': result = self._GetKnownContentFilterCounts( *args, **kwargs )
         elif action == 'last_shutdown_work_time': result = self.modules_db_maintenance.GetLastShutdownWorkTime( *args, **kwargs )
         elif action == 'local_booru_share_keys': result = self.modules_serialisable.GetYAMLDumpNames( ClientDBSerialisable.YAML_DUMP_ID_LOCAL_BOORU )
         elif action == 'local_booru_share': result = self.modules_serialisable.GetYAMLDump( ClientDBSerialisable.YAML_DUMP_ID_LOCAL_BOORU, *args, **kwargs )
@@ -10095,7 +10868,9 @@ class DB( HydrusDB.HydrusDB ):
         elif action == 'tag_siblings_lookup': result = self.modules_tag_siblings.GetTagSiblingsForTags( *args, **kwargs )
         elif action == 'trash_hashes': result = self._GetTrashHashes( *args, **kwargs )
         elif action == 'potential_duplicates_count': result = self._DuplicatesGetPotentialDuplicatesCount( *args, **kwargs )
+        elif action == 'url_and_hash_statuses': result = self._GetURLAndHashStatuses( *args, **kwargs )
         elif action == 'url_statuses': result = self._GetURLStatuses( *args, **kwargs )
+        elif action == 'video_keyframe_timestamps': result = self._GetVideoKeyframeTimestamps( *args, **kwargs )
         elif action == 'vacuum_data': result = self.modules_db_maintenance.GetVacuumData( *args, **kwargs )
         else: raise Exception( 'db received an unknown read command: ' + action )
         
@@ -11354,6 +12129,20 @@ class DB( HydrusDB.HydrusDB ):
         BlockingSafeShowMessage( message )
         
     
+    def _ReportSearchPlan( self, file_search_context: ClientSearch.FileSearchContext, search_plan_report_rows ):
+        
+        predicates_summary = ', '.join( ( predicate.ToString( with_count = False ) for predicate in file_search_context.GetPredicates() ) )
+        
+        lines = [ 'search plan for {}:'.format( predicates_summary ) ]
+        
+        for ( i, ( step_description, step_estimate, num_step_results, num_results_left, time_took ) ) in enumerate( search_plan_report_rows ):
+            
+            lines.append( '{}. {}: estimated {}, found {}, {} left, {}ms'.format( i + 1, step_description, HydrusData.ToHumanInt( step_estimate ), HydrusData.ToHumanInt( num_step_results ), HydrusData.ToHumanInt( num_results_left ), int( time_took * 1000 ) ) )
+            
+        
+        HydrusData.ShowText( '\n'.join( lines ) )
+        
+    
     def _ReportUnderupdatedDB( self, version ):
         
         message = 'This client\'s database is version {}, but the software is significantly later, {}! Trying to update many versions in one go can be dangerous due to bitrot. I suggest you try at most to only do 10 versions at once. If you want to try a big jump anyway, you should make sure you have a backup beforehand so you can roll back to it in case the update makes your db unbootable. If you would rather try smaller updates, or you do not have a backup, force-kill this client in Task Manager right now. Otherwise, ok this dialog box to continue.'.format( HydrusData.ToHumanInt( version ), HydrusData.ToHumanInt( HC.SOFTWARE_VERSION ) )
@@ -11530,6 +12319,13 @@ class DB( HydrusDB.HydrusDB ):
             
         
     
+    def _ReshardClientFiles( self, old_prefixes, new_prefixes_to_locations ):
+        
+        self._ExecuteMany( 'DELETE FROM client_files_locations WHERE prefix = ?;', ( ( prefix, ) for prefix in old_prefixes ) )
+        
+        self._ExecuteMany( 'INSERT INTO client_files_locations ( prefix, location ) VALUES ( ?, ? );', ( ( prefix, HydrusPaths.ConvertAbsPathToPortablePath( location ) ) for ( prefix, location ) in new_prefixes_to_locations.items() ) )
+        
+    
     def _SaveDirtyServices( self, dirty_services ):
         
         # if allowed to save objects
@@ -11632,6 +12428,191 @@ class DB( HydrusDB.HydrusDB ):
         self._ExecuteMany( 'INSERT INTO service_directory_file_map ( service_id, directory_id, hash_id ) VALUES ( ?, ?, ? );', ( ( service_id, directory_id, hash_id ) for hash_id in hash_ids ) )
         
     
+    def _TryToGetTopKHashIdsFromQuery( self, query_hash_ids_table: HydrusDBBase.SyncedTemporaryIntegerTable, file_search_context: ClientSearch.FileSearchContext, job_key: ClientThreading.JobKey, limit: int, sort_by: typing.Optional[ ClientMedia.MediaSort ] ):
+        
+        # for a limited search, rather than find everything and then sort and clip, we walk the files in sort order and test them a batch at a time until we have enough
+        # this only works if every predicate is cheap to test on a small batch, and if enough files match that we won't walk a big chunk of the db to find them
+        # returning None means do the normal search
+        
+        location_context = file_search_context.GetLocationContext()
+        
+        if not ( location_context.IsOneDomain() and location_context.IncludesCurrent() ) or location_context.IncludesDeleted() or location_context.IsAllKnownFiles():
+            
+            return None
+            
+        
+        system_predicates = file_search_context.GetSystemPredicates()
+        
+        simple_preds = system_predicates.GetSimpleInfo()
+        
+        ( required_file_service_statuses, excluded_file_service_statuses ) = system_predicates.GetFileServiceStatuses()
+        
+        if len( file_search_context.GetORPredicates() ) > 0 or not set( simple_preds.keys() ).issubset( TOP_K_SIMPLE_PREDICATE_KEYS ):
+            
+            return None
+            
+        
+        if system_predicates.HasSimilarTo() or system_predicates.GetKingFilter() is not None or system_predicates.MustNotBeLocal():
+            
+            return None
+            
+        
+        if len( system_predicates.GetRatingsPredicates() ) > 0 or len( system_predicates.GetDuplicateRelationshipCountPredicates() ) > 0 or len( system_predicates.GetFileViewingStatsPredicates() ) > 0 or len( system_predicates.GetNumTagsNumberTests() ) > 0:
+            
+            return None
+            
+        
+        if len( required_file_service_statuses ) > 0 or len( excluded_file_service_statuses ) > 0:
+            
+            return None
+            
+        
+        file_service_key = list( location_context.current_service_keys )[0]
+        
+        file_service_id = self.modules_services.GetServiceId( file_service_key )
+        
+        current_files_table_name = ClientDBFilesStorage.GenerateFilesTableName( file_service_id, HC.CONTENT_STATUS_CURRENT )
+        
+        if sort_by is None:
+            
+            # the normal search does a random sample here
+            
+            sort_data = CC.SORT_FILES_BY_RANDOM
+            
+        else:
+            
+            ( sort_metadata, sort_data ) = sort_by.sort_type
+            
+            if sort_metadata != 'system' or not ( sort_data in TOP_K_SORT_COLUMNS or sort_data in ( CC.SORT_FILES_BY_IMPORT_TIME, CC.SORT_FILES_BY_RANDOM ) ):
+                
+                return None
+                
+            
+        
+        # now let's guess how many files we will have to test to get our limit
+        
+        domain_size = self.modules_files_storage.GetCurrentFilesCount( file_service_id )
+        
+        if domain_size == 0:
+            
+            return None
+            
+        
+        file_search_context_branch = self._GetFileSearchContextBranch( file_search_context )
+        
+        num_inbox = len( self.modules_files_metadata_basic.inbox_hash_ids )
+        
+        estimated_match_fraction = 1.0
+        
+        for tag in file_search_context.GetTagsToInclude():
+            
+            estimated_match_fraction *= min( 1.0, self._GetTagSearchCountEstimate( file_search_context_branch, tag ) / domain_size )
+            
+        
+        for tag in file_search_context.GetTagsToExclude():
+            
+            estimated_match_fraction *= max( 0.0, 1.0 - ( self._GetTagSearchCountEstimate( file_search_context_branch, tag ) / domain_size ) )
+            
+        
+        estimated_match_fraction *= 0.5 ** ( len( file_search_context.GetNamespacesToInclude() ) + len( file_search_context.GetNamespacesToExclude() ) + len( file_search_context.GetWildcardsToExclude() ) )
+        estimated_match_fraction *= 0.25 ** len( file_search_context.GetWildcardsToInclude() )
+        estimated_match_fraction *= 0.5 ** len( simple_preds )
+        
+        if system_predicates.MustBeInbox():
+            
+            estimated_match_fraction *= min( 1.0, num_inbox / domain_size )
+            
+        
+        if system_predicates.MustBeArchive():
+            
+            estimated_match_fraction *= max( 0.0, 1.0 - ( num_inbox / domain_size ) )
+            
+        
+        # past this, a full search is about as cheap
+        max_num_to_test = domain_size // 4
+        
+        if estimated_match_fraction == 0.0 or limit / estimated_match_fraction > max_num_to_test:
+            
+            return None
+            
+        
+        if sort_data == CC.SORT_FILES_BY_RANDOM:
+            
+            # we sample in sqlite rather than pulling the whole domain into python
+            # ( hash_id * a + b ) mod a prime is a random shuffle of the hash_ids that stays the same between batches, so LIMIT/OFFSET paging never tests a file twice
+            
+            prime = 2147483647
+            
+            query = 'SELECT hash_id FROM {} ORDER BY ( hash_id * {} + {} ) % {} LIMIT ? OFFSET ?;'.format( current_files_table_name, random.randint( 1, prime - 1 ), random.randint( 0, prime - 1 ), prime )
+            
+        else:
+            
+            direction = 'DESC' if sort_by.sort_order == CC.SORT_DESC else 'ASC'
+            
+            if sort_data == CC.SORT_FILES_BY_IMPORT_TIME:
+                
+                query = 'SELECT hash_id FROM {} ORDER BY timestamp {} LIMIT ? OFFSET ?;'.format( current_files_table_name, direction )
+                
+            else:
+                
+                # files_info first so we walk its index. files with no files_info row are not walked, but we fall back before that matters
+                query = 'SELECT hash_id FROM files_info CROSS JOIN {} USING ( hash_id ) ORDER BY {} {} LIMIT ? OFFSET ?;'.format( current_files_table_name, TOP_K_SORT_COLUMNS[ sort_data ], direction )
+                
+            
+        
+        def get_candidates( offset, num_to_get ):
+            
+            return self._STL( self._Execute( query, ( num_to_get, offset ) ) )
+            
+        
+        top_k_hash_ids = []
+        
+        num_tested = 0
+        num_batches = 0
+        
+        batch_size = max( 256, int( ( limit / estimated_match_fraction ) * 1.5 ) )
+        
+        while len( top_k_hash_ids ) < limit:
+            
+            if job_key.IsCancelled():
+                
+                return []
+                
+            
+            num_to_get = min( batch_size, max_num_to_test - num_tested )
+            
+            candidate_hash_ids = get_candidates( num_tested, num_to_get ) if num_to_get > 0 else []
+            
+            if len( candidate_hash_ids ) == 0:
+                
+                # we guessed too few matches, or ran out of files. either way, the normal search can do it
+                
+                if HG.db_report_mode:
+                    
+                    HydrusData.ShowText( 'top-k search gave up after testing {} files in {} batches'.format( HydrusData.ToHumanInt( num_tested ), HydrusData.ToHumanInt( num_batches ) ) )
+                    
+                
+                return None
+                
+            
+            num_tested += len( candidate_hash_ids )
+            num_batches += 1
+            
+            matching_hash_ids = set( self._DoGetHashIdsFromQuery( query_hash_ids_table, file_search_context, job_key = job_key, query_hash_ids = candidate_hash_ids ) )
+            
+            top_k_hash_ids.extend( ( hash_id for hash_id in candidate_hash_ids if hash_id in matching_hash_ids ) )
+            
+            batch_size *= 2
+            
+        
+        if HG.db_report_mode:
+            
+            HydrusData.ShowText( 'top-k search found {} files after testing {} in {} batches'.format( HydrusData.ToHumanInt( limit ), HydrusData.ToHumanInt( num_tested ), HydrusData.ToHumanInt( num_batches ) ) )
+            
+        
+        return top_k_hash_ids[:limit]
+        
+    
     def _TryToSortHashIds( self, location_context: ClientLocation.LocationContext, hash_ids, sort_by: ClientMedia.MediaSort ):
         
         did_sort = False
@@ -13648,6 +14629,62 @@ class DB( HydrusDB.HydrusDB ):
                 
             
         
+        if version == 473:
+            
+            result = self._Execute( 'SELECT 1 FROM sqlite_master WHERE name = ?;', ( 'file_video_keyframes', ) ).fetchone()
+            
+            if result is None:
+                
+                try:
+                    
+                    self._Execute( 'CREATE TABLE IF NOT EXISTS main.file_video_keyframes ( hash_id INTEGER PRIMARY KEY, keyframe_timestamps TEXT );' )
+                    
+                    self._controller.frame_splash_status.SetSubtext( 'scheduling videos for keyframe indexing' )
+                    
+                    table_join = self.modules_files_storage.GetTableJoinLimitedByFileDomain( self.modules_services.combined_local_file_service_id, 'files_info', HC.CONTENT_STATUS_CURRENT )
+                    
+                    hash_ids = self._STL( self._Execute( 'SELECT hash_id FROM {} WHERE mime IN {};'.format( table_join, HydrusData.SplayListForDB( HC.VIDEO ) ) ) )
+                    
+                    self.modules_files_maintenance_queue.AddJobs( hash_ids, ClientFiles.REGENERATE_FILE_DATA_JOB_VIDEO_KEYFRAMES )
+                    
+                except Exception as e:
+                    
+                    HydrusData.PrintException( e )
+                    
+                    message = 'Trying to schedule videos for keyframe indexing failed! Please let hydrus dev know!'
+                    
+                    self.pub_initial_message( message )
+                    
+                
+            
+        
+        if version == 474:
+            
+            try:
+                
+                self._controller.frame_splash_status.SetSubtext( 'counting tags per file' )
+                
+                tag_service_ids = self.modules_services.GetServiceIds( HC.REAL_TAG_SERVICES )
+                file_service_ids = self.modules_services.GetServiceIds( HC.FILE_SERVICES_WITH_SPECIFIC_MAPPING_CACHES )
+                
+                for ( file_service_id, tag_service_id ) in itertools.product( file_service_ids, tag_service_ids ):
+                    
+                    self.modules_mappings_cache_specific_display.GenerateFileTagCounts( file_service_id, tag_service_id )
+                    
+                
+            except Exception as e:
+                
+                HydrusData.PrintException( e )
+                
+                message = 'Trying to count the tags on each file failed! Please let hydrus dev know!'
+                
+                self.pub_initial_message( message )
+                
+            
+            self._Execute( 'CREATE TABLE IF NOT EXISTS main.export_folder_manifest_settings ( export_folder_name TEXT PRIMARY KEY, settings_hash BLOB_BYTES );' )
+            self._Execute( 'CREATE TABLE IF NOT EXISTS main.export_folder_manifests ( export_folder_name TEXT, hash_id INTEGER, path TEXT, PRIMARY KEY ( export_folder_name, hash_id ) );' )
+            
+        
         self._controller.frame_splash_status.SetTitleText( 'updated db to v{}'.format( HydrusData.ToHumanInt( version + 1 ) ) )
         
         self._Execute( 'UPDATE version SET version = ?;', ( version + 1, ) )
@@ -14140,8 +15177,12 @@ class DB( HydrusDB.HydrusDB ):
         elif action == 'dirty_services': self._SaveDirtyServices( *args, **kwargs )
         elif action == 'dissolve_alternates_group': self.modules_files_duplicates.DuplicatesDissolveAlternatesGroupIdFromHashes( *args, **kwargs )
         elif action == 'dissolve_duplicates_group': self.modules_files_duplicates.DuplicatesDissolveMediaIdFromHashes( *args, **kwargs )
+        elif action == 'duplicate_pair_queue_drop': self.modules_files_duplicates.DuplicatesDropPotentialDuplicatePairsQueue( *args, **kwargs )
+        elif action == 'duplicate_pair_queue_fill': result = self.modules_files_duplicates.DuplicatesFillPotentialDuplicatePairsQueue( *args, **kwargs )
+        elif action == 'duplicate_pair_queue_start': result = self._DuplicatesStartPotentialDuplicatePairsQueue( *args, **kwargs )
         elif action == 'duplicate_pair_status': self._DuplicatesSetDuplicatePairStatus( *args, **kwargs )
         elif action == 'duplicate_set_king': self.modules_files_duplicates.DuplicatesSetKingFromHash( *args, **kwargs )
+        elif action == 'export_folder_manifest': self.modules_serialisable.SetExportFolderManifest( *args, **kwargs )
         elif action == 'file_maintenance_add_jobs': self.modules_files_maintenance_queue.AddJobs( *args, **kwargs )
         elif action == 'file_maintenance_add_jobs_hashes': self.modules_files_maintenance_queue.AddJobsHashes( *args, **kwargs )
         elif action == 'file_maintenance_cancel_jobs': self.modules_files_maintenance_queue.CancelJobs( *args, **kwargs )
@@ -14155,7 +15196,9 @@ class DB( HydrusDB.HydrusDB ):
         elif action == 'maintain_hashed_serialisables': result = self.modules_serialisable.MaintainHashedStorage( *args, **kwargs )
         elif action == 'maintain_similar_files_search_for_potential_duplicates': result = self._PerceptualHashesSearchForPotentialDuplicates( *args, **kwargs )
         elif action == 'maintain_similar_files_tree': self.modules_similar_files.MaintainTree( *args, **kwargs )
+        elif action == 'migration_bulk_add_mappings': self._MigrationBulkAddMappings( *args, **kwargs )
         elif action == 'migration_clear_job': self._MigrationClearJob( *args, **kwargs )
+        elif action == 'migration_finish_bulk_mappings': self._MigrationFinishBulkMappings( *args, **kwargs )
         elif action == 'migration_start_mappings_job': self._MigrationStartMappingsJob( *args, **kwargs )
         elif action == 'migration_start_pairs_job': self._MigrationStartPairsJob( *args, **kwargs )
         elif action == 'process_repository_content': result = self._ProcessRepositoryContent( *args, **kwargs )
@@ -14185,6 +15228,7 @@ class DB( HydrusDB.HydrusDB ):
         elif action == 'reprocess_repository': self.modules_repositories.ReprocessRepository( *args, **kwargs )
         elif action == 'reset_repository': self._ResetRepository( *args, **kwargs )
         elif action == 'reset_repository_processing': self._ResetRepositoryProcessing( *args, **kwargs )
+        elif action == 'reshard_client_files': self._ReshardClientFiles( *args, **kwargs )
         elif action == 'reset_potential_search_status': self._PerceptualHashesResetSearchFromHashes( *args, **kwargs )
         elif action == 'save_options': self._SaveOptions( *args, **kwargs )
         elif action == 'serialisable': self.modules_serialisable.SetJSONDump( *args, **kwargs )
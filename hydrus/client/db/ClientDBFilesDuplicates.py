@@ -1,5 +1,6 @@
 import collections
 import itertools
+import os
 import random
 import sqlite3
 import typing
@@ -15,6 +16,24 @@ from hydrus.client.db import ClientDBFilesStorage
 from hydrus.client.db import ClientDBModule
 from hydrus.client.db import ClientDBSimilarFiles
 
+class PotentialDuplicatePairsQueue( object ):
+    
+    def __init__( self, queue_table_name, results_table_name, db_location_context: ClientDBFilesStorage.DBLocationContext, both_files_match, pixel_dupes_preference, max_hamming_distance, allowed_hash_ids = None, preferred_hash_ids = None ):
+        
+        self.queue_table_name = queue_table_name
+        self.results_table_name = results_table_name
+        self.db_location_context = db_location_context
+        self.both_files_match = both_files_match
+        self.pixel_dupes_preference = pixel_dupes_preference
+        self.max_hamming_distance = max_hamming_distance
+        self.allowed_hash_ids = allowed_hash_ids
+        self.preferred_hash_ids = preferred_hash_ids
+        
+        # we walk potential_duplicate_pairs in primary key order, this is the last ( smaller_media_id, larger_media_id ) we looked at
+        self.scan_position = ( -1, -1 )
+        self.scan_is_done = False
+        
+    
 class ClientDBFilesDuplicates( ClientDBModule.ClientDBModule ):
     
     def __init__(
@@ -33,6 +52,8 @@ class ClientDBFilesDuplicates( ClientDBModule.ClientDBModule ):
         
         self._service_ids_to_content_types_to_outstanding_local_processing = collections.defaultdict( dict )
         
+        self._queue_keys_to_potential_duplicate_pairs_queues = {}
+        
     
     def _GetInitialIndexGenerationDict( self ) -> dict:
         
@@ -255,6 +276,25 @@ class ClientDBFilesDuplicates( ClientDBModule.ClientDBModule ):
         self.modules_similar_files.ResetSearch( hash_ids )
         
     
+    def DuplicatesDropPotentialDuplicatePairsQueue( self, queue_key ):
+        
+        if queue_key not in self._queue_keys_to_potential_duplicate_pairs_queues:
+            
+            return
+            
+        
+        queue = self._queue_keys_to_potential_duplicate_pairs_queues[ queue_key ]
+        
+        del self._queue_keys_to_potential_duplicate_pairs_queues[ queue_key ]
+        
+        self._Execute( 'DROP TABLE IF EXISTS {};'.format( queue.queue_table_name ) )
+        
+        if queue.results_table_name is not None:
+            
+            self._Execute( 'DROP TABLE IF EXISTS {};'.format( queue.results_table_name ) )
+            
+        
+    
     def DuplicatesDissolveAlternatesGroupId( self, alternates_group_id ):
         
         media_ids = self.DuplicatesGetAlternateMediaIds( alternates_group_id )
@@ -314,6 +354,73 @@ class ClientDBFilesDuplicates( ClientDBModule.ClientDBModule ):
             
         
     
+    def DuplicatesFillPotentialDuplicatePairsQueue( self, queue_key, num_to_scan = 10000, max_queue_size = 25000 ):
+        
+        # the expensive part of fetching pairs for the filter is the big DISTINCT join of every potential pair against the search
+        # here we do that join on one bite-size block of potential_duplicate_pairs at a time and save what matches, so each call is quick and the filter can read as it goes
+        # returns whether there is more useful work to do
+        
+        if queue_key not in self._queue_keys_to_potential_duplicate_pairs_queues:
+            
+            return False # the filter closed and dropped it
+            
+        
+        queue = self.DuplicatesGetPotentialDuplicatePairsQueue( queue_key )
+        
+        if queue.scan_is_done:
+            
+            return False
+            
+        
+        ( last_smaller_media_id, last_larger_media_id ) = queue.scan_position
+        
+        rows = self._Execute( 'SELECT smaller_media_id, larger_media_id, distance FROM potential_duplicate_pairs WHERE smaller_media_id = ? AND larger_media_id > ? ORDER BY larger_media_id LIMIT ?;', ( last_smaller_media_id, last_larger_media_id, num_to_scan ) ).fetchall()
+        
+        if len( rows ) < num_to_scan:
+            
+            rows.extend( self._Execute( 'SELECT smaller_media_id, larger_media_id, distance FROM potential_duplicate_pairs WHERE smaller_media_id > ? ORDER BY smaller_media_id, larger_media_id LIMIT ?;', ( last_smaller_media_id, num_to_scan - len( rows ) ) ).fetchall() )
+            
+        
+        if len( rows ) < num_to_scan:
+            
+            queue.scan_is_done = True
+            
+        
+        if len( rows ) > 0:
+            
+            ( smaller_media_id, larger_media_id, distance ) = rows[-1]
+            
+            queue.scan_position = ( smaller_media_id, larger_media_id )
+            
+            scan_table_name = 'mem.potential_duplicate_pairs_scan'
+            
+            self._Execute( 'CREATE TABLE IF NOT EXISTS {} ( smaller_media_id INTEGER, larger_media_id INTEGER, distance INTEGER, PRIMARY KEY ( smaller_media_id, larger_media_id ) );'.format( scan_table_name ) )
+            
+            self._ExecuteMany( 'INSERT OR IGNORE INTO {} ( smaller_media_id, larger_media_id, distance ) VALUES ( ?, ?, ? );'.format( scan_table_name ), rows )
+            
+            if queue.results_table_name is None:
+                
+                table_join = self.DuplicatesGetPotentialDuplicatePairsTableJoinOnEverythingSearchResults( queue.db_location_context, queue.pixel_dupes_preference, queue.max_hamming_distance, pairs_table_name = scan_table_name )
+                
+            else:
+                
+                table_join = self.DuplicatesGetPotentialDuplicatePairsTableJoinOnSearchResults( queue.db_location_context, queue.results_table_name, queue.both_files_match, queue.pixel_dupes_preference, queue.max_hamming_distance, pairs_table_name = scan_table_name )
+                
+            
+            # distinct important here for the search results table join
+            self._Execute( 'INSERT OR IGNORE INTO {} ( smaller_media_id, larger_media_id, distance ) SELECT DISTINCT smaller_media_id, larger_media_id, distance FROM {};'.format( queue.queue_table_name, table_join ) )
+            
+            self._Execute( 'DELETE FROM {};'.format( scan_table_name ) )
+            
+        
+        if queue.scan_is_done:
+            
+            return False
+            
+        
+        return self.DuplicatesGetPotentialDuplicatePairsQueueSize( queue_key ) < max_queue_size
+        
+    
     def DuplicatesFilterKingHashIds( self, allowed_hash_ids ):
         
         # can't just pull explicit king_hash_ids, since files that do not have a media_id are still kings
@@ -888,9 +995,39 @@ class ClientDBFilesDuplicates( ClientDBModule.ClientDBModule ):
         return media_id
         
     
-    def DuplicatesGetPotentialDuplicatePairsTableJoinOnEverythingSearchResults( self, db_location_context: ClientDBFilesStorage.DBLocationContext, pixel_dupes_preference: int, max_hamming_distance: int ):
+    def DuplicatesGetPotentialDuplicatePairsQueue( self, queue_key ) -> PotentialDuplicatePairsQueue:
+        
+        if queue_key not in self._queue_keys_to_potential_duplicate_pairs_queues:
+            
+            raise HydrusExceptions.DataMissing( 'Did not find that potential duplicate pairs queue! Perhaps the filter was open across a client restart?' )
+            
+        
+        return self._queue_keys_to_potential_duplicate_pairs_queues[ queue_key ]
+        
+    
+    def DuplicatesGetPotentialDuplicatePairsQueueRows( self, queue_key, limit ):
+        
+        queue = self.DuplicatesGetPotentialDuplicatePairsQueue( queue_key )
+        
+        # smallest distance first. pairs a decision has since cleared from potential_duplicate_pairs fall out in the join
         
-        tables = 'potential_duplicate_pairs, duplicate_file_members AS duplicate_file_members_smaller, duplicate_file_members AS duplicate_file_members_larger'
+        query = 'SELECT smaller_media_id, larger_media_id, {}.distance FROM {} CROSS JOIN potential_duplicate_pairs USING ( smaller_media_id, larger_media_id ) ORDER BY {}.distance LIMIT ?;'.format( queue.queue_table_name, queue.queue_table_name, queue.queue_table_name )
+        
+        return self._Execute( query, ( limit, ) ).fetchall()
+        
+    
+    def DuplicatesGetPotentialDuplicatePairsQueueSize( self, queue_key ):
+        
+        queue = self.DuplicatesGetPotentialDuplicatePairsQueue( queue_key )
+        
+        ( num_rows, ) = self._Execute( 'SELECT COUNT( * ) FROM {};'.format( queue.queue_table_name ) ).fetchone()
+        
+        return num_rows
+        
+    
+    def DuplicatesGetPotentialDuplicatePairsTableJoinOnEverythingSearchResults( self, db_location_context: ClientDBFilesStorage.DBLocationContext, pixel_dupes_preference: int, max_hamming_distance: int, pairs_table_name = 'potential_duplicate_pairs' ):
+        
+        tables = '{}, duplicate_file_members AS duplicate_file_members_smaller, duplicate_file_members AS duplicate_file_members_larger'.format( pairs_table_name )
         join_predicate = 'smaller_media_id = duplicate_file_members_smaller.media_id AND larger_media_id = duplicate_file_members_larger.media_id AND distance <= {}'.format( max_hamming_distance )
         
         if not db_location_context.location_context.IsAllKnownFiles():
@@ -943,7 +1080,7 @@ class ClientDBFilesDuplicates( ClientDBModule.ClientDBModule ):
         return table_join
         
     
-    def DuplicatesGetPotentialDuplicatePairsTableJoinOnSearchResults( self, db_location_context: ClientDBFilesStorage.DBLocationContext, results_table_name: str, both_files_match: bool, pixel_dupes_preference: int, max_hamming_distance: int ):
+    def DuplicatesGetPotentialDuplicatePairsTableJoinOnSearchResults( self, db_location_context: ClientDBFilesStorage.DBLocationContext, results_table_name: str, both_files_match: bool, pixel_dupes_preference: int, max_hamming_distance: int, pairs_table_name = 'potential_duplicate_pairs' ):
         
         # why yes this is a seven table join that involves a mix of duplicated tables, temporary tables, and duplicated temporary tables
         #
@@ -994,7 +1131,7 @@ class ClientDBFilesDuplicates( ClientDBModule.ClientDBModule ):
         # ████████████████████████████████████████████████████████████████████████
         #
         
-        base_tables = 'potential_duplicate_pairs, duplicate_file_members AS duplicate_file_members_smaller, duplicate_file_members AS duplicate_file_members_larger'
+        base_tables = '{}, duplicate_file_members AS duplicate_file_members_smaller, duplicate_file_members AS duplicate_file_members_larger'.format( pairs_table_name )
         
         join_predicate_media_to_hashes = 'smaller_media_id = duplicate_file_members_smaller.media_id AND larger_media_id = duplicate_file_members_larger.media_id AND distance <= {}'.format( max_hamming_distance )
         
@@ -1252,6 +1389,13 @@ class ClientDBFilesDuplicates( ClientDBModule.ClientDBModule ):
             
         
     
+    def DuplicatesRemoveFromPotentialDuplicatePairsQueue( self, queue_key, pairs_of_media_ids ):
+        
+        queue = self.DuplicatesGetPotentialDuplicatePairsQueue( queue_key )
+        
+        self._ExecuteMany( 'DELETE FROM {} WHERE smaller_media_id = ? AND larger_media_id = ?;'.format( queue.queue_table_name ), pairs_of_media_ids )
+        
+    
     def DuplicatesRemovePotentialPairs( self, hash_id ):
         
         media_id = self.DuplicatesGetMediaId( hash_id, do_not_create = True )
@@ -1272,6 +1416,14 @@ class ClientDBFilesDuplicates( ClientDBModule.ClientDBModule ):
             
         
     
+    def DuplicatesRestartPotentialDuplicatePairsQueue( self, queue_key ):
+        
+        queue = self.DuplicatesGetPotentialDuplicatePairsQueue( queue_key )
+        
+        queue.scan_position = ( -1, -1 )
+        queue.scan_is_done = False
+        
+    
     def DuplicatesSetAlternates( self, media_id_a, media_id_b ):
         
         # let's clear out any outstanding potentials. whether this is a valid or not connection, we don't want to see it again
@@ -1377,6 +1529,52 @@ class ClientDBFilesDuplicates( ClientDBModule.ClientDBModule ):
         self.DuplicatesSetKing( hash_id, media_id )
         
     
+    def DuplicatesStartPotentialDuplicatePairsQueue( self, db_location_context: ClientDBFilesStorage.DBLocationContext, query_hash_ids, both_files_match, pixel_dupes_preference, max_hamming_distance ):
+        
+        # query_hash_ids None means system:everything
+        
+        queue_key = os.urandom( 8 ).hex()
+        
+        queue_table_name = 'durable_temp.potential_duplicate_pairs_queue_{}'.format( queue_key )
+        
+        self._Execute( 'CREATE TABLE IF NOT EXISTS {} ( smaller_media_id INTEGER, larger_media_id INTEGER, distance INTEGER, PRIMARY KEY ( smaller_media_id, larger_media_id ) );'.format( queue_table_name ) )
+        
+        self._CreateIndex( queue_table_name, [ 'distance' ] )
+        
+        allowed_hash_ids = None
+        preferred_hash_ids = None
+        
+        if query_hash_ids is None:
+            
+            results_table_name = None
+            
+        else:
+            
+            if both_files_match:
+                
+                allowed_hash_ids = query_hash_ids
+                
+            else:
+                
+                preferred_hash_ids = query_hash_ids
+                
+            
+            results_table_name = 'durable_temp.potential_duplicate_pairs_queue_results_{}'.format( queue_key )
+            
+            self._Execute( 'CREATE TABLE IF NOT EXISTS {} ( hash_id INTEGER PRIMARY KEY );'.format( results_table_name ) )
+            
+            self._ExecuteMany( 'INSERT OR IGNORE INTO {} ( hash_id ) VALUES ( ? );'.format( results_table_name ), ( ( hash_id, ) for hash_id in query_hash_ids ) )
+            
+            self._Execute( 'ANALYZE {};'.format( results_table_name ) )
+            
+        
+        queue = PotentialDuplicatePairsQueue( queue_table_name, results_table_name, db_location_context, both_files_match, pixel_dupes_preference, max_hamming_distance, allowed_hash_ids = allowed_hash_ids, preferred_hash_ids = preferred_hash_ids )
+        
+        self._queue_keys_to_potential_duplicate_pairs_queues[ queue_key ] = queue
+        
+        return queue_key
+        
+    
     def GetTablesAndColumnsThatUseDefinitions( self, content_type: int ) -> typing.List[ typing.Tuple[ str, str ] ]:
         
         tables_and_columns = []
@@ -120,6 +120,12 @@ class ClientDBFilesMaintenance( ClientDBModule.ClientDBModule ):
                     
                     self.modules_similar_files.SetPixelHash( hash_id, pixel_hash_id )
                     
+                elif job_type == ClientFiles.REGENERATE_FILE_DATA_JOB_VIDEO_KEYFRAMES:
+                    
+                    keyframe_timestamps = additional_data
+                    
+                    self.modules_files_metadata_basic.SetVideoKeyframeTimestamps( hash_id, keyframe_timestamps )
+                    
                 elif job_type == ClientFiles.REGENERATE_FILE_DATA_JOB_FILE_MODIFIED_TIMESTAMP:
                     
                     file_modified_timestamp = additional_data
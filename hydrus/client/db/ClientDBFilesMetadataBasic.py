@@ -1,3 +1,4 @@
+import json
 import os
 import sqlite3
 import typing
@@ -40,7 +41,8 @@ class ClientDBFilesMetadataBasic( ClientDBModule.ClientDBModule ):
         return {
             'main.file_inbox' : ( 'CREATE TABLE IF NOT EXISTS {} ( hash_id INTEGER PRIMARY KEY );', 400 ),
             'main.files_info' : ( 'CREATE TABLE IF NOT EXISTS {} ( hash_id INTEGER PRIMARY KEY, size INTEGER, mime INTEGER, width INTEGER, height INTEGER, duration INTEGER, num_frames INTEGER, has_audio INTEGER_BOOLEAN, num_words INTEGER );', 400 ),
-            'main.has_icc_profile' : ( 'CREATE TABLE IF NOT EXISTS {} ( hash_id INTEGER PRIMARY KEY );', 465 )
+            'main.has_icc_profile' : ( 'CREATE TABLE IF NOT EXISTS {} ( hash_id INTEGER PRIMARY KEY );', 465 ),
+            'main.file_video_keyframes' : ( 'CREATE TABLE IF NOT EXISTS {} ( hash_id INTEGER PRIMARY KEY, keyframe_timestamps TEXT );', 474 )
         }
         
     
@@ -100,6 +102,16 @@ class ClientDBFilesMetadataBasic( ClientDBModule.ClientDBModule ):
         return mime
         
     
+    def GetHashIdsToMimes( self, hash_ids: typing.Collection[ int ] ) -> typing.Dict[ int, int ]:
+        
+        with self._MakeTemporaryIntegerTable( hash_ids, 'hash_id' ) as temp_hash_ids_table_name:
+            
+            hash_ids_to_mimes = dict( self._Execute( 'SELECT hash_id, mime FROM {} CROSS JOIN files_info USING ( hash_id );'.format( temp_hash_ids_table_name ) ) )
+            
+        
+        return hash_ids_to_mimes
+        
+    
     def GetNumViewable( self, hash_ids: typing.Collection[ int ] ) -> int:
         
         if len( hash_ids ) == 1:
@@ -138,7 +150,8 @@ class ClientDBFilesMetadataBasic( ClientDBModule.ClientDBModule ):
             return [
                 ( 'file_inbox', 'hash_id' ),
                 ( 'files_info', 'hash_id' ),
-                ( 'has_icc_profile', 'hash_id' )
+                ( 'has_icc_profile', 'hash_id' ),
+                ( 'file_video_keyframes', 'hash_id' )
             ]
             
         
@@ -188,6 +201,20 @@ class ClientDBFilesMetadataBasic( ClientDBModule.ClientDBModule ):
         return has_icc_profile_hash_ids
         
     
+    def GetVideoKeyframeTimestamps( self, hash_id: int ):
+        
+        result = self._Execute( 'SELECT keyframe_timestamps FROM file_video_keyframes WHERE hash_id = ?;', ( hash_id, ) ).fetchone()
+        
+        if result is None:
+            
+            return None
+            
+        
+        ( keyframe_timestamps_json, ) = result
+        
+        return json.loads( keyframe_timestamps_json )
+        
+    
     def InboxFiles( self, hash_ids: typing.Collection[ int ] ) -> typing.Set[ int ]:
         
         if not isinstance( hash_ids, set ):
@@ -219,3 +246,8 @@ class ClientDBFilesMetadataBasic( ClientDBModule.ClientDBModule ):
             
         
     
+    def SetVideoKeyframeTimestamps( self, hash_id: int, keyframe_timestamps: typing.List[ int ] ):
+        
+        self._Execute( 'REPLACE INTO file_video_keyframes ( hash_id, keyframe_timestamps ) VALUES ( ?, ? );', ( hash_id, json.dumps( keyframe_timestamps ) ) )
+        
+    
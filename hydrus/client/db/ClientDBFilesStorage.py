@@ -682,6 +682,15 @@ class ClientDBFilesStorage( ClientDBModule.ClientDBModule ):
         return rows
         
     
+    def GetCurrentHashIdsAddedSince( self, service_id: int, timestamp: int ) -> typing.List[ int ]:
+        
+        current_files_table_name = GenerateFilesTableName( service_id, HC.CONTENT_STATUS_CURRENT )
+        
+        hash_ids = self._STL( self._Execute( 'SELECT hash_id FROM {} WHERE timestamp >= ?;'.format( current_files_table_name ), ( timestamp, ) ) )
+        
+        return hash_ids
+        
+    
     def GetCurrentTimestamp( self, service_id: int, hash_id: int ):
         
         current_files_table_name = GenerateFilesTableName( service_id, HC.CONTENT_STATUS_CURRENT )
@@ -731,6 +740,15 @@ class ClientDBFilesStorage( ClientDBModule.ClientDBModule ):
         return ( num_files, num_thumbnails )
         
     
+    def GetDeletedHashIdsDeletedSince( self, service_id: int, timestamp: int ) -> typing.List[ int ]:
+        
+        ( current_files_table_name, deleted_files_table_name, pending_files_table_name, petitioned_files_table_name ) = GenerateFilesTableNames( service_id )
+        
+        hash_ids = self._STL( self._Execute( 'SELECT hash_id FROM {} WHERE timestamp >= ? AND hash_id NOT IN ( SELECT hash_id FROM {} );'.format( deleted_files_table_name, current_files_table_name ), ( timestamp, ) ) )
+        
+        return hash_ids
+        
+    
     def GetDeletedFilesCount( self, service_id: int ) -> int:
         
         deleted_files_table_name = GenerateFilesTableName( service_id, HC.CONTENT_STATUS_DELETED )
@@ -5,6 +5,7 @@ import typing
 
 from hydrus.core import HydrusConstants as HC
 from hydrus.core import HydrusData
+from hydrus.core import HydrusDBBase
 
 from hydrus.client.db import ClientDBMappingsCounts
 from hydrus.client.db import ClientDBMappingsCountsUpdate
@@ -24,6 +25,14 @@ def GenerateSpecificDisplayMappingsCacheTableNames( file_service_id, tag_service
     
     return ( cache_display_current_mappings_table_name, cache_display_pending_mappings_table_name )
     
+def GenerateSpecificDisplayFileTagCountsTableName( file_service_id, tag_service_id ):
+    
+    suffix = '{}_{}'.format( file_service_id, tag_service_id )
+    
+    cache_display_file_tag_counts_table_name = 'external_caches.specific_display_file_tag_counts_cache_{}'.format( suffix )
+    
+    return cache_display_file_tag_counts_table_name
+    
 class ClientDBMappingsCacheSpecificDisplay( ClientDBModule.ClientDBModule ):
     
     CAN_REPOPULATE_ALL_MISSING_DATA = True
@@ -39,6 +48,25 @@ class ClientDBMappingsCacheSpecificDisplay( ClientDBModule.ClientDBModule ):
         ClientDBModule.ClientDBModule.__init__( self, 'client mappings counts', cursor )
         
     
+    def _GetFileTagCountsStatusColumnAndOtherTable( self, file_service_id, tag_service_id, status ):
+        
+        ( cache_display_current_mappings_table_name, cache_display_pending_mappings_table_name ) = GenerateSpecificDisplayMappingsCacheTableNames( file_service_id, tag_service_id )
+        
+        if status == HC.CONTENT_STATUS_CURRENT:
+            
+            return ( 'current_count', cache_display_pending_mappings_table_name )
+            
+        else:
+            
+            return ( 'pending_count', cache_display_current_mappings_table_name )
+            
+        
+    
+    def _GetHashIdsWithDisplayTag( self, cache_display_mappings_table_name, hash_ids_table_name, tag_id ):
+        
+        return self._STS( self._Execute( 'SELECT hash_id FROM {} CROSS JOIN {} USING ( hash_id ) WHERE tag_id = ?;'.format( hash_ids_table_name, cache_display_mappings_table_name ), ( tag_id, ) ) )
+        
+    
     def _GetServiceIndexGenerationDictSingle( self, file_service_id, tag_service_id ):
         
         ( cache_display_current_mappings_table_name, cache_display_pending_mappings_table_name ) = GenerateSpecificDisplayMappingsCacheTableNames( file_service_id, tag_service_id )
@@ -53,6 +81,14 @@ class ClientDBMappingsCacheSpecificDisplay( ClientDBModule.ClientDBModule ):
             ( [ 'tag_id', 'hash_id' ], True, 400 )
         ]
         
+        cache_display_file_tag_counts_table_name = GenerateSpecificDisplayFileTagCountsTableName( file_service_id, tag_service_id )
+        
+        index_generation_dict[ cache_display_file_tag_counts_table_name ] = [
+            ( [ 'current_count' ], False, 475 ),
+            ( [ 'pending_count' ], False, 475 ),
+            ( [ 'current_or_pending_count' ], False, 475 )
+        ]
+        
         return index_generation_dict
         
     
@@ -85,6 +121,10 @@ class ClientDBMappingsCacheSpecificDisplay( ClientDBModule.ClientDBModule ):
         table_dict[ cache_display_current_mappings_table_name ] = ( 'CREATE TABLE IF NOT EXISTS {} ( hash_id INTEGER, tag_id INTEGER, PRIMARY KEY ( hash_id, tag_id ) ) WITHOUT ROWID;', version )
         table_dict[ cache_display_pending_mappings_table_name ] = ( 'CREATE TABLE IF NOT EXISTS {} ( hash_id INTEGER, tag_id INTEGER, PRIMARY KEY ( hash_id, tag_id ) ) WITHOUT ROWID;', version )
         
+        cache_display_file_tag_counts_table_name = GenerateSpecificDisplayFileTagCountsTableName( file_service_id, tag_service_id )
+        
+        table_dict[ cache_display_file_tag_counts_table_name ] = ( 'CREATE TABLE IF NOT EXISTS {} ( hash_id INTEGER PRIMARY KEY, current_count INTEGER, pending_count INTEGER, current_or_pending_count INTEGER );', 475 )
+        
         return table_dict
         
     
@@ -111,6 +151,91 @@ class ClientDBMappingsCacheSpecificDisplay( ClientDBModule.ClientDBModule ):
         return self.modules_services.GetServiceIds( HC.REAL_TAG_SERVICES )
         
     
+    def _RegenerateFileTagCounts( self, file_service_id, tag_service_id ):
+        
+        # the full recount, for when a whole cache is (re)built. normal mapping changes move the counts by delta
+        
+        ( cache_display_current_mappings_table_name, cache_display_pending_mappings_table_name ) = GenerateSpecificDisplayMappingsCacheTableNames( file_service_id, tag_service_id )
+        
+        cache_display_file_tag_counts_table_name = GenerateSpecificDisplayFileTagCountsTableName( file_service_id, tag_service_id )
+        
+        self._Execute( 'DELETE FROM {};'.format( cache_display_file_tag_counts_table_name ) )
+        
+        select_statements = [
+            'SELECT hash_id, tag_id, 1 AS is_current, 0 AS is_pending FROM {}'.format( cache_display_current_mappings_table_name ),
+            'SELECT hash_id, tag_id, 0 AS is_current, 1 AS is_pending FROM {}'.format( cache_display_pending_mappings_table_name )
+        ]
+        
+        # a display tag can be both current and pending on a file when different siblings/parents imply it, so the 'either' count is its own thing
+        
+        query = 'INSERT INTO {} ( hash_id, current_count, pending_count, current_or_pending_count ) SELECT hash_id, SUM( is_current ), SUM( is_pending ), COUNT( DISTINCT tag_id ) FROM ( {} ) GROUP BY hash_id;'.format( cache_display_file_tag_counts_table_name, ' UNION ALL '.join( select_statements ) )
+        
+        self._Execute( query )
+        
+    
+    def _RepairRepopulateTables( self, table_names, cursor_transaction_wrapper: HydrusDBBase.DBCursorTransactionWrapper ):
+        
+        file_service_ids = self.modules_services.GetServiceIds( HC.FILE_SERVICES_WITH_SPECIFIC_MAPPING_CACHES )
+        tag_service_ids = self.modules_services.GetServiceIds( HC.REAL_TAG_SERVICES )
+        
+        for ( file_service_id, tag_service_id ) in itertools.product( file_service_ids, tag_service_ids ):
+            
+            if GenerateSpecificDisplayFileTagCountsTableName( file_service_id, tag_service_id ) in table_names:
+                
+                self._RegenerateFileTagCounts( file_service_id, tag_service_id )
+                
+                cursor_transaction_wrapper.CommitAndBegin()
+                
+            
+        
+    
+    def _UpdateFileTagCounts( self, file_service_id, tag_service_id, status, tag_id, hash_ids, delta ):
+        
+        # tag_id was just added to (delta 1) or removed from (delta -1) these files' display mappings for this status
+        # the 'either' count only moves if the file does not also have the tag in the other status
+        
+        cache_display_file_tag_counts_table_name = GenerateSpecificDisplayFileTagCountsTableName( file_service_id, tag_service_id )
+        
+        ( count_column_name, other_cache_display_mappings_table_name ) = self._GetFileTagCountsStatusColumnAndOtherTable( file_service_id, tag_service_id, status )
+        
+        if delta > 0:
+            
+            self._ExecuteMany( 'INSERT OR IGNORE INTO {} ( hash_id, current_count, pending_count, current_or_pending_count ) VALUES ( ?, 0, 0, 0 );'.format( cache_display_file_tag_counts_table_name ), ( ( hash_id, ) for hash_id in hash_ids ) )
+            
+        
+        update = 'UPDATE {} SET {} = {} + ?, current_or_pending_count = current_or_pending_count + ( CASE WHEN EXISTS ( SELECT 1 FROM {} WHERE {}.hash_id = {}.hash_id AND {}.tag_id = ? ) THEN 0 ELSE ? END ) WHERE hash_id = ?;'.format( cache_display_file_tag_counts_table_name, count_column_name, count_column_name, other_cache_display_mappings_table_name, other_cache_display_mappings_table_name, cache_display_file_tag_counts_table_name, other_cache_display_mappings_table_name )
+        
+        self._ExecuteMany( update, ( ( delta, tag_id, delta, hash_id ) for hash_id in hash_ids ) )
+        
+        if delta < 0:
+            
+            self._ExecuteMany( 'DELETE FROM {} WHERE hash_id = ? AND current_or_pending_count = 0;'.format( cache_display_file_tag_counts_table_name ), ( ( hash_id, ) for hash_id in hash_ids ) )
+            
+        
+    
+    def _UpdateFileTagCountsFromTable( self, file_service_id, tag_service_id, status, tag_id, hash_ids_table_name, delta ):
+        
+        # as above, for the big sibling/parent jobs that collect their changed hash_ids in a temp table
+        
+        cache_display_file_tag_counts_table_name = GenerateSpecificDisplayFileTagCountsTableName( file_service_id, tag_service_id )
+        
+        ( count_column_name, other_cache_display_mappings_table_name ) = self._GetFileTagCountsStatusColumnAndOtherTable( file_service_id, tag_service_id, status )
+        
+        if delta > 0:
+            
+            self._Execute( 'INSERT OR IGNORE INTO {} ( hash_id, current_count, pending_count, current_or_pending_count ) SELECT hash_id, 0, 0, 0 FROM {};'.format( cache_display_file_tag_counts_table_name, hash_ids_table_name ) )
+            
+        
+        update = 'UPDATE {} SET {} = {} + ?, current_or_pending_count = current_or_pending_count + ( CASE WHEN EXISTS ( SELECT 1 FROM {} WHERE {}.hash_id = {}.hash_id AND {}.tag_id = ? ) THEN 0 ELSE ? END ) WHERE hash_id IN ( SELECT hash_id FROM {} );'.format( cache_display_file_tag_counts_table_name, count_column_name, count_column_name, other_cache_display_mappings_table_name, other_cache_display_mappings_table_name, cache_display_file_tag_counts_table_name, other_cache_display_mappings_table_name, hash_ids_table_name )
+        
+        self._Execute( update, ( delta, tag_id, delta ) )
+        
+        if delta < 0:
+            
+            self._Execute( 'DELETE FROM {} WHERE hash_id IN ( SELECT hash_id FROM {} ) AND current_or_pending_count = 0;'.format( cache_display_file_tag_counts_table_name, hash_ids_table_name ) )
+            
+        
+    
     def AddFiles( self, file_service_id, tag_service_id, hash_ids, hash_ids_table_name ):
         
         ( cache_display_current_mappings_table_name, cache_display_pending_mappings_table_name ) = GenerateSpecificDisplayMappingsCacheTableNames( file_service_id, tag_service_id )
@@ -144,6 +269,11 @@ class ClientDBMappingsCacheSpecificDisplay( ClientDBModule.ClientDBModule ):
         
         counts_cache_changes = []
         
+        # the files are new to this domain, so we can count their tags as we go
+        hash_ids_to_current_counts = collections.Counter()
+        hash_ids_to_pending_counts = collections.Counter()
+        hash_ids_to_current_and_pending_counts = collections.Counter()
+        
         # for all display tags implied by the existing storage mappings, add them
         # btw, when we add files to a specific domain, we know that all inserts are new
         
@@ -157,6 +287,8 @@ class ClientDBMappingsCacheSpecificDisplay( ClientDBModule.ClientDBModule ):
                 
                 self._ExecuteMany( 'INSERT OR IGNORE INTO ' + cache_display_current_mappings_table_name + ' ( hash_id, tag_id ) VALUES ( ?, ? );', ( ( hash_id, display_tag_id ) for hash_id in display_current_hash_ids ) )
                 
+                hash_ids_to_current_counts.update( display_current_hash_ids )
+                
             
             #
             
@@ -168,6 +300,9 @@ class ClientDBMappingsCacheSpecificDisplay( ClientDBModule.ClientDBModule ):
                 
                 self._ExecuteMany( 'INSERT OR IGNORE INTO ' + cache_display_pending_mappings_table_name + ' ( hash_id, tag_id ) VALUES ( ?, ? );', ( ( hash_id, display_tag_id ) for hash_id in display_pending_hash_ids ) )
                 
+                hash_ids_to_pending_counts.update( display_pending_hash_ids )
+                hash_ids_to_current_and_pending_counts.update( display_pending_hash_ids.intersection( display_current_hash_ids ) )
+                
             
             #
             
@@ -181,6 +316,12 @@ class ClientDBMappingsCacheSpecificDisplay( ClientDBModule.ClientDBModule ):
             
             self.modules_mappings_counts_update.AddCounts( ClientTags.TAG_DISPLAY_ACTUAL, file_service_id, tag_service_id, counts_cache_changes )
             
+            cache_display_file_tag_counts_table_name = GenerateSpecificDisplayFileTagCountsTableName( file_service_id, tag_service_id )
+            
+            counted_hash_ids = set( hash_ids_to_current_counts.keys() ).union( hash_ids_to_pending_counts.keys() )
+            
+            self._ExecuteMany( 'INSERT OR REPLACE INTO {} ( hash_id, current_count, pending_count, current_or_pending_count ) VALUES ( ?, ?, ?, ? );'.format( cache_display_file_tag_counts_table_name ), ( ( hash_id, hash_ids_to_current_counts[ hash_id ], hash_ids_to_pending_counts[ hash_id ], hash_ids_to_current_counts[ hash_id ] + hash_ids_to_pending_counts[ hash_id ] - hash_ids_to_current_and_pending_counts[ hash_id ] ) for hash_id in counted_hash_ids ) )
+            
         
     
     def AddImplications( self, file_service_id, tag_service_id, implication_tag_ids, tag_id, status_hook = None ):
@@ -211,23 +352,35 @@ class ClientDBMappingsCacheSpecificDisplay( ClientDBModule.ClientDBModule ):
                 continue
                 
             
-            if len( add_tag_ids ) == 1:
+            # we collect exactly the files that are getting the tag, so the per-file counts can move by delta
+            
+            with self._MakeTemporaryIntegerTable( [], 'hash_id' ) as temp_hash_ids_table_name:
+                
+                not_already_there = 'NOT EXISTS ( SELECT 1 FROM {} WHERE {}.hash_id = {}.hash_id AND {}.tag_id = ? )'.format( cache_display_mappings_table_name, cache_display_mappings_table_name, cache_mappings_table_name, cache_display_mappings_table_name )
                 
-                ( add_tag_id, ) = add_tag_ids
+                if len( add_tag_ids ) == 1:
+                    
+                    ( add_tag_id, ) = add_tag_ids
+                    
+                    self._Execute( 'INSERT OR IGNORE INTO {} ( hash_id ) SELECT hash_id FROM {} WHERE tag_id = ? AND {};'.format( temp_hash_ids_table_name, cache_mappings_table_name, not_already_there ), ( add_tag_id, tag_id ) )
+                    
+                else:
+                    
+                    with self._MakeTemporaryIntegerTable( add_tag_ids, 'tag_id' ) as temp_tag_ids_table_name:
+                        
+                        # for all new implications, get files with those tags and not existing
+                        
+                        self._Execute( 'INSERT OR IGNORE INTO {} ( hash_id ) SELECT hash_id FROM {} CROSS JOIN {} USING ( tag_id ) WHERE {};'.format( temp_hash_ids_table_name, temp_tag_ids_table_name, cache_mappings_table_name, not_already_there ), ( tag_id, ) )
+                        
+                    
                 
-                self._Execute( 'INSERT OR IGNORE INTO {} ( hash_id, tag_id ) SELECT hash_id, ? FROM {} WHERE tag_id = ?;'.format( cache_display_mappings_table_name, cache_mappings_table_name ), ( tag_id, add_tag_id ) )
+                self._Execute( 'INSERT OR IGNORE INTO {} ( hash_id, tag_id ) SELECT hash_id, ? FROM {};'.format( cache_display_mappings_table_name, temp_hash_ids_table_name ), ( tag_id, ) )
                 
                 statuses_to_count_delta[ status ] = self._GetRowCount()
                 
-            else:
-                
-                with self._MakeTemporaryIntegerTable( add_tag_ids, 'tag_id' ) as temp_tag_ids_table_name:
-                    
-                    # for all new implications, get files with those tags and not existing
+                if statuses_to_count_delta[ status ] > 0:
                     
-                    self._Execute( 'INSERT OR IGNORE INTO {} ( hash_id, tag_id ) SELECT hash_id, ? FROM {} CROSS JOIN {} USING ( tag_id );'.format( cache_display_mappings_table_name, temp_tag_ids_table_name, cache_mappings_table_name ), ( tag_id, ) )
-                    
-                    statuses_to_count_delta[ status ] = self._GetRowCount()
+                    self._UpdateFileTagCountsFromTable( file_service_id, tag_service_id, status, tag_id, temp_hash_ids_table_name, 1 )
                     
                 
             
@@ -253,15 +406,20 @@ class ClientDBMappingsCacheSpecificDisplay( ClientDBModule.ClientDBModule ):
         
         ac_counts = collections.Counter()
         
-        for display_tag_id in display_tag_ids:
-            
-            self._ExecuteMany( 'INSERT OR IGNORE INTO ' + cache_display_current_mappings_table_name + ' ( hash_id, tag_id ) VALUES ( ?, ? );', ( ( hash_id, display_tag_id ) for hash_id in hash_ids ) )
+        with self._MakeTemporaryIntegerTable( hash_ids, 'hash_id' ) as temp_hash_ids_table_name:
             
-            num_added = self._GetRowCount()
-            
-            if num_added > 0:
+            for display_tag_id in display_tag_ids:
+                
+                added_hash_ids = set( hash_ids ).difference( self._GetHashIdsWithDisplayTag( cache_display_current_mappings_table_name, temp_hash_ids_table_name, display_tag_id ) )
                 
-                ac_counts[ display_tag_id ] += num_added
+                if len( added_hash_ids ) > 0:
+                    
+                    self._ExecuteMany( 'INSERT OR IGNORE INTO ' + cache_display_current_mappings_table_name + ' ( hash_id, tag_id ) VALUES ( ?, ? );', ( ( hash_id, display_tag_id ) for hash_id in added_hash_ids ) )
+                    
+                    ac_counts[ display_tag_id ] += len( added_hash_ids )
+                    
+                    self._UpdateFileTagCounts( file_service_id, tag_service_id, HC.CONTENT_STATUS_CURRENT, display_tag_id, added_hash_ids, 1 )
+                    
                 
             
         
@@ -286,6 +444,8 @@ class ClientDBMappingsCacheSpecificDisplay( ClientDBModule.ClientDBModule ):
         
         self.modules_mappings_counts.ClearCounts( ClientTags.TAG_DISPLAY_ACTUAL, file_service_id, tag_service_id, keep_pending = keep_pending )
         
+        self._RegenerateFileTagCounts( file_service_id, tag_service_id )
+        
     
     def Drop( self, file_service_id, tag_service_id ):
         
@@ -294,6 +454,10 @@ class ClientDBMappingsCacheSpecificDisplay( ClientDBModule.ClientDBModule ):
         self._Execute( 'DROP TABLE IF EXISTS {};'.format( cache_display_current_mappings_table_name ) )
         self._Execute( 'DROP TABLE IF EXISTS {};'.format( cache_display_pending_mappings_table_name ) )
         
+        cache_display_file_tag_counts_table_name = GenerateSpecificDisplayFileTagCountsTableName( file_service_id, tag_service_id )
+        
+        self._Execute( 'DROP TABLE IF EXISTS {};'.format( cache_display_file_tag_counts_table_name ) )
+        
         self.modules_mappings_counts.DropTables( ClientTags.TAG_DISPLAY_ACTUAL, file_service_id, tag_service_id )
         
     
@@ -334,6 +498,10 @@ class ClientDBMappingsCacheSpecificDisplay( ClientDBModule.ClientDBModule ):
         self._ExecuteMany( 'DELETE FROM ' + cache_display_current_mappings_table_name + ' WHERE hash_id = ?;', ( ( hash_id, ) for hash_id in hash_ids ) )
         self._ExecuteMany( 'DELETE FROM ' + cache_display_pending_mappings_table_name + ' WHERE hash_id = ?;', ( ( hash_id, ) for hash_id in hash_ids ) )
         
+        cache_display_file_tag_counts_table_name = GenerateSpecificDisplayFileTagCountsTableName( file_service_id, tag_service_id )
+        
+        self._ExecuteMany( 'DELETE FROM ' + cache_display_file_tag_counts_table_name + ' WHERE hash_id = ?;', ( ( hash_id, ) for hash_id in hash_ids ) )
+        
         if len( counts_cache_changes ) > 0:
             
             self.modules_mappings_counts_update.ReduceCounts( ClientTags.TAG_DISPLAY_ACTUAL, file_service_id, tag_service_id, counts_cache_changes )
@@ -434,11 +602,21 @@ class ClientDBMappingsCacheSpecificDisplay( ClientDBModule.ClientDBModule ):
                         predicates_phrase = '{} AND {}'.format( hash_id_in_storage_remove, hash_id_not_in_storage_keep )
                         
                     
-                    query = 'DELETE FROM {} WHERE tag_id = {} AND {};'.format( cache_display_mappings_table_name, tag_id, predicates_phrase )
-                    
-                    self._Execute( query )
+                    # we collect exactly the files that are losing the tag, so the per-file counts can move by delta
                     
-                    statuses_to_count_delta[ status ] = self._GetRowCount()
+                    with self._MakeTemporaryIntegerTable( [], 'hash_id' ) as temp_hash_ids_table_name:
+                        
+                        self._Execute( 'INSERT OR IGNORE INTO {} ( hash_id ) SELECT hash_id FROM {} WHERE tag_id = {} AND {};'.format( temp_hash_ids_table_name, cache_display_mappings_table_name, tag_id, predicates_phrase ) )
+                        
+                        self._Execute( 'DELETE FROM {} WHERE hash_id IN ( SELECT hash_id FROM {} ) AND tag_id = ?;'.format( cache_display_mappings_table_name, temp_hash_ids_table_name ), ( tag_id, ) )
+                        
+                        statuses_to_count_delta[ status ] = self._GetRowCount()
+                        
+                        if statuses_to_count_delta[ status ] > 0:
+                            
+                            self._UpdateFileTagCountsFromTable( file_service_id, tag_service_id, status, tag_id, temp_hash_ids_table_name, -1 )
+                            
+                        
                     
                 
             
@@ -464,41 +642,53 @@ class ClientDBMappingsCacheSpecificDisplay( ClientDBModule.ClientDBModule ):
         
         ac_counts = collections.Counter()
         
-        for ( display_tag_id, implied_by_tag_ids ) in implies_tag_ids_to_implied_by_tag_ids.items():
-            
-            # for every tag implied by the storage tag being removed
-            
-            other_implied_by_tag_ids = set( implied_by_tag_ids )
-            other_implied_by_tag_ids.discard( storage_tag_id )
+        with self._MakeTemporaryIntegerTable( hash_ids, 'hash_id' ) as temp_hash_ids_table_name:
             
-            if len( other_implied_by_tag_ids ) == 0:
+            for ( display_tag_id, implied_by_tag_ids ) in implies_tag_ids_to_implied_by_tag_ids.items():
                 
-                # nothing else implies this tag on display, so can just straight up delete
+                # for every tag implied by the storage tag being removed
                 
-                self._ExecuteMany( 'DELETE FROM {} WHERE tag_id = ? AND hash_id = ?;'.format( cache_display_current_mappings_table_name ), ( ( display_tag_id, hash_id ) for hash_id in hash_ids ) )
+                existing_hash_ids = self._GetHashIdsWithDisplayTag( cache_display_current_mappings_table_name, temp_hash_ids_table_name, display_tag_id )
                 
-                num_deleted = self._GetRowCount()
-                
-            else:
-                
-                # other things imply this tag on display, so we need to check storage to see what else has it
-                statuses_to_table_names = self.modules_mappings_storage.GetFastestStorageMappingTableNames( file_service_id, tag_service_id )
+                if len( existing_hash_ids ) == 0:
+                    
+                    continue
+                    
                 
-                mappings_table_name = statuses_to_table_names[ HC.CONTENT_STATUS_CURRENT ]
+                other_implied_by_tag_ids = set( implied_by_tag_ids )
+                other_implied_by_tag_ids.discard( storage_tag_id )
                 
-                with self._MakeTemporaryIntegerTable( other_implied_by_tag_ids, 'tag_id' ) as temp_table_name:
+                if len( other_implied_by_tag_ids ) == 0:
                     
-                    delete = 'DELETE FROM {} WHERE tag_id = ? AND hash_id = ? AND NOT EXISTS ( SELECT 1 FROM {} CROSS JOIN {} USING ( tag_id ) WHERE hash_id = ? );'.format( cache_display_current_mappings_table_name, mappings_table_name, temp_table_name )
+                    # nothing else implies this tag on display, so can just straight up delete
                     
-                    self._ExecuteMany( delete, ( ( display_tag_id, hash_id, hash_id ) for hash_id in hash_ids ) )
+                    self._ExecuteMany( 'DELETE FROM {} WHERE tag_id = ? AND hash_id = ?;'.format( cache_display_current_mappings_table_name ), ( ( display_tag_id, hash_id ) for hash_id in existing_hash_ids ) )
                     
-                    num_deleted = self._GetRowCount()
+                    removed_hash_ids = existing_hash_ids
+                    
+                else:
+                    
+                    # other things imply this tag on display, so we need to check storage to see what else has it
+                    statuses_to_table_names = self.modules_mappings_storage.GetFastestStorageMappingTableNames( file_service_id, tag_service_id )
+                    
+                    mappings_table_name = statuses_to_table_names[ HC.CONTENT_STATUS_CURRENT ]
+                    
+                    with self._MakeTemporaryIntegerTable( other_implied_by_tag_ids, 'tag_id' ) as temp_table_name:
+                        
+                        delete = 'DELETE FROM {} WHERE tag_id = ? AND hash_id = ? AND NOT EXISTS ( SELECT 1 FROM {} CROSS JOIN {} USING ( tag_id ) WHERE hash_id = ? );'.format( cache_display_current_mappings_table_name, mappings_table_name, temp_table_name )
+                        
+                        self._ExecuteMany( delete, ( ( display_tag_id, hash_id, hash_id ) for hash_id in existing_hash_ids ) )
+                        
+                        removed_hash_ids = existing_hash_ids.difference( self._GetHashIdsWithDisplayTag( cache_display_current_mappings_table_name, temp_hash_ids_table_name, display_tag_id ) )
+                        
                     
                 
-            
-            if num_deleted > 0:
-                
-                ac_counts[ display_tag_id ] += num_deleted
+                if len( removed_hash_ids ) > 0:
+                    
+                    ac_counts[ display_tag_id ] += len( removed_hash_ids )
+                    
+                    self._UpdateFileTagCounts( file_service_id, tag_service_id, HC.CONTENT_STATUS_CURRENT, display_tag_id, removed_hash_ids, -1 )
+                    
                 
             
         
@@ -532,6 +722,13 @@ class ClientDBMappingsCacheSpecificDisplay( ClientDBModule.ClientDBModule ):
             self._Execute( 'INSERT OR IGNORE INTO {} ( hash_id, tag_id ) SELECT hash_id, tag_id FROM {};'.format( cache_display_current_mappings_table_name, cache_current_mappings_table_name ) )
             self._Execute( 'INSERT OR IGNORE INTO {} ( hash_id, tag_id ) SELECT hash_id, tag_id FROM {};'.format( cache_display_pending_mappings_table_name, cache_pending_mappings_table_name ) )
             
+            if status_hook is not None:
+                
+                status_hook( 'counting tags per file' )
+                
+            
+            self._RegenerateFileTagCounts( file_service_id, tag_service_id )
+            
         
         self.modules_mappings_counts.CreateTables( ClientTags.TAG_DISPLAY_ACTUAL, file_service_id, tag_service_id, populate_from_storage = populate_from_storage )
         
@@ -548,6 +745,26 @@ class ClientDBMappingsCacheSpecificDisplay( ClientDBModule.ClientDBModule ):
             
         
     
+    def GenerateFileTagCounts( self, file_service_id, tag_service_id ):
+        
+        cache_display_file_tag_counts_table_name = GenerateSpecificDisplayFileTagCountsTableName( file_service_id, tag_service_id )
+        
+        table_generation_dict = self._GetServiceTableGenerationDictSingle( file_service_id, tag_service_id )
+        
+        ( create_query_without_name, version_added ) = table_generation_dict[ cache_display_file_tag_counts_table_name ]
+        
+        self._Execute( create_query_without_name.format( cache_display_file_tag_counts_table_name ) )
+        
+        self._RegenerateFileTagCounts( file_service_id, tag_service_id )
+        
+        index_generation_dict = self._GetServiceIndexGenerationDictSingle( file_service_id, tag_service_id )
+        
+        for ( table_name, columns, unique, version_added ) in self._FlattenIndexGenerationDict( { cache_display_file_tag_counts_table_name : index_generation_dict[ cache_display_file_tag_counts_table_name ] } ):
+            
+            self._CreateIndex( table_name, columns, unique = unique )
+            
+        
+    
     def GetTablesAndColumnsThatUseDefinitions( self, content_type: int ) -> typing.List[ typing.Tuple[ str, str ] ]:
         
         tables_and_columns = []
@@ -556,7 +773,12 @@ class ClientDBMappingsCacheSpecificDisplay( ClientDBModule.ClientDBModule ):
             
             table_dict = self._GetServicesTableGenerationDict()
             
-            for table_name in table_dict.keys():
+            for ( table_name, ( create_query_without_name, version_added ) ) in table_dict.items():
+                
+                if 'tag_id' not in create_query_without_name:
+                    
+                    continue
+                    
                 
                 tables_and_columns.append( ( table_name, 'tag_id' ) )
                 
@@ -582,15 +804,20 @@ class ClientDBMappingsCacheSpecificDisplay( ClientDBModule.ClientDBModule ):
         
         display_tag_ids = self.modules_tag_display.GetImplies( ClientTags.TAG_DISPLAY_ACTUAL, tag_service_id, tag_id )
         
-        for display_tag_id in display_tag_ids:
-            
-            self._ExecuteMany( 'INSERT OR IGNORE INTO ' + cache_display_pending_mappings_table_name + ' ( hash_id, tag_id ) VALUES ( ?, ? );', ( ( hash_id, display_tag_id ) for hash_id in hash_ids ) )
+        with self._MakeTemporaryIntegerTable( hash_ids, 'hash_id' ) as temp_hash_ids_table_name:
             
-            num_added = self._GetRowCount()
-            
-            if num_added > 0:
+            for display_tag_id in display_tag_ids:
                 
-                ac_counts[ display_tag_id ] += num_added
+                added_hash_ids = set( hash_ids ).difference( self._GetHashIdsWithDisplayTag( cache_display_pending_mappings_table_name, temp_hash_ids_table_name, display_tag_id ) )
+                
+                if len( added_hash_ids ) > 0:
+                    
+                    self._ExecuteMany( 'INSERT OR IGNORE INTO ' + cache_display_pending_mappings_table_name + ' ( hash_id, tag_id ) VALUES ( ?, ? );', ( ( hash_id, display_tag_id ) for hash_id in added_hash_ids ) )
+                    
+                    ac_counts[ display_tag_id ] += len( added_hash_ids )
+                    
+                    self._UpdateFileTagCounts( file_service_id, tag_service_id, HC.CONTENT_STATUS_PENDING, display_tag_id, added_hash_ids, 1 )
+                    
                 
             
         
@@ -666,6 +893,8 @@ class ClientDBMappingsCacheSpecificDisplay( ClientDBModule.ClientDBModule ):
         
         self.modules_mappings_counts_update.AddCounts( ClientTags.TAG_DISPLAY_ACTUAL, file_service_id, tag_service_id, counts_cache_changes )
         
+        self._RegenerateFileTagCounts( file_service_id, tag_service_id )
+        
     
     def RescindPendingMappings( self, file_service_id, tag_service_id, storage_tag_id, hash_ids ):
         
@@ -677,43 +906,55 @@ class ClientDBMappingsCacheSpecificDisplay( ClientDBModule.ClientDBModule ):
         
         ac_counts = collections.Counter()
         
-        for ( display_tag_id, implied_by_tag_ids ) in implies_tag_ids_to_implied_by_tag_ids.items():
-            
-            # for every tag implied by the storage tag being removed
+        with self._MakeTemporaryIntegerTable( hash_ids, 'hash_id' ) as temp_hash_ids_table_name:
             
-            other_implied_by_tag_ids = set( implied_by_tag_ids )
-            other_implied_by_tag_ids.discard( storage_tag_id )
-            
-            if len( other_implied_by_tag_ids ) == 0:
-                
-                # nothing else implies this tag on display, so can just straight up delete
+            for ( display_tag_id, implied_by_tag_ids ) in implies_tag_ids_to_implied_by_tag_ids.items():
                 
-                self._ExecuteMany( 'DELETE FROM {} WHERE tag_id = ? AND hash_id = ?;'.format( cache_display_pending_mappings_table_name ), ( ( display_tag_id, hash_id ) for hash_id in hash_ids ) )
+                # for every tag implied by the storage tag being removed
                 
-                num_rescinded = self._GetRowCount()
+                existing_hash_ids = self._GetHashIdsWithDisplayTag( cache_display_pending_mappings_table_name, temp_hash_ids_table_name, display_tag_id )
                 
-            else:
-                
-                # other things imply this tag on display, so we need to check storage to see what else has it
-                statuses_to_table_names = self.modules_mappings_storage.GetFastestStorageMappingTableNames( file_service_id, tag_service_id )
+                if len( existing_hash_ids ) == 0:
+                    
+                    continue
+                    
                 
-                mappings_table_name = statuses_to_table_names[ HC.CONTENT_STATUS_PENDING ]
+                other_implied_by_tag_ids = set( implied_by_tag_ids )
+                other_implied_by_tag_ids.discard( storage_tag_id )
                 
-                with self._MakeTemporaryIntegerTable( other_implied_by_tag_ids, 'tag_id' ) as temp_table_name:
+                if len( other_implied_by_tag_ids ) == 0:
                     
-                    # storage mappings to temp other tag ids
-                    # delete mappings where it shouldn't exist for other reasons lad
-                    delete = 'DELETE FROM {} WHERE tag_id = ? AND hash_id = ? AND NOT EXISTS ( SELECT 1 FROM {} CROSS JOIN {} USING ( tag_id ) WHERE hash_id = ? )'.format( cache_display_pending_mappings_table_name, mappings_table_name, temp_table_name )
+                    # nothing else implies this tag on display, so can just straight up delete
                     
-                    self._ExecuteMany( delete, ( ( display_tag_id, hash_id, hash_id ) for hash_id in hash_ids ) )
+                    self._ExecuteMany( 'DELETE FROM {} WHERE tag_id = ? AND hash_id = ?;'.format( cache_display_pending_mappings_table_name ), ( ( display_tag_id, hash_id ) for hash_id in existing_hash_ids ) )
                     
-                    num_rescinded = self._GetRowCount()
+                    removed_hash_ids = existing_hash_ids
+                    
+                else:
+                    
+                    # other things imply this tag on display, so we need to check storage to see what else has it
+                    statuses_to_table_names = self.modules_mappings_storage.GetFastestStorageMappingTableNames( file_service_id, tag_service_id )
+                    
+                    mappings_table_name = statuses_to_table_names[ HC.CONTENT_STATUS_PENDING ]
+                    
+                    with self._MakeTemporaryIntegerTable( other_implied_by_tag_ids, 'tag_id' ) as temp_table_name:
+                        
+                        # storage mappings to temp other tag ids
+                        # delete mappings where it shouldn't exist for other reasons lad
+                        delete = 'DELETE FROM {} WHERE tag_id = ? AND hash_id = ? AND NOT EXISTS ( SELECT 1 FROM {} CROSS JOIN {} USING ( tag_id ) WHERE hash_id = ? )'.format( cache_display_pending_mappings_table_name, mappings_table_name, temp_table_name )
+                        
+                        self._ExecuteMany( delete, ( ( display_tag_id, hash_id, hash_id ) for hash_id in existing_hash_ids ) )
+                        
+                        removed_hash_ids = existing_hash_ids.difference( self._GetHashIdsWithDisplayTag( cache_display_pending_mappings_table_name, temp_hash_ids_table_name, display_tag_id ) )
+                        
                     
                 
-            
-            if num_rescinded > 0:
-                
-                ac_counts[ display_tag_id ] += num_rescinded
+                if len( removed_hash_ids ) > 0:
+                    
+                    ac_counts[ display_tag_id ] += len( removed_hash_ids )
+                    
+                    self._UpdateFileTagCounts( file_service_id, tag_service_id, HC.CONTENT_STATUS_PENDING, display_tag_id, removed_hash_ids, -1 )
+                    
                 
             
         
@@ -167,6 +167,8 @@ class ClientDBSerialisable( ClientDBModule.ClientDBModule ):
     def _GetInitialTableGenerationDict( self ) -> dict:
         
         return {
+            'main.export_folder_manifest_settings' : ( 'CREATE TABLE IF NOT EXISTS {} ( export_folder_name TEXT PRIMARY KEY, settings_hash BLOB_BYTES );', 475 ),
+            'main.export_folder_manifests' : ( 'CREATE TABLE IF NOT EXISTS {} ( export_folder_name TEXT, hash_id INTEGER, path TEXT, PRIMARY KEY ( export_folder_name, hash_id ) );', 475 ),
             'main.json_dict' : ( 'CREATE TABLE IF NOT EXISTS {} ( name TEXT PRIMARY KEY, dump BLOB_BYTES );', 400 ),
             'main.json_dumps' : ( 'CREATE TABLE IF NOT EXISTS {} ( dump_type INTEGER PRIMARY KEY, version INTEGER, dump BLOB_BYTES );', 400 ),
             'main.json_dumps_named' : ( 'CREATE TABLE IF NOT EXISTS {} ( dump_type INTEGER, dump_name TEXT, version INTEGER, timestamp INTEGER, dump BLOB_BYTES, PRIMARY KEY ( dump_type, dump_name, timestamp ) );', 400 ),
@@ -175,6 +177,20 @@ class ClientDBSerialisable( ClientDBModule.ClientDBModule ):
         }
         
     
+    def ClearExportFolderManifest( self, export_folder_name = None ):
+        
+        if export_folder_name is None:
+            
+            self._Execute( 'DELETE FROM export_folder_manifests;' )
+            self._Execute( 'DELETE FROM export_folder_manifest_settings;' )
+            
+        else:
+            
+            self._Execute( 'DELETE FROM export_folder_manifests WHERE export_folder_name = ?;', ( export_folder_name, ) )
+            self._Execute( 'DELETE FROM export_folder_manifest_settings WHERE export_folder_name = ?;', ( export_folder_name, ) )
+            
+        
+    
     def DeleteJSONDump( self, dump_type ):
         
         self._Execute( 'DELETE FROM json_dumps WHERE dump_type = ?;', ( dump_type, ) )
@@ -195,6 +211,11 @@ class ClientDBSerialisable( ClientDBModule.ClientDBModule ):
             self._Execute( 'DELETE FROM json_dumps_named WHERE dump_type = ? AND dump_name = ? AND timestamp = ?;', ( dump_type, dump_name, timestamp ) )
             
         
+        if dump_type == HydrusSerialisable.SERIALISABLE_TYPE_EXPORT_FOLDER and timestamp is None:
+            
+            self.ClearExportFolderManifest( export_folder_name = dump_name )
+            
+        
     
     def DeleteYAMLDump( self, dump_type, dump_name = None ):
         
@@ -236,6 +257,20 @@ class ClientDBSerialisable( ClientDBModule.ClientDBModule ):
         return all_expected_hashes
         
     
+    def GetExportFolderManifest( self, export_folder_name, settings_hash ):
+        
+        # None means we have no manifest we can trust for these settings, so the export folder should look at everything on disk
+        
+        result = self._Execute( 'SELECT settings_hash FROM export_folder_manifest_settings WHERE export_folder_name = ?;', ( export_folder_name, ) ).fetchone()
+        
+        if result is None or result[0] != settings_hash:
+            
+            return None
+            
+        
+        return dict( self._Execute( 'SELECT hash_id, path FROM export_folder_manifests WHERE export_folder_name = ?;', ( export_folder_name, ) ) )
+        
+    
     def GetHashedJSONDumps( self, hashes ):
         
         shown_missing_dump_message = False
@@ -501,6 +536,13 @@ class ClientDBSerialisable( ClientDBModule.ClientDBModule ):
     
     def GetTablesAndColumnsThatUseDefinitions( self, content_type: int ) -> typing.List[ typing.Tuple[ str, str ] ]:
         
+        if content_type == HC.CONTENT_TYPE_HASH:
+            
+            return [
+                ( 'export_folder_manifests', 'hash_id' )
+            ]
+            
+        
         return []
         
     
@@ -850,6 +892,22 @@ class ClientDBSerialisable( ClientDBModule.ClientDBModule ):
             
         
     
+    def SetExportFolderManifest( self, export_folder_name, settings_hash, hash_ids_to_paths, deletee_hash_ids ):
+        
+        result = self._Execute( 'SELECT settings_hash FROM export_folder_manifest_settings WHERE export_folder_name = ?;', ( export_folder_name, ) ).fetchone()
+        
+        if result is None or result[0] != settings_hash:
+            
+            self.ClearExportFolderManifest( export_folder_name = export_folder_name )
+            
+            self._Execute( 'INSERT INTO export_folder_manifest_settings ( export_folder_name, settings_hash ) VALUES ( ?, ? );', ( export_folder_name, sqlite3.Binary( settings_hash ) ) )
+            
+        
+        self._ExecuteMany( 'DELETE FROM export_folder_manifests WHERE export_folder_name = ? AND hash_id = ?;', ( ( export_folder_name, hash_id ) for hash_id in deletee_hash_ids ) )
+        
+        self._ExecuteMany( 'REPLACE INTO export_folder_manifests ( export_folder_name, hash_id, path ) VALUES ( ?, ?, ? );', ( ( export_folder_name, hash_id, path ) for ( hash_id, path ) in hash_ids_to_paths.items() ) )
+        
+    
     def SetJSONComplex( self,
         overwrite_types_and_objs: typing.Optional[ typing.Tuple[ typing.Iterable[ int ], typing.Iterable[ HydrusSerialisable.SerialisableBase ] ] ] = None,
         set_objs: typing.Optional[ typing.List[ HydrusSerialisable.SerialisableBase ] ] = None,
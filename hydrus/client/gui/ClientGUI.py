@@ -875,7 +875,15 @@ class FrameGUI( ClientGUITopLevelWindows.MainFrameThatResizes ):
         
         text = action + ' backup at "' + path + '"?'
         text += os.linesep * 2
-        text += 'The database will be locked while the backup occurs, which may lock up your gui as well.'
+        
+        if HG.db_journal_mode == 'WAL':
+            
+            text += 'The database will keep working while the backup occurs. Database files that have not changed since the last backup will be skipped.'
+            
+        else:
+            
+            text += 'The database will be locked while the backup occurs, which may lock up your gui as well.'
+            
         
         result = ClientGUIDialogsQuick.GetYesNo( self, text )
         
@@ -3212,6 +3220,9 @@ class FrameGUI( ClientGUITopLevelWindows.MainFrameThatResizes ):
         ClientGUIMenus.AppendMenuCheckItem( data_actions, 'db ui-hang relief mode', 'Have UI-synchronised database jobs process pending Qt events while they wait.', HG.db_ui_hang_relief_mode, self._SwitchBoolean, 'db_ui_hang_relief_mode' )
         ClientGUIMenus.AppendMenuItem( data_actions, 'review threads', 'Show current threads and what they are doing.', self._ReviewThreads )
         ClientGUIMenus.AppendMenuItem( data_actions, 'show scheduled jobs', 'Print some information about the currently scheduled jobs log.', self._DebugShowScheduledJobs )
+        ClientGUIMenus.AppendMenuItem( data_actions, 'show parsing cache metrics', 'Show how often the downloader parsing cache has saved a parse.', self._controller.parsing_cache.ShowMetrics )
+        ClientGUIMenus.AppendMenuItem( data_actions, 'review db job metrics', 'Show how long each kind of db job has waited and run, and how long commits take.', self._ReviewDBJobMetrics )
+        ClientGUIMenus.AppendMenuItem( data_actions, 'show pubsub metrics', 'Show the pubsub queue depth and how long each topic has spent in delivery.', self._controller.DebugShowPubSubMetrics )
         ClientGUIMenus.AppendMenuItem( data_actions, 'subscription manager snapshot', 'Have the subscription system show what it is doing.', self._controller.subscriptions_manager.ShowSnapshot )
         ClientGUIMenus.AppendMenuItem( data_actions, 'flush log', 'Command the log to write any buffered contents to hard drive.', HydrusData.DebugPrint, 'Flushing log' )
         ClientGUIMenus.AppendMenuItem( data_actions, 'enable truncated image loading', 'Enable the truncated image loading to test out broken jpegs.', self._EnableLoadTruncatedImages )
@@ -5234,6 +5245,15 @@ class FrameGUI( ClientGUITopLevelWindows.MainFrameThatResizes ):
         frame.SetPanel( panel )
         
     
+    def _ReviewDBJobMetrics( self ):
+        
+        frame = ClientGUITopLevelWindowsPanels.FrameThatTakesScrollablePanel( self, 'review db job metrics' )
+        
+        panel = ClientGUIScrolledPanelsReview.ReviewDBJobMetrics( frame, self._controller )
+        
+        frame.SetPanel( panel )
+        
+    
     def _ReviewFileMaintenance( self ):
         
         frame = ClientGUITopLevelWindowsPanels.FrameThatTakesScrollablePanel( self, 'file maintenance' )
@@ -899,6 +899,9 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             
             self._export_location = QP.DirPickerCtrl( self )
             
+            self._export_folder_num_copy_workers = QP.MakeQSpinBox( self, min = 1, max = 32 )
+            self._export_folder_num_copy_workers.setToolTip( 'How many files an export folder copies at once. More can help on network drives and SSDs, but a single spinning disk prefers 1.' )
+            
             self._prefix_hash_when_copying = QW.QCheckBox( self )
             self._prefix_hash_when_copying.setToolTip( 'If you often paste hashes into boorus, check this to automatically prefix with the type, like "md5:2496dabcbd69e3c56a5d8caabb7acde5".' )
             
@@ -942,6 +945,8 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
                     
                 
             
+            self._export_folder_num_copy_workers.setValue( self._new_options.GetInteger( 'export_folder_num_copy_workers' ) )
+            
             self._prefix_hash_when_copying.setChecked( self._new_options.GetBoolean( 'prefix_hash_when_copying' ) )
             
             self._delete_to_recycle_bin.setChecked( HC.options[ 'delete_to_recycle_bin' ] )
@@ -987,6 +992,7 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             rows.append( ( 'Number of hours a file can be in the trash before being deleted: ', self._trash_max_age ) )
             rows.append( ( 'Maximum size of trash (MB): ', self._trash_max_size ) )
             rows.append( ( 'Default export directory: ', self._export_location ) )
+            rows.append( ( 'Export folders: files to copy at once: ', self._export_folder_num_copy_workers ) )
             
             gridbox = ClientGUICommon.WrapInGrid( self, rows )
             
@@ -1061,6 +1067,8 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             
             HC.options[ 'export_path' ] = HydrusPaths.ConvertAbsPathToPortablePath( self._export_location.GetPath() )
             
+            self._new_options.SetInteger( 'export_folder_num_copy_workers', self._export_folder_num_copy_workers.value() )
+            
             self._new_options.SetBoolean( 'prefix_hash_when_copying', self._prefix_hash_when_copying.isChecked() )
             
             HC.options[ 'delete_to_recycle_bin' ] = self._delete_to_recycle_bin.isChecked()
@@ -1705,6 +1713,12 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             self._file_maintenance_idle_throttle_velocity.setToolTip( tt )
             self._file_maintenance_active_throttle_velocity.setToolTip( tt )
             
+            self._file_maintenance_num_cpu_workers = QP.MakeQSpinBox( self._file_maintenance_panel, min = 1, max = 64 )
+            self._file_maintenance_num_cpu_workers.setToolTip( 'How many files to work on at once for heavy jobs like metadata and thumbnail regeneration. The throttles above still apply.' )
+            
+            self._file_maintenance_num_io_workers = QP.MakeQSpinBox( self._file_maintenance_panel, min = 1, max = 64 )
+            self._file_maintenance_num_io_workers.setToolTip( 'How many files to work on at once for disk-bound jobs like file integrity and permission checks. The throttles above still apply.' )
+            
             #
             
             self._idle_normal.setChecked( HC.options[ 'idle_normal' ] )
@@ -1736,6 +1750,9 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             
             self._file_maintenance_active_throttle_velocity.SetValue( file_maintenance_active_throttle_velocity )
             
+            self._file_maintenance_num_cpu_workers.setValue( self._new_options.GetInteger( 'file_maintenance_num_cpu_workers' ) )
+            self._file_maintenance_num_io_workers.setValue( self._new_options.GetInteger( 'file_maintenance_num_io_workers' ) )
+            
             #
             
             rows = []
@@ -1810,6 +1827,8 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             rows.append( ( 'Idle throttle: ', self._file_maintenance_idle_throttle_velocity ) )
             rows.append( ( 'Run file maintenance during normal time: ', self._file_maintenance_during_active ) )
             rows.append( ( 'Normal throttle: ', self._file_maintenance_active_throttle_velocity ) )
+            rows.append( ( 'Parallel workers for cpu-heavy jobs: ', self._file_maintenance_num_cpu_workers ) )
+            rows.append( ( 'Parallel workers for disk-heavy jobs: ', self._file_maintenance_num_io_workers ) )
             
             gridbox = ClientGUICommon.WrapInGrid( self._file_maintenance_panel, rows )
             
@@ -1892,6 +1911,9 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             self._new_options.SetInteger( 'file_maintenance_active_throttle_files', file_maintenance_active_throttle_files )
             self._new_options.SetInteger( 'file_maintenance_active_throttle_time_delta', file_maintenance_active_throttle_time_delta )
             
+            self._new_options.SetInteger( 'file_maintenance_num_cpu_workers', self._file_maintenance_num_cpu_workers.value() )
+            self._new_options.SetInteger( 'file_maintenance_num_io_workers', self._file_maintenance_num_io_workers.value() )
+            
         
     
     class _MediaPanel( QW.QWidget ):
@@ -2700,6 +2722,9 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             
             self._estimated_number_video_frames = QW.QLabel( '', buffer_panel )
             
+            self._video_fast_downscale = QW.QCheckBox( buffer_panel )
+            self._video_fast_downscale.setToolTip( 'When the native renderer shows a video smaller than its real resolution, ffmpeg will use a quick and slightly rougher scaler. This can help a lot with big 4k vids on a slow CPU.' )
+            
             #
             
             misc_panel = ClientGUICommon.StaticBox( self, 'misc' )
@@ -2721,6 +2746,7 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             self._ideal_tile_dimension.setValue( self._new_options.GetInteger( 'ideal_tile_dimension' ) )
             
             self._video_buffer_size_mb.setValue( self._new_options.GetInteger( 'video_buffer_size_mb' ) )
+            self._video_fast_downscale.setChecked( self._new_options.GetBoolean( 'video_fast_downscale' ) )
             
             self._forced_search_limit.SetValue( self._new_options.GetNoneableInteger( 'forced_search_limit' ) )
             
@@ -2861,6 +2887,7 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             rows = []
             
             rows.append( ( 'MB memory for video buffer: ', video_buffer_sizer ) )
+            rows.append( ( 'Use fast scaling when shrinking video: ', self._video_fast_downscale ) )
             
             gridbox = ClientGUICommon.WrapInGrid( buffer_panel, rows )
             
@@ -2984,6 +3011,7 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             self._new_options.SetInteger( 'image_cache_prefetch_limit_percentage', self._image_cache_prefetch_limit_percentage.value() )
             
             self._new_options.SetInteger( 'video_buffer_size_mb', self._video_buffer_size_mb.value() )
+            self._new_options.SetBoolean( 'video_fast_downscale', self._video_fast_downscale.isChecked() )
             
             self._new_options.SetNoneableInteger( 'forced_search_limit', self._forced_search_limit.GetValue() )
             
@@ -3782,6 +3810,9 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             
             self._media_background_bmp_path = QP.FilePickerCtrl( self )
             
+            self._thumbnail_storage_packed = QW.QCheckBox( self )
+            self._thumbnail_storage_packed.setToolTip( 'Store thumbnails in a few big pack files per folder rather than one file each. This is much kinder to slow or network drives and backups. The client converts your existing thumbnails over in idle maintenance time, and will convert them back if you turn this off.' )
+            
             #
             
             ( thumbnail_width, thumbnail_height ) = HC.options[ 'thumbnail_dimensions' ]
@@ -3807,6 +3838,8 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
                 self._media_background_bmp_path.SetPath( media_background_bmp_path )
                 
             
+            self._thumbnail_storage_packed.setChecked( self._new_options.GetBoolean( 'thumbnail_storage_packed' ) )
+            
             #
             
             rows = []
@@ -3820,6 +3853,7 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             rows.append( ( 'Do not scroll down on key navigation if thumbnail at least this % visible: ', self._thumbnail_visibility_scroll_percent ) )
             rows.append( ( 'EXPERIMENTAL: Scroll thumbnails at this rate per scroll tick: ', self._thumbnail_scroll_rate ) )
             rows.append( ( 'EXPERIMENTAL: Image path for thumbnail panel background image (set blank to clear): ', self._media_background_bmp_path ) )
+            rows.append( ( 'EXPERIMENTAL: Store thumbnails in packs: ', self._thumbnail_storage_packed ) )
             
             gridbox = ClientGUICommon.WrapInGrid( self, rows )
             
@@ -3867,6 +3901,8 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             
             self._new_options.SetNoneableString( 'media_background_bmp_path', media_background_bmp_path )
             
+            self._new_options.SetBoolean( 'thumbnail_storage_packed', self._thumbnail_storage_packed.isChecked() )
+            
         
     
     def CommitChanges( self ):
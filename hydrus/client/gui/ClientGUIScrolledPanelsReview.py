@@ -122,6 +122,17 @@ class MigrateDatabasePanel( ClientGUIScrolledPanels.ReviewPanel ):
         
         self._rebalance_button = ClientGUICommon.BetterButton( file_locations_panel, 'move files now', self._Rebalance )
         
+        self._prefix_length = ClientGUICommon.BetterChoice( file_locations_panel )
+        
+        self._prefix_length.addItem( '256 (e.g. f00 to fff, the default)', 2 )
+        self._prefix_length.addItem( '4,096 (e.g. f000 to ffff, for very large clients)', 3 )
+        
+        self._prefix_length.setToolTip( 'With millions of files, each of the default 256 folders can hold tens of thousands of files, which some filesystems and network drives handle poorly. Changing this will split or merge your folders the next time files are moved. It can be done while the client is running.' )
+        
+        self._prefix_length.SetValue( self._new_options.GetInteger( 'client_files_prefix_length' ) )
+        
+        self._prefix_length.currentIndexChanged.connect( self._SetPrefixLength )
+        
         #
         
         migration_panel = ClientGUICommon.StaticBox( self, 'migrate database files (and portable media file locations)' )
@@ -141,6 +152,11 @@ class MigrateDatabasePanel( ClientGUIScrolledPanels.ReviewPanel ):
         QP.AddToLayout( t_hbox, self._thumbnails_location_set, CC.FLAGS_CENTER_PERPENDICULAR )
         QP.AddToLayout( t_hbox, self._thumbnails_location_clear, CC.FLAGS_CENTER_PERPENDICULAR )
         
+        p_hbox = QP.HBoxLayout()
+        
+        QP.AddToLayout( p_hbox, ClientGUICommon.BetterStaticText( file_locations_panel, 'number of file and thumbnail folders' ), CC.FLAGS_CENTER_PERPENDICULAR )
+        QP.AddToLayout( p_hbox, self._prefix_length, CC.FLAGS_CENTER_PERPENDICULAR_EXPAND_DEPTH )
+        
         rebalance_hbox = QP.HBoxLayout()
         
         QP.AddToLayout( rebalance_hbox, self._rebalance_status_st, CC.FLAGS_EXPAND_BOTH_WAYS )
@@ -148,6 +164,7 @@ class MigrateDatabasePanel( ClientGUIScrolledPanels.ReviewPanel ):
         
         file_locations_panel.Add( current_media_locations_listctrl_panel, CC.FLAGS_EXPAND_BOTH_WAYS )
         file_locations_panel.Add( t_hbox, CC.FLAGS_EXPAND_PERPENDICULAR )
+        file_locations_panel.Add( p_hbox, CC.FLAGS_EXPAND_PERPENDICULAR )
         file_locations_panel.Add( rebalance_hbox, CC.FLAGS_EXPAND_SIZER_PERPENDICULAR )
         
         #
@@ -385,8 +402,8 @@ class MigrateDatabasePanel( ClientGUIScrolledPanels.ReviewPanel ):
             pretty_portable = 'no'
             
         
-        fp = locations_to_file_weights[ location ] / 256.0
-        tp = locations_to_thumb_weights[ location ] / 256.0
+        fp = locations_to_file_weights[ location ]
+        tp = locations_to_thumb_weights[ location ]
         
         p = HydrusData.ConvertFloatToPercentage
         
@@ -519,12 +536,12 @@ class MigrateDatabasePanel( ClientGUIScrolledPanels.ReviewPanel ):
             
             if prefix.startswith( 'f' ):
                 
-                locations_to_file_weights[ location ] += 1
+                locations_to_file_weights[ location ] += ClientFiles.GetClientFilesPrefixWeight( prefix )
                 
             
             if prefix.startswith( 't' ):
                 
-                locations_to_thumb_weights[ location ] += 1
+                locations_to_thumb_weights[ location ] += ClientFiles.GetClientFilesPrefixWeight( prefix )
                 
             
         
@@ -792,6 +809,15 @@ class MigrateDatabasePanel( ClientGUIScrolledPanels.ReviewPanel ):
             
         
     
+    def _SetPrefixLength( self ):
+        
+        self._new_options.SetInteger( 'client_files_prefix_length', self._prefix_length.GetValue() )
+        
+        self._controller.Write( 'serialisable', self._new_options )
+        
+        self._Update()
+        
+    
     def _SetThumbnailLocation( self ):
         
         with QP.DirDialog( self, 'Select thumbnail location' ) as dlg:
@@ -1741,6 +1767,97 @@ class MigrateTagsPanel( ClientGUIScrolledPanels.ReviewPanel ):
         self._UpdateMigrationControlsNewDestination()
         
     
+class ReviewDBJobMetrics( ClientGUIScrolledPanels.ReviewPanel ):
+    
+    def __init__( self, parent, controller ):
+        
+        ClientGUIScrolledPanels.ReviewPanel.__init__( self, parent )
+        
+        self._controller = controller
+        
+        self._job_keys_to_job_dicts = {}
+        
+        self._summary_st = ClientGUICommon.BetterStaticText( self )
+        
+        self._list_ctrl_panel = ClientGUIListCtrl.BetterListCtrlPanel( self )
+        
+        self._list_ctrl = ClientGUIListCtrl.BetterListCtrl( self._list_ctrl_panel, CGLC.COLUMN_LIST_DB_JOB_METRICS.ID, 20, self._ConvertDataToListCtrlTuples )
+        
+        self._list_ctrl_panel.SetListCtrl( self._list_ctrl )
+        
+        self._list_ctrl_panel.AddButton( 'refresh snapshot', self._RefreshSnapshot )
+        self._list_ctrl_panel.AddButton( 'reset metrics', self._ResetMetrics )
+        
+        #
+        
+        self._list_ctrl.Sort()
+        
+        self._RefreshSnapshot()
+        
+        #
+        
+        vbox = QP.VBoxLayout()
+        
+        QP.AddToLayout( vbox, self._summary_st, CC.FLAGS_EXPAND_PERPENDICULAR )
+        QP.AddToLayout( vbox, self._list_ctrl_panel, CC.FLAGS_EXPAND_BOTH_WAYS )
+        
+        self.widget().setLayout( vbox )
+        
+    
+    def _ConvertDataToListCtrlTuples( self, job_key ):
+        
+        job_dict = self._job_keys_to_job_dicts[ job_key ]
+        
+        job = '{} {}'.format( job_dict[ 'job_type' ], job_dict[ 'action' ] )
+        num_jobs = job_dict[ 'num_jobs' ]
+        total_time = job_dict[ 'execution' ][ 'total' ]
+        median = job_dict[ 'execution' ][ 'p50' ]
+        p99 = job_dict[ 'execution' ][ 'p99' ]
+        max_time = job_dict[ 'execution' ][ 'max' ]
+        queue_wait_p99 = job_dict[ 'queue_wait' ][ 'p99' ]
+        rows_changed = job_dict[ 'rows_changed' ][ 'total' ]
+        temp_tables = job_dict[ 'temp_tables' ][ 'total' ]
+        num_errors = job_dict[ 'num_errors' ]
+        
+        pretty_job = job
+        pretty_num_jobs = HydrusData.ToHumanInt( num_jobs )
+        pretty_total_time = HydrusData.TimeDeltaToPrettyTimeDelta( total_time )
+        pretty_median = HydrusData.TimeDeltaToPrettyTimeDelta( median )
+        pretty_p99 = HydrusData.TimeDeltaToPrettyTimeDelta( p99 )
+        pretty_max_time = HydrusData.TimeDeltaToPrettyTimeDelta( max_time )
+        pretty_queue_wait_p99 = HydrusData.TimeDeltaToPrettyTimeDelta( queue_wait_p99 )
+        pretty_rows_changed = HydrusData.ToHumanInt( rows_changed )
+        pretty_temp_tables = HydrusData.ToHumanInt( temp_tables )
+        pretty_num_errors = HydrusData.ToHumanInt( num_errors )
+        
+        display_tuple = ( pretty_job, pretty_num_jobs, pretty_total_time, pretty_median, pretty_p99, pretty_max_time, pretty_queue_wait_p99, pretty_rows_changed, pretty_temp_tables, pretty_num_errors )
+        sort_tuple = ( job, num_jobs, total_time, median, p99, max_time, queue_wait_p99, rows_changed, temp_tables, num_errors )
+        
+        return ( display_tuple, sort_tuple )
+        
+    
+    def _RefreshSnapshot( self ):
+        
+        snapshot = self._controller.GetDBJobMetrics()
+        
+        self._job_keys_to_job_dicts = { ( job_dict[ 'job_type' ], job_dict[ 'action' ] ) : job_dict for job_dict in snapshot[ 'jobs' ] }
+        
+        commits = snapshot[ 'commits' ]
+        
+        summary = 'Since {}: {} commits, p50 {}, p99 {}, max {}.'.format( HydrusData.ConvertTimestampToPrettyTime( snapshot[ 'since' ] ), HydrusData.ToHumanInt( commits[ 'count' ] ), HydrusData.TimeDeltaToPrettyTimeDelta( commits[ 'p50' ] ), HydrusData.TimeDeltaToPrettyTimeDelta( commits[ 'p99' ] ), HydrusData.TimeDeltaToPrettyTimeDelta( commits[ 'max' ] ) )
+        
+        self._summary_st.setText( summary )
+        
+        self._list_ctrl.SetData( list( self._job_keys_to_job_dicts.keys() ) )
+        
+    
+    def _ResetMetrics( self ):
+        
+        self._controller.ClearDBJobMetrics()
+        
+        self._RefreshSnapshot()
+        
+    
 class ReviewDownloaderImport( ClientGUIScrolledPanels.ReviewPanel ):
     
     def __init__( self, parent, network_engine ):
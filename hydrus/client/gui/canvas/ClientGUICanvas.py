@@ -13,6 +13,7 @@ from hydrus.core import HydrusPaths
 from hydrus.core import HydrusTags
 
 from hydrus.client import ClientApplicationCommand as CAC
+from hydrus.client import ClientCaches
 from hydrus.client import ClientConstants as CC
 from hydrus.client import ClientData
 from hydrus.client import ClientDuplicates
@@ -971,6 +972,46 @@ class Canvas( QW.QWidget ):
         self._media_container.PausePlay()
         
     
+    def _PrefetchNeighbour( self, media ):
+        
+        hash = media.GetHash()
+        
+        image_cache = HG.client_controller.GetCache( 'images' )
+        
+        if not image_cache.HasImageRenderer( hash ):
+            
+            image_cache.PrefetchImageRenderer( media )
+            
+            if not image_cache.HasImageRenderer( hash ):
+                
+                # too big to prefetch, so it renders on demand
+                
+                return
+                
+            
+        
+        # and the tiles it will first show, so flicking through is not a wall of blank tiles while they render
+        
+        ( media_show_action, media_start_paused, media_start_with_embed ) = self._GetShowAction( media )
+        
+        if media_show_action != CC.MEDIA_VIEWER_ACTION_SHOW_WITH_NATIVE:
+            
+            return
+            
+        
+        ( zoom, canvas_zoom ) = CalculateCanvasZooms( self, media, media_show_action )
+        
+        ( media_width, media_height ) = CalculateMediaSize( media, zoom )
+        
+        clip_rects_and_target_resolutions = ClientGUICanvasMedia.GetFirstScreenTileClipRects( media, QC.QSize( media_width, media_height ), self.size() )
+        
+        image_renderer = image_cache.GetImageRenderer( media )
+        
+        tile_cache = HG.client_controller.GetCache( 'image_tiles' )
+        
+        tile_cache.PrefetchTiles( image_renderer, media, clip_rects_and_target_resolutions, ClientCaches.TILE_PREFETCH_PRIORITY_NEIGHBOUR )
+        
+    
     def _PrefetchNeighbours( self ):
         
         pass
@@ -2608,6 +2649,13 @@ class CanvasFilterDuplicates( CanvasWithHovers ):
         
         self._currently_fetching_pairs = False
         
+        # the db works out our pairs into a queue in the background while we filter, so fetching the next batch is quick
+        self._pair_queue_key = None
+        self._pair_queue_producer_running = False
+        self._pair_queue_closed = False
+        
+        self._hashes_to_prefetched_media_results = {}
+        
         self._unprocessed_pairs = []
         self._current_pair = None
         self._processed_pairs = []
@@ -2949,6 +2997,39 @@ class CanvasFilterDuplicates( CanvasWithHovers ):
         self._ProcessPair( HC.DUPLICATE_SAME_QUALITY )
         
     
+    def _PrefetchNeighbours( self ):
+        
+        if self._current_media is None or len( self._media_list ) < 2:
+            
+            return
+            
+        
+        other_media = self._media_list.GetNext( self._current_media )
+        
+        if other_media.IsStaticImage():
+            
+            self._PrefetchNeighbour( other_media )
+            
+        
+        # and the pair after this one, so the next decision does not wait on a load
+        
+        if len( self._unprocessed_pairs ) > 0:
+            
+            for hash in self._unprocessed_pairs[-1]:
+                
+                if hash in self._hashes_to_prefetched_media_results:
+                    
+                    next_media = ClientMedia.MediaSingleton( self._hashes_to_prefetched_media_results[ hash ] )
+                    
+                    if next_media.IsStaticImage():
+                        
+                        self._PrefetchNeighbour( next_media )
+                        
+                    
+                
+            
+        
+    
     def _ProcessPair( self, duplicate_type, delete_first = False, delete_second = False, delete_both = False, duplicate_action_options = None ):
         
         if self._current_media is None:
@@ -3096,9 +3177,11 @@ class CanvasFilterDuplicates( CanvasWithHovers ):
             
             self._media_list = ClientMedia.ListeningMediaList( self._location_context, [] )
             
+            self._hashes_to_prefetched_media_results = {}
+            
             self._currently_fetching_pairs = True
             
-            HG.client_controller.CallToThread( self.THREADFetchPairs, self._file_search_context, self._both_files_match, self._pixel_dupes_preference, self._max_hamming_distance )
+            HG.client_controller.CallToThread( self.THREADFetchPairs, self._pair_queue_key, self._file_search_context, self._both_files_match, self._pixel_dupes_preference, self._max_hamming_distance )
             
             self.update()
             
@@ -3118,7 +3201,15 @@ class CanvasFilterDuplicates( CanvasWithHovers ):
                     return False
                     
                 
-                ( first_media_result, second_media_result ) = HG.client_controller.Read( 'media_results', pair )
+                if first_hash in self._hashes_to_prefetched_media_results and second_hash in self._hashes_to_prefetched_media_results:
+                    
+                    first_media_result = self._hashes_to_prefetched_media_results[ first_hash ]
+                    second_media_result = self._hashes_to_prefetched_media_results[ second_hash ]
+                    
+                else:
+                    
+                    ( first_media_result, second_media_result ) = HG.client_controller.Read( 'media_results', pair )
+                    
                 
                 first_media = ClientMedia.MediaSingleton( first_media_result )
                 second_media = ClientMedia.MediaSingleton( second_media_result )
@@ -3226,6 +3317,18 @@ class CanvasFilterDuplicates( CanvasWithHovers ):
         self._ShowNewPair()
         
     
+    def _StartPairQueueProducer( self ):
+        
+        if self._pair_queue_key is None or self._pair_queue_producer_running or self._pair_queue_closed:
+            
+            return
+            
+        
+        self._pair_queue_producer_running = True
+        
+        HG.client_controller.CallToThread( self.THREADProducePairs, self._pair_queue_key )
+        
+    
     def _SwitchMedia( self ):
         
         if self._current_media is not None:
@@ -3255,6 +3358,15 @@ class CanvasFilterDuplicates( CanvasWithHovers ):
         
         HG.client_controller.pub( 'new_similar_files_potentials_search_numbers' )
         
+        self._pair_queue_closed = True
+        
+        if self._pair_queue_key is not None:
+            
+            HG.client_controller.Write( 'duplicate_pair_queue_drop', self._pair_queue_key )
+            
+            self._pair_queue_key = None
+            
+        
         ClientMedia.hashes_to_jpeg_quality = {} # clear the cache
         ClientMedia.hashes_to_pixel_hashes = {} # clear the cache
         
@@ -3425,7 +3537,7 @@ class CanvasFilterDuplicates( CanvasWithHovers ):
             
         
     
-    def THREADFetchPairs( self, file_search_context, both_files_match, pixel_dupes_preference, max_hamming_distance ):
+    def THREADFetchPairs( self, pair_queue_key, file_search_context, both_files_match, pixel_dupes_preference, max_hamming_distance ):
         
         def qt_close():
             
@@ -3439,7 +3551,7 @@ class CanvasFilterDuplicates( CanvasWithHovers ):
             self._TryToCloseWindow()
             
         
-        def qt_continue( unprocessed_pairs ):
+        def qt_continue( unprocessed_pairs, hashes_to_media_results ):
             
             if not self or not QP.isValid( self):
                 
@@ -3447,13 +3559,35 @@ class CanvasFilterDuplicates( CanvasWithHovers ):
                 
             
             self._unprocessed_pairs = unprocessed_pairs
+            self._hashes_to_prefetched_media_results = hashes_to_media_results
             
             self._currently_fetching_pairs = False
             
+            self._StartPairQueueProducer()
+            
             self._ShowNewPair()
             
         
-        result = HG.client_controller.Read( 'duplicate_pairs_for_filtering', file_search_context, both_files_match, pixel_dupes_preference, max_hamming_distance )
+        def qt_set_queue_key( queue_key ):
+            
+            if not self or not QP.isValid( self ) or self._pair_queue_closed:
+                
+                HG.client_controller.Write( 'duplicate_pair_queue_drop', queue_key )
+                
+                return
+                
+            
+            self._pair_queue_key = queue_key
+            
+        
+        if pair_queue_key is None:
+            
+            pair_queue_key = HG.client_controller.WriteSynchronous( 'duplicate_pair_queue_start', file_search_context, both_files_match, pixel_dupes_preference, max_hamming_distance )
+            
+            QP.CallAfter( qt_set_queue_key, pair_queue_key )
+            
+        
+        result = HG.client_controller.Read( 'duplicate_pairs_for_filtering_from_queue', pair_queue_key )
         
         if len( result ) == 0:
             
@@ -3461,7 +3595,35 @@ class CanvasFilterDuplicates( CanvasWithHovers ):
             
         else:
             
-            QP.CallAfter( qt_continue, result )
+            # one db hit for the whole batch, rather than one per pair as we go
+            
+            hashes = list( { hash for pair in result for hash in pair } )
+            
+            media_results = HG.client_controller.Read( 'media_results', hashes )
+            
+            hashes_to_media_results = { media_result.GetHash() : media_result for media_result in media_results }
+            
+            QP.CallAfter( qt_continue, result, hashes_to_media_results )
+            
+        
+    
+    def THREADProducePairs( self, pair_queue_key ):
+        
+        try:
+            
+            while not ( HG.view_shutdown or self._pair_queue_closed ):
+                
+                work_to_do = HG.client_controller.WriteSynchronous( 'duplicate_pair_queue_fill', pair_queue_key )
+                
+                if not work_to_do:
+                    
+                    break
+                    
+                
+            
+        finally:
+            
+            self._pair_queue_producer_running = False
             
         
     
@@ -3560,21 +3722,13 @@ class CanvasMediaList( ClientMedia.ListeningMediaList, CanvasWithHovers ):
             to_render.append( ( previous, delay ) )
             
         
-        image_cache = HG.client_controller.GetCache( 'images' )
-        
         for ( media, delay ) in to_render:
             
-            hash = media.GetHash()
-            mime = media.GetMime()
-            
             if media.IsStaticImage():
                 
-                if not image_cache.HasImageRenderer( hash ):
-                    
-                    # we do qt safe to make sure the job is cancelled if we are destroyed
-                    
-                    HG.client_controller.CallLaterQtSafe( self, delay, 'image pre-fetch', image_cache.PrefetchImageRenderer, media )
-                    
+                # we do qt safe to make sure the job is cancelled if we are destroyed
+                
+                HG.client_controller.CallLaterQtSafe( self, delay, 'image pre-fetch', self._PrefetchNeighbour, media )
                 
             
         
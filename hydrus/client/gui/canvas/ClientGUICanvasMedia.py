@@ -12,6 +12,7 @@ from hydrus.core import HydrusGlobals as HG
 from hydrus.core import HydrusPaths
 
 from hydrus.client import ClientApplicationCommand as CAC
+from hydrus.client import ClientCaches
 from hydrus.client import ClientConstants as CC
 from hydrus.client import ClientRendering
 from hydrus.client.gui import ClientGUIFunctions
@@ -23,6 +24,163 @@ from hydrus.client.gui import QtPorting as QP
 from hydrus.client.gui.widgets import ClientGUICommon
 from hydrus.client.media import ClientMedia
 
+def CalculateCanvasTileSize( zoom ) -> QC.QSize:
+    
+    # it is most convenient to have tiles that line up with the current zoom ratio
+    # 768 is a convenient size for meaty GPU blitting, but as a number it doesn't make for nice multiplication
+    
+    # a 'nice' size is one that divides nicely by our zoom, so that integer translations between canvas and native res aren't losing too much in the float remainder
+    
+    # the trick of going ( 123456 // 16 ) * 16 to give you a nice multiple of 16 does not work with floats like 1.4 lmao.
+    # what we can do instead is phrase 1.4 as 7/5 and use 7 as our int. any number cleanly divisible by 7 is cleanly divisible by 1.4
+    
+    ideal_tile_dimension = HG.client_controller.new_options.GetInteger( 'ideal_tile_dimension' )
+    
+    nice_number = HydrusData.GetNicelyDivisibleNumberForZoom( zoom, ideal_tile_dimension )
+    
+    if nice_number == -1:
+        
+        # we are in extreme zoom land. nice multiples are impossible with reasonable size tiles, so we'll have to settle for some problems
+        # a future solution is to get a bigger zoom and scale down
+        # a future solution is to just make overlapping screen covering tiles and never deal with seams lmao
+        
+        tile_dimension = ideal_tile_dimension
+        
+    else:
+        
+        tile_dimension = ( ideal_tile_dimension // nice_number ) * nice_number
+        
+    
+    tile_dimension = max( min( tile_dimension, 2048 ), 1 )
+    
+    if HG.canvas_tile_outline_mode:
+        
+        HydrusData.ShowText( '{} from zoom {} and nice number {}'.format( tile_dimension, zoom, nice_number ) )
+        
+    
+    return QC.QSize( tile_dimension, tile_dimension )
+    
+def GetFirstScreenTileClipRects( media, canvas_size: QC.QSize, viewport_size: QC.QSize ):
+    
+    # the tiles a StaticImage of canvas_size will draw first when it is shown centered in a viewport, for prefetch
+    
+    ( media_width, media_height ) = media.GetResolution()
+    
+    if media_width == 0 or media_height == 0:
+        
+        return []
+        
+    
+    zoom = canvas_size.width() / media_width
+    
+    canvas_tile_size = CalculateCanvasTileSize( zoom )
+    
+    visible_width = min( canvas_size.width(), viewport_size.width() )
+    visible_height = min( canvas_size.height(), viewport_size.height() )
+    
+    visible_topLeft = QC.QPoint( ( canvas_size.width() - visible_width ) // 2, ( canvas_size.height() - visible_height ) // 2 )
+    
+    visible_rect = QC.QRect( visible_topLeft, QC.QSize( visible_width, visible_height ) )
+    
+    tile_coordinates = GetTileCoordinatesInRect( visible_rect, canvas_size, canvas_tile_size )
+    
+    clip_rects_and_target_resolutions = []
+    
+    for tile_coordinate in tile_coordinates:
+        
+        ( native_clip_rect, canvas_clip_rect ) = GetTileClipRects( media.GetResolution(), canvas_size, canvas_tile_size, zoom, tile_coordinate )
+        
+        clip_rects_and_target_resolutions.append( ( native_clip_rect, canvas_clip_rect.size() ) )
+        
+    
+    return clip_rects_and_target_resolutions
+    
+def GetTileClipRects( media_resolution, canvas_size: QC.QSize, canvas_tile_size: QC.QSize, zoom, tile_coordinate ) -> typing.Tuple[ QC.QRect, QC.QRect ]:
+    
+    ( tile_x, tile_y ) = tile_coordinate
+    
+    ( my_width, my_height ) = ( canvas_size.width(), canvas_size.height() )
+    
+    ( normal_canvas_width, normal_canvas_height ) = ( canvas_tile_size.width(), canvas_tile_size.height() )
+    
+    ( media_width, media_height ) = media_resolution
+    
+    canvas_x = tile_x * canvas_tile_size.width()
+    canvas_y = tile_y * canvas_tile_size.height()
+    
+    canvas_topLeft = QC.QPoint( canvas_x, canvas_y )
+    
+    canvas_width = normal_canvas_width
+    
+    if canvas_x + normal_canvas_width > my_width:
+        
+        # this is the rightmost tile and should be shrunk
+        
+        canvas_width = my_width % normal_canvas_width
+        
+    
+    canvas_height = normal_canvas_height
+    
+    if canvas_y + normal_canvas_height > my_height:
+        
+        # this is the bottommost tile and should be shrunk
+        
+        canvas_height = my_height % normal_canvas_height
+        
+    
+    canvas_width = max( 1, canvas_width )
+    canvas_height = max( 1, canvas_height )
+    
+    # if we are the last row/column our size is not this!
+    
+    canvas_clip_size = QC.QSize( canvas_width, canvas_height )
+    
+    canvas_clip_rect = QC.QRect( canvas_topLeft, canvas_clip_size )
+    
+    native_clip_rect = QC.QRect( canvas_topLeft / zoom, canvas_clip_size / zoom )
+    
+    # dealing with rounding errors with zoom calc
+    if native_clip_rect.width() + native_clip_rect.x() > media_width:
+        
+        native_clip_rect.setWidth( media_width - native_clip_rect.x() )
+        
+    
+    if native_clip_rect.height() + native_clip_rect.y() > media_height:
+        
+        native_clip_rect.setHeight( media_height - native_clip_rect.y() )
+        
+    
+    if native_clip_rect.width() == 0:
+        
+        native_clip_rect.setX( max( native_clip_rect.x() - 1, 0 ) )
+        native_clip_rect.setWidth( 1 )
+        
+    
+    if native_clip_rect.height() == 0:
+        
+        native_clip_rect.setY( max( native_clip_rect.y() - 1, 0 ) )
+        native_clip_rect.setHeight( 1 )
+        
+    
+    return ( native_clip_rect, canvas_clip_rect )
+    
+def GetTileCoordinatesInRect( rect: QC.QRect, canvas_size: QC.QSize, canvas_tile_size: QC.QSize ):
+    
+    if canvas_size.width() == 0 or canvas_size.height() == 0 or canvas_tile_size.width() == 0 or canvas_tile_size.height() == 0:
+        
+        return []
+        
+    
+    topLeft_tile_coordinate = ( rect.left() // canvas_tile_size.width(), rect.top() // canvas_tile_size.height() )
+    bottomRight_tile_coordinate = ( rect.right() // canvas_tile_size.width(), rect.bottom() // canvas_tile_size.height() )
+    
+    i = itertools.product(
+        range( topLeft_tile_coordinate[0], bottomRight_tile_coordinate[0] + 1 ),
+        range( topLeft_tile_coordinate[1], bottomRight_tile_coordinate[1] + 1 )
+    )
+    
+    return list( i )
+    
 def ShouldHaveAnimationBar( media, show_action ):
     
     if media is None:
@@ -1649,9 +1807,9 @@ class EmbedButton( QW.QWidget ):
             
             mime = self._media.GetMime()
             
-            thumbnail_path = HG.client_controller.client_files_manager.GetThumbnailPath( self._media )
+            thumbnail_bytes = HG.client_controller.client_files_manager.GetThumbnailBytes( self._media )
             
-            self._thumbnail_qt_pixmap = ClientRendering.GenerateHydrusBitmap( thumbnail_path, mime ).GetQtPixmap()
+            self._thumbnail_qt_pixmap = ClientRendering.GenerateHydrusBitmapFromBytes( thumbnail_bytes, mime ).GetQtPixmap()
             
             self.update()
             
@@ -1677,9 +1835,9 @@ class OpenExternallyPanel( QW.QWidget ):
             
             mime = self._media.GetMime()
             
-            thumbnail_path = HG.client_controller.client_files_manager.GetThumbnailPath( self._media )
+            thumbnail_bytes = HG.client_controller.client_files_manager.GetThumbnailBytes( self._media )
             
-            qt_pixmap = ClientRendering.GenerateHydrusBitmap( thumbnail_path, mime ).GetQtPixmap()
+            qt_pixmap = ClientRendering.GenerateHydrusBitmapFromBytes( thumbnail_bytes, mime ).GetQtPixmap()
             
             thumbnail_window = ClientGUICommon.BufferedWindowIcon( self, qt_pixmap )
             
@@ -1760,6 +1918,8 @@ class StaticImage( QW.QWidget ):
         
         self._zoom = 1.0
         
+        self._prefetch_tile_coordinates = set()
+        
         if self._canvas_type in CC.CANVAS_MEDIA_VIEWER_TYPES:
             
             shortcut_set = 'media_viewer_media_window'
@@ -1777,7 +1937,8 @@ class StaticImage( QW.QWidget ):
         if self._media is None or self.width() == 0 or self.height() == 0:
             
             self._zoom = 1.0
-            tile_dimension = 0
+            
+            self._canvas_tile_size = QC.QSize( 0, 0 )
             
         else:
             
@@ -1785,45 +1946,15 @@ class StaticImage( QW.QWidget ):
             
             self._zoom = self.width() / media_width
             
-            # it is most convenient to have tiles that line up with the current zoom ratio
-            # 768 is a convenient size for meaty GPU blitting, but as a number it doesn't make for nice multiplication
-            
-            # a 'nice' size is one that divides nicely by our zoom, so that integer translations between canvas and native res aren't losing too much in the float remainder
-            
-            # the trick of going ( 123456 // 16 ) * 16 to give you a nice multiple of 16 does not work with floats like 1.4 lmao.
-            # what we can do instead is phrase 1.4 as 7/5 and use 7 as our int. any number cleanly divisible by 7 is cleanly divisible by 1.4
-            
-            ideal_tile_dimension = HG.client_controller.new_options.GetInteger( 'ideal_tile_dimension' )
-            
-            nice_number = HydrusData.GetNicelyDivisibleNumberForZoom( self._zoom, ideal_tile_dimension )
-            
-            if nice_number == -1:
-                
-                # we are in extreme zoom land. nice multiples are impossible with reasonable size tiles, so we'll have to settle for some problems
-                # a future solution is to get a bigger zoom and scale down
-                # a future solution is to just make overlapping screen covering tiles and never deal with seams lmao
-                
-                tile_dimension = ideal_tile_dimension
-                
-            else:
-                
-                tile_dimension = ( ideal_tile_dimension // nice_number ) * nice_number
-                
-            
-            tile_dimension = max( min( tile_dimension, 2048 ), 1 )
-            
-            if HG.canvas_tile_outline_mode:
-                
-                HydrusData.ShowText( '{} from zoom {} and nice number {}'.format( tile_dimension, self._zoom, nice_number ) )
-                
+            self._canvas_tile_size = CalculateCanvasTileSize( self._zoom )
             
         
-        self._canvas_tile_size = QC.QSize( tile_dimension, tile_dimension )
-        
         self._canvas_tiles = {}
         
         self._is_rendered = False
         
+        self._prefetch_tile_coordinates = set()
+        
     
     def _DrawBackground( self, painter ):
         
@@ -1849,7 +1980,7 @@ class StaticImage( QW.QWidget ):
         
         tile = self._tile_cache.GetTile( self._image_renderer, self._media, native_clip_rect, canvas_clip_rect.size() )
         
-        painter.drawPixmap( 0, 0, tile.qt_pixmap )
+        painter.drawPixmap( 0, 0, tile.GetQtPixmap() )
         
         if HG.canvas_tile_outline_mode:
             
@@ -1864,98 +1995,51 @@ class StaticImage( QW.QWidget ):
     
     def _GetClipRectsFromTileCoordinates( self, tile_coordinate ) -> typing.Tuple[ QC.QRect, QC.QRect ]:
         
-        ( tile_x, tile_y ) = tile_coordinate
+        return GetTileClipRects( self._media.GetResolution(), self.size(), self._canvas_tile_size, self._zoom, tile_coordinate )
         
-        ( my_width, my_height ) = ( self.width(), self.height() )
-        
-        ( normal_canvas_width, normal_canvas_height ) = ( self._canvas_tile_size.width(), self._canvas_tile_size.height() )
-        
-        ( media_width, media_height ) = self._media.GetResolution()
-        
-        canvas_x = tile_x * self._canvas_tile_size.width()
-        canvas_y = tile_y * self._canvas_tile_size.height()
-        
-        canvas_topLeft = QC.QPoint( canvas_x, canvas_y )
+    
+    def _GetTileCoordinatesInView( self, rect: QC.QRect ):
         
-        canvas_width = normal_canvas_width
+        return GetTileCoordinatesInRect( rect, self.size(), self._canvas_tile_size )
         
-        if canvas_x + normal_canvas_width > my_width:
-            
-            # this is the rightmost tile and should be shrunk
-            
-            canvas_width = my_width % normal_canvas_width
-            
+    
+    def _PrefetchRingTiles( self, visible_tile_coordinates ):
         
-        canvas_height = normal_canvas_height
+        # when zoomed into a big image, the user is going to drag the next tiles into view any moment, so render the ring around what we can see
         
-        if canvas_y + normal_canvas_height > my_height:
+        if len( visible_tile_coordinates ) == 0:
             
-            # this is the bottommost tile and should be shrunk
-            
-            canvas_height = my_height % normal_canvas_height
+            return
             
         
-        canvas_width = max( 1, canvas_width )
-        canvas_height = max( 1, canvas_height )
+        max_tile_x = ( self.width() - 1 ) // self._canvas_tile_size.width()
+        max_tile_y = ( self.height() - 1 ) // self._canvas_tile_size.height()
         
-        # if we are the last row/column our size is not this!
+        xs = [ tile_x for ( tile_x, tile_y ) in visible_tile_coordinates ]
+        ys = [ tile_y for ( tile_x, tile_y ) in visible_tile_coordinates ]
         
-        canvas_size = QC.QSize( canvas_width, canvas_height )
+        ring_xs = range( max( min( xs ) - 1, 0 ), min( max( xs ) + 1, max_tile_x ) + 1 )
+        ring_ys = range( max( min( ys ) - 1, 0 ), min( max( ys ) + 1, max_tile_y ) + 1 )
         
-        canvas_clip_rect = QC.QRect( canvas_topLeft, canvas_size )
+        prefetch_tile_coordinates = set( itertools.product( ring_xs, ring_ys ) ).difference( visible_tile_coordinates )
         
-        native_clip_rect = QC.QRect( canvas_topLeft / self._zoom, canvas_size / self._zoom )
-        
-        # dealing with rounding errors with zoom calc
-        if native_clip_rect.width() + native_clip_rect.x() > media_width:
+        if prefetch_tile_coordinates == self._prefetch_tile_coordinates:
             
-            native_clip_rect.setWidth( media_width - native_clip_rect.x() )
+            return
             
         
-        if native_clip_rect.height() + native_clip_rect.y() > media_height:
-            
-            native_clip_rect.setHeight( media_height - native_clip_rect.y() )
-            
+        self._prefetch_tile_coordinates = prefetch_tile_coordinates
         
-        if native_clip_rect.width() == 0:
-            
-            native_clip_rect.setX( max( native_clip_rect.x() - 1, 0 ) )
-            native_clip_rect.setWidth( 1 )
-            
+        clip_rects_and_target_resolutions = []
         
-        if native_clip_rect.height() == 0:
+        for tile_coordinate in prefetch_tile_coordinates:
             
-            native_clip_rect.setY( max( native_clip_rect.y() - 1, 0 ) )
-            native_clip_rect.setHeight( 1 )
-            
-        
-        return ( native_clip_rect, canvas_clip_rect )
-        
-    
-    def _GetTileCoordinateFromPoint( self, pos: QC.QPoint ):
-        
-        tile_x = pos.x() // self._canvas_tile_size.width()
-        tile_y = pos.y() // self._canvas_tile_size.height()
-        
-        return ( tile_x, tile_y )
-        
-    
-    def _GetTileCoordinatesInView( self, rect: QC.QRect ):
-        
-        if self.width() == 0 or self.height() == 0 or self._canvas_tile_size.width() == 0 or self._canvas_tile_size.height() == 0:
+            ( native_clip_rect, canvas_clip_rect ) = self._GetClipRectsFromTileCoordinates( tile_coordinate )
             
-            return []
+            clip_rects_and_target_resolutions.append( ( native_clip_rect, canvas_clip_rect.size() ) )
             
         
-        topLeft_tile_coordinate = self._GetTileCoordinateFromPoint( rect.topLeft() )
-        bottomRight_tile_coordinate = self._GetTileCoordinateFromPoint( rect.bottomRight() )
-        
-        i = itertools.product(
-            range( topLeft_tile_coordinate[0], bottomRight_tile_coordinate[0] + 1 ),
-            range( topLeft_tile_coordinate[1], bottomRight_tile_coordinate[1] + 1 )
-        )
-        
-        return list( i )
+        self._tile_cache.PrefetchTiles( self._image_renderer, self._media, clip_rects_and_target_resolutions, ClientCaches.TILE_PREFETCH_PRIORITY_CURRENT )
         
     
     def ClearMedia( self ):
@@ -2007,6 +2091,8 @@ class StaticImage( QW.QWidget ):
                 del self._canvas_tiles[ deletee_tile_coordinate ]
                 
             
+            self._PrefetchRingTiles( all_visible_tile_coordinates )
+            
             if not self._is_rendered:
                 
                 self.readyForNeighbourPrefetch.emit()
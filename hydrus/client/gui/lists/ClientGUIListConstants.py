@@ -1465,3 +1465,36 @@ register_column_type( COLUMN_LIST_VACUUM_DATA.ID, COLUMN_LIST_VACUUM_DATA.CAN_VA
 register_column_type( COLUMN_LIST_VACUUM_DATA.ID, COLUMN_LIST_VACUUM_DATA.VACUUM_TIME_ESTIMATE, 'vacuum time estimate', False, 48, True )
 
 default_column_list_sort_lookup[ COLUMN_LIST_VACUUM_DATA.ID ] = ( COLUMN_LIST_VACUUM_DATA.NAME, True )
+
+#
+
+class COLUMN_LIST_DB_JOB_METRICS( COLUMN_LIST_DEFINITION ):
+    
+    ID = 67
+    
+    JOB = 0
+    NUM_JOBS = 1
+    TOTAL_TIME = 2
+    MEDIAN = 3
+    P99 = 4
+    MAX = 5
+    QUEUE_WAIT_P99 = 6
+    ROWS_CHANGED = 7
+    TEMP_TABLES = 8
+    NUM_ERRORS = 9
+    
+
+column_list_type_name_lookup[ COLUMN_LIST_DB_JOB_METRICS.ID ] = 'db job metrics'
+
+register_column_type( COLUMN_LIST_DB_JOB_METRICS.ID, COLUMN_LIST_DB_JOB_METRICS.JOB, 'job', False, 36, True )
+register_column_type( COLUMN_LIST_DB_JOB_METRICS.ID, COLUMN_LIST_DB_JOB_METRICS.NUM_JOBS, 'count', False, 8, True )
+register_column_type( COLUMN_LIST_DB_JOB_METRICS.ID, COLUMN_LIST_DB_JOB_METRICS.TOTAL_TIME, 'total time', False, 16, True )
+register_column_type( COLUMN_LIST_DB_JOB_METRICS.ID, COLUMN_LIST_DB_JOB_METRICS.MEDIAN, 'p50', False, 16, True )
+register_column_type( COLUMN_LIST_DB_JOB_METRICS.ID, COLUMN_LIST_DB_JOB_METRICS.P99, 'p99', False, 16, True )
+register_column_type( COLUMN_LIST_DB_JOB_METRICS.ID, COLUMN_LIST_DB_JOB_METRICS.MAX, 'max', False, 16, True )
+register_column_type( COLUMN_LIST_DB_JOB_METRICS.ID, COLUMN_LIST_DB_JOB_METRICS.QUEUE_WAIT_P99, 'queue wait p99', False, 16, True )
+register_column_type( COLUMN_LIST_DB_JOB_METRICS.ID, COLUMN_LIST_DB_JOB_METRICS.ROWS_CHANGED, 'rows changed', False, 12, True )
+register_column_type( COLUMN_LIST_DB_JOB_METRICS.ID, COLUMN_LIST_DB_JOB_METRICS.TEMP_TABLES, 'temp tables', False, 12, True )
+register_column_type( COLUMN_LIST_DB_JOB_METRICS.ID, COLUMN_LIST_DB_JOB_METRICS.NUM_ERRORS, 'errors', False, 8, True )
+
+default_column_list_sort_lookup[ COLUMN_LIST_DB_JOB_METRICS.ID ] = ( COLUMN_LIST_DB_JOB_METRICS.TOTAL_TIME, False )
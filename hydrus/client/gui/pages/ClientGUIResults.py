@@ -2441,7 +2441,9 @@ class MediaPanelThumbnails( MediaPanel ):
         
         if len( thumbnails_to_render_later ) > 0:
             
-            HG.client_controller.GetCache( 'thumbnail' ).Waterfall( self._page_key, thumbnails_to_render_later )
+            in_viewport = page_index in self._CalculateVisiblePageIndices()
+            
+            HG.client_controller.GetCache( 'thumbnail' ).Waterfall( self._page_key, thumbnails_to_render_later, in_viewport = in_viewport )
             
         
     
@@ -4196,6 +4198,11 @@ class MediaPanelThumbnails( MediaPanel ):
         
         if len( affected_thumbnails ) > 0:
             
+            for thumbnail in affected_thumbnails:
+                
+                thumbnail.DirtyDecoration()
+                
+            
             self._RedrawMedia( affected_thumbnails )
             
         
@@ -4210,6 +4217,12 @@ class MediaPanelThumbnails( MediaPanel ):
                 
                 media.UpdateFileInfo( hashes_to_media_results )
                 
+                media.DirtyDecoration()
+                
+            
+            self._sorted_media.dirty_sort_keys( affected_media )
+            
+            self.DirtyCollectKeys( hashes_to_media_results.keys() )
             
             self._RedrawMedia( affected_media )
             
@@ -4228,10 +4241,46 @@ class MediaPanelThumbnails( MediaPanel ):
         HG.client_controller.CallToThread( do_it, self, do_it, affected_hashes )
         
     
+    def ProcessContentUpdates( self, service_keys_to_content_updates ):
+        
+        # tags, inbox, trash and remote locations all show on the decorated thumb, so anything touched needs a new composite
+        
+        for ( service_key, content_updates ) in service_keys_to_content_updates.items():
+            
+            for content_update in content_updates:
+                
+                hashes = content_update.GetHashes()
+                
+                if self._HasHashes( hashes ):
+                    
+                    for thumbnail in self._GetMedia( hashes ):
+                        
+                        thumbnail.DirtyDecoration()
+                        
+                    
+                
+            
+        
+        MediaPanel.ProcessContentUpdates( self, service_keys_to_content_updates )
+        
+    
+    def ProcessServiceUpdates( self, service_keys_to_service_updates ):
+        
+        for media in self._sorted_media:
+            
+            media.DirtyDecoration()
+            
+        
+        MediaPanel.ProcessServiceUpdates( self, service_keys_to_service_updates )
+        
+    
     def RedrawAllThumbnails( self ):
         
         self._DirtyAllPages()
         
+        self.ClearSortKeys()
+        self.ClearCollectKeys()
+        
         for m in self._collected_media:
             
             m.RecalcInternals()
@@ -4688,10 +4737,10 @@ class Thumbnail( Selectable ):
         self._last_upper_summary = None
         self._last_lower_summary = None
         
-    
-    def GetQtImage( self ):
+        self._decoration_token = object()
         
-        thumbnail_hydrus_bmp = HG.client_controller.GetCache( 'thumbnail' ).GetThumbnail( self )
+    
+    def _GenerateDecoratedQtImage( self, thumbnail_hydrus_bmp ):
         
         thumbnail_border = HG.client_controller.new_options.GetInteger( 'thumbnail_border' )
         
@@ -5042,6 +5091,33 @@ class Thumbnail( Selectable ):
         return qt_image
         
     
+    def DirtyDecoration( self ):
+        
+        # a new token means a new key, so the old composites just age out of the cache
+        self._decoration_token = object()
+        
+    
+    def GetQtImage( self ):
+        
+        thumbnail_hydrus_bmp = HG.client_controller.GetCache( 'thumbnail' ).GetThumbnail( self )
+        
+        decorated_thumbnail_cache = HG.client_controller.GetCache( 'decorated_thumbnail' )
+        
+        # the bitmap is in the key so a regenerated or newly loaded thumb gets a fresh composite
+        key = ( self._decoration_token, self._selected, thumbnail_hydrus_bmp )
+        
+        qt_image = decorated_thumbnail_cache.GetQtImage( key )
+        
+        if qt_image is None:
+            
+            qt_image = self._GenerateDecoratedQtImage( thumbnail_hydrus_bmp )
+            
+            decorated_thumbnail_cache.AddQtImage( key, qt_image )
+            
+        
+        return qt_image
+        
+    
 class ThumbnailMediaCollection( Thumbnail, ClientMedia.MediaCollection ):
     
     def __init__( self, location_context, media_results ):
@@ -5050,6 +5126,29 @@ class ThumbnailMediaCollection( Thumbnail, ClientMedia.MediaCollection ):
         Thumbnail.__init__( self )
         
     
+    def _RecalcAfterMediaRemove( self ):
+        
+        ClientMedia.MediaCollection._RecalcAfterMediaRemove( self )
+        
+        self.DirtyDecoration()
+        
+    
+    def _RecalcInternals( self ):
+        
+        ClientMedia.MediaCollection._RecalcInternals( self )
+        
+        # file count, inbox and so on may have changed
+        self.DirtyDecoration()
+        
+    
+    def AddMedia( self, new_media ):
+        
+        # adding members updates the collection piecemeal rather than through _RecalcInternals, so we dirty here too
+        ClientMedia.MediaCollection.AddMedia( self, new_media )
+        
+        self.DirtyDecoration()
+        
+    
 class ThumbnailMediaSingleton( Thumbnail, ClientMedia.MediaSingleton ):
     
     def __init__( self, media_result ):
@@ -35,6 +35,11 @@ from hydrus.client.networking import ClientNetworkingFunctions
 FILE_SEED_TYPE_HDD = 0
 FILE_SEED_TYPE_URL = 1
 
+PRE_IMPORT_STATUS_PREFETCH_BATCH_SIZE = 256
+
+# a prefetch is a snapshot of the db. if the queue is paused or slow, we don't want to act on one that is minutes old
+PRE_IMPORT_STATUS_PREFETCH_TTL = 60
+
 class FileSeed( HydrusSerialisable.SerialisableBase ):
     
     SERIALISABLE_TYPE = HydrusSerialisable.SERIALISABLE_TYPE_FILE_SEED
@@ -74,6 +79,9 @@ class FileSeed( HydrusSerialisable.SerialisableBase ):
         self._tags = set()
         self._hashes = {}
         
+        # not serialised. the file seed cache fills this in for a batch of the queue at once
+        self._pre_import_status_prefetch = None
+        
     
     def __eq__( self, other ):
         
@@ -165,6 +173,86 @@ class FileSeed( HydrusSerialisable.SerialisableBase ):
             
         
     
+    def _GetPreImportStatusPrefetch( self ):
+        
+        # returns None if we have nothing or it is too old to trust
+        
+        if self._pre_import_status_prefetch is None:
+            
+            return None
+            
+        
+        ( prefetch_time, urls_to_statuses, hash_types_and_hashes_to_statuses ) = self._pre_import_status_prefetch
+        
+        if HydrusData.TimeHasPassed( prefetch_time + PRE_IMPORT_STATUS_PREFETCH_TTL ):
+            
+            self._pre_import_status_prefetch = None
+            
+            return None
+            
+        
+        return ( urls_to_statuses, hash_types_and_hashes_to_statuses )
+        
+    
+    def _GetPreImportStatusPredictionHashJobs( self, file_import_options: FileImportOptions.FileImportOptions ):
+        
+        if file_import_options.DoNotCheckHashesBeforeImporting() or len( self._hashes ) == 0:
+            
+            return []
+            
+        
+        jobs = []
+        
+        if 'sha256' in self._hashes:
+            
+            jobs.append( ( 'sha256', self._hashes[ 'sha256' ] ) )
+            
+        
+        for ( hash_type, found_hash ) in self._hashes.items():
+            
+            if hash_type == 'sha256':
+                
+                continue
+                
+            
+            jobs.append( ( hash_type, found_hash ) )
+            
+        
+        return jobs
+        
+    
+    def _GetPreImportStatusPredictionURLs( self, file_import_options: FileImportOptions.FileImportOptions, file_url = None ):
+        
+        if file_import_options.DoNotCheckKnownURLsBeforeImporting():
+            
+            return []
+            
+        
+        urls = []
+        
+        if self.file_seed_type == FILE_SEED_TYPE_URL:
+            
+            urls.append( self.file_seed_data )
+            
+        
+        if file_url is not None:
+            
+            urls.append( file_url )
+            
+        
+        urls.extend( self._primary_urls )
+        
+        # now that we store primary and source urls separately, we'll trust any primary but be careful about source
+        # trusting classless source urls was too much of a hassle with too many boorus providing bad source urls like user account pages
+        
+        urls.extend( ( url for url in self._source_urls if HG.client_controller.network_engine.domain_manager.URLDefinitelyRefersToOneFile( url ) ) )
+        
+        # now discard gallery pages or post urls that can hold multiple files
+        urls = [ url for url in urls if not HG.client_controller.network_engine.domain_manager.URLCanReferToMultipleFiles( url ) ]
+        
+        return urls
+        
+    
     def _GetSerialisableInfo( self ):
         
         serialisable_external_filterable_tags = list( self._external_filterable_tags )
@@ -543,39 +631,41 @@ class FileSeed( HydrusSerialisable.SerialisableBase ):
         return dict( self._hashes )
         
     
-    def GetPreImportStatusPredictionHash( self, file_import_options: FileImportOptions.FileImportOptions ) -> ClientImportFiles.FileImportStatus:
-        
-        hash_match_found = False
+    def GetPreImportStatusPredictionHash( self, file_import_options: FileImportOptions.FileImportOptions, hash_types_and_hashes_to_statuses = None ) -> ClientImportFiles.FileImportStatus:
         
-        if file_import_options.DoNotCheckHashesBeforeImporting() or len( self._hashes ) == 0:
+        if hash_types_and_hashes_to_statuses is None:
             
-            return ( hash_match_found, ClientImportFiles.FileImportStatus.STATICGetUnknownStatus() )
+            hash_types_and_hashes_to_statuses = {}
             
         
-        # hashes
-        
-        jobs = []
+        hash_match_found = False
         
-        if 'sha256' in self._hashes:
-            
-            jobs.append( ( 'sha256', self._hashes[ 'sha256' ] ) )
-            
+        jobs = self._GetPreImportStatusPredictionHashJobs( file_import_options )
         
-        for ( hash_type, found_hash ) in self._hashes.items():
+        if len( jobs ) == 0:
             
-            if hash_type == 'sha256':
-                
-                continue
-                
-            
-            jobs.append( ( hash_type, found_hash ) )
+            return ( hash_match_found, ClientImportFiles.FileImportStatus.STATICGetUnknownStatus() )
             
         
         first_result = None
         
         for ( hash_type, found_hash ) in jobs:
             
-            file_import_status = HG.client_controller.Read( 'hash_status', hash_type, found_hash, prefix = '{} hash recognised'.format( hash_type ) )
+            if ( hash_type, found_hash ) in hash_types_and_hashes_to_statuses:
+                
+                file_import_status = hash_types_and_hashes_to_statuses[ ( hash_type, found_hash ) ]
+                
+            elif hash_type == 'sha256' and HG.client_controller.known_content_filter_manager.HashIsDefinitelyNew( found_hash ):
+                
+                file_import_status = ClientImportFiles.FileImportStatus.STATICGetUnknownStatus()
+                
+                file_import_status.hash = found_hash
+                
+            else:
+                
+                file_import_status = HG.client_controller.Read( 'hash_status', hash_type, found_hash, prefix = '{} hash recognised'.format( hash_type ) )
+                
+            
             
             hash_match_found = True
             
@@ -603,36 +693,19 @@ class FileSeed( HydrusSerialisable.SerialisableBase ):
             
         
     
-    def GetPreImportStatusPredictionURL( self, file_import_options: FileImportOptions.FileImportOptions, file_url = None ) -> ClientImportFiles.FileImportStatus:
+    def GetPreImportStatusPredictionURL( self, file_import_options: FileImportOptions.FileImportOptions, file_url = None, urls_to_statuses = None ) -> ClientImportFiles.FileImportStatus:
         
         if file_import_options.DoNotCheckKnownURLsBeforeImporting():
             
             return ClientImportFiles.FileImportStatus.STATICGetUnknownStatus()
             
         
-        # urls
-        
-        urls = []
-        
-        if self.file_seed_type == FILE_SEED_TYPE_URL:
-            
-            urls.append( self.file_seed_data )
-            
-        
-        if file_url is not None:
+        if urls_to_statuses is None:
             
-            urls.append( file_url )
+            urls_to_statuses = {}
             
         
-        urls.extend( self._primary_urls )
-        
-        # now that we store primary and source urls separately, we'll trust any primary but be careful about source
-        # trusting classless source urls was too much of a hassle with too many boorus providing bad source urls like user account pages
-        
-        urls.extend( ( url for url in self._source_urls if HG.client_controller.network_engine.domain_manager.URLDefinitelyRefersToOneFile( url ) ) )
-        
-        # now discard gallery pages or post urls that can hold multiple files
-        urls = [ url for url in urls if not HG.client_controller.network_engine.domain_manager.URLCanReferToMultipleFiles( url ) ]
+        urls = self._GetPreImportStatusPredictionURLs( file_import_options, file_url = file_url )
         
         unrecognised_url_results = set()
         
@@ -640,7 +713,19 @@ class FileSeed( HydrusSerialisable.SerialisableBase ):
         
         for url in urls:
             
-            results = HG.client_controller.Read( 'url_statuses', url )
+            if url in urls_to_statuses:
+                
+                results = urls_to_statuses[ url ]
+                
+            elif HG.client_controller.known_content_filter_manager.URLIsDefinitelyNew( url ):
+                
+                results = []
+                
+            else:
+                
+                results = HG.client_controller.Read( 'url_statuses', url )
+                
+            
             
             if len( results ) == 0: # if no match found, no useful data discovered
                 
@@ -732,6 +817,14 @@ class FileSeed( HydrusSerialisable.SerialisableBase ):
             
         
     
+    def GetPreImportStatusPredictionJobs( self, file_import_options: FileImportOptions.FileImportOptions ):
+        
+        urls = self._GetPreImportStatusPredictionURLs( file_import_options )
+        hash_types_and_hashes = self._GetPreImportStatusPredictionHashJobs( file_import_options )
+        
+        return ( urls, hash_types_and_hashes )
+        
+    
     def GetSearchFileSeeds( self ):
         
         if self.file_seed_type == FILE_SEED_TYPE_URL:
@@ -776,6 +869,11 @@ class FileSeed( HydrusSerialisable.SerialisableBase ):
         return self.GetHash() is not None
         
     
+    def HasPreImportStatusPrefetch( self ):
+        
+        return self._GetPreImportStatusPrefetch() is not None
+        
+    
     def Import( self, temp_path: str, file_import_options: FileImportOptions.FileImportOptions, status_hook = None, use_symlinks = False ):
         
         file_import_job = ClientImportFiles.FileImportJob( temp_path, file_import_options )
@@ -948,7 +1046,23 @@ class FileSeed( HydrusSerialisable.SerialisableBase ):
     
     def PredictPreImportStatus( self, file_import_options: FileImportOptions.FileImportOptions, tag_import_options: TagImportOptions.TagImportOptions, file_url = None ):
         
-        ( hash_match_found, hash_file_import_status ) = self.GetPreImportStatusPredictionHash( file_import_options )
+        urls_to_statuses = None
+        hash_types_and_hashes_to_statuses = None
+        
+        if file_url is None:
+            
+            pre_import_status_prefetch = self._GetPreImportStatusPrefetch()
+            
+            if pre_import_status_prefetch is not None:
+                
+                ( urls_to_statuses, hash_types_and_hashes_to_statuses ) = pre_import_status_prefetch
+                
+                # good for one go only. anything after this should ask the db fresh
+                self._pre_import_status_prefetch = None
+                
+            
+        
+        ( hash_match_found, hash_file_import_status ) = self.GetPreImportStatusPredictionHash( file_import_options, hash_types_and_hashes_to_statuses = hash_types_and_hashes_to_statuses )
         
         # now let's set the prediction
         
@@ -960,7 +1074,7 @@ class FileSeed( HydrusSerialisable.SerialisableBase ):
             
         else:
             
-            url_file_import_status = self.GetPreImportStatusPredictionURL( file_import_options, file_url = file_url )
+            url_file_import_status = self.GetPreImportStatusPredictionURL( file_import_options, file_url = file_url, urls_to_statuses = urls_to_statuses )
             
             file_import_status = url_file_import_status
             
@@ -980,7 +1094,7 @@ class FileSeed( HydrusSerialisable.SerialisableBase ):
                 
                 if url_file_import_status is None:
                     
-                    url_file_import_status = self.GetPreImportStatusPredictionURL( file_import_options, file_url = file_url )
+                    url_file_import_status = self.GetPreImportStatusPredictionURL( file_import_options, file_url = file_url, urls_to_statuses = urls_to_statuses )
                     
                 
                 if url_file_import_status.AlreadyInDB():
@@ -1046,6 +1160,16 @@ class FileSeed( HydrusSerialisable.SerialisableBase ):
             
         
     
+    def SetPreImportStatusPrefetch( self, urls_to_statuses, hash_types_and_hashes_to_statuses ):
+        
+        # we only keep what the db recognised. an unknown result can go stale fast--an earlier file seed in the same batch might import that very file--so those are always asked again
+        
+        urls_to_statuses = { url : statuses for ( url, statuses ) in urls_to_statuses.items() if len( statuses ) > 0 }
+        hash_types_and_hashes_to_statuses = { hash_type_and_hash : file_import_status for ( hash_type_and_hash, file_import_status ) in hash_types_and_hashes_to_statuses.items() if file_import_status.status != CC.STATUS_UNKNOWN }
+        
+        self._pre_import_status_prefetch = ( HydrusData.GetNow(), urls_to_statuses, hash_types_and_hashes_to_statuses )
+        
+    
     def SetReferralURL( self, referral_url: str ):
         
         self._referral_url = referral_url
@@ -1137,6 +1261,8 @@ class FileSeed( HydrusSerialisable.SerialisableBase ):
             
             status_hook( 'checking url status' )
             
+            file_seed_cache.PrefetchPreImportStatuses( self, file_import_options )
+            
             ( should_download_metadata, should_download_file ) = self.PredictPreImportStatus( file_import_options, tag_import_options )
             
             if self.IsAPostURL():
@@ -2655,6 +2781,78 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
         HG.client_controller.pub( 'file_seed_cache_file_seeds_updated', self._file_seed_cache_key, file_seeds )
         
     
+    def PrefetchPreImportStatuses( self, file_seed: FileSeed, file_import_options: FileImportOptions.FileImportOptions ):
+        
+        # rather than every file seed doing its own url and hash status db jobs as it comes up, we do one job for a good chunk of the queue ahead
+        # a long run of 'already in db' posts then goes through in a handful of db jobs, not hundreds
+        
+        if file_seed.HasPreImportStatusPrefetch():
+            
+            return
+            
+        
+        file_seeds = [ file_seed ]
+        
+        with self._lock:
+            
+            if self._statuses_to_indexed_file_seeds_dirty:
+                
+                self._RegenerateStatusesToFileSeeds()
+                
+            
+            for ( index, queued_file_seed ) in self._statuses_to_indexed_file_seeds[ CC.STATUS_UNKNOWN ]:
+                
+                if len( file_seeds ) >= PRE_IMPORT_STATUS_PREFETCH_BATCH_SIZE:
+                    
+                    break
+                    
+                
+                if queued_file_seed is file_seed or queued_file_seed.HasPreImportStatusPrefetch():
+                    
+                    continue
+                    
+                
+                file_seeds.append( queued_file_seed )
+                
+            
+        
+        file_seeds_and_jobs = [ ( file_seed, file_seed.GetPreImportStatusPredictionJobs( file_import_options ) ) for file_seed in file_seeds ]
+        
+        all_urls = set()
+        all_hash_types_and_hashes = set()
+        
+        for ( file_seed, ( urls, hash_types_and_hashes ) ) in file_seeds_and_jobs:
+            
+            all_urls.update( urls )
+            all_hash_types_and_hashes.update( hash_types_and_hashes )
+            
+        
+        # anything the known content filter says is definitely new does not need the db at all
+        
+        known_content_filter_manager = HG.client_controller.known_content_filter_manager
+        
+        all_urls = { url for url in all_urls if not known_content_filter_manager.URLIsDefinitelyNew( url ) }
+        all_hash_types_and_hashes = { ( hash_type, found_hash ) for ( hash_type, found_hash ) in all_hash_types_and_hashes if not ( hash_type == 'sha256' and known_content_filter_manager.HashIsDefinitelyNew( found_hash ) ) }
+        
+        if len( all_urls ) == 0 and len( all_hash_types_and_hashes ) == 0:
+            
+            urls_to_statuses = {}
+            hash_types_and_hashes_to_statuses = {}
+            
+        else:
+            
+            ( urls_to_statuses, hash_types_and_hashes_to_statuses ) = HG.client_controller.Read( 'url_and_hash_statuses', all_urls, all_hash_types_and_hashes )
+            
+        
+        for ( file_seed, ( urls, hash_types_and_hashes ) ) in file_seeds_and_jobs:
+            
+            file_seed.SetPreImportStatusPrefetch(
+                { url : urls_to_statuses[ url ] for url in urls if url in urls_to_statuses },
+                { hash_type_and_hash : hash_types_and_hashes_to_statuses[ hash_type_and_hash ] for hash_type_and_hash in hash_types_and_hashes if hash_type_and_hash in hash_types_and_hashes_to_statuses }
+            )
+            
+        
+    
     def RemoveFileSeeds( self, file_seeds: typing.Iterable[ FileSeed ] ):
         
         with self._lock:
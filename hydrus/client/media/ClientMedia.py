@@ -3,6 +3,8 @@ import itertools
 import random
 import typing
 
+import numpy
+
 from hydrus.core import HydrusConstants as HC
 from hydrus.core import HydrusText
 from hydrus.core import HydrusData
@@ -813,6 +815,10 @@ class MediaList( object ):
         self._media_sort = MediaSort( ( 'system', CC.SORT_FILES_BY_FILESIZE ), CC.SORT_ASC )
         self._media_collect = MediaCollect()
         
+        # hash -> collection key for the current collect-by. content updates knock out just the rows they touch
+        self._collect_keys_definition = None
+        self._hashes_to_collect_keys = {}
+        
         self._sorted_media = SortedList( [ self._GenerateMediaSingleton( media_result ) for media_result in media_results ] )
         self._selected_media = set()
         
@@ -834,8 +840,25 @@ class MediaList( object ):
         namespaces_to_collect_by = list( media_collect.namespaces )
         ratings_to_collect_by = list( media_collect.rating_service_keys )
         
+        collect_keys_definition = ( tuple( namespaces_to_collect_by ), tuple( ratings_to_collect_by ) )
+        
+        if collect_keys_definition != self._collect_keys_definition:
+            
+            self._collect_keys_definition = collect_keys_definition
+            self._hashes_to_collect_keys = {}
+            
+        
         for media in medias:
             
+            hash = media.GetHash()
+            
+            if hash in self._hashes_to_collect_keys:
+                
+                keys_to_medias[ self._hashes_to_collect_keys[ hash ] ].append( media )
+                
+                continue
+                
+            
             if len( namespaces_to_collect_by ) > 0:
                 
                 namespace_key = media.GetTagsManager().GetNamespaceSlice( namespaces_to_collect_by, ClientTags.TAG_DISPLAY_ACTUAL )
@@ -854,6 +877,8 @@ class MediaList( object ):
                 rating_key = frozenset()
                 
             
+            self._hashes_to_collect_keys[ hash ] = ( namespace_key, rating_key )
+            
             keys_to_medias[ ( namespace_key, rating_key ) ].append( media )
             
         
@@ -1016,15 +1041,19 @@ class MediaList( object ):
             
         
         affected_singleton_media = self._GetMedia( hashes, discriminator = 'singletons' )
+        affected_collected_media = self._GetMedia( hashes, discriminator = 'collections' )
         
-        for media in self._collected_media:
+        for media in affected_collected_media:
             
             media._RemoveMediaByHashes( hashes )
             
         
-        affected_collected_media = [ media for media in self._collected_media if media.HasNoMedia() ]
+        emptied_collected_media = [ media for media in affected_collected_media if media.HasNoMedia() ]
         
-        self._RemoveMediaDirectly( affected_singleton_media, affected_collected_media )
+        # a collection that only shrank has a new size, file count and so on, so its cached sort keys are stale
+        self._sorted_media.dirty_sort_keys( [ media for media in affected_collected_media if not media.HasNoMedia() ] )
+        
+        self._RemoveMediaDirectly( affected_singleton_media, emptied_collected_media )
         
     
     def _RemoveMediaDirectly( self, singleton_media, collected_media ):
@@ -1042,6 +1071,11 @@ class MediaList( object ):
         self._singleton_media.difference_update( singleton_media )
         self._collected_media.difference_update( collected_media )
         
+        for media in singleton_media.union( collected_media ):
+            
+            self.DirtyCollectKeys( media.GetHashes() )
+            
+        
         self._sorted_media.remove_items( singleton_media.union( collected_media ) )
         
         self._RecalcAfterMediaRemove()
@@ -1076,6 +1110,25 @@ class MediaList( object ):
         return new_media
         
     
+    def ClearCollectKeys( self ):
+        
+        # tags managers were swapped wholesale, so every cached collection key is suspect
+        
+        self._hashes_to_collect_keys = {}
+        
+    
+    def ClearSortKeys( self ):
+        
+        # siblings, parents or tag presentation changed, so any cached tag sort keys are wrong
+        
+        self._sorted_media.clear_sort_keys()
+        
+        for media in self._collected_media:
+            
+            media.ClearSortKeys()
+            
+        
+    
     def Collect( self, media_collect = None ):
         
         if media_collect == None:
@@ -1085,11 +1138,40 @@ class MediaList( object ):
         
         self._media_collect = media_collect
         
+        # we reuse what we can here. a collection whose members have not changed keeps its object and all its calculated internals
+        
+        hashes_to_singleton_media = { media.GetHash() : media for media in self._singleton_media }
+        hash_sets_to_collected_media = { frozenset( media.GetHashes() ) : media for media in self._collected_media }
+        
+        def get_singleton( media ):
+            
+            hash = media.GetHash()
+            
+            if hash in hashes_to_singleton_media:
+                
+                return hashes_to_singleton_media[ hash ]
+                
+            
+            return self._GenerateMediaSingleton( media.GetMediaResult() )
+            
+        
+        def get_collection( medias ):
+            
+            hashes = frozenset( ( media.GetHash() for media in medias ) )
+            
+            if hashes in hash_sets_to_collected_media:
+                
+                return hash_sets_to_collected_media[ hashes ]
+                
+            
+            return self._GenerateMediaCollection( [ media.GetMediaResult() for media in medias ] )
+            
+        
         flat_media = list( self._singleton_media )
         
         for media in self._collected_media:
             
-            flat_media.extend( [ self._GenerateMediaSingleton( media_result ) for media_result in media.GenerateMediaResults() ] )
+            flat_media.extend( media.GetFlatMedia() )
             
         
         if self._media_collect.DoesACollect():
@@ -1108,17 +1190,17 @@ class MediaList( object ):
                     
                     unmatched_medias = keys_to_medias[ unmatched_key ]
                     
-                    self._singleton_media.update( unmatched_medias )
+                    self._singleton_media.update( ( get_singleton( media ) for media in unmatched_medias ) )
                     
                     del keys_to_medias[ unmatched_key ]
                     
                 
             
-            self._collected_media = { self._GenerateMediaCollection( [ media.GetMediaResult() for media in medias ] ) for ( key, medias ) in keys_to_medias.items() }# if len( medias ) > 1 }
+            self._collected_media = { get_collection( medias ) for ( key, medias ) in keys_to_medias.items() }# if len( medias ) > 1 }
             
         else:
             
-            self._singleton_media = set( flat_media )
+            self._singleton_media = { get_singleton( media ) for media in flat_media }
             
             self._collected_media = set()
             
@@ -1135,6 +1217,16 @@ class MediaList( object ):
             media.DeletePending( service_key )
             
         
+        self._sorted_media.clear_sort_keys()
+        
+    
+    def DirtyCollectKeys( self, hashes ):
+        
+        for hash in hashes:
+            
+            self._hashes_to_collect_keys.pop( hash, None )
+            
+        
     
     def GetFilteredFileCount( self, file_filter ):
         
@@ -1621,6 +1713,31 @@ class MediaList( object ):
             m.ProcessContentUpdates( service_keys_to_content_updates )
             
         
+        # only these rows need their sort keys regenerated next sort
+        
+        affected_hashes = set()
+        
+        for content_updates in service_keys_to_content_updates.values():
+            
+            for content_update in content_updates:
+                
+                affected_hashes.update( content_update.GetHashes() )
+                
+            
+        
+        self._sorted_media.dirty_sort_keys( self._GetMedia( affected_hashes ) )
+        
+        for content_updates in service_keys_to_content_updates.values():
+            
+            for content_update in content_updates:
+                
+                if content_update.GetDataType() in ( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_TYPE_RATINGS ):
+                    
+                    self.DirtyCollectKeys( content_update.GetHashes() )
+                    
+                
+            
+        
         for ( service_key, content_updates ) in service_keys_to_content_updates.items():
             
             for content_update in content_updates:
@@ -1692,6 +1809,8 @@ class MediaList( object ):
             
             for media in self._collected_media: media.ResetService( service_key )
             
+            self._sorted_media.clear_sort_keys()
+            
         
     
     def Sort( self, media_sort = None ):
@@ -1930,10 +2049,18 @@ class MediaCollection( MediaList, Media ):
         
         self._archive = True
         self._inbox = False
+        self._inbox_hashes = set()
         
         self._size = 0
         self._size_definite = True
         
+        # running counts, so adding or removing members only has to look at those members
+        self._num_size_indefinite = 0
+        self._duration_sum = 0
+        self._num_with_audio = 0
+        
+        self._has_notes = False
+        
         self._width = None
         self._height = None
         self._duration = None
@@ -1952,6 +2079,7 @@ class MediaCollection( MediaList, Media ):
     def _RecalcAfterContentUpdates( self, service_keys_to_content_updates ):
         
         archive_or_inbox = False
+        archive_or_inbox_hashes = set()
         
         data_types = set()
         
@@ -1972,6 +2100,7 @@ class MediaCollection( MediaList, Media ):
                     if action in ( HC.CONTENT_UPDATE_ARCHIVE, HC.CONTENT_UPDATE_INBOX ):
                         
                         archive_or_inbox = True
+                        archive_or_inbox_hashes.update( content_update.GetHashes() )
                         
                         continue
                         
@@ -1989,7 +2118,7 @@ class MediaCollection( MediaList, Media ):
             
             if archive_or_inbox:
                 
-                self._RecalcArchiveInbox()
+                self._RecalcArchiveInbox( hashes = archive_or_inbox_hashes )
                 
             
             for data_type in data_types:
@@ -2021,10 +2150,31 @@ class MediaCollection( MediaList, Media ):
         self._RecalcArchiveInbox()
         
     
-    def _RecalcArchiveInbox( self ):
+    def _RecalcArchiveInbox( self, hashes = None ):
         
-        self._archive = True in ( media.HasArchive() for media in self._sorted_media )
-        self._inbox = True in ( media.HasInbox() for media in self._sorted_media )
+        # we track which members are in the inbox, so an archive/inbox update only has to look at the files it touched
+        
+        if hashes is None:
+            
+            self._inbox_hashes = { media.GetHash() for media in self._sorted_media if media.HasInbox() }
+            
+        else:
+            
+            for media in self._GetMedia( hashes, discriminator = 'singletons' ):
+                
+                if media.HasInbox():
+                    
+                    self._inbox_hashes.add( media.GetHash() )
+                    
+                else:
+                    
+                    self._inbox_hashes.discard( media.GetHash() )
+                    
+                
+            
+        
+        self._inbox = len( self._inbox_hashes ) > 0
+        self._archive = len( self._inbox_hashes ) < len( self._sorted_media )
         
     
     def _RecalcFileViewingStats( self ):
@@ -2085,17 +2235,14 @@ class MediaCollection( MediaList, Media ):
         
         self._RecalcArchiveInbox()
         
-        self._size = sum( [ media.GetSize() for media in self._sorted_media ] )
-        self._size_definite = not False in ( media.IsSizeDefinite() for media in self._sorted_media )
-        
-        duration_sum = sum( [ media.GetDuration() for media in self._sorted_media if media.HasDuration() ] )
-        
-        if duration_sum > 0: self._duration = duration_sum
-        else: self._duration = None
+        self._size = 0
+        self._num_size_indefinite = 0
+        self._duration_sum = 0
+        self._num_with_audio = 0
         
-        self._has_audio = True in ( media.HasAudio() for media in self._sorted_media )
+        self._has_notes = False
         
-        self._has_notes = True in ( media.HasNotes() for media in self._sorted_media )
+        self._UpdateAggregates( self._sorted_media, 1 )
         
         self._RecalcRatings()
         self._RecalcFileViewingStats()
@@ -2121,11 +2268,71 @@ class MediaCollection( MediaList, Media ):
         self._tags_manager = ClientMediaManagers.TagsManager.MergeTagsManagers( tags_managers )
         
     
+    def _RemoveMediaDirectly( self, singleton_media, collected_media ):
+        
+        removee_media = self._singleton_media.intersection( singleton_media )
+        
+        MediaList._RemoveMediaDirectly( self, singleton_media, collected_media )
+        
+        self._UpdateAggregates( removee_media, -1 )
+        
+    
+    def _UpdateAggregates( self, medias, delta ):
+        
+        for media in medias:
+            
+            self._size += delta * media.GetSize()
+            
+            if not media.IsSizeDefinite():
+                
+                self._num_size_indefinite += delta
+                
+            
+            if media.HasDuration():
+                
+                self._duration_sum += delta * media.GetDuration()
+                
+            
+            if media.HasAudio():
+                
+                self._num_with_audio += delta
+                
+            
+        
+        self._size_definite = self._num_size_indefinite == 0
+        
+        if self._duration_sum > 0: self._duration = self._duration_sum
+        else: self._duration = None
+        
+        self._has_audio = self._num_with_audio > 0
+        
+        if delta > 0:
+            
+            self._has_notes = self._has_notes or True in ( media.HasNotes() for media in medias )
+            
+        elif self._has_notes:
+            
+            # notes updates do not recalc us, so a running count could drift. we look again, which stops at the first hit
+            self._has_notes = True in ( media.HasNotes() for media in self._sorted_media )
+            
+        
+    
     def AddMedia( self, new_media ):
         
+        new_media = list( { media.GetHash() : media for media in FlattenMedia( new_media ) if media.GetHash() not in self._hashes }.values() )
+        
         MediaList.AddMedia( self, new_media )
         
-        self._RecalcInternals()
+        # the sums just move by the new members. merged tags, locations, ratings and viewing stats cannot be done that way, so they are rebuilt
+        
+        self._UpdateAggregates( new_media, 1 )
+        
+        self._RecalcArchiveInbox( hashes = { media.GetHash() for media in new_media } )
+        
+        self._RecalcHashes()
+        self._RecalcTags()
+        self._RecalcRatings()
+        self._RecalcFileViewingStats()
         
     
     def DeletePending( self, service_key ):
@@ -3124,7 +3331,7 @@ class MediaSort( HydrusSerialisable.SerialisableBase ):
                 
                 x_tags_manager = x.GetTagsManager()
                 
-                return [ x_tags_manager.GetComparableNamespaceSlice( ( namespace, ), tag_display_type ) for namespace in namespaces ]
+                return tuple( ( x_tags_manager.GetComparableNamespaceSlice( ( namespace, ), tag_display_type ) for namespace in namespaces ) )
                 
             
         elif sort_metadata == 'rating':
@@ -3235,7 +3442,7 @@ class MediaSort( HydrusSerialisable.SerialisableBase ):
             
             ( sort_key, reverse ) = self.GetSortKeyAndReverse( location_context )
             
-            media_results_list.sort( sort_key, reverse = reverse )
+            media_results_list.sort( sort_key, reverse = reverse, sort_identifier = ( self.sort_type, location_context ) )
             
         
     
@@ -3254,6 +3461,8 @@ HydrusSerialisable.SERIALISABLE_TYPES_TO_OBJECT_TYPES[ HydrusSerialisable.SERIAL
 
 class SortedList( object ):
     
+    MAX_CACHED_SORT_KEYS = 4
+    
     def __init__( self, initial_items = None ):
         
         if initial_items is None:
@@ -3263,6 +3472,10 @@ class SortedList( object ):
         
         self._sort_key = None
         self._sort_reverse = False
+        self._sort_identifier = None
+        
+        # sort_identifier -> item -> sort key, so re-sorting only has to generate keys for new or changed rows
+        self._sort_identifiers_to_cached_sort_keys = {}
         
         self._sorted_list = list( initial_items )
         
@@ -3302,6 +3515,36 @@ class SortedList( object ):
         self._items_to_indices = {}
         
     
+    def _GetCachedSortKeys( self, sort_identifier, sort_key ):
+        
+        if sort_identifier in self._sort_identifiers_to_cached_sort_keys:
+            
+            # move it to the end, so it is the last to be culled
+            items_to_sort_keys = self._sort_identifiers_to_cached_sort_keys.pop( sort_identifier )
+            
+        else:
+            
+            items_to_sort_keys = {}
+            
+            while len( self._sort_identifiers_to_cached_sort_keys ) >= self.MAX_CACHED_SORT_KEYS:
+                
+                del self._sort_identifiers_to_cached_sort_keys[ next( iter( self._sort_identifiers_to_cached_sort_keys ) ) ]
+                
+            
+        
+        self._sort_identifiers_to_cached_sort_keys[ sort_identifier ] = items_to_sort_keys
+        
+        for item in self._sorted_list:
+            
+            if item not in items_to_sort_keys:
+                
+                items_to_sort_keys[ item ] = sort_key( item )
+                
+            
+        
+        return [ items_to_sort_keys[ item ] for item in self._sorted_list ]
+        
+    
     def _RecalcIndices( self ):
         
         self._items_to_indices = { item : index for ( index, item ) in enumerate( self._sorted_list ) }
@@ -3309,6 +3552,28 @@ class SortedList( object ):
         self._indices_dirty = False
         
     
+    def _SortByRanks( self, sort_keys, reverse ):
+        
+        # comparing big nested namespace tuples 200,000 * log( 200,000 ) times is what makes a big sort slow
+        # so we compare each distinct key once, swap every row's key for its integer rank, and let numpy do the rest
+        
+        distinct_sort_keys = sorted( set( sort_keys ) )
+        
+        sort_keys_to_ranks = { sort_key : rank for ( rank, sort_key ) in enumerate( distinct_sort_keys ) }
+        
+        ranks = numpy.fromiter( ( sort_keys_to_ranks[ sort_key ] for sort_key in sort_keys ), dtype = numpy.int64, count = len( sort_keys ) )
+        
+        if reverse:
+            
+            # negating rather than flipping keeps equal items in their current order, just like list.sort( reverse = True )
+            ranks = - ranks
+            
+        
+        order = numpy.argsort( ranks, kind = 'stable' )
+        
+        self._sorted_list = [ self._sorted_list[ i ] for i in order ]
+        
+    
     def append_items( self, items ):
         
         if self._indices_dirty is None:
@@ -3350,8 +3615,29 @@ class SortedList( object ):
         self.sort()
         
     
+    def clear_sort_keys( self ):
+        
+        self._sort_identifiers_to_cached_sort_keys = {}
+        
+    
+    def dirty_sort_keys( self, items ):
+        
+        for items_to_sort_keys in self._sort_identifiers_to_cached_sort_keys.values():
+            
+            for item in items:
+                
+                if item in items_to_sort_keys:
+                    
+                    del items_to_sort_keys[ item ]
+                    
+                
+            
+        
+    
     def remove_items( self, items ):
         
+        self.dirty_sort_keys( items )
+        
         deletee_indices = [ self.index( item ) for item in items ]
         
         deletee_indices.sort( reverse = True )
@@ -3372,26 +3658,38 @@ class SortedList( object ):
             
         
         self._sort_key = sort_key
+        self._sort_identifier = None
         
         random.shuffle( self._sorted_list )
         
         self._DirtyIndices()
         
     
-    def sort( self, sort_key = None, reverse = False ):
+    def sort( self, sort_key = None, reverse = False, sort_identifier = None ):
         
         if sort_key is None:
             
             sort_key = self._sort_key
             reverse = self._sort_reverse
+            sort_identifier = self._sort_identifier
             
         else:
             
             self._sort_key = sort_key
             self._sort_reverse = reverse
+            self._sort_identifier = sort_identifier
             
         
-        self._sorted_list.sort( key = sort_key, reverse = reverse )
+        if sort_identifier is None:
+            
+            self._sorted_list.sort( key = sort_key, reverse = reverse )
+            
+        else:
+            
+            sort_keys = self._GetCachedSortKeys( sort_identifier, sort_key )
+            
+            self._SortByRanks( sort_keys, reverse )
+            
         
         self._DirtyIndices()
         
@@ -696,15 +696,22 @@ class HydrusResourceBooruThumbnail( HydrusResourceBooru ):
         
         mime = media_result.GetMime()
         
-        response_context_mime = HC.IMAGE_PNG
-        
         if mime in HC.MIMES_WITH_THUMBNAILS:
             
             client_files_manager = HG.client_controller.client_files_manager
             
-            path = client_files_manager.GetThumbnailPath( media_result )
+            try:
+                
+                thumbnail_bytes = client_files_manager.GetThumbnailBytes( media_result )
+                
+            except HydrusExceptions.FileMissingException:
+                
+                raise HydrusExceptions.NotFoundException( 'Could not find that thumbnail!' )
+                
+            
+            response_context = HydrusServerResources.ResponseContext( 200, mime = HC.APPLICATION_UNKNOWN, body = thumbnail_bytes )
             
-            response_context_mime = HC.APPLICATION_UNKNOWN
+            return response_context
             
         elif mime in HC.AUDIO:
             
@@ -728,7 +735,7 @@ class HydrusResourceBooruThumbnail( HydrusResourceBooru ):
             raise HydrusExceptions.NotFoundException( 'Could not find that thumbnail!' )
             
         
-        response_context = HydrusServerResources.ResponseContext( 200, mime = response_context_mime, path = path )
+        response_context = HydrusServerResources.ResponseContext( 200, mime = HC.IMAGE_PNG, path = path )
         
         return response_context
         
@@ -1628,7 +1635,14 @@ class HydrusResourceClientAPIRestrictedAddURLsGetURLFiles( HydrusResourceClientA
             raise HydrusExceptions.BadRequestException( e )
             
         
-        url_statuses = HG.client_controller.Read( 'url_statuses', normalised_url )
+        if HG.client_controller.known_content_filter_manager.URLIsDefinitelyNew( normalised_url ):
+            
+            url_statuses = []
+            
+        else:
+            
+            url_statuses = HG.client_controller.Read( 'url_statuses', normalised_url )
+            
         
         json_happy_url_statuses = []
         
@@ -2288,20 +2302,14 @@ class HydrusResourceClientAPIRestrictedGetFilesGetThumbnail( HydrusResourceClien
         
         try:
             
-            path = HG.client_controller.client_files_manager.GetThumbnailPath( media_result )
-            
-            if not os.path.exists( path ):
-                
-                # not _supposed_ to happen, but it seems in odd situations it can
-                raise HydrusExceptions.FileMissingException()
-                
+            thumbnail_bytes = HG.client_controller.client_files_manager.GetThumbnailBytes( media_result )
             
         except HydrusExceptions.FileMissingException:
             
             raise HydrusExceptions.NotFoundException( 'Could not find that file!' )
             
         
-        response_context = HydrusServerResources.ResponseContext( 200, mime = HC.APPLICATION_OCTET_STREAM, path = path )
+        response_context = HydrusServerResources.ResponseContext( 200, mime = HC.APPLICATION_OCTET_STREAM, body = thumbnail_bytes )
         
         return response_context
         
@@ -2459,6 +2467,24 @@ class HydrusResourceClientAPIRestrictedManageDatabase( HydrusResourceClientAPIRe
         request.client_api_permissions.CheckPermission( ClientAPI.CLIENT_API_PERMISSION_MANAGE_DATABASE )
         
     
+class HydrusResourceClientAPIRestrictedManageDatabaseDBJobMetrics( HydrusResourceClientAPIRestrictedManageDatabase ):
+    
+    BLOCKED_WHEN_BUSY = False
+    
+    def _threadDoGETJob( self, request: HydrusServerRequest.HydrusRequest ):
+        
+        db_job_metrics = HG.client_controller.GetDBJobMetrics()
+        
+        body_dict = { 'db_job_metrics' : db_job_metrics }
+        
+        mime = HC.APPLICATION_JSON
+        body = json.dumps( body_dict )
+        
+        response_context = HydrusServerResources.ResponseContext( 200, mime = mime, body = body )
+        
+        return response_context
+        
+    
 class HydrusResourceClientAPIRestrictedManageDatabaseLockOff( HydrusResourceClientAPIRestrictedManageDatabase ):
     
     BLOCKED_WHEN_BUSY = False
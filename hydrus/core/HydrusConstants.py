@@ -81,8 +81,8 @@ options = {}
 # Misc
 
 NETWORK_VERSION = 20
-SOFTWARE_VERSION = 473
-CLIENT_API_VERSION = 25
+SOFTWARE_VERSION = 475
+CLIENT_API_VERSION = 26
 
 SERVER_THUMBNAIL_DIMENSIONS = ( 200, 200 )
 
@@ -260,9 +260,9 @@ class HydrusController( object ):
         self._pubsub.pubimmediate( topic, *args, **kwargs )
         
     
-    def sub( self, object, method_name, topic ):
+    def sub( self, object, method_name, topic, deliver_on_worker = False ):
         
-        self._pubsub.sub( object, method_name, topic )
+        self._pubsub.sub( object, method_name, topic, deliver_on_worker = deliver_on_worker )
         
     
     def AcquireThreadSlot( self, thread_type ):
@@ -376,6 +376,11 @@ class HydrusController( object ):
         for cache in list(self._caches.values()): cache.Clear()
         
     
+    def ClearDBJobMetrics( self ):
+        
+        self.db.ClearJobMetrics()
+        
+    
     def CurrentlyIdle( self ):
         
         return True
@@ -411,6 +416,24 @@ class HydrusController( object ):
         HydrusData.ShowText( summary )
         
     
+    def DebugShowPubSubMetrics( self ):
+        
+        ( queue_depth, peak_queue_depth, topics_to_metrics ) = self._pubsub.GetMetrics()
+        
+        lines = []
+        
+        lines.append( 'pubsub queue depth: {}, peak: {}'.format( HydrusData.ToHumanInt( queue_depth ), HydrusData.ToHumanInt( peak_queue_depth ) ) )
+        
+        sorted_metrics = sorted( topics_to_metrics.items(), key = lambda item: item[1][2], reverse = True )
+        
+        for ( topic, ( num_pubs, num_deliveries, total_time, max_time ) ) in sorted_metrics:
+            
+            lines.append( '{}: {} pubs in {} deliveries, total {}, max {}'.format( topic, HydrusData.ToHumanInt( num_pubs ), HydrusData.ToHumanInt( num_deliveries ), HydrusData.TimeDeltaToPrettyTimeDelta( total_time ), HydrusData.TimeDeltaToPrettyTimeDelta( max_time ) ) )
+            
+        
+        HydrusData.ShowText( '\n'.join( lines ) )
+        
+    
     def DoingFastExit( self ) -> bool:
         
         return self._doing_fast_exit
@@ -426,6 +449,11 @@ class HydrusController( object ):
         return self.db_dir
         
     
+    def GetDBJobMetrics( self ):
+        
+        return self.db.GetJobMetrics()
+        
+    
     def GetDBStatus( self ):
         
         return self.db.GetStatus()
@@ -1,5 +1,6 @@
 import collections
 import distutils.version
+import json
 import os
 import queue
 import sqlite3
@@ -7,6 +8,7 @@ import traceback
 import time
 
 from hydrus.core import HydrusDBBase
+from hydrus.core import HydrusDBMetrics
 from hydrus.core import HydrusConstants as HC
 from hydrus.core import HydrusData
 from hydrus.core import HydrusEncryption
@@ -14,6 +16,12 @@ from hydrus.core import HydrusExceptions
 from hydrus.core import HydrusGlobals as HG
 from hydrus.core import HydrusPaths
 
+BACKUP_MANIFEST_FILENAME = 'backup_manifest.json'
+
+# pages are usually 1KB or 4KB
+ONLINE_BACKUP_PAGES_PER_STEP = 8192
+ONLINE_BACKUP_STEP_PAUSE = 0.02
+
 def CheckCanVacuum( db_path, stop_time = None ):
     
     db = sqlite3.connect( db_path, isolation_level = None, detect_types = sqlite3.PARSE_DECLTYPES )
@@ -50,6 +58,20 @@ def CheckCanVacuumData( db_path, page_size, page_count, freelist_count, stop_tim
     
     HydrusDBBase.CheckHasSpaceForDBTransaction( db_dir, db_size )
     
+def GetDBFileChangeToken( db_path ):
+    
+    # after a full wal checkpoint, everything is in the main file, so if that has not been touched, the db has not changed
+    # the header change counter is not reliable in WAL mode
+    
+    if not os.path.exists( db_path ):
+        
+        return None
+        
+    
+    stat_result = os.stat( db_path )
+    
+    return [ stat_result.st_size, stat_result.st_mtime_ns ]
+    
 def GetApproxVacuumDuration( db_size ):
     
     vacuum_estimate = int( db_size * 1.2 )
@@ -60,6 +82,34 @@ def GetApproxVacuumDuration( db_size ):
     
     return approx_vacuum_duration
     
+def ReadBackupManifest( backup_dir ):
+    
+    path = os.path.join( backup_dir, BACKUP_MANIFEST_FILENAME )
+    
+    if os.path.exists( path ):
+        
+        try:
+            
+            with open( path, 'r', encoding = 'utf-8' ) as f:
+                
+                manifest = json.load( f )
+                
+            
+            if isinstance( manifest, dict ):
+                
+                return manifest
+                
+            
+        except Exception as e:
+            
+            HydrusData.Print( 'Could not read the backup manifest at "{}", so the whole backup will be redone. Error follows:'.format( path ) )
+            
+            HydrusData.PrintException( e, do_wait = False )
+            
+        
+    
+    return {}
+    
 def ReadFromCancellableCursor( cursor, largest_group_size, cancelled_hook = None ):
     
     if cancelled_hook is None:
@@ -120,6 +170,19 @@ def ReadLargeIdQueryInSeparateChunks( cursor, select_statement, chunk_size ):
     
     cursor.execute( 'DROP TABLE ' + table_name + ';' )
     
+def WriteBackupManifest( backup_dir, manifest ):
+    
+    path = os.path.join( backup_dir, BACKUP_MANIFEST_FILENAME )
+    
+    temp_path = path + '.temp'
+    
+    with open( temp_path, 'w', encoding = 'utf-8' ) as f:
+        
+        json.dump( manifest, f )
+        
+    
+    os.replace( temp_path, path )
+    
 def VacuumDB( db_path ):
     
     db = sqlite3.connect( db_path, isolation_level = None, detect_types = sqlite3.PARSE_DECLTYPES )
@@ -156,6 +219,86 @@ def VacuumDB( db_path ):
     
     c.execute( 'PRAGMA journal_mode = {};'.format( HG.db_journal_mode ) )
     
+class OnlineBackup( object ):
+    
+    def __init__( self, db_dir, db_filenames ):
+        
+        # a WAL read transaction on a separate connection gives us a fixed snapshot of every db
+        # the main connection can keep writing, and the backup api will copy from the snapshot without restarting
+        
+        self._db_filenames = dict( db_filenames )
+        
+        db_path = os.path.join( db_dir, self._db_filenames[ 'main' ] )
+        
+        self._db = sqlite3.connect( db_path, isolation_level = None, check_same_thread = False )
+        
+        try:
+            
+            for ( name, filename ) in self._db_filenames.items():
+                
+                if name != 'main':
+                    
+                    self._db.execute( 'ATTACH ? AS ' + name + ';', ( os.path.join( db_dir, filename ), ) )
+                    
+                
+            
+            self._db.execute( 'BEGIN DEFERRED;' )
+            
+            for name in self._db_filenames.keys():
+                
+                self._db.execute( 'SELECT 1 FROM {}.sqlite_master LIMIT 1;'.format( name ) ).fetchall()
+                
+            
+        except:
+            
+            self._db.close()
+            
+            raise
+            
+        
+    
+    def BackupDB( self, name, dest_path, text_update_hook = None, is_cancelled_hook = None ):
+        
+        filename = self._db_filenames[ name ]
+        
+        def progress( status, remaining, total ):
+            
+            if is_cancelled_hook is not None and is_cancelled_hook():
+                
+                # this aborts the backup, and the dest db rolls back to how it was
+                
+                raise HydrusExceptions.CancelledException( 'Backup cancelled!' )
+                
+            
+            if text_update_hook is not None:
+                
+                text_update_hook( 'copying {}: {}'.format( filename, HydrusData.ConvertValueRangeToPrettyString( total - remaining, total ) ) )
+                
+            
+        
+        dest_db = sqlite3.connect( dest_path )
+        
+        try:
+            
+            self._db.backup( dest_db, pages = ONLINE_BACKUP_PAGES_PER_STEP, progress = progress, name = name, sleep = ONLINE_BACKUP_STEP_PAUSE )
+            
+        finally:
+            
+            dest_db.close()
+            
+        
+    
+    def Close( self ):
+        
+        if self._db is not None:
+            
+            self._db.close()
+            
+            self._db = None
+            
+        
+        
+    
 class HydrusDB( HydrusDBBase.DBBase ):
     
     READ_WRITE_ACTIONS = []
@@ -236,6 +379,8 @@ class HydrusDB( HydrusDBBase.DBBase ):
         self._current_status = ''
         self._current_job_name = ''
         
+        self._job_metrics = HydrusDBMetrics.DBMetrics()
+        
         self._db = None
         self._is_connected = False
         
@@ -359,6 +504,13 @@ class HydrusDB( HydrusDBBase.DBBase ):
         self._Execute( 'ATTACH ? AS durable_temp;', ( db_path, ) )
         
     
+    def _CanDoOnlineBackup( self ):
+        
+        # other journal modes would block writes for as long as the backup read transaction is open
+        
+        return HG.db_journal_mode == 'WAL'
+        
+    
     def _CleanAfterJobWork( self ):
         
         self._cursor_transaction_wrapper.CleanPubSubs()
@@ -415,6 +567,41 @@ class HydrusDB( HydrusDBBase.DBBase ):
         return HydrusData.JobDatabase( job_type, synchronous, action, *args, **kwargs )
         
     
+    def _GetDBChangeTokens( self ):
+        
+        self._cursor_transaction_wrapper.Commit()
+        
+        try:
+            
+            db_change_tokens = {}
+            
+            for ( name, filename ) in self._db_filenames.items():
+                
+                ( busy, num_wal_frames, num_checkpointed_frames ) = self._Execute( 'PRAGMA {}.wal_checkpoint( TRUNCATE );'.format( name ) ).fetchone()
+                
+                if busy:
+                    
+                    db_change_tokens[ filename ] = None
+                    
+                else:
+                    
+                    db_change_tokens[ filename ] = GetDBFileChangeToken( os.path.join( self._db_dir, filename ) )
+                    
+                
+            
+        finally:
+            
+            self._cursor_transaction_wrapper.BeginImmediate()
+            
+        
+        return db_change_tokens
+        
+    
+    def _GetJobCounters( self ):
+        
+        return ( HydrusData.GetNowPrecise(), self._db.total_changes, HydrusDBBase.TemporaryIntegerTableNameCache.instance().GetNumNamesGiven() )
+        
+    
     def _GetPossibleAdditionalDBFilenames( self ):
         
         return [ self._ssl_cert_filename, self._ssl_key_filename ]
@@ -489,7 +676,7 @@ class HydrusDB( HydrusDBBase.DBBase ):
             
             self._is_connected = True
             
-            self._cursor_transaction_wrapper = HydrusDBBase.DBCursorTransactionWrapper( self._c, HG.db_transaction_commit_period )
+            self._cursor_transaction_wrapper = HydrusDBBase.DBCursorTransactionWrapper( self._c, HG.db_transaction_commit_period, job_metrics = self._job_metrics )
             
             if HG.no_db_temp_files:
                 
@@ -585,6 +772,11 @@ class HydrusDB( HydrusDBBase.DBBase ):
         
         ( action, args, kwargs ) = job.GetCallableTuple()
         
+        # the commit is timed separately, so the job's counters stop before it
+        job_start_counters = self._GetJobCounters()
+        job_end_counters = None
+        job_errored = False
+        
         try:
             
             if job_type in ( 'read_write', 'write' ):
@@ -616,6 +808,8 @@ class HydrusDB( HydrusDBBase.DBBase ):
             
             self._cursor_transaction_wrapper.Save()
             
+            job_end_counters = self._GetJobCounters()
+            
             if self._cursor_transaction_wrapper.TimeToCommit():
                 
                 self._current_status = 'db committing'
@@ -629,6 +823,13 @@ class HydrusDB( HydrusDBBase.DBBase ):
             
         except Exception as e:
             
+            if job_end_counters is None:
+                
+                job_end_counters = self._GetJobCounters()
+                
+            
+            job_errored = True
+            
             self._ManageDBError( job, e )
             
             try:
@@ -650,6 +851,14 @@ class HydrusDB( HydrusDBBase.DBBase ):
             
             self._CleanAfterJobWork()
             
+            if job_end_counters is not None:
+                
+                ( job_start_time, start_total_changes, start_num_temp_tables ) = job_start_counters
+                ( job_end_time, end_total_changes, end_num_temp_tables ) = job_end_counters
+                
+                self._job_metrics.ReportJob( job_type, action, job_start_time - job.GetCreationTime(), job_end_time - job_start_time, end_total_changes - start_total_changes, end_num_temp_tables - start_num_temp_tables, job_errored )
+                
+            
             self._current_status = ''
             
             self.publish_status_update()
@@ -709,6 +918,11 @@ class HydrusDB( HydrusDBBase.DBBase ):
         pass
         
     
+    def ClearJobMetrics( self ):
+        
+        self._job_metrics.Clear()
+        
+    
     def CurrentlyDoingJob( self ):
         
         return self._currently_doing_job
@@ -728,6 +942,11 @@ class HydrusDB( HydrusDBBase.DBBase ):
         return total
         
     
+    def GetJobMetrics( self ):
+        
+        return self._job_metrics.GetSnapshot()
+        
+    
     def GetSSLPaths( self ):
         
         # create ssl keys
@@ -3,6 +3,7 @@ import psutil
 import sqlite3
 
 from hydrus.core import HydrusData
+from hydrus.core import HydrusIntegerSets
 from hydrus.core import HydrusPaths
 from hydrus.core import HydrusGlobals as HG
 from hydrus.core import HydrusTemp
@@ -73,6 +74,9 @@ class TemporaryIntegerTableNameCache( object ):
         self._column_names_to_table_names = collections.defaultdict( collections.deque )
         self._column_names_counter = collections.Counter()
         
+        # never reset, the db job metrics diff it across a job
+        self._num_names_given = 0
+        
     
     @staticmethod
     def instance() -> 'TemporaryIntegerTableNameCache':
@@ -114,9 +118,16 @@ class TemporaryIntegerTableNameCache( object ):
         
         table_name = table_names.pop()
         
+        self._num_names_given += 1
+        
         return ( initialised, table_name )
         
     
+    def GetNumNamesGiven( self ):
+        
+        return self._num_names_given
+        
+    
     def ReleaseName( self, column_name, table_name ):
         
         self._column_names_to_table_names[ column_name ].append( table_name )
@@ -159,6 +170,80 @@ class TemporaryIntegerTable( object ):
         return False
         
     
+class SyncedTemporaryIntegerTable( object ):
+    
+    # a temp integer table that is kept in step with a changing set, for a run of queries that each want to join on the current results
+    # syncing only writes the difference, which for a search that narrows as it goes is much less than the whole set
+    
+    def __init__( self, cursor: sqlite3.Cursor, column_name ):
+        
+        self._cursor = cursor
+        self._column_name = column_name
+        
+        self._synced_integers = HydrusIntegerSets.IntegerSet()
+        
+        ( self._initialised, self._table_name ) = TemporaryIntegerTableNameCache.instance().GetName( self._column_name )
+        
+    
+    def __enter__( self ):
+        
+        if not self._initialised:
+            
+            self._cursor.execute( 'CREATE TABLE IF NOT EXISTS {} ( {} INTEGER PRIMARY KEY );'.format( self._table_name, self._column_name ) )
+            
+        
+        return self
+        
+    
+    def __exit__( self, exc_type, exc_val, exc_tb ):
+        
+        self._cursor.execute( 'DELETE FROM {};'.format( self._table_name ) )
+        
+        TemporaryIntegerTableNameCache.instance().ReleaseName( self._column_name, self._table_name )
+        
+        return False
+        
+    
+    def GetTableName( self ):
+        
+        return self._table_name
+        
+    
+    def Sync( self, integers ) -> bool:
+        
+        if not isinstance( integers, HydrusIntegerSets.IntegerSet ):
+            
+            integers = HydrusIntegerSets.IntegerSet( integers )
+            
+        
+        deletees = self._synced_integers.difference( integers )
+        insertees = integers.difference( self._synced_integers )
+        
+        if len( deletees ) == 0 and len( insertees ) == 0:
+            
+            return False
+            
+        
+        if len( deletees ) > len( integers ):
+            
+            # quicker to start again
+            
+            self._cursor.execute( 'DELETE FROM {};'.format( self._table_name ) )
+            
+            insertees = integers
+            
+        elif len( deletees ) > 0:
+            
+            self._cursor.executemany( 'DELETE FROM {} WHERE {} = ?;'.format( self._table_name, self._column_name ), ( ( i, ) for i in deletees ) )
+            
+        
+        self._cursor.executemany( 'INSERT INTO {} ( {} ) VALUES ( ? );'.format( self._table_name, self._column_name ), ( ( i, ) for i in insertees ) )
+        
+        self._synced_integers = integers.copy()
+        
+        return True
+        
+    
 class DBBase( object ):
     
     def __init__( self ):
@@ -285,6 +370,11 @@ class DBBase( object ):
         return self._TableOrIndexExists( index_name, 'index' )
         
     
+    def _MakeSyncedTemporaryIntegerTable( self, column_name ):
+        
+        return SyncedTemporaryIntegerTable( self._c, column_name )
+        
+    
     def _MakeTemporaryIntegerTable( self, integer_iterable, column_name ):
         
         return TemporaryIntegerTable( self._c, integer_iterable, column_name )
@@ -316,6 +406,13 @@ class DBBase( object ):
         return { item for ( item, ) in iterable_cursor }
         
     
+    def _STIS( self, iterable_cursor ):
+        
+        # strip singleton tuples to a compressed integer set
+        
+        return HydrusIntegerSets.IntegerSet( self._STI( iterable_cursor ) )
+        
+    
     def _TableExists( self, table_name ):
         
         return self._TableOrIndexExists( table_name, 'table' )
@@ -349,13 +446,14 @@ class DBBase( object ):
     
 class DBCursorTransactionWrapper( DBBase ):
     
-    def __init__( self, c: sqlite3.Cursor, transaction_commit_period: int ):
+    def __init__( self, c: sqlite3.Cursor, transaction_commit_period: int, job_metrics = None ):
         
         DBBase.__init__( self )
         
         self._SetCursor( c )
         
         self._transaction_commit_period = transaction_commit_period
+        self._job_metrics = job_metrics
         
         self._transaction_start_time = 0
         self._in_transaction = False
@@ -393,8 +491,15 @@ class DBCursorTransactionWrapper( DBBase ):
             
             self.CleanPubSubs()
             
+            commit_start_time = HydrusData.GetNowPrecise()
+            
             self._Execute( 'COMMIT;' )
             
+            if self._job_metrics is not None:
+                
+                self._job_metrics.ReportCommit( HydrusData.GetNowPrecise() - commit_start_time )
+                
+            
             self._in_transaction = False
             self._transaction_contains_writes = False
             
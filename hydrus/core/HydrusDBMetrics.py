@@ -0,0 +1,224 @@
+import bisect
+import threading
+
+from hydrus.core import HydrusData
+
+# fixed log-scale buckets, in seconds. a duration goes in the first bucket whose upper bound it does not exceed, and there is an extra overflow bucket at the end
+# fixed buckets means recording is a bisect and an increment, and histograms from different runs line up
+LATENCY_BUCKET_UPPER_BOUNDS = ( 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0 )
+
+class LatencyHistogram( object ):
+    
+    def __init__( self ):
+        
+        self._bucket_counts = [ 0 ] * ( len( LATENCY_BUCKET_UPPER_BOUNDS ) + 1 )
+        
+        self._count = 0
+        self._total = 0.0
+        self._max = 0.0
+        
+    
+    def AddDuration( self, duration ):
+        
+        duration = max( 0.0, duration )
+        
+        self._bucket_counts[ bisect.bisect_left( LATENCY_BUCKET_UPPER_BOUNDS, duration ) ] += 1
+        
+        self._count += 1
+        self._total += duration
+        
+        if duration > self._max:
+            
+            self._max = duration
+            
+        
+    
+    def GetCount( self ):
+        
+        return self._count
+        
+    
+    def GetMax( self ):
+        
+        return self._max
+        
+    
+    def GetPercentile( self, percentile ):
+        
+        # the upper bound of the bucket the percentile falls in, so this is an overestimate by at most one bucket
+        
+        if self._count == 0:
+            
+            return 0.0
+            
+        
+        rank = percentile * self._count / 100
+        
+        running_count = 0
+        
+        for ( i, bucket_count ) in enumerate( self._bucket_counts ):
+            
+            running_count += bucket_count
+            
+            if running_count >= rank and bucket_count > 0:
+                
+                if i < len( LATENCY_BUCKET_UPPER_BOUNDS ):
+                    
+                    return min( LATENCY_BUCKET_UPPER_BOUNDS[ i ], self._max )
+                    
+                else:
+                    
+                    return self._max
+                    
+                
+            
+        
+        return self._max
+        
+    
+    def GetTotal( self ):
+        
+        return self._total
+        
+    
+    def ToDict( self ):
+        
+        buckets = [ [ upper_bound, bucket_count ] for ( upper_bound, bucket_count ) in zip( LATENCY_BUCKET_UPPER_BOUNDS, self._bucket_counts ) ]
+        
+        buckets.append( [ None, self._bucket_counts[ -1 ] ] )
+        
+        return {
+            'count' : self._count,
+            'total' : self._total,
+            'max' : self._max,
+            'p50' : self.GetPercentile( 50 ),
+            'p90' : self.GetPercentile( 90 ),
+            'p99' : self.GetPercentile( 99 ),
+            'buckets' : buckets
+        }
+        
+    
+class DBJobMetrics( object ):
+    
+    def __init__( self ):
+        
+        self._queue_wait = LatencyHistogram()
+        self._execution = LatencyHistogram()
+        
+        self._num_errors = 0
+        
+        self._total_rows_changed = 0
+        self._max_rows_changed = 0
+        
+        self._total_temp_tables = 0
+        self._max_temp_tables = 0
+        
+    
+    def AddJob( self, queue_wait, duration, rows_changed, num_temp_tables, errored ):
+        
+        self._queue_wait.AddDuration( queue_wait )
+        self._execution.AddDuration( duration )
+        
+        if errored:
+            
+            self._num_errors += 1
+            
+        
+        self._total_rows_changed += rows_changed
+        self._max_rows_changed = max( self._max_rows_changed, rows_changed )
+        
+        self._total_temp_tables += num_temp_tables
+        self._max_temp_tables = max( self._max_temp_tables, num_temp_tables )
+        
+    
+    def GetTotalExecutionTime( self ):
+        
+        return self._execution.GetTotal()
+        
+    
+    def ToDict( self ):
+        
+        return {
+            'num_jobs' : self._execution.GetCount(),
+            'num_errors' : self._num_errors,
+            'queue_wait' : self._queue_wait.ToDict(),
+            'execution' : self._execution.ToDict(),
+            'rows_changed' : { 'total' : self._total_rows_changed, 'max' : self._max_rows_changed },
+            'temp_tables' : { 'total' : self._total_temp_tables, 'max' : self._max_temp_tables }
+        }
+        
+    
+class DBMetrics( object ):
+    
+    # always on, so recording is kept to a handful of additions under a lock. the db thread is the only writer, so the lock is just for readers taking a snapshot
+    
+    def __init__( self ):
+        
+        self._lock = threading.Lock()
+        
+        self._Reset()
+        
+    
+    def _Reset( self ):
+        
+        self._since = HydrusData.GetNow()
+        
+        self._job_keys_to_job_metrics = {}
+        
+        self._commits = LatencyHistogram()
+        
+    
+    def Clear( self ):
+        
+        with self._lock:
+            
+            self._Reset()
+            
+        
+    
+    def GetSnapshot( self ):
+        
+        with self._lock:
+            
+            sorted_items = sorted( self._job_keys_to_job_metrics.items(), key = lambda item: item[1].GetTotalExecutionTime(), reverse = True )
+            
+            jobs = []
+            
+            for ( ( job_type, action ), job_metrics ) in sorted_items:
+                
+                job_dict = job_metrics.ToDict()
+                
+                job_dict[ 'job_type' ] = job_type
+                job_dict[ 'action' ] = action
+                
+                jobs.append( job_dict )
+                
+            
+            return {
+                'since' : self._since,
+                'jobs' : jobs,
+                'commits' : self._commits.ToDict()
+            }
+            
+        
+    
+    def ReportCommit( self, duration ):
+        
+        with self._lock:
+            
+            self._commits.AddDuration( duration )
+            
+        
+    
+    def ReportJob( self, job_type, action, queue_wait, duration, rows_changed, num_temp_tables, errored ):
+        
+        job_key = ( job_type, action )
+        
+        with self._lock:
+            
+            if job_key not in self._job_keys_to_job_metrics:
+                
+                self._job_keys_to_job_metrics[ job_key ] = DBJobMetrics()
+                
+            
+            self._job_keys_to_job_metrics[ job_key ].AddJob( queue_wait, duration, max( 0, rows_changed ), max( 0, num_temp_tables ), errored )
@@ -80,3 +80,4 @@ twisted_is_broke = False
 dirty_object_lock = threading.Lock()
 client_busy = threading.Lock()
 server_busy = threading.Lock()
+server_backup_lock = threading.Lock()
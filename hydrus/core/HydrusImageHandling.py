@@ -342,6 +342,73 @@ def GenerateNumPyImage( path, mime, force_pil = False ) -> numpy.array:
             
         
     
+    if NumPyImageHasOpaqueAlphaChannel( numpy_image ):
+        
+        convert = cv2.COLOR_RGBA2RGB
+        
+        numpy_image = cv2.cvtColor( numpy_image, convert )
+        
+    
+    return numpy_image
+    
+def GenerateNumPyImageFromBytes( image_bytes: bytes, mime, force_pil = False ) -> numpy.array:
+    
+    # this is for images that are not on disk as their own file, like thumbnails in a pack
+    
+    if not OPENCV_OK:
+        
+        force_pil = True
+        
+    
+    if not force_pil:
+        
+        try:
+            
+            pil_image = RawOpenPILImage( io.BytesIO( image_bytes ) )
+            
+            if pil_image.mode == 'LAB' or HasICCProfile( pil_image ):
+                
+                force_pil = True
+                
+            
+        except HydrusExceptions.DamagedOrUnusualFileException:
+            
+            pass
+            
+        
+    
+    numpy_image = None
+    
+    if mime not in PIL_ONLY_MIMETYPES and not force_pil:
+        
+        if mime == HC.IMAGE_JPEG:
+            
+            flags = CV_IMREAD_FLAGS_JPEG
+            
+        elif mime == HC.IMAGE_PNG:
+            
+            flags = CV_IMREAD_FLAGS_PNG
+            
+        else:
+            
+            flags = CV_IMREAD_FLAGS_WEIRD
+            
+        
+        numpy_image = cv2.imdecode( numpy.frombuffer( image_bytes, dtype = 'uint8' ), flags )
+        
+        if numpy_image is not None:
+            
+            numpy_image = DequantizeNumPyImage( numpy_image )
+            
+        
+    
+    if numpy_image is None:
+        
+        pil_image = GeneratePILImage( io.BytesIO( image_bytes ) )
+        
+        numpy_image = GenerateNumPyImageFromPILImage( pil_image )
+        
+    
     if NumPyImageHasOpaqueAlphaChannel( numpy_image ):
         
         convert = cv2.COLOR_RGBA2RGB
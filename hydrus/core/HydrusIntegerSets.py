@@ -0,0 +1,435 @@
+import numpy
+
+# a roaring-style compressed set of non-negative integers, for big hash_id sets
+# the space is split into chunks of 65536 on the high bits. a sparse chunk is a sorted uint16 array of the low bits, a dense one a packed 8KB bitmap
+# a python set of 3M ints is ~100MB and every op is a hash probe. this is a few MB and every op is a numpy vector op on each pair of chunks
+
+CHUNK_BITS = 16
+CHUNK_SIZE = 1 << CHUNK_BITS
+CHUNK_MASK = CHUNK_SIZE - 1
+
+BITMAP_NUM_BYTES = CHUNK_SIZE // 8
+
+# past this many members, a bitmap is smaller than an array
+MAX_ARRAY_CARDINALITY = 4096
+
+POPCOUNTS = numpy.array( [ bin( i ).count( '1' ) for i in range( 256 ) ], dtype = numpy.uint32 )
+
+def ArrayToBitmap( array: numpy.ndarray ) -> numpy.ndarray:
+    
+    bits = numpy.zeros( CHUNK_SIZE, dtype = bool )
+    
+    bits[ array ] = True
+    
+    return numpy.packbits( bits, bitorder = 'little' )
+    
+def BitmapToArray( bitmap: numpy.ndarray ) -> numpy.ndarray:
+    
+    return numpy.flatnonzero( numpy.unpackbits( bitmap, bitorder = 'little' ) ).astype( numpy.uint16 )
+    
+def BitmapCardinality( bitmap: numpy.ndarray ) -> int:
+    
+    return int( POPCOUNTS[ bitmap ].sum() )
+    
+def BitmapContainsArray( bitmap: numpy.ndarray, array: numpy.ndarray ) -> numpy.ndarray:
+    
+    return ( ( bitmap[ array >> 3 ] >> ( array & 7 ).astype( numpy.uint8 ) ) & 1 ).astype( bool )
+    
+def ContainerCardinality( container: numpy.ndarray ) -> int:
+    
+    if IsBitmap( container ):
+        
+        return BitmapCardinality( container )
+        
+    else:
+        
+        return len( container )
+        
+    
+def ContainerToArray( container: numpy.ndarray ) -> numpy.ndarray:
+    
+    if IsBitmap( container ):
+        
+        return BitmapToArray( container )
+        
+    else:
+        
+        return container
+        
+    
+def ContainerToBitmap( container: numpy.ndarray ) -> numpy.ndarray:
+    
+    if IsBitmap( container ):
+        
+        return container
+        
+    else:
+        
+        return ArrayToBitmap( container )
+        
+    
+def IsBitmap( container: numpy.ndarray ) -> bool:
+    
+    return container.dtype == numpy.uint8
+    
+def NormaliseBitmap( bitmap: numpy.ndarray ):
+    
+    # after an op that can only shrink a bitmap, it may want to be an array or nothing
+    
+    cardinality = BitmapCardinality( bitmap )
+    
+    if cardinality == 0:
+        
+        return None
+        
+    elif cardinality <= MAX_ARRAY_CARDINALITY:
+        
+        return BitmapToArray( bitmap )
+        
+    else:
+        
+        return bitmap
+        
+    
+def NormaliseArray( array: numpy.ndarray ):
+    
+    if len( array ) == 0:
+        
+        return None
+        
+    elif len( array ) > MAX_ARRAY_CARDINALITY:
+        
+        return ArrayToBitmap( array )
+        
+    else:
+        
+        return array
+        
+    
+def ContainerAnd( container_a: numpy.ndarray, container_b: numpy.ndarray ):
+    
+    a_is_bitmap = IsBitmap( container_a )
+    b_is_bitmap = IsBitmap( container_b )
+    
+    if a_is_bitmap and b_is_bitmap:
+        
+        return NormaliseBitmap( numpy.bitwise_and( container_a, container_b ) )
+        
+    elif a_is_bitmap:
+        
+        return NormaliseArray( container_b[ BitmapContainsArray( container_a, container_b ) ] )
+        
+    elif b_is_bitmap:
+        
+        return NormaliseArray( container_a[ BitmapContainsArray( container_b, container_a ) ] )
+        
+    else:
+        
+        return NormaliseArray( numpy.intersect1d( container_a, container_b, assume_unique = True ) )
+        
+    
+def ContainerAndNot( container_a: numpy.ndarray, container_b: numpy.ndarray ):
+    
+    a_is_bitmap = IsBitmap( container_a )
+    b_is_bitmap = IsBitmap( container_b )
+    
+    if a_is_bitmap:
+        
+        return NormaliseBitmap( numpy.bitwise_and( container_a, numpy.invert( ContainerToBitmap( container_b ) ) ) )
+        
+    elif b_is_bitmap:
+        
+        return NormaliseArray( container_a[ ~BitmapContainsArray( container_b, container_a ) ] )
+        
+    else:
+        
+        return NormaliseArray( numpy.setdiff1d( container_a, container_b, assume_unique = True ) )
+        
+    
+def ContainerOr( container_a: numpy.ndarray, container_b: numpy.ndarray ):
+    
+    if IsBitmap( container_a ) or IsBitmap( container_b ):
+        
+        return numpy.bitwise_or( ContainerToBitmap( container_a ), ContainerToBitmap( container_b ) )
+        
+    else:
+        
+        return NormaliseArray( numpy.union1d( container_a, container_b ) )
+        
+    
+def SortedUniqueArrayToContainers( array: numpy.ndarray ) -> dict:
+    
+    chunks_to_containers = {}
+    
+    if len( array ) == 0:
+        
+        return chunks_to_containers
+        
+    
+    if array[0] < 0:
+        
+        raise ValueError( 'Integer sets can only hold non-negative integers!' )
+        
+    
+    chunks = array >> CHUNK_BITS
+    
+    split_indices = numpy.flatnonzero( numpy.diff( chunks ) ) + 1
+    
+    for sub_array in numpy.split( array, split_indices ):
+        
+        chunk = int( sub_array[0] >> CHUNK_BITS )
+        
+        chunks_to_containers[ chunk ] = NormaliseArray( ( sub_array & CHUNK_MASK ).astype( numpy.uint16 ) )
+        
+    
+    return chunks_to_containers
+    
+class IntegerSet( object ):
+    
+    # behaves like a set of ints for everything the db search code does with one, but iterates in sorted order
+    
+    __hash__ = None
+    
+    def __init__( self, integers = None ):
+        
+        self._chunks_to_containers = {}
+        
+        if integers is not None:
+            
+            self._SetIntegers( integers )
+            
+        
+    
+    def __contains__( self, integer ):
+        
+        chunk = integer >> CHUNK_BITS
+        
+        if chunk not in self._chunks_to_containers:
+            
+            return False
+            
+        
+        container = self._chunks_to_containers[ chunk ]
+        
+        low = integer & CHUNK_MASK
+        
+        if IsBitmap( container ):
+            
+            return bool( ( container[ low >> 3 ] >> ( low & 7 ) ) & 1 )
+            
+        else:
+            
+            i = numpy.searchsorted( container, low )
+            
+            return bool( i < len( container ) and container[ i ] == low )
+            
+        
+    
+    def __eq__( self, other ):
+        
+        if isinstance( other, IntegerSet ):
+            
+            if self._chunks_to_containers.keys() != other._chunks_to_containers.keys():
+                
+                return False
+                
+            
+            # containers are always normalised, so equal sets have equal containers
+            
+            return all( ( numpy.array_equal( container, other._chunks_to_containers[ chunk ] ) for ( chunk, container ) in self._chunks_to_containers.items() ) )
+            
+        elif isinstance( other, ( set, frozenset ) ):
+            
+            return len( self ) == len( other ) and self == IntegerSet( other )
+            
+        else:
+            
+            return NotImplemented
+            
+        
+    
+    def __iter__( self ):
+        
+        for chunk in sorted( self._chunks_to_containers.keys() ):
+            
+            base = chunk << CHUNK_BITS
+            
+            yield from ( ContainerToArray( self._chunks_to_containers[ chunk ] ).astype( numpy.int64 ) + base ).tolist()
+            
+        
+    
+    def __len__( self ):
+        
+        return sum( ( ContainerCardinality( container ) for container in self._chunks_to_containers.values() ) )
+        
+    
+    def __repr__( self ):
+        
+        return 'IntegerSet: {} integers in {} chunks'.format( len( self ), len( self._chunks_to_containers ) )
+        
+    
+    def _GetOther( self, other ) -> "IntegerSet":
+        
+        if isinstance( other, IntegerSet ):
+            
+            return other
+            
+        else:
+            
+            return IntegerSet( other )
+            
+        
+    
+    def _SetIntegers( self, integers ):
+        
+        if isinstance( integers, IntegerSet ):
+            
+            self._chunks_to_containers = dict( integers._chunks_to_containers )
+            
+            return
+            
+        
+        if isinstance( integers, numpy.ndarray ):
+            
+            array = integers.astype( numpy.int64 )
+            
+        elif isinstance( integers, ( set, frozenset, list, tuple ) ):
+            
+            array = numpy.fromiter( integers, dtype = numpy.int64, count = len( integers ) )
+            
+        else:
+            
+            array = numpy.fromiter( integers, dtype = numpy.int64 )
+            
+        
+        self._chunks_to_containers = SortedUniqueArrayToContainers( numpy.unique( array ) )
+        
+    
+    def add( self, integer ):
+        
+        self.update( ( integer, ) )
+        
+    
+    def copy( self ) -> "IntegerSet":
+        
+        # containers are never edited in place, so sharing them is fine
+        
+        return IntegerSet( self )
+        
+    
+    def difference( self, other ) -> "IntegerSet":
+        
+        result = self.copy()
+        
+        result.difference_update( other )
+        
+        return result
+        
+    
+    def difference_update( self, other ):
+        
+        other = self._GetOther( other )
+        
+        for ( chunk, other_container ) in other._chunks_to_containers.items():
+            
+            if chunk in self._chunks_to_containers:
+                
+                container = ContainerAndNot( self._chunks_to_containers[ chunk ], other_container )
+                
+                if container is None:
+                    
+                    del self._chunks_to_containers[ chunk ]
+                    
+                else:
+                    
+                    self._chunks_to_containers[ chunk ] = container
+                    
+                
+            
+        
+    
+    def discard( self, integer ):
+        
+        self.difference_update( ( integer, ) )
+        
+    
+    def intersection( self, other ) -> "IntegerSet":
+        
+        result = self.copy()
+        
+        result.intersection_update( other )
+        
+        return result
+        
+    
+    def intersection_update( self, other ):
+        
+        other = self._GetOther( other )
+        
+        chunks_to_containers = {}
+        
+        for ( chunk, container ) in self._chunks_to_containers.items():
+            
+            if chunk in other._chunks_to_containers:
+                
+                container = ContainerAnd( container, other._chunks_to_containers[ chunk ] )
+                
+                if container is not None:
+                    
+                    chunks_to_containers[ chunk ] = container
+                    
+                
+            
+        
+        self._chunks_to_containers = chunks_to_containers
+        
+    
+    def isdisjoint( self, other ) -> bool:
+        
+        return len( self.intersection( other ) ) == 0
+        
+    
+    def issubset( self, other ) -> bool:
+        
+        return len( self.difference( other ) ) == 0
+        
+    
+    def union( self, other ) -> "IntegerSet":
+        
+        result = self.copy()
+        
+        result.update( other )
+        
+        return result
+        
+    
+    def update( self, other ):
+        
+        other = self._GetOther( other )
+        
+        for ( chunk, other_container ) in other._chunks_to_containers.items():
+            
+            if chunk in self._chunks_to_containers:
+                
+                self._chunks_to_containers[ chunk ] = ContainerOr( self._chunks_to_containers[ chunk ], other_container )
+                
+            else:
+                
+                self._chunks_to_containers[ chunk ] = other_container
+                
+            
+        
+    
+    def GetMemoryUsage( self ) -> int:
+        
+        return sum( ( container.nbytes for container in self._chunks_to_containers.values() ) )
+        
+    
+    def ToNumPyArray( self ) -> numpy.ndarray:
+        
+        if len( self._chunks_to_containers ) == 0:
+            
+            return numpy.zeros( 0, dtype = numpy.int64 )
+            
+        
+        return numpy.concatenate( [ ContainerToArray( self._chunks_to_containers[ chunk ] ).astype( numpy.int64 ) + ( chunk << CHUNK_BITS ) for chunk in sorted( self._chunks_to_containers.keys() ) ] )
@@ -1,3 +1,4 @@
+import collections
 import threading
 import weakref
 
@@ -5,6 +6,78 @@ from hydrus.core import HydrusData
 from hydrus.core import HydrusExceptions
 from hydrus.core import HydrusGlobals as HG
 
+def CoalesceIdenticalCalls( calls ):
+    
+    # for 'refresh this' topics, where the same pub may come in many times in a frame
+    
+    coalesced_calls = []
+    
+    for ( args, kwargs ) in calls:
+        
+        if ( args, kwargs ) not in coalesced_calls:
+            
+            coalesced_calls.append( ( args, kwargs ) )
+            
+        
+    
+    return coalesced_calls
+    
+
+def CoalesceDictsOfLists( calls ):
+    
+    # for topics with a single key -> list arg, like service_keys_to_content_updates
+    
+    merged = {}
+    
+    for ( args, kwargs ) in calls:
+        
+        ( keys_to_lists, ) = args
+        
+        if len( kwargs ) > 0:
+            
+            raise ValueError( 'Cannot coalesce calls with kwargs!' )
+            
+        
+        for ( key, items ) in keys_to_lists.items():
+            
+            if key not in merged:
+                
+                merged[ key ] = []
+                
+            
+            merged[ key ].extend( items )
+            
+        
+    
+    return [ ( ( merged, ), {} ) ]
+    
+
+def CoalesceListsByFirstArg( calls ):
+    
+    # for topics like ( page_key, list_of_things )
+    
+    first_args_to_lists = {}
+    
+    for ( args, kwargs ) in calls:
+        
+        ( first_arg, items ) = args
+        
+        if len( kwargs ) > 0:
+            
+            raise ValueError( 'Cannot coalesce calls with kwargs!' )
+            
+        
+        if first_arg not in first_args_to_lists:
+            
+            first_args_to_lists[ first_arg ] = []
+            
+        
+        first_args_to_lists[ first_arg ].extend( items )
+        
+    
+    return [ ( ( first_arg, items ), {} ) for ( first_arg, items ) in first_args_to_lists.items() ]
+    
+
 class HydrusPubSub( object ):
     
     def __init__( self, controller, valid_callable ):
@@ -22,6 +95,14 @@ class HydrusPubSub( object ):
         
         self._topics_to_objects = {}
         self._topics_to_method_names = {}
+        self._topics_to_objects_to_worker_method_names = {}
+        
+        self._topics_to_coalesce_callables = {}
+        
+        self._metrics_lock = threading.Lock()
+        
+        self._peak_queue_depth = 0
+        self._topics_to_metrics = collections.defaultdict( lambda: [ 0, 0, 0.0, 0.0 ] ) # num pubs, num deliveries, total time, max time
         
     
     def _GetCallableTuples( self, topic ):
@@ -44,6 +125,7 @@ class HydrusPubSub( object ):
                         
                     
                     method_names = self._topics_to_method_names[ topic ]
+                    worker_method_names = self._topics_to_objects_to_worker_method_names[ topic ].get( obj, set() ) if topic in self._topics_to_objects_to_worker_method_names else set()
                     
                     for method_name in method_names:
                         
@@ -51,7 +133,7 @@ class HydrusPubSub( object ):
                             
                             callable = getattr( obj, method_name )
                             
-                            callable_tuples.append( ( obj, callable ) )
+                            callable_tuples.append( ( obj, callable, method_name in worker_method_names ) )
                             
                         
                     
@@ -65,6 +147,78 @@ class HydrusPubSub( object ):
         return callable_tuples
         
     
+    def _CoalescePubsubs( self, pubsubs ):
+        
+        # a run of consecutive coalescable pubs is merged down per topic, in first-seen order
+        # any other pub breaks the run, so nothing gets delivered earlier than a pub that was made before it
+        
+        coalesced_pubsubs = []
+        
+        topics_to_calls = {}
+        
+        for ( topic, args, kwargs ) in pubsubs:
+            
+            if topic in self._topics_to_coalesce_callables:
+                
+                if topic not in topics_to_calls:
+                    
+                    topics_to_calls[ topic ] = []
+                    
+                
+                topics_to_calls[ topic ].append( ( args, kwargs ) )
+                
+            else:
+                
+                coalesced_pubsubs.extend( self._CoalesceRun( topics_to_calls ) )
+                
+                topics_to_calls = {}
+                
+                coalesced_pubsubs.append( ( topic, args, kwargs ) )
+                
+            
+        
+        coalesced_pubsubs.extend( self._CoalesceRun( topics_to_calls ) )
+        
+        return coalesced_pubsubs
+        
+    
+    def _CoalesceRun( self, topics_to_calls ):
+        
+        coalesced_pubsubs = []
+        
+        for ( topic, calls ) in topics_to_calls.items():
+            
+            if len( calls ) > 1:
+                
+                coalesce_callable = self._topics_to_coalesce_callables[ topic ]
+                
+                try:
+                    
+                    calls = coalesce_callable( calls )
+                    
+                except Exception as e:
+                    
+                    HydrusData.Print( 'Could not coalesce pubsub topic "{}", so delivering them individually. Error was:'.format( topic ) )
+                    
+                    HydrusData.PrintException( e, do_wait = False )
+                    
+                
+            
+            coalesced_pubsubs.extend( ( ( topic, args, kwargs ) for ( args, kwargs ) in calls ) )
+            
+        
+        return coalesced_pubsubs
+        
+    
+    def ClearMetrics( self ):
+        
+        with self._metrics_lock:
+            
+            self._peak_queue_depth = 0
+            self._topics_to_metrics = collections.defaultdict( lambda: [ 0, 0, 0.0, 0.0 ] )
+            
+        
+    
     def DoingWork( self ):
         
         return self._doing_work
@@ -97,6 +251,16 @@ class HydrusPubSub( object ):
                 self._pubsubs = []
                 
             
+            with self._metrics_lock:
+                
+                for ( topic, args, kwargs ) in pubsubs:
+                    
+                    self._topics_to_metrics[ topic ][0] += 1
+                    
+                
+            
+            pubsubs = self._CoalescePubsubs( pubsubs )
+            
             for ( topic, args, kwargs ) in pubsubs:
                 
                 try:
@@ -113,11 +277,20 @@ class HydrusPubSub( object ):
                         HydrusData.ShowText( ( topic, args, kwargs, callable_tuples ) )
                         
                     
+                    time_started = HydrusData.GetNowPrecise()
+                    
                     if HG.profile_mode and not_a_report:
                         
                         summary = 'Profiling pubsub: {}'.format( topic )
                         
-                        for ( obj, callable ) in callable_tuples:
+                        for ( obj, callable, deliver_on_worker ) in callable_tuples:
+                            
+                            if deliver_on_worker:
+                                
+                                self._controller.CallToThread( callable, *args, **kwargs )
+                                
+                                continue
+                                
                             
                             try:
                                 
@@ -131,7 +304,14 @@ class HydrusPubSub( object ):
                         
                     else:
                         
-                        for ( obj, callable ) in callable_tuples:
+                        for ( obj, callable, deliver_on_worker ) in callable_tuples:
+                            
+                            if deliver_on_worker:
+                                
+                                self._controller.CallToThread( callable, *args, **kwargs )
+                                
+                                continue
+                                
                             
                             try:
                                 
@@ -144,6 +324,17 @@ class HydrusPubSub( object ):
                             
                         
                     
+                    time_taken = HydrusData.GetNowPrecise() - time_started
+                    
+                    with self._metrics_lock:
+                        
+                        metrics = self._topics_to_metrics[ topic ]
+                        
+                        metrics[1] += 1
+                        metrics[2] += time_taken
+                        metrics[3] = max( metrics[3], time_taken )
+                        
+                    
                 except Exception as e:
                     
                     HydrusData.ShowException( e )
@@ -156,12 +347,37 @@ class HydrusPubSub( object ):
             
         
     
+    def GetMetrics( self ):
+        
+        with self._lock:
+            
+            queue_depth = len( self._pubsubs )
+            
+        
+        with self._metrics_lock:
+            
+            topics_to_metrics = { topic : tuple( metrics ) for ( topic, metrics ) in self._topics_to_metrics.items() }
+            
+            return ( queue_depth, self._peak_queue_depth, topics_to_metrics )
+            
+        
+    
     def pub( self, topic, *args, **kwargs ):
         
         with self._lock:
             
             self._pubsubs.append( ( topic, args, kwargs ) )
             
+            queue_depth = len( self._pubsubs )
+            
+        
+        if queue_depth > self._peak_queue_depth:
+            
+            with self._metrics_lock:
+                
+                self._peak_queue_depth = max( self._peak_queue_depth, queue_depth )
+                
+            
         
         self._pub_event.set()
         
@@ -173,13 +389,33 @@ class HydrusPubSub( object ):
             callable_tuples = self._GetCallableTuples( topic )
             
         
-        for ( obj, callable ) in callable_tuples:
+        for ( obj, callable, deliver_on_worker ) in callable_tuples:
             
             callable( *args, **kwargs )
             
         
     
-    def sub( self, object, method_name, topic ):
+    def SetCoalesceCallable( self, topic, coalesce_callable ):
+        
+        # coalesce_callable takes a list of ( args, kwargs ) and returns a shorter list of the same
+        
+        with self._lock:
+            
+            if coalesce_callable is None:
+                
+                if topic in self._topics_to_coalesce_callables:
+                    
+                    del self._topics_to_coalesce_callables[ topic ]
+                    
+                
+            else:
+                
+                self._topics_to_coalesce_callables[ topic ] = coalesce_callable
+                
+            
+        
+    
+    def sub( self, object, method_name, topic, deliver_on_worker = False ):
         
         with self._lock:
             
@@ -189,6 +425,23 @@ class HydrusPubSub( object ):
             self._topics_to_objects[ topic ].add( object )
             self._topics_to_method_names[ topic ].add( method_name )
             
+            # worker delivery is a property of this subscription, not the topic's method name, so other objects with the same method are unaffected
+            
+            if deliver_on_worker:
+                
+                if topic not in self._topics_to_objects_to_worker_method_names: self._topics_to_objects_to_worker_method_names[ topic ] = weakref.WeakKeyDictionary()
+                
+                objects_to_worker_method_names = self._topics_to_objects_to_worker_method_names[ topic ]
+                
+                if object not in objects_to_worker_method_names: objects_to_worker_method_names[ object ] = set()
+                
+                objects_to_worker_method_names[ object ].add( method_name )
+                
+            elif topic in self._topics_to_objects_to_worker_method_names and object in self._topics_to_objects_to_worker_method_names[ topic ]:
+                
+                self._topics_to_objects_to_worker_method_names[ topic ][ object ].discard( method_name )
+                
+            
         
     
     def WaitOnPub( self ):
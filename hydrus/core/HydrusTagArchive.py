@@ -22,6 +22,12 @@ import sqlite3
 
 # If you are only adding a couple tags, you can exclude the BigJob stuff. It just makes millions of sequential writes more efficient.
 
+# If you are making a really big archive, go hta.BeginBigJob( bulk = True ) instead. This holds all the hash and tag ids in memory, batches and sorts the
+# inserts, and drops the indices until CommitBigJob. It also turns off the journal and fsyncs for the duration, so if your computer crashes halfway, the
+# archive is likely garbage and you should start again.
+
+# To read an archive quickly, IterateMappingsInChunks gives you lists of ( hash, tags ) with one joined query per list.
+
 
 # Also, this manages hashes as bytes, not hex, so if you have something like:
 
@@ -63,6 +69,8 @@ hash_str_to_type_lookup[ 'sha1' ] = HASH_TYPE_SHA1
 hash_str_to_type_lookup[ 'sha256' ] = HASH_TYPE_SHA256
 hash_str_to_type_lookup[ 'sha512' ] = HASH_TYPE_SHA512
 
+BULK_JOB_FLUSH_SIZE = 250000
+
 def ReadLargeIdQueryInSeparateChunks( cursor, select_statement, chunk_size ):
     
     table_name = 'tempbigread' + os.urandom( 32 ).hex()
@@ -107,10 +115,81 @@ class HydrusTagArchive( object ):
         self._namespaces = { namespace for ( namespace, ) in self._c.execute( 'SELECT namespace FROM namespaces;' ) }
         self._namespaces.add( '' )
         
+        self._in_bulk_job = False
+        
+        self._hashes_to_hash_ids = {}
+        self._tags_to_tag_ids = {}
+        
+        self._next_hash_id = 1
+        self._next_tag_id = 1
+        
+        self._pending_hash_inserts = []
+        self._pending_tag_inserts = []
+        self._pending_mapping_inserts = []
+        
+        self._journal_mode_before_bulk_job = None
+        self._synchronous_before_bulk_job = None
+        
     
     def _AddMappings( self, hash_id, tag_ids ):
         
-        self._c.executemany( 'INSERT OR IGNORE INTO mappings ( hash_id, tag_id ) VALUES ( ?, ? );', ( ( hash_id, tag_id ) for tag_id in tag_ids ) )
+        if self._in_bulk_job:
+            
+            self._pending_mapping_inserts.extend( ( ( hash_id, tag_id ) for tag_id in tag_ids ) )
+            
+            if len( self._pending_mapping_inserts ) >= BULK_JOB_FLUSH_SIZE:
+                
+                self._FlushBulkInserts()
+                
+            
+        else:
+            
+            self._c.executemany( 'INSERT OR IGNORE INTO mappings ( hash_id, tag_id ) VALUES ( ?, ? );', ( ( hash_id, tag_id ) for tag_id in tag_ids ) )
+            
+        
+    
+    def _CreateIndices( self ):
+        
+        self._c.execute( 'CREATE UNIQUE INDEX IF NOT EXISTS hashes_hash_index ON hashes ( hash );' )
+        self._c.execute( 'CREATE INDEX IF NOT EXISTS mappings_hash_id_index ON mappings ( hash_id );' )
+        self._c.execute( 'CREATE UNIQUE INDEX IF NOT EXISTS tags_tag_index ON tags ( tag );' )
+        
+    
+    def _DropIndices( self ):
+        
+        self._c.execute( 'DROP INDEX IF EXISTS hashes_hash_index;' )
+        self._c.execute( 'DROP INDEX IF EXISTS mappings_hash_id_index;' )
+        self._c.execute( 'DROP INDEX IF EXISTS tags_tag_index;' )
+        
+    
+    def _FlushBulkInserts( self ):
+        
+        # everything that reads or deletes from the tables calls this first, so it never sees a half-done bulk job
+        
+        if len( self._pending_hash_inserts ) > 0:
+            
+            self._c.executemany( 'INSERT INTO hashes ( hash_id, hash ) VALUES ( ?, ? );', self._pending_hash_inserts )
+            
+            self._pending_hash_inserts = []
+            
+        
+        if len( self._pending_tag_inserts ) > 0:
+            
+            self._c.executemany( 'INSERT INTO tags ( tag_id, tag ) VALUES ( ?, ? );', self._pending_tag_inserts )
+            
+            self._pending_tag_inserts = []
+            
+        
+        if len( self._pending_mapping_inserts ) > 0:
+            
+            # sorted inserts append to the end of the primary key btree rather than jumping all over it
+            
+            self._pending_mapping_inserts.sort()
+            
+            self._c.executemany( 'INSERT OR IGNORE INTO mappings ( hash_id, tag_id ) VALUES ( ?, ? );', self._pending_mapping_inserts )
+            
+            self._pending_mapping_inserts = []
+            
         
     
     def _InitDB( self ):
@@ -118,15 +197,14 @@ class HydrusTagArchive( object ):
         self._c.execute( 'CREATE TABLE hash_type ( hash_type INTEGER );' )
         
         self._c.execute( 'CREATE TABLE hashes ( hash_id INTEGER PRIMARY KEY, hash BLOB_BYTES );' )
-        self._c.execute( 'CREATE UNIQUE INDEX hashes_hash_index ON hashes ( hash );' )
         
         self._c.execute( 'CREATE TABLE mappings ( hash_id INTEGER, tag_id INTEGER, PRIMARY KEY ( hash_id, tag_id ) );' )
-        self._c.execute( 'CREATE INDEX mappings_hash_id_index ON mappings ( hash_id );' )
         
         self._c.execute( 'CREATE TABLE namespaces ( namespace TEXT );' )
         
         self._c.execute( 'CREATE TABLE tags ( tag_id INTEGER PRIMARY KEY, tag TEXT );' )
-        self._c.execute( 'CREATE UNIQUE INDEX tags_tag_index ON tags ( tag );' )
+        
+        self._CreateIndices()
         
     
     def _InitDBConnection( self ):
@@ -138,6 +216,8 @@ class HydrusTagArchive( object ):
     
     def _GetHashes( self, tag_id ):
         
+        self._FlushBulkInserts()
+        
         result = { hash for ( hash, ) in self._c.execute( 'SELECT hash FROM mappings NATURAL JOIN hashes WHERE tag_id = ?;', ( tag_id, ) ) }
         
         return result
@@ -145,6 +225,29 @@ class HydrusTagArchive( object ):
     
     def _GetHashId( self, hash, read_only = False ):
         
+        if self._in_bulk_job:
+            
+            if hash in self._hashes_to_hash_ids:
+                
+                return self._hashes_to_hash_ids[ hash ]
+                
+            
+            if read_only:
+                
+                raise Exception()
+                
+            
+            hash_id = self._next_hash_id
+            
+            self._next_hash_id += 1
+            
+            self._hashes_to_hash_ids[ hash ] = hash_id
+            
+            self._pending_hash_inserts.append( ( hash_id, sqlite3.Binary( hash ) ) )
+            
+            return hash_id
+            
+        
         result = self._c.execute( 'SELECT hash_id FROM hashes WHERE hash = ?;', ( sqlite3.Binary( hash ), ) ).fetchone()
         
         if result is None:
@@ -168,6 +271,8 @@ class HydrusTagArchive( object ):
     
     def _GetTags( self, hash_id ):
         
+        self._FlushBulkInserts()
+        
         result = { tag for ( tag, ) in self._c.execute( 'SELECT tag FROM mappings NATURAL JOIN tags WHERE hash_id = ?;', ( hash_id, ) ) }
         
         return result
@@ -175,22 +280,45 @@ class HydrusTagArchive( object ):
     
     def _GetTagId( self, tag, read_only = False ):
         
-        result = self._c.execute( 'SELECT tag_id FROM tags WHERE tag = ?;', ( tag, ) ).fetchone()
-        
-        if result is None:
+        if self._in_bulk_job:
+            
+            if tag in self._tags_to_tag_ids:
+                
+                return self._tags_to_tag_ids[ tag ]
+                
             
             if read_only:
                 
                 raise Exception()
                 
             
-            self._c.execute( 'INSERT INTO tags ( tag ) VALUES ( ? );', ( tag, ) )
+            tag_id = self._next_tag_id
             
-            tag_id = self._c.lastrowid
+            self._next_tag_id += 1
+            
+            self._tags_to_tag_ids[ tag ] = tag_id
+            
+            self._pending_tag_inserts.append( ( tag_id, tag ) )
             
         else:
             
-            ( tag_id, ) = result
+            result = self._c.execute( 'SELECT tag_id FROM tags WHERE tag = ?;', ( tag, ) ).fetchone()
+            
+            if result is None:
+                
+                if read_only:
+                    
+                    raise Exception()
+                    
+                
+                self._c.execute( 'INSERT INTO tags ( tag ) VALUES ( ? );', ( tag, ) )
+                
+                tag_id = self._c.lastrowid
+                
+            else:
+                
+                ( tag_id, ) = result
+                
             
         
         if ':' in tag:
@@ -208,22 +336,69 @@ class HydrusTagArchive( object ):
         return tag_id
         
     
-    def BeginBigJob( self ):
+    def BeginBigJob( self, bulk = False ):
+        
+        if bulk:
+            
+            # these cannot change inside a transaction
+            
+            ( self._journal_mode_before_bulk_job, ) = self._c.execute( 'PRAGMA journal_mode;' ).fetchone()
+            ( self._synchronous_before_bulk_job, ) = self._c.execute( 'PRAGMA synchronous;' ).fetchone()
+            
+            self._c.execute( 'PRAGMA journal_mode = OFF;' )
+            self._c.execute( 'PRAGMA synchronous = OFF;' )
+            
         
         self._c.execute( 'BEGIN IMMEDIATE;' )
         
+        if bulk:
+            
+            self._hashes_to_hash_ids = { hash : hash_id for ( hash_id, hash ) in self._c.execute( 'SELECT hash_id, hash FROM hashes;' ) }
+            self._tags_to_tag_ids = { tag : tag_id for ( tag_id, tag ) in self._c.execute( 'SELECT tag_id, tag FROM tags;' ) }
+            
+            self._next_hash_id = max( self._hashes_to_hash_ids.values(), default = 0 ) + 1
+            self._next_tag_id = max( self._tags_to_tag_ids.values(), default = 0 ) + 1
+            
+            # the id dicts do the lookups now, so the indices would only slow the inserts down
+            
+            self._DropIndices()
+            
+            self._in_bulk_job = True
+            
+        
     
     def CommitBigJob( self ):
         
+        if self._in_bulk_job:
+            
+            self._FlushBulkInserts()
+            
+            self._CreateIndices()
+            
+            self._in_bulk_job = False
+            
+            self._hashes_to_hash_ids = {}
+            self._tags_to_tag_ids = {}
+            
+        
         self._c.execute( 'COMMIT;' )
         
+        if self._journal_mode_before_bulk_job is not None:
+            
+            self._c.execute( 'PRAGMA journal_mode = {};'.format( self._journal_mode_before_bulk_job ) )
+            self._c.execute( 'PRAGMA synchronous = {};'.format( self._synchronous_before_bulk_job ) )
+            
+            self._journal_mode_before_bulk_job = None
+            self._synchronous_before_bulk_job = None
+            
+        
     
     def AddMapping( self, hash, tag ):
         
         hash_id = self._GetHashId( hash )
         tag_id = self._GetTagId( tag )
         
-        self._c.execute( 'INSERT OR IGNORE INTO mappings ( hash_id, tag_id ) VALUES ( ?, ? );', ( hash_id, tag_id ) )
+        self._AddMappings( hash_id, ( tag_id, ) )
         
     
     def AddMappings( self, hash, tags ):
@@ -246,6 +421,8 @@ class HydrusTagArchive( object ):
     
     def DeleteMapping( self, hash, tag ):
         
+        self._FlushBulkInserts()
+        
         hash_id = self._GetHashId( hash )
         tag_id = self._GetTagId( tag )
         
@@ -259,6 +436,8 @@ class HydrusTagArchive( object ):
         try: hash_id = self._GetHashId( hash, read_only = True )
         except: return
         
+        self._FlushBulkInserts()
+        
         self._c.execute( 'DELETE FROM mappings WHERE hash_id = ?;', ( hash_id, ) )
         
     
@@ -290,6 +469,8 @@ class HydrusTagArchive( object ):
         
         if result is None:
             
+            self._FlushBulkInserts()
+            
             result = self._c.execute( 'SELECT hash FROM hashes;' ).fetchone()
             
             if result is None:
@@ -380,6 +561,8 @@ class HydrusTagArchive( object ):
     
     def IterateHashes( self ):
         
+        self._FlushBulkInserts()
+        
         for ( hash, ) in self._c.execute( 'SELECT hash FROM hashes;' ):
             
             yield hash
@@ -388,24 +571,63 @@ class HydrusTagArchive( object ):
     
     def IterateMappings( self ):
         
-        for group_of_hash_ids in ReadLargeIdQueryInSeparateChunks( self._c, 'SELECT hash_id FROM hashes;', 256 ):
+        for chunk in self.IterateMappingsInChunks():
+            
+            yield from chunk
+            
+        
+    
+    def IterateMappingsInChunks( self, chunk_size = 10000 ):
+        
+        # each chunk is a list of ( hash, tags ) for up to chunk_size hashes, fetched with one joined query over a range of the mappings primary key
+        
+        self._FlushBulkInserts()
+        
+        last_hash_id = -1
+        
+        while True:
             
-            for hash_id in group_of_hash_ids:
+            hash_ids = [ hash_id for ( hash_id, ) in self._c.execute( 'SELECT hash_id FROM hashes WHERE hash_id > ? ORDER BY hash_id LIMIT ?;', ( last_hash_id, chunk_size ) ) ]
+            
+            if len( hash_ids ) == 0:
+                
+                break
                 
-                tags = self._GetTags( hash_id )
+            
+            first_hash_id = hash_ids[0]
+            last_hash_id = hash_ids[-1]
+            
+            chunk = []
+            
+            current_hash_id = None
+            current_tags = None
+            
+            query = 'SELECT mappings.hash_id, hash, tag FROM mappings CROSS JOIN hashes ON ( mappings.hash_id = hashes.hash_id ) CROSS JOIN tags ON ( mappings.tag_id = tags.tag_id ) WHERE mappings.hash_id BETWEEN ? AND ? ORDER BY mappings.hash_id;'
+            
+            for ( hash_id, hash, tag ) in self._c.execute( query, ( first_hash_id, last_hash_id ) ):
                 
-                if len( tags ) > 0:
+                if hash_id != current_hash_id:
                     
-                    ( hash, ) = self._c.execute( 'SELECT hash FROM hashes WHERE hash_id = ?;', ( hash_id, ) ).fetchone()
+                    current_hash_id = hash_id
+                    current_tags = set()
                     
-                    yield ( hash, tags )
+                    chunk.append( ( hash, current_tags ) )
                     
                 
+                current_tags.add( tag )
+                
+            
+            if len( chunk ) > 0:
+                
+                yield chunk
+                
             
         
     
     def IterateMappingsTagFirst( self ):
         
+        self._FlushBulkInserts()
+        
         for group_of_tag_ids in ReadLargeIdQueryInSeparateChunks( self._c, 'SELECT tag_id FROM tags;', 256 ):
             
             for tag_id in group_of_tag_ids:
@@ -430,6 +652,8 @@ class HydrusTagArchive( object ):
     
     def RebuildNamespaces( self, namespaces_to_exclude = set() ):
         
+        self._FlushBulkInserts()
+        
         self._namespaces = set()
         self._namespaces.add( '' )
         
@@ -462,6 +686,8 @@ class HydrusTagArchive( object ):
         
         hash_id = self._GetHashId( hash )
         
+        self._FlushBulkInserts()
+        
         self._c.execute( 'DELETE FROM mappings WHERE hash_id = ?;', ( hash_id, ) )
         
         tag_ids = [ self._GetTagId( tag ) for tag in tags ]
@@ -1,3 +1,4 @@
+import bisect
 import numpy
 import os
 import re
@@ -489,6 +490,35 @@ def GetMime( path ):
     
     return HC.APPLICATION_UNKNOWN
     
+def GetVideoKeyframeTimestamps( path ):
+    
+    # we only want the keyframes, so we can tell the decoder to skip everything else. this is pretty quick, even for long vids
+    
+    cmd = [ FFMPEG_PATH, '-hide_banner', '-skip_frame', 'nokey', '-i', path, '-an', '-sn', '-vf', 'showinfo', '-f', 'null', '-' ]
+    
+    sbp_kwargs = HydrusData.GetSubprocessKWArgs()
+    
+    HydrusData.CheckProgramIsNotShuttingDown()
+    
+    try:
+        
+        process = subprocess.Popen( cmd, bufsize = 10**5, stdin = subprocess.PIPE, stdout = subprocess.PIPE, stderr = subprocess.PIPE, **sbp_kwargs )
+        
+    except FileNotFoundError as e:
+        
+        raise FileNotFoundError( 'Cannot interact with video because FFMPEG not found--are you sure it is installed? Full error: ' + str( e ) )
+        
+    
+    ( stdout, stderr ) = HydrusThreading.SubprocessCommunicate( process )
+    
+    ( text, encoding ) = HydrusText.NonFailingUnicodeDecode( stderr, 'utf-8' )
+    
+    lines = text.splitlines()
+    
+    CheckFFMPEGError( lines )
+    
+    return ParseFFMPEGKeyframeTimestamps( lines )
+    
 def HasVideoStream( path ):
     
     lines = GetFFMPEGInfoLines( path )
@@ -758,6 +788,40 @@ def ParseFFMPEGHasVideo( lines ):
     
     return True
     
+def ParseFFMPEGKeyframeTimestamps( lines ):
+    
+    # [Parsed_showinfo_0 @ 0x55d6c6b7a2c0] n:   1 pts:  12012 pts_time:0.4004  duration:   1001 ...
+    
+    keyframe_timestamps_ms = set()
+    
+    for line in lines:
+        
+        if 'Parsed_showinfo' not in line:
+            
+            continue
+            
+        
+        result = re.search( r'pts_time:\s*(-?[\d\.]+)', line )
+        
+        if result is None:
+            
+            continue
+            
+        
+        try:
+            
+            timestamp_ms = int( round( float( result.group( 1 ) ) * 1000 ) )
+            
+        except:
+            
+            continue
+            
+        
+        keyframe_timestamps_ms.add( max( timestamp_ms, 0 ) )
+        
+    
+    return sorted( keyframe_timestamps_ms )
+    
 def ParseFFMPEGMimeText( lines ):
     
     try:
@@ -970,7 +1034,7 @@ def VideoHasAudio( path, info_lines ):
 # This was built from moviepy's FFMPEG_VideoReader
 class VideoRendererFFMPEG( object ):
     
-    def __init__( self, path, mime, duration, num_frames, target_resolution, pix_fmt = "rgb24", clip_rect = None ):
+    def __init__( self, path, mime, duration, num_frames, target_resolution, pix_fmt = "rgb24", clip_rect = None, keyframe_timestamps = None, fast_scale = False ):
         
         self._path = path
         self._mime = mime
@@ -978,6 +1042,7 @@ class VideoRendererFFMPEG( object ):
         self._num_frames = num_frames
         self._target_resolution = target_resolution
         self._clip_rect = clip_rect
+        self._fast_scale = fast_scale
         
         self.lastread = None
         
@@ -988,6 +1053,13 @@ class VideoRendererFFMPEG( object ):
             self.fps = 24
             
         
+        self._keyframe_indices = None
+        
+        if keyframe_timestamps is not None and len( keyframe_timestamps ) > 0 and self._mime not in ( HC.IMAGE_APNG, HC.IMAGE_GIF ):
+            
+            self._keyframe_indices = sorted( { int( ( timestamp_ms / 1000.0 ) * self.fps ) for timestamp_ms in keyframe_timestamps } )
+            
+        
         self.pix_fmt = pix_fmt
         
         if pix_fmt == 'rgba': self.depth = 4
@@ -1017,6 +1089,18 @@ class VideoRendererFFMPEG( object ):
             
         
     
+    def _GetKeyframeIndexAtOrBefore( self, index ):
+        
+        i = bisect.bisect_right( self._keyframe_indices, index )
+        
+        if i == 0:
+            
+            return 0
+            
+        
+        return self._keyframe_indices[ i - 1 ]
+        
+    
     def initialize( self, start_index = 0 ):
         
         self.close()
@@ -1062,18 +1146,32 @@ class VideoRendererFFMPEG( object ):
             cmd.extend( [ '-ss', "%.03f" % ss ] )
             
         
+        video_filters = []
+        
         if self._clip_rect is not None:
             
             ( clip_x, clip_y, clip_width, clip_height ) = self._clip_rect
             
-            cmd.extend( [ '-vf', 'crop={}:{}:{}:{}'.format( clip_width, clip_height, clip_x, clip_y ) ] )
+            video_filters.append( 'crop={}:{}:{}:{}'.format( clip_width, clip_height, clip_x, clip_y ) )
+            
+        
+        # the scale goes in the filter chain so we can pick the scaler. fast_bilinear is a lot cheaper than the default bicubic when shrinking a big vid
+        
+        if self._fast_scale:
+            
+            video_filters.append( 'scale={}:{}:flags=fast_bilinear'.format( w, h ) )
+            
+        else:
+            
+            video_filters.append( 'scale={}:{}'.format( w, h ) )
             
         
+        cmd.extend( [ '-vf', ','.join( video_filters ) ] )
+        
         cmd.extend( [
             '-loglevel', 'quiet',
             '-f', 'image2pipe',
             "-pix_fmt", self.pix_fmt,
-            "-s", str( w ) + 'x' + str( h ),
             '-vsync', '0',
             '-vcodec', 'rawvideo',
             '-'
@@ -1180,7 +1278,17 @@ class VideoRendererFFMPEG( object ):
     def set_position( self, pos ):
         
         rewind = pos < self.pos
-        jump_a_long_way_ahead = pos > self.pos + 60
+        
+        if self._keyframe_indices is None:
+            
+            jump_a_long_way_ahead = pos > self.pos + 60
+            
+        else:
+            
+            # a seek lands on the keyframe before pos and decodes forward from there, so it only beats skipping if that keyframe is past where we are now
+            
+            jump_a_long_way_ahead = self._GetKeyframeIndexAtOrBefore( pos ) > self.pos
+            
         
         if rewind or jump_a_long_way_ahead:
             
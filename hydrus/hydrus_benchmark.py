@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+
+from hydrus.client.gui import QtPorting as QP
+from qtpy import QtWidgets as QW
+
+import argparse
+import sys
+import threading
+import traceback
+
+from twisted.internet import reactor
+
+from hydrus.core import HydrusConstants as HC
+from hydrus.core import HydrusData
+from hydrus.core import HydrusGlobals as HG
+from hydrus.test import BenchmarkClientDB
+from hydrus.test import TestController
+
+def boot():
+    
+    argparser = argparse.ArgumentParser( description = 'hydrus client db benchmarks' )
+    
+    argparser.add_argument( '--scale', default = 'small', choices = list( BenchmarkClientDB.SCALES.keys() ), help = 'the size of the synthetic db to build (default=small)' )
+    argparser.add_argument( '--num_files', type = int, help = 'override the scale\'s number of files' )
+    argparser.add_argument( '--num_tags', type = int, help = 'override the scale\'s number of tags' )
+    argparser.add_argument( '--num_mappings_per_file', type = int, help = 'override the scale\'s number of mappings per file' )
+    argparser.add_argument( '--num_siblings', type = int, help = 'override the scale\'s number of tag siblings' )
+    argparser.add_argument( '--num_parents', type = int, help = 'override the scale\'s number of tag parents' )
+    argparser.add_argument( '--num_similar_files', type = int, help = 'override the scale\'s number of files with perceptual hashes' )
+    argparser.add_argument( '--num_repository_mappings', type = int, help = 'override the scale\'s number of mappings in a repository update' )
+    argparser.add_argument( '--repeats', type = int, default = 5, help = 'how many times to run each benchmark after a warm-up run (default=5)' )
+    argparser.add_argument( '--seed', type = int, default = 0, help = 'the random seed for the synthetic db (default=0)' )
+    argparser.add_argument( '--only', nargs = '+', choices = BenchmarkClientDB.BENCHMARK_NAMES, help = 'only run these benchmarks' )
+    argparser.add_argument( '-o', '--output', default = 'benchmark_results.json', help = 'where to write the json results, or - for stdout (default=benchmark_results.json)' )
+    argparser.add_argument( '--compare', help = 'a previous json results file to compare this run against' )
+    
+    result = argparser.parse_args()
+    
+    scale = dict( BenchmarkClientDB.SCALES[ result.scale ] )
+    
+    for key in scale.keys():
+        
+        value = getattr( result, key )
+        
+        if value is not None:
+            
+            scale[ key ] = value
+            
+        
+    
+    controller = None
+    was_successful = False
+    
+    try:
+        
+        threading.Thread( target = reactor.run, kwargs = { 'installSignalHandlers' : 0 } ).start()
+        
+        QP.MonkeyPatchMissingMethods()
+        app = QW.QApplication( sys.argv )
+        
+        app.call_after_catcher = QP.CallAfterEventCatcher( app )
+        
+        # the test controller gives us everything a client db needs without booting a real client
+        
+        win = QW.QWidget( None )
+        win.setWindowTitle( 'Running benchmarks...' )
+        
+        controller = TestController.Controller( win, None )
+        
+        def do_it():
+            
+            nonlocal was_successful
+            
+            try:
+                
+                benchmark = BenchmarkClientDB.ClientDBBenchmark( controller, controller.db_dir, scale, repeats = result.repeats, seed = result.seed, benchmark_names = result.only )
+                
+                results = benchmark.Run()
+                
+                BenchmarkClientDB.WriteResults( results, result.output )
+                
+                if result.compare is not None:
+                    
+                    BenchmarkClientDB.CompareResults( BenchmarkClientDB.LoadResults( result.compare ), results )
+                    
+                
+                was_successful = True
+                
+            except:
+                
+                HydrusData.DebugPrint( traceback.format_exc() )
+                
+            finally:
+                
+                QP.CallAfter( win.deleteLater )
+                
+            
+        
+        win.show()
+        
+        threading.Thread( target = do_it ).start()
+        
+        app.exec_()
+        
+    except:
+        
+        HydrusData.DebugPrint( traceback.format_exc() )
+        
+    finally:
+        
+        HG.started_shutdown = True
+        HG.view_shutdown = True
+        HG.model_shutdown = True
+        
+        if controller is not None:
+            
+            controller.pubimmediate( 'wake_daemons' )
+            
+            controller.TidyUp()
+            
+        
+        reactor.callFromThread( reactor.stop )
+        
+        print( 'This was version ' + str( HC.SOFTWARE_VERSION ) )
+        
+        sys.exit( 0 if was_successful else 1 )
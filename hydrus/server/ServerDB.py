@@ -346,6 +346,18 @@ class DB( HydrusDB.HydrusDB ):
     
     def _Backup( self ):
         
+        if self._CanDoOnlineBackup():
+            
+            self._BackupOnline()
+            
+        else:
+            
+            self._BackupOffline()
+            
+        
+    
+    def _BackupOffline( self ):
+        
         locked = HG.server_busy.acquire( False ) # pylint: disable=E1111
         
         if not locked:
@@ -396,6 +408,106 @@ class DB( HydrusDB.HydrusDB ):
             
         
     
+    def _BackupOnline( self ):
+        
+        locked = HG.server_backup_lock.acquire( False ) # pylint: disable=E1111
+        
+        if not locked:
+            
+            HydrusData.Print( 'Could not backup because a backup is already running.' )
+            
+            return
+            
+        
+        try:
+            
+            backup_path = os.path.join( self._db_dir, 'server_backup' )
+            
+            HydrusPaths.MakeSureDirectoryExists( backup_path )
+            
+            manifest = HydrusDB.ReadBackupManifest( backup_path )
+            
+            previous_db_change_tokens = manifest.get( 'db_change_tokens', {} )
+            
+            db_change_tokens = self._GetDBChangeTokens()
+            
+            names_to_backup = []
+            
+            for ( name, filename ) in self._db_filenames.items():
+                
+                db_change_token = db_change_tokens[ filename ]
+                
+                if db_change_token is None or db_change_token != previous_db_change_tokens.get( filename, None ) or not os.path.exists( os.path.join( backup_path, filename ) ):
+                    
+                    names_to_backup.append( name )
+                    
+                else:
+                    
+                    HydrusData.Print( 'backing up: ' + filename + ' has not changed' )
+                    
+                
+            
+            online_backup = HydrusDB.OnlineBackup( self._db_dir, self._db_filenames )
+            
+        except:
+            
+            HG.server_backup_lock.release()
+            
+            raise
+            
+        
+        def do_it():
+            
+            try:
+                
+                for name in names_to_backup:
+                    
+                    filename = self._db_filenames[ name ]
+                    
+                    HydrusData.Print( 'backing up: copying ' + filename )
+                    
+                    online_backup.BackupDB( name, os.path.join( backup_path, filename ) )
+                    
+                    previous_db_change_tokens[ filename ] = db_change_tokens[ filename ]
+                    
+                    manifest[ 'db_change_tokens' ] = previous_db_change_tokens
+                    
+                    HydrusDB.WriteBackupManifest( backup_path, manifest )
+                    
+                
+                online_backup.Close()
+                
+                for filename in [ self._ssl_cert_filename, self._ssl_key_filename ]:
+                    
+                    source = os.path.join( self._db_dir, filename )
+                    dest = os.path.join( backup_path, filename )
+                    
+                    if os.path.exists( source ):
+                        
+                        HydrusData.Print( 'backing up: copying ' + filename )
+                        
+                        HydrusPaths.MirrorFile( source, dest )
+                        
+                    
+                
+                # the server file store is not listed by time, but the tree mirror only copies what has changed
+                
+                HydrusData.Print( 'backing up: copying files' )
+                HydrusPaths.MirrorTree( self._files_dir, os.path.join( backup_path, 'server_files' ) )
+                
+                HydrusData.Print( 'backing up: done!' )
+                
+            finally:
+                
+                online_backup.Close()
+                
+                HG.server_backup_lock.release()
+                
+            
+        
+        self._controller.CallToThread( do_it )
+        
+    
     def _ClearDeferredPhysicalDelete( self, file_hash = None, thumbnail_hash = None ):
         
         file_master_hash_id = None if file_hash is None else self._GetMasterHashId( file_hash )
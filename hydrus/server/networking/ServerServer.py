@@ -46,6 +46,7 @@ class HydrusServiceAdmin( HydrusServiceRestricted ):
         
         root.putChild( b'busy', ServerServerResources.HydrusResourceBusyCheck() )
         root.putChild( b'backup', ServerServerResources.HydrusResourceRestrictedBackup( self._service, HydrusServer.REMOTE_DOMAIN ) )
+        root.putChild( b'db_job_metrics', ServerServerResources.HydrusResourceRestrictedDBJobMetrics( self._service, HydrusServer.REMOTE_DOMAIN ) )
         root.putChild( b'lock_on', ServerServerResources.HydrusResourceRestrictedLockOn( self._service, HydrusServer.REMOTE_DOMAIN ) )
         root.putChild( b'lock_off', ServerServerResources.HydrusResourceRestrictedLockOff( self._service, HydrusServer.REMOTE_DOMAIN ) )
         root.putChild( b'services', ServerServerResources.HydrusResourceRestrictedServices( self._service, HydrusServer.REMOTE_DOMAIN ) )
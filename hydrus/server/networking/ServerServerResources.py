@@ -23,7 +23,7 @@ class HydrusResourceBusyCheck( HydrusServerResources.Resource ):
         
         request.setResponseCode( 200 )
         
-        if HG.server_busy.locked():
+        if HG.server_busy.locked() or HG.server_backup_lock.locked():
             
             return b'1'
             
@@ -817,6 +817,26 @@ class HydrusResourceRestrictedBackup( HydrusResourceRestricted ):
         return response_context
         
     
+class HydrusResourceRestrictedDBJobMetrics( HydrusResourceRestricted ):
+    
+    BLOCKED_WHEN_BUSY = False
+    
+    def _checkAccountPermissions( self, request: HydrusServerRequest.HydrusRequest ):
+        
+        request.hydrus_account.CheckPermission( HC.CONTENT_TYPE_SERVICES, HC.PERMISSION_ACTION_MODERATE )
+        
+    
+    def _threadDoGETJob( self, request: HydrusServerRequest.HydrusRequest ):
+        
+        db_job_metrics = HG.server_controller.GetDBJobMetrics()
+        
+        body = HydrusNetworkVariableHandling.DumpHydrusArgsToNetworkBytes( { 'db_job_metrics' : db_job_metrics } )
+        
+        response_context = HydrusServerResources.ResponseContext( 200, body = body )
+        
+        return response_context
+        
+    
 class HydrusResourceRestrictedLockOn( HydrusResourceRestricted ):
     
     def _checkAccountPermissions( self, request: HydrusServerRequest.HydrusRequest ):
@@ -0,0 +1,578 @@
+import collections
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import time
+
+from hydrus.core import HydrusConstants as HC
+from hydrus.core import HydrusData
+
+from hydrus.client import ClientConstants as CC
+from hydrus.client import ClientLocation
+from hydrus.client import ClientSearch
+from hydrus.client import ClientServices
+from hydrus.client import ClientThreading
+from hydrus.client.db import ClientDB
+from hydrus.client.importing import ClientImportFiles
+from hydrus.client.importing.options import FileImportOptions
+from hydrus.client.metadata import ClientTags
+
+# this builds a synthetic client db at a chosen scale and times the db jobs that matter for day to day speed
+# it is not a test--nothing here checks results--it is for tracking the effect of a change across versions
+# results are written as json so they can be diffed or graphed
+
+BENCHMARK_RESULTS_VERSION = 1
+
+SCALES = {}
+
+SCALES[ 'tiny' ] = { 'num_files' : 1000, 'num_tags' : 500, 'num_mappings_per_file' : 10, 'num_siblings' : 50, 'num_parents' : 50, 'num_similar_files' : 500, 'num_repository_mappings' : 10000 }
+SCALES[ 'small' ] = { 'num_files' : 10000, 'num_tags' : 5000, 'num_mappings_per_file' : 15, 'num_siblings' : 500, 'num_parents' : 500, 'num_similar_files' : 5000, 'num_repository_mappings' : 100000 }
+SCALES[ 'medium' ] = { 'num_files' : 100000, 'num_tags' : 50000, 'num_mappings_per_file' : 20, 'num_siblings' : 5000, 'num_parents' : 5000, 'num_similar_files' : 50000, 'num_repository_mappings' : 1000000 }
+SCALES[ 'large' ] = { 'num_files' : 1000000, 'num_tags' : 300000, 'num_mappings_per_file' : 25, 'num_siblings' : 20000, 'num_parents' : 20000, 'num_similar_files' : 500000, 'num_repository_mappings' : 5000000 }
+
+NAMESPACES = [ 'series', 'character', 'creator', 'meta' ]
+
+BENCHMARK_NAMES = [
+    'file_query_ids',
+    'autocomplete_predicates',
+    'media_results',
+    'similar_files',
+    'import_file',
+    'process_repository_content'
+]
+
+class ClientDBBenchmark( object ):
+    
+    def __init__( self, controller, db_dir, scale, repeats = 5, seed = 0, benchmark_names = None ):
+        
+        self._controller = controller
+        self._db_dir = db_dir
+        self._scale = scale
+        self._repeats = repeats
+        
+        if benchmark_names is None:
+            
+            benchmark_names = BENCHMARK_NAMES
+            
+        
+        self._benchmark_names = benchmark_names
+        
+        # a fixed seed means the same scale always makes the same db, so results compare across versions
+        self._random = random.Random( seed )
+        
+        self._db = None
+        
+        self._tags_by_popularity = []
+        self._hashes = []
+        self._similar_files_hashes = []
+        
+        self._tag_repo_service_key = HydrusData.GenerateKey()
+        
+        self._build_results = []
+        self._benchmark_results = []
+        
+    
+    def _AddResult( self, results, name, times, num_ops, notes = '' ):
+        
+        result = {}
+        
+        result[ 'name' ] = name
+        result[ 'repeats' ] = len( times )
+        result[ 'num_ops' ] = num_ops
+        result[ 'times' ] = times
+        result[ 'min' ] = min( times )
+        result[ 'median' ] = statistics.median( times )
+        result[ 'mean' ] = statistics.mean( times )
+        result[ 'max' ] = max( times )
+        result[ 'ops_per_second' ] = num_ops / result[ 'median' ] if result[ 'median' ] > 0 else None
+        result[ 'notes' ] = notes
+        
+        results.append( result )
+        
+        HydrusData.Print( '{}: median {:.4f}s over {} runs, {} ops'.format( name, result[ 'median' ], HydrusData.ToHumanInt( len( times ) ), HydrusData.ToHumanInt( num_ops ) ) )
+        
+    
+    def _Read( self, action, *args, **kwargs ):
+        
+        return self._db.Read( action, *args, **kwargs )
+        
+    
+    def _Time( self, func, *args, **kwargs ):
+        
+        time_started = HydrusData.GetNowPrecise()
+        
+        func( *args, **kwargs )
+        
+        return HydrusData.GetNowPrecise() - time_started
+        
+    
+    def _TimeBuild( self, name, num_ops, func, *args, **kwargs ):
+        
+        HydrusData.Print( 'building: {}'.format( name ) )
+        
+        time_took = self._Time( func, *args, **kwargs )
+        
+        self._AddResult( self._build_results, name, [ time_took ], num_ops )
+        
+    
+    def _TimeRepeated( self, name, num_ops, func, *args, **kwargs ):
+        
+        # the first run warms the sqlite page cache and any in-memory caches, so we report it separately
+        
+        first_time = self._Time( func, *args, **kwargs )
+        
+        times = [ self._Time( func, *args, **kwargs ) for i in range( self._repeats ) ]
+        
+        self._AddResult( self._benchmark_results, name, times, num_ops, notes = 'cold run took {:.6f}s'.format( first_time ) )
+        
+    
+    def _Write( self, action, *args, **kwargs ):
+        
+        return self._db.Write( action, True, *args, **kwargs )
+        
+    
+    def _GenerateFakeImportJob( self, hash, perceptual_hash = None ):
+        
+        ( size, mime, width, height, duration, num_frames, has_audio, num_words ) = ( self._random.randint( 10000, 5000000 ), HC.IMAGE_JPEG, 640, 480, None, None, False, None )
+        
+        file_import_options = FileImportOptions.FileImportOptions()
+        
+        fake_file_import_job = ClientImportFiles.FileImportJob( 'fake path', file_import_options )
+        
+        fake_file_import_job._pre_import_file_status = ClientImportFiles.FileImportStatus( CC.STATUS_UNKNOWN, hash )
+        fake_file_import_job._file_info = ( size, mime, width, height, duration, num_frames, has_audio, num_words )
+        fake_file_import_job._extra_hashes = ( self._GenerateHash( 16 ), self._GenerateHash( 20 ), self._GenerateHash( 64 ) )
+        fake_file_import_job._perceptual_hashes = [] if perceptual_hash is None else [ perceptual_hash ]
+        fake_file_import_job._file_import_options = file_import_options
+        
+        return fake_file_import_job
+        
+    
+    def _GenerateHash( self, num_bytes = 32 ):
+        
+        return bytes( self._random.getrandbits( 8 ) for i in range( num_bytes ) )
+        
+    
+    def _GenerateTag( self, i ):
+        
+        # a quarter namespaced, the rest unnamespaced, like a normal client
+        
+        if i % 4 == 0:
+            
+            return '{}:tag {}'.format( NAMESPACES[ ( i // 4 ) % len( NAMESPACES ) ], i )
+            
+        else:
+            
+            return 'tag {}'.format( i )
+            
+        
+    
+    def _GetFileSearchContext( self, predicates = None, tag_service_key = CC.DEFAULT_LOCAL_TAG_SERVICE_KEY ):
+        
+        location_context = ClientLocation.LocationContext.STATICCreateSimple( CC.LOCAL_FILE_SERVICE_KEY )
+        tag_search_context = ClientSearch.TagSearchContext( service_key = tag_service_key )
+        
+        return ClientSearch.FileSearchContext( location_context = location_context, tag_search_context = tag_search_context, predicates = predicates )
+        
+    
+    def _BuildDB( self ):
+        
+        self._db = ClientDB.DB( self._controller, self._db_dir, 'client' )
+        
+        self._controller.SetTestDB( self._db )
+        
+        services = self._Read( 'services' )
+        
+        services.append( ClientServices.GenerateService( self._tag_repo_service_key, HC.TAG_REPOSITORY, 'benchmark tag repo' ) )
+        
+        self._Write( 'update_services', services )
+        
+        num_files = self._scale[ 'num_files' ]
+        num_similar_files = min( self._scale[ 'num_similar_files' ], num_files )
+        
+        self._tags_by_popularity = [ self._GenerateTag( i ) for i in range( self._scale[ 'num_tags' ] ) ]
+        self._hashes = [ self._GenerateHash() for i in range( num_files ) ]
+        self._similar_files_hashes = self._hashes[ : num_similar_files ]
+        
+        self._TimeBuild( 'build:import_files', num_files, self._BuildFiles )
+        self._TimeBuild( 'build:mappings', num_files * self._scale[ 'num_mappings_per_file' ], self._BuildMappings )
+        self._TimeBuild( 'build:siblings_and_parents', self._scale[ 'num_siblings' ] + self._scale[ 'num_parents' ], self._BuildSiblingsAndParents )
+        self._TimeBuild( 'build:similar_files_tree', num_similar_files, self._Write, 'maintain_similar_files_tree' )
+        
+    
+    def _BuildFiles( self ):
+        
+        # similar files come in little clusters of near-identical perceptual hashes, so the duplicate search has something to find
+        
+        cluster_base = None
+        
+        for ( i, hash ) in enumerate( self._hashes ):
+            
+            perceptual_hash = None
+            
+            if i < len( self._similar_files_hashes ):
+                
+                if i % 4 == 0:
+                    
+                    cluster_base = self._random.getrandbits( 64 )
+                    
+                
+                flipped = cluster_base
+                
+                for j in range( self._random.randint( 0, 6 ) ):
+                    
+                    flipped ^= 1 << self._random.randint( 0, 63 )
+                    
+                
+                perceptual_hash = flipped.to_bytes( 8, 'big' )
+                
+            
+            self._Write( 'import_file', self._GenerateFakeImportJob( hash, perceptual_hash = perceptual_hash ) )
+            
+        
+    
+    def _BuildMappings( self ):
+        
+        # tag popularity is zipf-like, so a few tags are on most files and most tags are on a handful
+        
+        cum_weights = list( self._GetCumulativeTagWeights() )
+        
+        tags_to_hashes = collections.defaultdict( list )
+        num_pending = 0
+        
+        for hash in self._hashes:
+            
+            tags = set( self._random.choices( self._tags_by_popularity, cum_weights = cum_weights, k = self._scale[ 'num_mappings_per_file' ] ) )
+            
+            for tag in tags:
+                
+                tags_to_hashes[ tag ].append( hash )
+                
+            
+            num_pending += len( tags )
+            
+            if num_pending > 50000:
+                
+                self._WriteMappings( tags_to_hashes )
+                
+                tags_to_hashes = collections.defaultdict( list )
+                num_pending = 0
+                
+            
+        
+        self._WriteMappings( tags_to_hashes )
+        
+    
+    def _BuildSiblingsAndParents( self ):
+        
+        content_updates = []
+        
+        num_tags = len( self._tags_by_popularity )
+        
+        for i in range( self._scale[ 'num_siblings' ] ):
+            
+            bad_tag = 'sibling {}'.format( i )
+            good_tag = self._tags_by_popularity[ self._random.randrange( num_tags ) ]
+            
+            content_updates.append( HydrusData.ContentUpdate( HC.CONTENT_TYPE_TAG_SIBLINGS, HC.CONTENT_UPDATE_ADD, ( bad_tag, good_tag ) ) )
+            
+        
+        for i in range( self._scale[ 'num_parents' ] ):
+            
+            # children are less popular than their parents, which stops loops
+            
+            parent_index = self._random.randrange( num_tags - 1 )
+            child_index = self._random.randrange( parent_index + 1, num_tags )
+            
+            content_updates.append( HydrusData.ContentUpdate( HC.CONTENT_TYPE_TAG_PARENTS, HC.CONTENT_UPDATE_ADD, ( self._tags_by_popularity[ child_index ], self._tags_by_popularity[ parent_index ] ) ) )
+            
+        
+        self._Write( 'content_updates', { CC.DEFAULT_LOCAL_TAG_SERVICE_KEY : content_updates } )
+        
+        still_work_to_do = True
+        
+        while still_work_to_do:
+            
+            still_work_to_do = self._Write( 'sync_tag_display_maintenance', CC.DEFAULT_LOCAL_TAG_SERVICE_KEY, 30 )
+            
+        
+    
+    def _GetCumulativeTagWeights( self ):
+        
+        total = 0.0
+        
+        for i in range( len( self._tags_by_popularity ) ):
+            
+            total += 1.0 / ( i + 1 )
+            
+            yield total
+            
+        
+    
+    def _WriteMappings( self, tags_to_hashes ):
+        
+        content_updates = [ HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( tag, hashes ) ) for ( tag, hashes ) in tags_to_hashes.items() ]
+        
+        if len( content_updates ) > 0:
+            
+            self._Write( 'content_updates', { CC.DEFAULT_LOCAL_TAG_SERVICE_KEY : content_updates } )
+            
+        
+    
+    def _BenchmarkAutocompletePredicates( self ):
+        
+        file_search_context = self._GetFileSearchContext()
+        
+        for ( name, search_text ) in [ ( 'short_prefix', 't*' ), ( 'long_prefix', 'tag 1*' ), ( 'namespace', 'series:*' ), ( 'exact', self._tags_by_popularity[ 0 ] ) ]:
+            
+            self._TimeRepeated( 'autocomplete_predicates:{}'.format( name ), 1, self._Read, 'autocomplete_predicates', ClientTags.TAG_DISPLAY_ACTUAL, file_search_context, search_text = search_text )
+            
+        
+    
+    def _BenchmarkFileQueryIds( self ):
+        
+        common_tag = self._tags_by_popularity[ 0 ]
+        mid_tag = self._tags_by_popularity[ len( self._tags_by_popularity ) // 100 ]
+        rare_tag = self._tags_by_popularity[ -1 ]
+        
+        searches = []
+        
+        searches.append( ( 'common_tag', [ ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_TAG, common_tag ) ] ) )
+        searches.append( ( 'rare_tag', [ ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_TAG, rare_tag ) ] ) )
+        searches.append( ( 'two_tags', [ ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_TAG, common_tag ), ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_TAG, mid_tag ) ] ) )
+        searches.append( ( 'tag_and_negated_tag', [ ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_TAG, common_tag ), ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_TAG, mid_tag, False ) ] ) )
+        searches.append( ( 'namespace', [ ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_NAMESPACE, 'series' ) ] ) )
+        searches.append( ( 'wildcard', [ ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_WILDCARD, 'tag 1*' ) ] ) )
+        searches.append( ( 'everything', [ ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_SYSTEM_EVERYTHING ) ] ) )
+        searches.append( ( 'everything_limit', [ ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_SYSTEM_EVERYTHING ), ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_SYSTEM_LIMIT, 256 ) ] ) )
+        searches.append( ( 'num_tags', [ ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_SYSTEM_NUM_TAGS, ( None, '>', 5 ) ) ] ) )
+        
+        for ( name, predicates ) in searches:
+            
+            file_search_context = self._GetFileSearchContext( predicates = predicates )
+            
+            self._TimeRepeated( 'file_query_ids:{}'.format( name ), 1, self._Read, 'file_query_ids', file_search_context )
+            
+        
+    
+    def _BenchmarkImportFile( self ):
+        
+        # every run imports new files, so this one grows the db a little
+        
+        num_to_import = 100
+        
+        def do_it():
+            
+            for i in range( num_to_import ):
+                
+                self._Write( 'import_file', self._GenerateFakeImportJob( self._GenerateHash() ) )
+                
+            
+        
+        self._TimeRepeated( 'import_file', num_to_import, do_it )
+        
+    
+    def _BenchmarkMediaResults( self ):
+        
+        num_to_fetch = min( 256, len( self._hashes ) )
+        
+        hashes = self._random.sample( self._hashes, num_to_fetch )
+        
+        self._TimeRepeated( 'media_results:up_to_256_hashes', num_to_fetch, self._Read, 'media_results', hashes )
+        
+        file_search_context = self._GetFileSearchContext( predicates = [ ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_SYSTEM_EVERYTHING ) ] )
+        
+        hash_ids = self._Read( 'file_query_ids', file_search_context )[ : 4096 ]
+        
+        self._TimeRepeated( 'media_results_from_ids:up_to_4096_ids', len( hash_ids ), self._Read, 'media_results_from_ids', hash_ids )
+        
+    
+    def _BenchmarkProcessRepositoryContent( self ):
+        
+        # a fresh update each run, with new service ids, so each run does real work
+        
+        num_mappings = self._scale[ 'num_repository_mappings' ]
+        num_hashes = min( len( self._hashes ), max( 1, num_mappings // 20 ) )
+        num_tags = min( len( self._tags_by_popularity ), max( 1, num_mappings // 100 ) )
+        
+        service_id_offset = 0
+        
+        def do_it():
+            
+            nonlocal service_id_offset
+            
+            hashes = self._random.sample( self._hashes, num_hashes )
+            tags = self._random.sample( self._tags_by_popularity, num_tags )
+            
+            service_hash_ids_to_hashes = [ ( service_id_offset + i, hash ) for ( i, hash ) in enumerate( hashes ) ]
+            service_tag_ids_to_tags = [ ( service_id_offset + i, tag ) for ( i, tag ) in enumerate( tags ) ]
+            
+            service_hash_ids = [ service_hash_id for ( service_hash_id, hash ) in service_hash_ids_to_hashes ]
+            
+            new_mappings = []
+            num_rows = 0
+            
+            for ( service_tag_id, tag ) in service_tag_ids_to_tags:
+                
+                num_for_this_tag = min( num_hashes, max( 1, ( num_mappings - num_rows ) // max( 1, num_tags - len( new_mappings ) ) ) )
+                
+                new_mappings.append( ( service_tag_id, self._random.sample( service_hash_ids, num_for_this_tag ) ) )
+                
+                num_rows += num_for_this_tag
+                
+            
+            service_id_offset += max( num_hashes, num_tags )
+            
+            job_key = ClientThreading.JobKey()
+            
+            definition_iterator_dict = { 'service_hash_ids_to_hashes' : iter( service_hash_ids_to_hashes ), 'service_tag_ids_to_tags' : iter( service_tag_ids_to_tags ) }
+            
+            while len( definition_iterator_dict ) > 0:
+                
+                self._Write( 'process_repository_definitions', self._tag_repo_service_key, HydrusData.GenerateKey(), definition_iterator_dict, ( HC.CONTENT_TYPE_DEFINITIONS, ), job_key, 30 )
+                
+            
+            content_hash = HydrusData.GenerateKey()
+            content_iterator_dict = { 'new_mappings' : HydrusData.SmoothOutMappingIterator( new_mappings, 50 ) }
+            
+            while len( content_iterator_dict ) > 0:
+                
+                self._Write( 'process_repository_content', self._tag_repo_service_key, content_hash, content_iterator_dict, ( HC.CONTENT_TYPE_MAPPINGS, ), job_key, 30 )
+                
+            
+        
+        self._TimeRepeated( 'process_repository_content', num_mappings, do_it )
+        
+    
+    def _BenchmarkSimilarFiles( self ):
+        
+        if len( self._similar_files_hashes ) == 0:
+            
+            return
+            
+        
+        hashes = tuple( self._random.sample( self._similar_files_hashes, min( 16, len( self._similar_files_hashes ) ) ) )
+        
+        for max_hamming in ( 4, 8 ):
+            
+            file_search_context = self._GetFileSearchContext( predicates = [ ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_SYSTEM_SIMILAR_TO, ( hashes, max_hamming ) ) ] )
+            
+            self._TimeRepeated( 'similar_files:similar_to_16_files_distance_{}'.format( max_hamming ), len( hashes ), self._Read, 'file_query_ids', file_search_context )
+            
+        
+        # the potential duplicates search only does real work once per distance, so it is timed once
+        
+        time_took = self._Time( self._Write, 'maintain_similar_files_search_for_potential_duplicates', 4 )
+        
+        self._AddResult( self._benchmark_results, 'similar_files:search_for_potential_duplicates_distance_4', [ time_took ], len( self._similar_files_hashes ) )
+        
+    
+    def GetResults( self ):
+        
+        results = {}
+        
+        results[ 'results_version' ] = BENCHMARK_RESULTS_VERSION
+        results[ 'hydrus_version' ] = HC.SOFTWARE_VERSION
+        results[ 'timestamp' ] = HydrusData.GetNow()
+        results[ 'platform' ] = platform.platform()
+        results[ 'python_version' ] = platform.python_version()
+        results[ 'sqlite_version' ] = sqlite3.sqlite_version
+        results[ 'scale' ] = dict( self._scale )
+        results[ 'repeats' ] = self._repeats
+        results[ 'build' ] = self._build_results
+        results[ 'benchmarks' ] = self._benchmark_results
+        
+        return results
+        
+    
+    def Run( self ):
+        
+        self._BuildDB()
+        
+        try:
+            
+            # the read benchmarks come first, since the write ones change the db
+            
+            name_to_call = {}
+            
+            name_to_call[ 'file_query_ids' ] = self._BenchmarkFileQueryIds
+            name_to_call[ 'autocomplete_predicates' ] = self._BenchmarkAutocompletePredicates
+            name_to_call[ 'media_results' ] = self._BenchmarkMediaResults
+            name_to_call[ 'similar_files' ] = self._BenchmarkSimilarFiles
+            name_to_call[ 'import_file' ] = self._BenchmarkImportFile
+            name_to_call[ 'process_repository_content' ] = self._BenchmarkProcessRepositoryContent
+            
+            for name in BENCHMARK_NAMES:
+                
+                if name in self._benchmark_names:
+                    
+                    HydrusData.Print( 'running: {}'.format( name ) )
+                    
+                    name_to_call[ name ]()
+                    
+        finally:
+            
+            self._db.Shutdown()
+            
+            while not self._db.LoopIsFinished():
+                
+                time.sleep( 0.1 )
+                
+            
+            self._controller.ClearTestDB()
+            
+        
+        return self.GetResults()
+        
+    
+def CompareResults( old_results, new_results ):
+    
+    # prints how each benchmark's median changed against an earlier run
+    
+    names_to_old_medians = { result[ 'name' ] : result[ 'median' ] for result in old_results[ 'benchmarks' ] }
+    
+    if old_results[ 'scale' ] != new_results[ 'scale' ]:
+        
+        HydrusData.Print( 'Warning: the two runs were at different scales, so this comparison may not mean much!' )
+        
+    
+    HydrusData.Print( 'Comparing against version {}:'.format( old_results[ 'hydrus_version' ] ) )
+    
+    for result in new_results[ 'benchmarks' ]:
+        
+        name = result[ 'name' ]
+        
+        if name not in names_to_old_medians or names_to_old_medians[ name ] == 0:
+            
+            continue
+            
+        
+        ratio = result[ 'median' ] / names_to_old_medians[ name ]
+        
+        HydrusData.Print( '{}: {:.4f}s -> {:.4f}s ({:.2f}x)'.format( name, names_to_old_medians[ name ], result[ 'median' ], ratio ) )
+        
+    
+def LoadResults( path ):
+    
+    with open( path, 'r', encoding = 'utf-8' ) as f:
+        
+        return json.load( f )
+        
+    
+def WriteResults( results, path ):
+    
+    if path == '-':
+        
+        json.dump( results, sys.stdout, indent = 4 )
+        
+        sys.stdout.write( os.linesep )
+        
+    else:
+        
+        with open( path, 'w', encoding = 'utf-8' ) as f:
+            
+            json.dump( results, f, indent = 4 )
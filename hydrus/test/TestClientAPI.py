@@ -13,6 +13,7 @@ from twisted.internet import reactor
 
 from hydrus.core import HydrusConstants as HC
 from hydrus.core import HydrusData
+from hydrus.core import HydrusDBMetrics
 from hydrus.core import HydrusExceptions
 from hydrus.core import HydrusGlobals as HG
 from hydrus.core import HydrusTags
@@ -1810,6 +1811,33 @@ class TestClientAPI( unittest.TestCase ):
         
         self.assertEqual( boned_stats, dict( expected_data ) )
         
+        #
+        
+        db_job_metrics = HydrusDBMetrics.DBMetrics()
+        
+        db_job_metrics.ReportJob( 'read', 'media_results', 0.001, 0.02, 0, 1, False )
+        db_job_metrics.ReportCommit( 0.05 )
+        
+        HG.test_controller.SetDBJobMetrics( db_job_metrics )
+        
+        path = '/manage_database/db_job_metrics'
+        
+        connection.request( 'GET', path, headers = headers )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        text = str( data, 'utf-8' )
+        
+        self.assertEqual( response.status, 200 )
+        
+        d = json.loads( text )
+        
+        self.assertEqual( d[ 'db_job_metrics' ], db_job_metrics.GetSnapshot() )
+        
+        HG.test_controller.SetDBJobMetrics( HydrusDBMetrics.DBMetrics() )
+        
     
     def _test_manage_pages( self, connection, set_up_permissions ):
         
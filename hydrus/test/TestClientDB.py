@@ -1,4 +1,5 @@
 import os
+import sqlite3
 import time
 import unittest
 
@@ -6,14 +7,18 @@ from mock import patch
 
 from hydrus.core import HydrusConstants as HC
 from hydrus.core import HydrusData
+from hydrus.core import HydrusDB
 from hydrus.core import HydrusGlobals as HG
+from hydrus.core import HydrusPaths
 from hydrus.core import HydrusSerialisable
 from hydrus.core.networking import HydrusNetwork
 
 from hydrus.client import ClientConstants as CC
 from hydrus.client import ClientDefaults
 from hydrus.client import ClientExporting
+from hydrus.client import ClientFiles
 from hydrus.client import ClientLocation
+from hydrus.client import ClientManagers
 from hydrus.client import ClientSearch
 from hydrus.client import ClientServices
 from hydrus.client.db import ClientDB
@@ -23,6 +28,8 @@ from hydrus.client.gui.pages import ClientGUISession
 from hydrus.client.importing import ClientImportLocal
 from hydrus.client.importing import ClientImportFiles
 from hydrus.client.importing.options import FileImportOptions
+from hydrus.client.media import ClientMedia
+from hydrus.client.media import ClientMediaManagers
 from hydrus.client.metadata import ClientTags
 
 from hydrus.test import TestController
@@ -243,6 +250,206 @@ class TestClientDB( unittest.TestCase ):
         self.assertEqual( set( result ), preds )
         
     
+    def test_backup( self ):
+        
+        TestClientDB._clear_db()
+        
+        def do_backup( path ):
+            
+            self._write( 'backup', path )
+            
+            while TestClientDB._db._online_backup_running:
+                
+                time.sleep( 0.05 )
+                
+            
+        
+        backup_path = os.path.join( TestController.DB_DIR, 'test_backup' )
+        
+        do_backup( backup_path )
+        
+        manifest = HydrusDB.ReadBackupManifest( backup_path )
+        
+        self.assertIn( 'files_timestamp', manifest )
+        
+        for filename in TestClientDB._db._db_filenames.values():
+            
+            dest = os.path.join( backup_path, filename )
+            
+            self.assertEqual( manifest[ 'db_change_tokens' ][ filename ], HydrusDB.GetDBFileChangeToken( os.path.join( TestController.DB_DIR, filename ) ) )
+            
+            db = sqlite3.connect( dest )
+            
+            self.assertEqual( db.execute( 'PRAGMA integrity_check;' ).fetchone(), ( 'ok', ) )
+            
+            db.close()
+            
+        
+        ( version, ) = sqlite3.connect( os.path.join( backup_path, 'client.db' ) ).execute( 'SELECT version FROM version;' ).fetchone()
+        
+        self.assertEqual( version, HC.SOFTWARE_VERSION )
+        
+        # nothing has touched the mappings, so it is skipped
+        
+        mappings_dest = os.path.join( backup_path, 'client.mappings.db' )
+        
+        mappings_mtime = os.path.getmtime( mappings_dest )
+        
+        # a new file goes in with the incremental file mirror
+        
+        HG.test_controller.SetRead( 'hash_status', ClientImportFiles.FileImportStatus.STATICGetUnknownStatus() )
+        
+        file_import_options = HG.client_controller.new_options.GetDefaultFileImportOptions( 'loud' )
+        
+        file_import_job = ClientImportFiles.FileImportJob( os.path.join( HC.STATIC_DIR, 'testing', 'muh_jpg.jpg' ), file_import_options )
+        
+        file_import_job.GeneratePreImportHashAndStatus()
+        
+        file_import_job.GenerateInfo()
+        
+        self._write( 'import_file', file_import_job )
+        
+        hash_encoded = file_import_job.GetHash().hex()
+        
+        file_relative_path = os.path.join( 'f' + hash_encoded[:2], hash_encoded + '.jpg' )
+        
+        HG.test_controller.client_files_manager.AddFile( file_import_job.GetHash(), HC.IMAGE_JPEG, os.path.join( HC.STATIC_DIR, 'testing', 'muh_jpg.jpg' ) )
+        
+        do_backup( backup_path )
+        
+        self.assertEqual( os.path.getmtime( mappings_dest ), mappings_mtime )
+        
+        self.assertTrue( os.path.exists( os.path.join( backup_path, 'client_files', file_relative_path ) ) )
+        
+        HydrusPaths.DeletePath( backup_path )
+        
+    
+    def test_client_files_resharding( self ):
+        
+        prefixes_to_locations = self._read( 'client_files_locations' )
+        
+        self.assertEqual( len( prefixes_to_locations ), 512 )
+        
+        location = prefixes_to_locations[ 'f00' ]
+        
+        deep_prefixes_to_locations = { 'f00' + c : location for c in '0123456789abcdef' }
+        
+        self._write( 'reshard_client_files', [ 'f00' ], deep_prefixes_to_locations )
+        
+        prefixes_to_locations = self._read( 'client_files_locations' )
+        
+        self.assertEqual( len( prefixes_to_locations ), 527 )
+        self.assertNotIn( 'f00', prefixes_to_locations )
+        
+        for prefix in deep_prefixes_to_locations:
+            
+            self.assertEqual( prefixes_to_locations[ prefix ], location )
+            
+        
+        self.assertEqual( ClientFiles.GetClientFilesPrefix( 'f', '00ab' + '0' * 60, prefixes_to_locations ), 'f00a' )
+        self.assertEqual( ClientFiles.GetClientFilesPrefix( 'f', '01ab' + '0' * 60, prefixes_to_locations ), 'f01' )
+        self.assertEqual( ClientFiles.GetClientFilesPrefix( 't', '00ab' + '0' * 60, prefixes_to_locations ), 't00' )
+        
+        # losing one deep prefix is repaired at that depth
+        
+        self._write( 'reshard_client_files', [ 'f000' ], {} )
+        
+        with patch.object( ClientDB.DB, '_DisplayCatastrophicError' ) as display_catastrophic_error:
+            
+            prefixes_to_locations = self._read( 'client_files_locations' )
+            
+            self.assertEqual( display_catastrophic_error.call_count, 1 )
+            
+            self.assertEqual( len( prefixes_to_locations ), 527 )
+            self.assertIn( 'f000', prefixes_to_locations )
+            self.assertNotIn( 'f00', prefixes_to_locations )
+            
+            # and it stays repaired, so the error does not come up again
+            
+            self.assertEqual( self._read( 'client_files_locations' ), prefixes_to_locations )
+            
+            self.assertEqual( display_catastrophic_error.call_count, 1 )
+            
+        
+        location = prefixes_to_locations[ 'f000' ]
+        
+        deep_prefixes_to_locations[ 'f000' ] = location
+        
+        self._write( 'reshard_client_files', list( deep_prefixes_to_locations.keys() ), { 'f00' : location } )
+        
+        prefixes_to_locations = self._read( 'client_files_locations' )
+        
+        self.assertEqual( len( prefixes_to_locations ), 512 )
+        self.assertEqual( prefixes_to_locations[ 'f00' ], location )
+        
+    
+    def test_db_job_metrics( self ):
+        
+        TestClientDB._db.ClearJobMetrics()
+        
+        self._write( 'serialisable_simple', 'db_job_metrics_test', 'hello' )
+        
+        for i in range( 3 ):
+            
+            self._read( 'serialisable_simple', 'db_job_metrics_test' )
+            
+        
+        # results are handed back before the job's metrics are reported
+        while TestClientDB._db.CurrentlyDoingJob():
+            
+            time.sleep( 0.01 )
+            
+        
+        snapshot = TestClientDB._db.GetJobMetrics()
+        
+        job_keys_to_job_dicts = { ( job_dict[ 'job_type' ], job_dict[ 'action' ] ) : job_dict for job_dict in snapshot[ 'jobs' ] }
+        
+        read_dict = job_keys_to_job_dicts[ ( 'read', 'serialisable_simple' ) ]
+        
+        self.assertEqual( read_dict[ 'num_jobs' ], 3 )
+        self.assertEqual( read_dict[ 'num_errors' ], 0 )
+        self.assertEqual( read_dict[ 'queue_wait' ][ 'count' ], 3 )
+        self.assertEqual( read_dict[ 'rows_changed' ][ 'total' ], 0 )
+        self.assertEqual( sum( ( bucket_count for ( upper_bound, bucket_count ) in read_dict[ 'execution' ][ 'buckets' ] ) ), 3 )
+        
+        write_dict = job_keys_to_job_dicts[ ( 'write', 'serialisable_simple' ) ]
+        
+        self.assertEqual( write_dict[ 'num_jobs' ], 1 )
+        self.assertGreaterEqual( write_dict[ 'rows_changed' ][ 'total' ], 1 )
+        
+        TestClientDB._db.ClearJobMetrics()
+        
+        self.assertEqual( TestClientDB._db.GetJobMetrics()[ 'jobs' ], [] )
+        
+    
+    def test_export_folder_change_tracker( self ):
+        
+        change_tracker = ClientExporting.ExportFolderChangeTracker( HG.test_controller )
+        
+        ( run_generation, changed_hashes ) = change_tracker.GetChangedHashes( 'test' )
+        
+        change_tracker.NotifyRunDone( 'test', run_generation, True )
+        
+        hash = HydrusData.GenerateKey()
+        
+        service_keys_to_content_updates = { CC.DEFAULT_LOCAL_TAG_SERVICE_KEY : [ HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( 'export test', ( hash, ) ) ) ] }
+        
+        # the test controller drops pubsubs, so we deliver whatever the db publishes straight away
+        
+        with patch.object( HG.test_controller, 'pub', HG.test_controller.pubimmediate ):
+            
+            HG.test_controller.Write( 'content_updates', True, service_keys_to_content_updates )
+            
+            # jobs run in order, so once this is back, the write's pubsubs have gone out
+            
+            self._read( 'services' )
+            
+        
+        ( run_generation, changed_hashes ) = change_tracker.GetChangedHashes( 'test' )
+        
+        self.assertEqual( changed_hashes, { hash } )
+        
+    
     def test_export_folders( self ):
         
         tag_search_context = ClientSearch.TagSearchContext( service_key = HydrusData.GenerateKey() )
@@ -259,6 +466,28 @@ class TestClientDB( unittest.TestCase ):
         
         self.assertEqual( result.GetName(), export_folder.GetName() )
         
+        #
+        
+        settings_hash = HydrusData.GenerateKey()
+        
+        self.assertEqual( self._read( 'export_folder_manifest', 'test path', settings_hash ), None )
+        
+        self._write( 'export_folder_manifest', 'test path', settings_hash, { 1 : 'a.jpg', 2 : 'b.jpg', 3 : 'c.jpg' }, set() )
+        
+        self.assertEqual( self._read( 'export_folder_manifest', 'test path', settings_hash ), { 1 : 'a.jpg', 2 : 'b.jpg', 3 : 'c.jpg' } )
+        
+        self._write( 'export_folder_manifest', 'test path', settings_hash, { 2 : 'd.jpg' }, { 3 } )
+        
+        self.assertEqual( self._read( 'export_folder_manifest', 'test path', settings_hash ), { 1 : 'a.jpg', 2 : 'd.jpg' } )
+        
+        # changing the path or phrase means the manifest is no good any more
+        
+        self.assertEqual( self._read( 'export_folder_manifest', 'test path', HydrusData.GenerateKey() ), None )
+        
+        self._write( 'delete_serialisable_named', HydrusSerialisable.SERIALISABLE_TYPE_EXPORT_FOLDER, 'test path' )
+        
+        self.assertEqual( self._read( 'export_folder_manifest', 'test path', settings_hash ), None )
+        
     
     def test_file_query_ids( self ):
         
@@ -285,7 +514,7 @@ class TestClientDB( unittest.TestCase ):
                 
             
         
-        def run_system_predicate_tests( tests ):
+        def run_system_predicate_tests( tests, tag_service_key = CC.COMBINED_TAG_SERVICE_KEY ):
             
             for ( predicate_type, info, result ) in tests:
                 
@@ -293,7 +522,9 @@ class TestClientDB( unittest.TestCase ):
                 
                 location_context = ClientLocation.LocationContext.STATICCreateSimple( CC.LOCAL_FILE_SERVICE_KEY )
                 
-                search_context = ClientSearch.FileSearchContext( location_context = location_context, predicates = predicates )
+                tag_search_context = ClientSearch.TagSearchContext( service_key = tag_service_key )
+                
+                search_context = ClientSearch.FileSearchContext( location_context = location_context, tag_search_context = tag_search_context, predicates = predicates )
                 
                 file_query_ids = self._read( 'file_query_ids', search_context )
                 
@@ -564,6 +795,20 @@ class TestClientDB( unittest.TestCase ):
         
         run_system_predicate_tests( tests )
         
+        # a single tag service uses the per-file tag counts
+        
+        tests = []
+        
+        tests.append( ( ClientSearch.PREDICATE_TYPE_SYSTEM_NUM_TAGS, ( None, '<', 2 ), 1 ) )
+        tests.append( ( ClientSearch.PREDICATE_TYPE_SYSTEM_NUM_TAGS, ( None, '<', 1 ), 0 ) )
+        tests.append( ( ClientSearch.PREDICATE_TYPE_SYSTEM_NUM_TAGS, ( None, '=', 0 ), 0 ) )
+        tests.append( ( ClientSearch.PREDICATE_TYPE_SYSTEM_NUM_TAGS, ( None, '=', 1 ), 1 ) )
+        tests.append( ( ClientSearch.PREDICATE_TYPE_SYSTEM_NUM_TAGS, ( None, CC.UNICODE_ALMOST_EQUAL_TO, 1 ), 1 ) )
+        tests.append( ( ClientSearch.PREDICATE_TYPE_SYSTEM_NUM_TAGS, ( None, '>', 0 ), 1 ) )
+        tests.append( ( ClientSearch.PREDICATE_TYPE_SYSTEM_NUM_TAGS, ( None, '>', 1 ), 0 ) )
+        
+        run_system_predicate_tests( tests, tag_service_key = CC.DEFAULT_LOCAL_TAG_SERVICE_KEY )
+        
         #
         
         tests = []
@@ -747,6 +992,227 @@ class TestClientDB( unittest.TestCase ):
         run_system_predicate_tests( tests )
         
     
+    def test_file_query_ids_planner( self ):
+        
+        # the planner runs the search steps most selective first. the result must be the same as running them in the fixed order they are made in
+        
+        TestClientDB._clear_db()
+        
+        num_files = 120
+        
+        hashes = [ HydrusData.GenerateKey() for i in range( num_files ) ]
+        
+        media_results = self._read( 'media_results', hashes )
+        
+        hashes_to_hash_ids = { media_result.GetHash() : media_result.GetHashId() for media_result in media_results }
+        
+        file_content_updates = []
+        tag_content_updates = []
+        
+        for ( i, hash ) in enumerate( hashes ):
+            
+            file_info_manager = ClientMediaManagers.FileInfoManager( hashes_to_hash_ids[ hash ], hash, size = 1000 + i, mime = HC.IMAGE_JPEG, width = 640, height = 480 )
+            
+            file_content_updates.append( HydrusData.ContentUpdate( HC.CONTENT_TYPE_FILES, HC.CONTENT_UPDATE_ADD, ( file_info_manager, 1500000000 + i ) ) )
+            
+        
+        file_content_updates.append( HydrusData.ContentUpdate( HC.CONTENT_TYPE_FILES, HC.CONTENT_UPDATE_INBOX, hashes[ : : 3 ] ) )
+        
+        # tags of very different sizes, so the planner has something to reorder
+        
+        tag_content_updates.append( HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( 'common', hashes[ : : 2 ] ) ) )
+        tag_content_updates.append( HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( 'uncommon', hashes[ : : 5 ] ) ) )
+        tag_content_updates.append( HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( 'rare', hashes[ : 40 : 10 ] ) ) )
+        tag_content_updates.append( HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( 'series:long series name', hashes[ : : 4 ] ) ) )
+        
+        self._write( 'content_updates', { CC.LOCAL_FILE_SERVICE_KEY : file_content_updates, CC.DEFAULT_LOCAL_TAG_SERVICE_KEY : tag_content_updates } )
+        
+        location_context = ClientLocation.LocationContext.STATICCreateSimple( CC.LOCAL_FILE_SERVICE_KEY )
+        
+        def do_search( predicates ):
+            
+            file_search_context = ClientSearch.FileSearchContext( location_context = location_context, predicates = predicates )
+            
+            return set( self._read( 'file_query_ids', file_search_context, apply_implicit_limit = False ) )
+            
+        
+        common = ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_TAG, 'common' )
+        uncommon = ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_TAG, 'uncommon' )
+        rare = ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_TAG, 'rare' )
+        series = ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_TAG, 'series:long series name' )
+        namespace = ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_NAMESPACE, 'series' )
+        wildcard = ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_WILDCARD, 'unc*' )
+        inbox = ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_SYSTEM_INBOX )
+        system_hash = ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_SYSTEM_HASH, ( tuple( hashes[ : 60 ] ), 'sha256' ) )
+        
+        tests = []
+        
+        tests.append( [ common, uncommon ] )
+        tests.append( [ common, rare ] )
+        tests.append( [ series, common, uncommon ] )
+        tests.append( [ common, inbox ] )
+        tests.append( [ system_hash, common, inbox ] )
+        tests.append( [ system_hash, namespace, uncommon ] )
+        tests.append( [ wildcard, common, inbox ] )
+        tests.append( [ rare, uncommon, common, series ] )
+        
+        for predicates in tests:
+            
+            # each predicate on its own does not go through the planner, so this is what any order has to give
+            
+            expected_result = set.intersection( *[ do_search( [ predicate ] ) for predicate in predicates ] )
+            
+            self.assertGreater( len( expected_result ), 0 )
+            
+            result = do_search( predicates )
+            
+            with patch.object( ClientDB.DB, '_OrderSearchSteps', lambda db, search_steps: search_steps ):
+                
+                fixed_order_result = do_search( predicates )
+                
+            
+            self.assertEqual( result, expected_result )
+            self.assertEqual( fixed_order_result, expected_result )
+            
+        
+    
+    def test_file_query_ids_top_k( self ):
+        
+        # a limited search on a simple sort walks the files in sort order a batch at a time, and it has to give the same result as the full search and clip
+        
+        TestClientDB._clear_db()
+        
+        num_files = 1200
+        
+        hashes = [ HydrusData.GenerateKey() for i in range( num_files ) ]
+        
+        media_results = self._read( 'media_results', hashes )
+        
+        hashes_to_hash_ids = { media_result.GetHash() : media_result.GetHashId() for media_result in media_results }
+        
+        png_hash_ids = set()
+        
+        content_updates = []
+        
+        for ( i, hash ) in enumerate( hashes ):
+            
+            hash_id = hashes_to_hash_ids[ hash ]
+            
+            # one in ten is a png, and every sort column is monotonic in i, some up and some down, so there are no ties and the pngs are spread evenly in every sort order
+            
+            if i % 10 == 0:
+                
+                mime = HC.IMAGE_PNG
+                
+                png_hash_ids.add( hash_id )
+                
+            else:
+                
+                mime = HC.IMAGE_JPEG
+                
+            
+            file_info_manager = ClientMediaManagers.FileInfoManager( hash_id, hash, size = 1000 + i, mime = mime, width = 5000 - i, height = 100 + i, duration = 100000 - ( i * 10 ), num_frames = 10 + i )
+            
+            timestamp = 1500000000 + ( ( i * 7 ) % num_files )
+            
+            content_updates.append( HydrusData.ContentUpdate( HC.CONTENT_TYPE_FILES, HC.CONTENT_UPDATE_ADD, ( file_info_manager, timestamp ) ) )
+            
+        
+        self._write( 'content_updates', { CC.LOCAL_FILE_SERVICE_KEY : content_updates } )
+        
+        location_context = ClientLocation.LocationContext.STATICCreateSimple( CC.LOCAL_FILE_SERVICE_KEY )
+        
+        png_predicate = ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_SYSTEM_MIME, ( HC.IMAGE_PNG, ) )
+        
+        def do_search( predicates, limit, sort_by ):
+            
+            if limit is not None:
+                
+                predicates = predicates + [ ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_SYSTEM_LIMIT, limit ) ]
+                
+            
+            file_search_context = ClientSearch.FileSearchContext( location_context = location_context, predicates = predicates )
+            
+            return self._read( 'file_query_ids', file_search_context, apply_implicit_limit = False, sort_by = sort_by )
+            
+        
+        def do_report_search( predicates, limit, sort_by ):
+            
+            # db report mode says whether the top-k search was used and how it went
+            
+            HG.db_report_mode = True
+            
+            try:
+                
+                with patch.object( HydrusData, 'ShowText' ) as show_text:
+                    
+                    result = do_search( predicates, limit, sort_by )
+                    
+                
+            finally:
+                
+                HG.db_report_mode = False
+                
+            
+            top_k_reports = [ call_args[0][0] for call_args in show_text.call_args_list if isinstance( call_args[0][0], str ) and call_args[0][0].startswith( 'top-k search' ) ]
+            
+            return ( result, top_k_reports )
+            
+        
+        # domain is 1200, so the top-k search tests at most 300 files in batches of 256 and then 512
+        # 10 from everything is the first batch, 28 pngs needs a second batch at an offset, and there are only 30 pngs in 300 files so 40 pngs gives up and does the normal search
+        
+        tests = []
+        
+        tests.append( ( [], 10, 'found', 1 ) )
+        tests.append( ( [ png_predicate ], 20, 'found', 1 ) )
+        tests.append( ( [ png_predicate ], 28, 'found', 2 ) )
+        tests.append( ( [ png_predicate ], 40, 'gave up', 2 ) )
+        
+        sort_datas = [ CC.SORT_FILES_BY_FILESIZE, CC.SORT_FILES_BY_DURATION, CC.SORT_FILES_BY_WIDTH, CC.SORT_FILES_BY_HEIGHT, CC.SORT_FILES_BY_NUM_FRAMES, CC.SORT_FILES_BY_IMPORT_TIME ]
+        
+        for sort_data in sort_datas:
+            
+            for sort_order in ( CC.SORT_ASC, CC.SORT_DESC ):
+                
+                sort_by = ClientMedia.MediaSort( ( 'system', sort_data ), sort_order )
+                
+                for ( predicates, limit, expected_report, expected_num_batches ) in tests:
+                    
+                    full_result = do_search( predicates, None, sort_by )
+                    
+                    ( result, top_k_reports ) = do_report_search( predicates, limit, sort_by )
+                    
+                    self.assertEqual( result, full_result[ : limit ] )
+                    
+                    self.assertEqual( len( top_k_reports ), 1 )
+                    
+                    self.assertTrue( top_k_reports[0].startswith( 'top-k search {}'.format( expected_report ) ) )
+                    self.assertTrue( top_k_reports[0].endswith( 'in {} batches'.format( expected_num_batches ) ) )
+                    
+                
+            
+        
+        # random sort is sampled in sqlite, so just check we got the right number of distinct matching files, over more than one batch
+        
+        sort_by = ClientMedia.MediaSort( ( 'system', CC.SORT_FILES_BY_RANDOM ), CC.SORT_ASC )
+        
+        for ( predicates, limit, expected_report, expected_num_batches ) in tests:
+            
+            ( result, top_k_reports ) = do_report_search( predicates, limit, sort_by )
+            
+            self.assertEqual( len( result ), limit )
+            self.assertEqual( len( set( result ) ), limit )
+            
+            if len( predicates ) > 0:
+                
+                self.assertTrue( set( result ).issubset( png_hash_ids ) )
+                
+            
+            self.assertEqual( len( top_k_reports ), 1 )
+            
+        
+    
     def test_file_system_predicates( self ):
         
         TestClientDB._clear_db()
@@ -1482,6 +1948,83 @@ class TestClientDB( unittest.TestCase ):
         self.assertEqual( written_hash, hash )
         
     
+    def test_known_content_filter( self ):
+        
+        TestClientDB._clear_db()
+        
+        original_known_content_filter_manager = HG.test_controller.known_content_filter_manager
+        
+        known_content_filter_manager = ClientManagers.KnownContentFilterManager( HG.test_controller )
+        
+        HG.test_controller.known_content_filter_manager = known_content_filter_manager
+        
+        try:
+            
+            hash = b'\xadm5\x99\xa6\xc4\x89\xa5u\xeb\x19\xc0&\xfa\xce\x97\xa9\xcdey\xe7G(\xb0\xce\x94\xa6\x01\xd22\xf3\xc3'
+            
+            path = os.path.join( HC.STATIC_DIR, 'hydrus.png' )
+            
+            old_url = 'https://site.com/post/111111'
+            new_url = 'https://site.com/post/222222'
+            
+            # before a build, we know nothing, so nothing is definitely new
+            
+            self.assertFalse( known_content_filter_manager.IsReady() )
+            self.assertFalse( known_content_filter_manager.URLIsDefinitelyNew( old_url ) )
+            self.assertFalse( known_content_filter_manager.HashIsDefinitelyNew( hash ) )
+            
+            file_import_options = HG.client_controller.new_options.GetDefaultFileImportOptions( 'loud' )
+            
+            file_import_job = ClientImportFiles.FileImportJob( path, file_import_options )
+            
+            file_import_job.GeneratePreImportHashAndStatus()
+            
+            file_import_job.GenerateInfo()
+            
+            self._write( 'import_file', file_import_job )
+            
+            self._write( 'content_updates', { CC.COMBINED_LOCAL_FILE_SERVICE_KEY : [ HydrusData.ContentUpdate( HC.CONTENT_TYPE_URLS, HC.CONTENT_UPDATE_ADD, ( [ old_url ], [ hash ] ) ) ] } )
+            
+            # built from the db
+            
+            known_content_filter_manager.Rebuild()
+            
+            self.assertTrue( known_content_filter_manager.IsReady() )
+            
+            self.assertFalse( known_content_filter_manager.URLIsDefinitelyNew( old_url ) )
+            self.assertFalse( known_content_filter_manager.URLIsDefinitelyNew( old_url.replace( 'https://', 'http://' ) ) )
+            self.assertFalse( known_content_filter_manager.HashIsDefinitelyNew( hash ) )
+            
+            self.assertTrue( known_content_filter_manager.URLIsDefinitelyNew( new_url ) )
+            
+            num_definitely_new = len( [ 1 for i in range( 1000 ) if known_content_filter_manager.HashIsDefinitelyNew( os.urandom( 32 ) ) ] )
+            
+            self.assertGreater( num_definitely_new, 950 )
+            
+            # kept up to date by the db as it writes
+            
+            self._write( 'content_updates', { CC.COMBINED_LOCAL_FILE_SERVICE_KEY : [ HydrusData.ContentUpdate( HC.CONTENT_TYPE_URLS, HC.CONTENT_UPDATE_ADD, ( [ new_url ], [ hash ] ) ) ] } )
+            
+            self.assertFalse( known_content_filter_manager.URLIsDefinitelyNew( new_url ) )
+            
+            deleted_hash = os.urandom( 32 )
+            
+            self.assertTrue( known_content_filter_manager.HashIsDefinitelyNew( deleted_hash ) )
+            
+            self._write( 'content_updates', { CC.COMBINED_LOCAL_FILE_SERVICE_KEY : [ HydrusData.ContentUpdate( HC.CONTENT_TYPE_FILES, HC.CONTENT_UPDATE_DELETE, ( deleted_hash, ) ) ] } )
+            
+            self.assertFalse( known_content_filter_manager.HashIsDefinitelyNew( deleted_hash ) )
+            
+            # and whatever it says is definitely new, the db agrees is unknown
+            
+            self.assertEqual( self._read( 'url_statuses', 'https://site.com/post/333333' ), [] )
+            
+        finally:
+            
+            HG.test_controller.known_content_filter_manager = original_known_content_filter_manager
+            
+        
+    
     def test_media_results( self ):
         
         TestClientDB._clear_db()
@@ -1938,3 +2481,110 @@ class TestClientDB( unittest.TestCase ):
             
         
     
+    def test_url_and_hash_statuses( self ):
+        
+        TestClientDB._clear_db()
+        
+        hash = b'\xadm5\x99\xa6\xc4\x89\xa5u\xeb\x19\xc0&\xfa\xce\x97\xa9\xcdey\xe7G(\xb0\xce\x94\xa6\x01\xd22\xf3\xc3'
+        
+        md5 = bytes.fromhex( 'fdadb2cae78f2dfeb629449cd005f2a2' )
+        
+        path = os.path.join( HC.STATIC_DIR, 'hydrus.png' )
+        
+        known_url = 'https://site.com/post/123456'
+        unknown_url = 'https://site.com/post/654321'
+        
+        urls = [ known_url, unknown_url ]
+        hash_types_and_hashes = [ ( 'sha256', hash ), ( 'md5', md5 ), ( 'md5', os.urandom( 16 ) ) ]
+        
+        #
+        
+        ( urls_to_statuses, hash_types_and_hashes_to_statuses ) = self._read( 'url_and_hash_statuses', urls, hash_types_and_hashes )
+        
+        self.assertEqual( urls_to_statuses, { known_url : [], unknown_url : [] } )
+        
+        for hash_type_and_hash in hash_types_and_hashes:
+            
+            self.assertEqual( hash_types_and_hashes_to_statuses[ hash_type_and_hash ].status, CC.STATUS_UNKNOWN )
+            
+        
+        #
+        
+        file_import_options = HG.client_controller.new_options.GetDefaultFileImportOptions( 'loud' )
+        
+        file_import_job = ClientImportFiles.FileImportJob( path, file_import_options )
+        
+        file_import_job.GeneratePreImportHashAndStatus()
+        
+        file_import_job.GenerateInfo()
+        
+        self._write( 'import_file', file_import_job )
+        
+        content_update = HydrusData.ContentUpdate( HC.CONTENT_TYPE_URLS, HC.CONTENT_UPDATE_ADD, ( [ known_url ], [ hash ] ) )
+        
+        self._write( 'content_updates', { CC.COMBINED_LOCAL_FILE_SERVICE_KEY : [ content_update ] } )
+        
+        #
+        
+        ( urls_to_statuses, hash_types_and_hashes_to_statuses ) = self._read( 'url_and_hash_statuses', urls, hash_types_and_hashes )
+        
+        self.assertEqual( len( urls_to_statuses[ known_url ] ), 1 )
+        self.assertEqual( urls_to_statuses[ known_url ][0].hash, hash )
+        self.assertEqual( urls_to_statuses[ unknown_url ], [] )
+        
+        # the bulk read should say exactly what the single reads say
+        
+        for url in urls:
+            
+            self.assertEqual( [ ( s.status, s.hash ) for s in urls_to_statuses[ url ] ], [ ( s.status, s.hash ) for s in self._read( 'url_statuses', url ) ] )
+            
+        
+        for ( hash_type, found_hash ) in hash_types_and_hashes:
+            
+            file_import_status = self._read( 'hash_status', hash_type, found_hash )
+            
+            self.assertEqual( hash_types_and_hashes_to_statuses[ ( hash_type, found_hash ) ].status, file_import_status.status )
+            self.assertEqual( hash_types_and_hashes_to_statuses[ ( hash_type, found_hash ) ].hash, file_import_status.hash )
+            
+        
+        self.assertEqual( hash_types_and_hashes_to_statuses[ ( 'sha256', hash ) ].hash, hash )
+        self.assertEqual( hash_types_and_hashes_to_statuses[ ( 'md5', md5 ) ].hash, hash )
+        
+    
+    def test_video_keyframes( self ):
+        
+        TestClientDB._clear_db()
+        
+        HG.test_controller.SetRead( 'hash_status', ClientImportFiles.FileImportStatus.STATICGetUnknownStatus() )
+        
+        path = os.path.join( HC.STATIC_DIR, 'testing', 'muh_mpeg.mpeg' )
+        
+        file_import_options = HG.client_controller.new_options.GetDefaultFileImportOptions( 'loud' )
+        
+        file_import_job = ClientImportFiles.FileImportJob( path, file_import_options )
+        
+        file_import_job.GeneratePreImportHashAndStatus()
+        
+        file_import_job.GenerateInfo()
+        
+        self._write( 'import_file', file_import_job )
+        
+        hash = file_import_job.GetHash()
+        
+        job_types_to_counts = self._read( 'file_maintenance_get_job_counts' )
+        
+        self.assertEqual( job_types_to_counts.get( ClientFiles.REGENERATE_FILE_DATA_JOB_VIDEO_KEYFRAMES, 0 ), 1 )
+        
+        self.assertEqual( self._read( 'video_keyframe_timestamps', hash ), None )
+        
+        keyframe_timestamps = [ 0, 400, 801, 1201 ]
+        
+        self._write( 'file_maintenance_clear_jobs', [ ( hash, ClientFiles.REGENERATE_FILE_DATA_JOB_VIDEO_KEYFRAMES, keyframe_timestamps ) ] )
+        
+        job_types_to_counts = self._read( 'file_maintenance_get_job_counts' )
+        
+        self.assertNotIn( ClientFiles.REGENERATE_FILE_DATA_JOB_VIDEO_KEYFRAMES, job_types_to_counts )
+        
+        self.assertEqual( self._read( 'video_keyframe_timestamps', hash ), keyframe_timestamps )
+        
+    
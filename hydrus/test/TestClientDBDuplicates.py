@@ -4,6 +4,7 @@ import unittest
 
 from hydrus.core import HydrusConstants as HC
 from hydrus.core import HydrusData
+from hydrus.core import HydrusExceptions
 from hydrus.core import HydrusGlobals as HG
 
 from hydrus.client import ClientConstants as CC
@@ -142,6 +143,46 @@ class TestClientDBDuplicates( unittest.TestCase ):
             self.assertIn( b, self._all_hashes )
             
         
+        pair_queue_key = self._write( 'duplicate_pair_queue_start', self._file_search_context, both_files_match, pixel_dupes_preference, max_hamming_distance )
+        
+        # the queue serves pairs in batches and removes them as it goes, so draining it should give every potential pair exactly once
+        # once it is empty it has another look for new pairs, which here are the same ones again, so we stop when we have a full set
+        
+        queue_pairs = []
+        
+        while len( queue_pairs ) < num_potentials:
+            
+            queue_filtering_pairs = self._read( 'duplicate_pairs_for_filtering_from_queue', pair_queue_key )
+            
+            if len( queue_filtering_pairs ) == 0:
+                
+                break
+                
+            
+            queue_pairs.extend( ( frozenset( pair ) for pair in queue_filtering_pairs ) )
+            
+        
+        self.assertEqual( len( queue_pairs ), num_potentials )
+        self.assertEqual( len( set( queue_pairs ) ), num_potentials )
+        
+        for pair in queue_pairs:
+            
+            self.assertTrue( pair.issubset( self._all_hashes ) )
+            
+        
+        # the old query always gives the same first batch, which should be in there
+        
+        self.assertTrue( { frozenset( pair ) for pair in filtering_pairs }.issubset( set( queue_pairs ) ) )
+        
+        self._write( 'duplicate_pair_queue_drop', pair_queue_key )
+        
+        self.assertFalse( self._write( 'duplicate_pair_queue_fill', pair_queue_key ) )
+        
+        with self.assertRaises( HydrusExceptions.DBException ):
+            
+            self._read( 'duplicate_pairs_for_filtering_from_queue', pair_queue_key )
+            
+        
         result = self._read( 'file_duplicate_info', ClientLocation.LocationContext.STATICCreateSimple( CC.LOCAL_FILE_SERVICE_KEY ), self._dupe_hashes[0] )
         
         self.assertEqual( result[ 'is_king' ], True )
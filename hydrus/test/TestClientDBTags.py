@@ -655,6 +655,113 @@ class TestClientDBTags( unittest.TestCase ):
         self.assertDictEqual( expected_display_tags_to_counts, tags_to_counts )
         
     
+    def test_display_file_tag_counts( self ):
+        
+        # the per-file tag counts move by delta on every write, so let's check they stay right through a bunch of different changes
+        
+        self._clear_db()
+        
+        path = os.path.join( HC.STATIC_DIR, 'testing', 'muh_jpg.jpg' )
+        
+        file_import_options = HG.client_controller.new_options.GetDefaultFileImportOptions( 'loud' )
+        
+        file_import_job = ClientImportFiles.FileImportJob( path, file_import_options )
+        
+        file_import_job.GeneratePreImportHashAndStatus()
+        
+        file_import_job.GenerateInfo()
+        
+        self._write( 'import_file', file_import_job )
+        
+        muh_jpg_hash = file_import_job.GetHash()
+        
+        ( media_result, ) = self._read( 'media_results', ( muh_jpg_hash, ) )
+        
+        muh_jpg_hash_id = media_result.GetHashId()
+        
+        def do_content_updates( content_updates ):
+            
+            self._write( 'content_updates', { self._public_service_key : content_updates } )
+            
+            self._sync_display()
+            
+        
+        def test_counts( expected_current_count, expected_pending_count, expected_current_or_pending_count ):
+            
+            location_context = ClientLocation.LocationContext.STATICCreateSimple( CC.LOCAL_FILE_SERVICE_KEY )
+            
+            for ( include_current_tags, include_pending_tags, expected_count ) in ( ( True, False, expected_current_count ), ( False, True, expected_pending_count ), ( True, True, expected_current_or_pending_count ) ):
+                
+                tag_search_context = ClientSearch.TagSearchContext( service_key = self._public_service_key, include_current_tags = include_current_tags, include_pending_tags = include_pending_tags )
+                
+                for ( operator, value, expected_result ) in ( ( '=', expected_count, { muh_jpg_hash_id } ), ( '=', expected_count + 1, set() ), ( '>', expected_count - 1, { muh_jpg_hash_id } ), ( '<', expected_count, set() ) ):
+                    
+                    predicates = [ ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_SYSTEM_NUM_TAGS, ( None, operator, value ) ) ]
+                    
+                    file_search_context = ClientSearch.FileSearchContext( location_context = location_context, tag_search_context = tag_search_context, predicates = predicates )
+                    
+                    self.assertEqual( set( self._read( 'file_query_ids', file_search_context ) ), expected_result )
+                    
+                
+            
+        
+        test_counts( 0, 0, 0 )
+        
+        # storage writes
+        
+        content_updates = []
+        
+        content_updates.append( HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( 'samus aran', ( muh_jpg_hash, ) ) ) )
+        content_updates.append( HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( 'metroid', ( muh_jpg_hash, ) ) ) )
+        content_updates.append( HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_PEND, ( 'samus aran', ( muh_jpg_hash, ) ) ) )
+        content_updates.append( HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_PEND, ( 'ridley', ( muh_jpg_hash, ) ) ) )
+        
+        do_content_updates( content_updates )
+        
+        test_counts( 2, 2, 3 )
+        
+        # a sibling and a parent turn up more display tags
+        
+        content_updates = []
+        
+        content_updates.append( HydrusData.ContentUpdate( HC.CONTENT_TYPE_TAG_SIBLINGS, HC.CONTENT_UPDATE_ADD, ( 'samus aran', 'character:samus aran' ) ) )
+        content_updates.append( HydrusData.ContentUpdate( HC.CONTENT_TYPE_TAG_PARENTS, HC.CONTENT_UPDATE_ADD, ( 'character:samus aran', 'series:metroid' ) ) )
+        
+        do_content_updates( content_updates )
+        
+        test_counts( 3, 3, 4 )
+        
+        # the display tags go when nothing implies them any more
+        
+        do_content_updates( [ HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_RESCIND_PEND, ( 'samus aran', ( muh_jpg_hash, ) ) ) ] )
+        
+        test_counts( 3, 1, 4 )
+        
+        do_content_updates( [ HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_DELETE, ( 'samus aran', ( muh_jpg_hash, ) ) ) ] )
+        
+        test_counts( 1, 1, 2 )
+        
+        # adding the ideal directly
+        
+        do_content_updates( [ HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( 'character:samus aran', ( muh_jpg_hash, ) ) ) ] )
+        
+        test_counts( 3, 1, 4 )
+        
+        # and a parent going away
+        
+        do_content_updates( [ HydrusData.ContentUpdate( HC.CONTENT_TYPE_TAG_PARENTS, HC.CONTENT_UPDATE_DELETE, ( 'character:samus aran', 'series:metroid' ) ) ] )
+        
+        test_counts( 2, 1, 3 )
+        
+        # a full regen agrees
+        
+        self._write( 'regenerate_tag_display_mappings_cache', self._public_service_key )
+        
+        self._sync_display()
+        
+        test_counts( 2, 1, 3 )
+        
+    
     def test_display_pairs_lookup_web_parents( self ):
         
         self._clear_db()
@@ -1,16 +1,32 @@
+import collections
 import os
 import shutil
+import time
 import unittest
 
+from mock import patch
+
+from qtpy import QtCore as QC
+
 from hydrus.core import HydrusConstants as HC
+from hydrus.core import HydrusData
+from hydrus.core import HydrusFileHandling
 from hydrus.core import HydrusGlobals as HG
 from hydrus.core import HydrusPaths
 from hydrus.core import HydrusTemp
 
+from hydrus.client import ClientCaches
 from hydrus.client import ClientConstants as CC
 from hydrus.client import ClientDaemons
+from hydrus.client import ClientExporting
+from hydrus.client import ClientFiles
+from hydrus.client import ClientRendering
+from hydrus.client import ClientThumbnailPacks
 from hydrus.client.importing import ClientImportFiles
 from hydrus.client.importing import ClientImportLocal
+from hydrus.client.media import ClientMedia
+from hydrus.client.media import ClientMediaManagers
+from hydrus.client.media import ClientMediaResult
 
 with open( os.path.join( HC.STATIC_DIR, 'hydrus.png' ), 'rb' ) as f:
     
@@ -18,6 +34,103 @@ with open( os.path.join( HC.STATIC_DIR, 'hydrus.png' ), 'rb' ) as f:
     
 class TestDaemons( unittest.TestCase ):
     
+    def test_export_folder_change_tracker( self ):
+        
+        change_tracker = ClientExporting.ExportFolderChangeTracker( HG.test_controller )
+        
+        hash = HydrusData.GenerateKey()
+        
+        # first run looks at everything
+        
+        ( run_generation, changed_hashes ) = change_tracker.GetChangedHashes( 'test' )
+        
+        self.assertEqual( changed_hashes, None )
+        
+        change_tracker.NotifyRunDone( 'test', run_generation, True )
+        
+        ( run_generation, changed_hashes ) = change_tracker.GetChangedHashes( 'test' )
+        
+        self.assertEqual( changed_hashes, set() )
+        
+        change_tracker.NotifyRunDone( 'test', run_generation, False )
+        
+        change_tracker.ProcessContentUpdates( { CC.DEFAULT_LOCAL_TAG_SERVICE_KEY : [ HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( 'test', ( hash, ) ) ) ] } )
+        
+        ( run_generation, changed_hashes ) = change_tracker.GetChangedHashes( 'test' )
+        
+        self.assertEqual( changed_hashes, { hash } )
+        
+        change_tracker.NotifyRunDone( 'test', run_generation, False )
+        
+        # and every so often after that, so changes in the folder get noticed
+        
+        with patch.object( HydrusData, 'GetNow', return_value = HydrusData.GetNow() + ClientExporting.ExportFolderChangeTracker.FULL_CHECK_PERIOD + 1 ):
+            
+            ( run_generation, changed_hashes ) = change_tracker.GetChangedHashes( 'test' )
+            
+            self.assertEqual( changed_hashes, None )
+            
+            change_tracker.NotifyRunDone( 'test', run_generation, True )
+            
+            ( run_generation, changed_hashes ) = change_tracker.GetChangedHashes( 'test' )
+            
+            self.assertEqual( changed_hashes, set() )
+            
+        
+    
+    def test_files_maintenance_workers( self ):
+        
+        test_files = []
+        
+        test_files.append( ( 'muh_jpg.jpg', HC.IMAGE_JPEG ) )
+        test_files.append( ( 'muh_png.png', HC.IMAGE_PNG ) )
+        test_files.append( ( 'muh_gif.gif', HC.IMAGE_GIF ) )
+        test_files.append( ( 'muh_apng.png', HC.IMAGE_APNG ) )
+        
+        media_results = []
+        expected_cleared_jobs = set()
+        
+        for ( i, ( filename, mime ) ) in enumerate( test_files ):
+            
+            path = os.path.join( HC.STATIC_DIR, 'testing', filename )
+            
+            ( md5, sha1, sha512 ) = HydrusFileHandling.GetExtraHashesFromPath( path )
+            
+            hash = HydrusFileHandling.GetHashFromPath( path )
+            
+            HG.test_controller.client_files_manager.AddFile( hash, mime, path )
+            
+            file_info_manager = ClientMediaManagers.FileInfoManager( i + 1, hash, size = os.path.getsize( path ), mime = mime )
+            
+            tags_manager = ClientMediaManagers.TagsManager( collections.defaultdict( HydrusData.default_dict_set ), collections.defaultdict( HydrusData.default_dict_set ) )
+            locations_manager = ClientMediaManagers.LocationsManager( dict(), dict(), set(), set(), inbox = True )
+            ratings_manager = ClientMediaManagers.RatingsManager( {} )
+            notes_manager = ClientMediaManagers.NotesManager( {} )
+            file_viewing_stats_manager = ClientMediaManagers.FileViewingStatsManager.STATICGenerateEmptyManager()
+            
+            media_results.append( ClientMediaResult.MediaResult( file_info_manager, tags_manager, locations_manager, ratings_manager, notes_manager, file_viewing_stats_manager ) )
+            
+            expected_cleared_jobs.add( ( hash, ClientFiles.REGENERATE_FILE_DATA_JOB_OTHER_HASHES, ( md5, sha1, sha512 ) ) )
+            
+        
+        for num_workers in ( 1, 3 ):
+            
+            HG.test_controller.new_options.SetInteger( 'file_maintenance_num_cpu_workers', num_workers )
+            
+            files_maintenance_manager = ClientFiles.FilesMaintenanceManager( HG.test_controller )
+            
+            HG.test_controller.ClearWrites( 'file_maintenance_clear_jobs' )
+            
+            files_maintenance_manager.RunJobImmediately( media_results, ClientFiles.REGENERATE_FILE_DATA_JOB_OTHER_HASHES, pub_job_key = False )
+            
+            # all the results should come back in one bulk write
+            
+            [ ( ( cleared_jobs, ), kwargs ) ] = HG.test_controller.GetWrite( 'file_maintenance_clear_jobs' )
+            
+            self.assertEqual( set( cleared_jobs ), expected_cleared_jobs )
+            
+        
+    
     def test_import_folders_daemon( self ):
         
         test_dir = HydrusTemp.GetTempDir()
@@ -78,3 +191,407 @@ class TestDaemons( unittest.TestCase ):
             
         
     
+    def test_reshard_prefixes( self ):
+        
+        client_files_dir = HydrusTemp.GetTempDir()
+        
+        original_client_files_locations = HG.test_controller.Read( 'client_files_locations' )
+        
+        client_files_locations = {}
+        
+        for prefix in HydrusData.IterateHexPrefixes():
+            
+            for c in ( 'f', 't' ):
+                
+                client_files_locations[ c + prefix ] = client_files_dir
+                
+            
+        
+        HG.test_controller.SetRead( 'client_files_locations', client_files_locations )
+        
+        def do_reshard( action, old_prefixes, new_prefixes_to_locations ):
+            
+            client_files_locations = dict( HG.test_controller.Read( 'client_files_locations' ) )
+            
+            for old_prefix in old_prefixes:
+                
+                del client_files_locations[ old_prefix ]
+                
+            
+            client_files_locations.update( new_prefixes_to_locations )
+            
+            HG.test_controller.SetRead( 'client_files_locations', client_files_locations )
+            
+        
+        try:
+            
+            client_files_manager = ClientFiles.ClientFilesManager( HG.test_controller )
+            
+            # more than one batch, so we can change things in the middle
+            
+            hashes_to_bytes = {}
+            
+            for i in range( 300 ):
+                
+                hash = b'\x00' + os.urandom( 31 )
+                
+                hashes_to_bytes[ hash ] = EXAMPLE_FILE + os.urandom( 8 )
+                
+                client_files_manager.LocklessAddFileFromBytes( hash, HC.IMAGE_PNG, hashes_to_bytes[ hash ] )
+                
+            
+            old_dir = os.path.join( client_files_dir, 'f00' )
+            
+            new_prefixes_to_locations = { 'f00' + c : client_files_dir for c in '0123456789abcdef' }
+            
+            def get_new_path( hash ):
+                
+                return os.path.join( client_files_dir, 'f00' + hash.hex()[2], hash.hex() + '.png' )
+                
+            
+            def check_files():
+                
+                for ( hash, file_bytes ) in hashes_to_bytes.items():
+                    
+                    with open( client_files_manager.GetFilePath( hash, HC.IMAGE_PNG ), 'rb' ) as f:
+                        
+                        self.assertEqual( f.read(), file_bytes )
+                        
+                    
+                
+            
+            # cancelling after the first batch leaves everything where it was
+            
+            cancel_stop_hook_calls = []
+            
+            def cancel_stop_hook():
+                
+                cancel_stop_hook_calls.append( True )
+                
+                return len( cancel_stop_hook_calls ) == 3
+                
+            
+            with patch.object( HG.test_controller, 'WriteSynchronous', do_reshard ):
+                
+                result = client_files_manager._ReshardPrefixes( [ 'f00' ], new_prefixes_to_locations, cancel_stop_hook )
+                
+            
+            self.assertFalse( result )
+            
+            self.assertIn( 'f00', client_files_manager._prefixes_to_locations )
+            self.assertEqual( len( os.listdir( old_dir ) ), 300 )
+            
+            for new_prefix in new_prefixes_to_locations:
+                
+                self.assertEqual( os.listdir( os.path.join( client_files_dir, new_prefix ) ), [] )
+                
+            
+            check_files()
+            
+            # files deleted and added after the first batch are caught up before the swap
+            
+            stop_hook_calls = []
+            deleted_hashes = set()
+            
+            def stop_hook():
+                
+                stop_hook_calls.append( True )
+                
+                if len( stop_hook_calls ) == 3:
+                    
+                    hash = [ hash for hash in hashes_to_bytes if os.path.exists( get_new_path( hash ) ) ][0]
+                    
+                    os.remove( client_files_manager.GetFilePath( hash, HC.IMAGE_PNG ) )
+                    
+                    del hashes_to_bytes[ hash ]
+                    
+                    deleted_hashes.add( hash )
+                    
+                    hash = b'\x00' + os.urandom( 31 )
+                    
+                    hashes_to_bytes[ hash ] = EXAMPLE_FILE
+                    
+                    client_files_manager.LocklessAddFileFromBytes( hash, HC.IMAGE_PNG, hashes_to_bytes[ hash ] )
+                    
+                
+                return False
+                
+            
+            with patch.object( HG.test_controller, 'WriteSynchronous', do_reshard ):
+                
+                result = client_files_manager._ReshardPrefixes( [ 'f00' ], new_prefixes_to_locations, stop_hook )
+                
+            
+            self.assertTrue( result )
+            self.assertEqual( len( stop_hook_calls ), 3 )
+            
+            self.assertNotIn( 'f00', client_files_manager._prefixes_to_locations )
+            self.assertFalse( os.path.exists( old_dir ) )
+            
+            check_files()
+            
+            for hash in hashes_to_bytes:
+                
+                self.assertTrue( os.path.exists( get_new_path( hash ) ) )
+                
+            
+            for hash in deleted_hashes:
+                
+                self.assertFalse( os.path.exists( get_new_path( hash ) ) )
+                
+            
+            self.assertEqual( client_files_manager._resharding_prefixes, set() )
+            
+        finally:
+            
+            HG.test_controller.SetRead( 'client_files_locations', original_client_files_locations )
+            
+            shutil.rmtree( client_files_dir )
+            
+        
+    
+    def test_thumbnail_packs( self ):
+        
+        client_files_manager = HG.test_controller.client_files_manager
+        
+        with open( os.path.join( HC.STATIC_DIR, 'hydrus_small.png' ), 'rb' ) as f:
+            
+            thumbnail_bytes = f.read()
+            
+        
+        media_results = []
+        hashes_to_thumbnail_bytes = {}
+        
+        for i in range( 5 ):
+            
+            hash = os.urandom( 32 )
+            
+            file_info_manager = ClientMediaManagers.FileInfoManager( i + 1, hash, size = 500, mime = HC.IMAGE_PNG, width = 20, height = 20 )
+            
+            tags_manager = ClientMediaManagers.TagsManager( collections.defaultdict( HydrusData.default_dict_set ), collections.defaultdict( HydrusData.default_dict_set ) )
+            locations_manager = ClientMediaManagers.LocationsManager( dict(), dict(), set(), set(), inbox = True )
+            ratings_manager = ClientMediaManagers.RatingsManager( {} )
+            notes_manager = ClientMediaManagers.NotesManager( {} )
+            file_viewing_stats_manager = ClientMediaManagers.FileViewingStatsManager.STATICGenerateEmptyManager()
+            
+            media_results.append( ClientMediaResult.MediaResult( file_info_manager, tags_manager, locations_manager, ratings_manager, notes_manager, file_viewing_stats_manager ) )
+            
+            hashes_to_thumbnail_bytes[ hash ] = thumbnail_bytes + bytes( [ i ] )
+            
+            client_files_manager.AddThumbnailFromBytes( hash, hashes_to_thumbnail_bytes[ hash ], silent = True )
+            
+        
+        def get_thumb_dir( hash ):
+            
+            return os.path.dirname( client_files_manager._GenerateExpectedThumbnailPath( hash ) )
+            
+        
+        def get_segment_filenames( hash ):
+            
+            return [ filename for filename in ClientThumbnailPacks.GetThumbnailPackDataFilenames( get_thumb_dir( hash ) ) if filename.endswith( ClientThumbnailPacks.THUMBNAIL_PACK_SEGMENT_EXT ) ]
+            
+        
+        try:
+            
+            # pack everything
+            
+            HG.test_controller.new_options.SetBoolean( 'thumbnail_storage_packed', True )
+            
+            client_files_manager.MaintainThumbnailStorage()
+            
+            for media_result in media_results:
+                
+                hash = media_result.GetHash()
+                
+                self.assertFalse( os.path.exists( client_files_manager._GenerateExpectedThumbnailPath( hash ) ) )
+                self.assertTrue( ClientThumbnailPacks.DirectoryHasThumbnailPack( get_thumb_dir( hash ) ) )
+                
+                self.assertTrue( client_files_manager.LocklessHasThumbnail( hash ) )
+                self.assertEqual( client_files_manager.GetThumbnailBytes( media_result ), hashes_to_thumbnail_bytes[ hash ] )
+                
+            
+            # regenerating appends, and compaction tidies up the dead records
+            
+            media_result = media_results[0]
+            
+            hash = media_result.GetHash()
+            
+            for i in range( 3 ):
+                
+                hashes_to_thumbnail_bytes[ hash ] = thumbnail_bytes + bytes( [ 100 + i ] )
+                
+                client_files_manager.AddThumbnailFromBytes( hash, hashes_to_thumbnail_bytes[ hash ], silent = True )
+                
+            
+            self.assertEqual( client_files_manager.GetThumbnailBytes( media_result ), hashes_to_thumbnail_bytes[ hash ] )
+            
+            segment_filenames = get_segment_filenames( hash )
+            
+            client_files_manager.MaintainThumbnailStorage()
+            
+            self.assertEqual( len( get_segment_filenames( hash ) ), 1 )
+            self.assertNotEqual( get_segment_filenames( hash ), segment_filenames )
+            
+            self.assertEqual( client_files_manager.GetThumbnailBytes( media_result ), hashes_to_thumbnail_bytes[ hash ] )
+            
+            # a backup gets its own consistent copy, and segments that were compacted away go from the backup too
+            
+            backup_dir = HydrusTemp.GetTempDir()
+            
+            backup_thumbnail_packs = {}
+            
+            try:
+                
+                backup_thumb_dir = os.path.join( backup_dir, os.path.basename( get_thumb_dir( hash ) ) )
+                
+                HydrusPaths.MakeSureDirectoryExists( backup_thumb_dir )
+                
+                for filename in segment_filenames:
+                    
+                    with open( os.path.join( backup_thumb_dir, filename ), 'wb' ) as f:
+                        
+                        f.write( b'stale' )
+                        
+                    
+                
+                client_files_manager.BackupThumbnailPacks( os.path.dirname( get_thumb_dir( hash ) ), backup_dir )
+                
+                self.assertEqual( sorted( ClientThumbnailPacks.GetThumbnailPackDataFilenames( backup_thumb_dir ) ), sorted( ClientThumbnailPacks.GetThumbnailPackDataFilenames( get_thumb_dir( hash ) ) ) )
+                
+                for media_result in media_results:
+                    
+                    backup_thumb_dir = os.path.join( backup_dir, os.path.basename( get_thumb_dir( media_result.GetHash() ) ) )
+                    
+                    if backup_thumb_dir not in backup_thumbnail_packs:
+                        
+                        backup_thumbnail_packs[ backup_thumb_dir ] = ClientThumbnailPacks.ThumbnailPack( backup_thumb_dir )
+                        
+                    
+                    self.assertEqual( backup_thumbnail_packs[ backup_thumb_dir ].GetThumbnailBytes( media_result.GetHash() ), hashes_to_thumbnail_bytes[ media_result.GetHash() ] )
+                    
+                
+            finally:
+                
+                for backup_thumbnail_pack in backup_thumbnail_packs.values():
+                    
+                    backup_thumbnail_pack.Close()
+                    
+                
+                shutil.rmtree( backup_dir )
+                
+            
+            # and back again
+            
+            HG.test_controller.new_options.SetBoolean( 'thumbnail_storage_packed', False )
+            
+            client_files_manager.MaintainThumbnailStorage()
+            
+            for media_result in media_results:
+                
+                hash = media_result.GetHash()
+                
+                self.assertEqual( ClientThumbnailPacks.GetThumbnailPackFilenames( get_thumb_dir( hash ) ), [] )
+                
+                with open( client_files_manager._GenerateExpectedThumbnailPath( hash ), 'rb' ) as f:
+                    
+                    self.assertEqual( f.read(), hashes_to_thumbnail_bytes[ hash ] )
+                    
+                
+            
+        finally:
+            
+            HG.test_controller.new_options.SetBoolean( 'thumbnail_storage_packed', False )
+            
+            client_files_manager.MaintainThumbnailStorage()
+            
+        
+    
+    def test_thumbnail_waterfall( self ):
+        
+        thumbnail_cache = HG.test_controller.GetCache( 'thumbnail' )
+        
+        with open( os.path.join( HC.STATIC_DIR, 'hydrus_small.png' ), 'rb' ) as f:
+            
+            thumbnail_bytes = f.read()
+            
+        
+        medias = []
+        
+        for i in range( 32 ):
+            
+            hash = os.urandom( 32 )
+            
+            file_info_manager = ClientMediaManagers.FileInfoManager( i + 1, hash, size = 500, mime = HC.IMAGE_PNG, width = 16, height = 16 )
+            
+            tags_manager = ClientMediaManagers.TagsManager( collections.defaultdict( HydrusData.default_dict_set ), collections.defaultdict( HydrusData.default_dict_set ) )
+            locations_manager = ClientMediaManagers.LocationsManager( { CC.COMBINED_LOCAL_FILE_SERVICE_KEY : HydrusData.GetNow() }, dict(), set(), set(), inbox = True )
+            ratings_manager = ClientMediaManagers.RatingsManager( {} )
+            notes_manager = ClientMediaManagers.NotesManager( {} )
+            file_viewing_stats_manager = ClientMediaManagers.FileViewingStatsManager.STATICGenerateEmptyManager()
+            
+            media_result = ClientMediaResult.MediaResult( file_info_manager, tags_manager, locations_manager, ratings_manager, notes_manager, file_viewing_stats_manager )
+            
+            HG.test_controller.client_files_manager.AddThumbnailFromBytes( hash, thumbnail_bytes, silent = True )
+            
+            medias.append( ClientMedia.MediaSingleton( media_result ) )
+            
+        
+        page_key = HydrusData.GenerateKey()
+        
+        thumbnail_cache.Waterfall( page_key, medias[ 16 : ], in_viewport = False )
+        thumbnail_cache.Waterfall( page_key, medias[ : 16 ] )
+        
+        thumbnail_cache.WaitUntilFree()
+        
+        for media in medias:
+            
+            self.assertTrue( thumbnail_cache.HasThumbnailCached( media ) )
+            
+        
+    
+    def test_image_tile_prefetch( self ):
+        
+        tile_cache = HG.test_controller.GetCache( 'image_tiles' )
+        
+        hash = os.urandom( 32 )
+        
+        HG.test_controller.client_files_manager.AddFile( hash, HC.IMAGE_PNG, os.path.join( HC.STATIC_DIR, 'hydrus.png' ) )
+        
+        file_info_manager = ClientMediaManagers.FileInfoManager( 1, hash, size = 500, mime = HC.IMAGE_PNG, width = 200, height = 200 )
+        
+        tags_manager = ClientMediaManagers.TagsManager( collections.defaultdict( HydrusData.default_dict_set ), collections.defaultdict( HydrusData.default_dict_set ) )
+        locations_manager = ClientMediaManagers.LocationsManager( { CC.COMBINED_LOCAL_FILE_SERVICE_KEY : HydrusData.GetNow() }, dict(), set(), set(), inbox = True )
+        ratings_manager = ClientMediaManagers.RatingsManager( {} )
+        notes_manager = ClientMediaManagers.NotesManager( {} )
+        file_viewing_stats_manager = ClientMediaManagers.FileViewingStatsManager.STATICGenerateEmptyManager()
+        
+        media = ClientMedia.MediaSingleton( ClientMediaResult.MediaResult( file_info_manager, tags_manager, locations_manager, ratings_manager, notes_manager, file_viewing_stats_manager ) )
+        
+        image_renderer = ClientRendering.ImageRenderer( media )
+        
+        # a 2x zoom, in four tiles
+        
+        clip_rects_and_target_resolutions = [ ( QC.QRect( x, y, 100, 100 ), QC.QSize( 200, 200 ) ) for ( x, y ) in ( ( 0, 0 ), ( 100, 0 ), ( 0, 100 ), ( 100, 100 ) ) ]
+        
+        tile_cache.PrefetchTiles( image_renderer, media, clip_rects_and_target_resolutions, ClientCaches.TILE_PREFETCH_PRIORITY_NEIGHBOUR )
+        
+        for i in range( 100 ):
+            
+            if False not in ( tile_cache._data_cache.HasData( tile_cache._GetKey( hash, clip_rect, target_resolution ) ) for ( clip_rect, target_resolution ) in clip_rects_and_target_resolutions ):
+                
+                break
+                
+            
+            time.sleep( 0.05 )
+            
+        
+        for ( clip_rect, target_resolution ) in clip_rects_and_target_resolutions:
+            
+            self.assertTrue( tile_cache._data_cache.HasData( tile_cache._GetKey( hash, clip_rect, target_resolution ) ) )
+            
+            tile = tile_cache.GetTile( image_renderer, media, clip_rect, target_resolution )
+            
+            self.assertEqual( tile.GetQtPixmap().size(), target_resolution )
+            
+        
+    
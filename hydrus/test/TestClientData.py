@@ -1,6 +1,330 @@
+import collections
+import os
 import unittest
 
 from hydrus.core import HydrusConstants as HC
+from hydrus.core import HydrusData
 from hydrus.core import HydrusExceptions
 
 from hydrus.client import ClientConstants as CC
+from hydrus.client import ClientLocation
+from hydrus.client.media import ClientMedia
+from hydrus.client.media import ClientMediaManagers
+from hydrus.client.media import ClientMediaResult
+from hydrus.client.metadata import ClientTags
+
+def GetTagsManager( tags ):
+    
+    service_keys_to_statuses_to_storage_tags = collections.defaultdict( HydrusData.default_dict_set )
+    service_keys_to_statuses_to_display_tags = collections.defaultdict( HydrusData.default_dict_set )
+    
+    service_keys_to_statuses_to_storage_tags[ CC.DEFAULT_LOCAL_TAG_SERVICE_KEY ][ HC.CONTENT_STATUS_CURRENT ] = set( tags )
+    service_keys_to_statuses_to_display_tags[ CC.DEFAULT_LOCAL_TAG_SERVICE_KEY ][ HC.CONTENT_STATUS_CURRENT ] = set( tags )
+    
+    return ClientMediaManagers.TagsManager( service_keys_to_statuses_to_storage_tags, service_keys_to_statuses_to_display_tags )
+    
+def GetMediaResult( hash_id, tags, size, duration = None, has_audio = False ):
+    
+    file_info_manager = ClientMediaManagers.FileInfoManager( hash_id, os.urandom( 32 ), size = size, mime = HC.VIDEO_MP4, width = 20, height = 20, duration = duration, has_audio = has_audio )
+    
+    tags_manager = GetTagsManager( tags )
+    locations_manager = ClientMediaManagers.LocationsManager( dict(), dict(), set(), set(), inbox = True )
+    ratings_manager = ClientMediaManagers.RatingsManager( {} )
+    notes_manager = ClientMediaManagers.NotesManager( {} )
+    file_viewing_stats_manager = ClientMediaManagers.FileViewingStatsManager.STATICGenerateEmptyManager()
+    
+    return ClientMediaResult.MediaResult( file_info_manager, tags_manager, locations_manager, ratings_manager, notes_manager, file_viewing_stats_manager )
+    
+class SortableThing( object ):
+    
+    def __init__( self, name, value ):
+        
+        self.name = name
+        self.value = value
+        
+    
+    def __repr__( self ):
+        
+        return self.name
+        
+    
+class TestMediaCollect( unittest.TestCase ):
+    
+    def _get_series_to_collections( self, media_list ):
+        
+        return { media.GetTagsManager().GetNamespaceSlice( [ 'series' ], ClientTags.TAG_DISPLAY_ACTUAL ) : media for media in media_list.GetSortedMedia() }
+        
+    
+    def test_collect( self ):
+        
+        series_a = frozenset( { 'series:a' } )
+        series_b = frozenset( { 'series:b' } )
+        series_c = frozenset( { 'series:c' } )
+        
+        a_1 = GetMediaResult( 1, series_a, 100, duration = 1000, has_audio = True )
+        a_2 = GetMediaResult( 2, series_a, 200 )
+        b_1 = GetMediaResult( 3, series_b, 300 )
+        b_2 = GetMediaResult( 4, series_b, 400 )
+        
+        media_list = ClientMedia.MediaList( ClientLocation.LocationContext.STATICCreateSimple( CC.LOCAL_FILE_SERVICE_KEY ), [ a_1, a_2, b_1, b_2 ] )
+        
+        media_list.Collect( ClientMedia.MediaCollect( namespaces = [ 'series' ] ) )
+        
+        series_to_collections = self._get_series_to_collections( media_list )
+        
+        self.assertEqual( set( series_to_collections.keys() ), { series_a, series_b } )
+        
+        collection_a = series_to_collections[ series_a ]
+        collection_b = series_to_collections[ series_b ]
+        
+        self.assertEqual( collection_a.GetNumFiles(), 2 )
+        self.assertEqual( collection_a.GetSize(), 300 )
+        self.assertEqual( collection_a.GetDuration(), 1000 )
+        self.assertTrue( collection_a.HasAudio() )
+        
+        self.assertEqual( collection_b.GetNumFiles(), 2 )
+        self.assertEqual( collection_b.GetSize(), 700 )
+        self.assertFalse( collection_b.HasDuration() )
+        self.assertFalse( collection_b.HasAudio() )
+        
+        # unchanged collections are reused
+        
+        media_list.Collect()
+        
+        series_to_collections = self._get_series_to_collections( media_list )
+        
+        self.assertIs( series_to_collections[ series_a ], collection_a )
+        self.assertIs( series_to_collections[ series_b ], collection_b )
+        
+        # a tags manager swap (as after a sibling change) is not seen until the keys are cleared
+        
+        b_2.SetTagsManager( GetTagsManager( series_a ) )
+        
+        media_list.Collect()
+        
+        self.assertIs( self._get_series_to_collections( media_list )[ series_b ], collection_b )
+        
+        media_list.ClearCollectKeys()
+        
+        media_list.Collect()
+        
+        series_to_collections = self._get_series_to_collections( media_list )
+        
+        self.assertIsNot( series_to_collections[ series_a ], collection_a )
+        self.assertIsNot( series_to_collections[ series_b ], collection_b )
+        
+        self.assertEqual( series_to_collections[ series_a ].GetNumFiles(), 3 )
+        self.assertEqual( series_to_collections[ series_a ].GetSize(), 700 )
+        self.assertEqual( series_to_collections[ series_b ].GetNumFiles(), 1 )
+        self.assertEqual( series_to_collections[ series_b ].GetSize(), 300 )
+        
+        collection_b = series_to_collections[ series_b ]
+        
+        # new file info (as from NotifyNewFileInfo) dirties just those files
+        
+        a_1.SetTagsManager( GetTagsManager( series_c ) )
+        
+        media_list.DirtyCollectKeys( { a_1.GetHash() } )
+        
+        media_list.Collect()
+        
+        series_to_collections = self._get_series_to_collections( media_list )
+        
+        self.assertEqual( set( series_to_collections.keys() ), { series_a, series_b, series_c } )
+        
+        self.assertIs( series_to_collections[ series_b ], collection_b )
+        
+        self.assertEqual( series_to_collections[ series_a ].GetSize(), 600 )
+        self.assertFalse( series_to_collections[ series_a ].HasAudio() )
+        self.assertTrue( series_to_collections[ series_c ].HasAudio() )
+        
+    
+    def test_collection_aggregates( self ):
+        
+        series_a = frozenset( { 'series:a' } )
+        
+        collection = ClientMedia.MediaCollection( ClientLocation.LocationContext.STATICCreateSimple( CC.LOCAL_FILE_SERVICE_KEY ), [ GetMediaResult( 1, series_a, 100 ), GetMediaResult( 2, series_a, 200, duration = 500 ) ] )
+        
+        self.assertEqual( collection.GetNumFiles(), 2 )
+        self.assertEqual( collection.GetSize(), 300 )
+        self.assertEqual( collection.GetDuration(), 500 )
+        self.assertFalse( collection.HasAudio() )
+        self.assertTrue( collection.IsSizeDefinite() )
+        
+        new_media_result = GetMediaResult( 3, series_a, 50, duration = 250, has_audio = True )
+        
+        collection.AddMedia( [ ClientMedia.MediaSingleton( new_media_result ) ] )
+        
+        self.assertEqual( collection.GetNumFiles(), 3 )
+        self.assertEqual( collection.GetSize(), 350 )
+        self.assertEqual( collection.GetDuration(), 750 )
+        self.assertTrue( collection.HasAudio() )
+        
+        # adding it again does nothing
+        
+        collection.AddMedia( [ ClientMedia.MediaSingleton( new_media_result ) ] )
+        
+        self.assertEqual( collection.GetNumFiles(), 3 )
+        self.assertEqual( collection.GetSize(), 350 )
+        
+        collection._RemoveMediaByHashes( { new_media_result.GetHash() } )
+        
+        self.assertEqual( collection.GetNumFiles(), 2 )
+        self.assertEqual( collection.GetSize(), 300 )
+        self.assertEqual( collection.GetDuration(), 500 )
+        self.assertFalse( collection.HasAudio() )
+        
+        # and a full recalc agrees
+        
+        collection.RecalcInternals()
+        
+        self.assertEqual( collection.GetSize(), 300 )
+        self.assertEqual( collection.GetDuration(), 500 )
+        self.assertFalse( collection.HasAudio() )
+        
+    
+    def test_sort_after_removal( self ):
+        
+        series_a = frozenset( { 'series:a' } )
+        series_b = frozenset( { 'series:b' } )
+        
+        a_1 = GetMediaResult( 1, series_a, 100 )
+        a_2 = GetMediaResult( 2, series_a, 200 )
+        a_3 = GetMediaResult( 3, series_a, 300 )
+        b_1 = GetMediaResult( 4, series_b, 150 )
+        b_2 = GetMediaResult( 5, series_b, 250 )
+        
+        for ( sort_data, expected_before, expected_after ) in (
+            ( CC.SORT_FILES_BY_NUM_COLLECTION_FILES, [ series_a, series_b ], [ series_b, series_a ] ),
+            ( CC.SORT_FILES_BY_FILESIZE, [ series_a, series_b ], [ series_b, series_a ] )
+        ):
+            
+            media_list = ClientMedia.MediaList( ClientLocation.LocationContext.STATICCreateSimple( CC.LOCAL_FILE_SERVICE_KEY ), [ a_1, a_2, a_3, b_1, b_2 ] )
+            
+            media_list.Collect( ClientMedia.MediaCollect( namespaces = [ 'series' ] ) )
+            
+            media_sort = ClientMedia.MediaSort( ( 'system', sort_data ), CC.SORT_DESC )
+            
+            media_list.Sort( media_sort )
+            
+            get_order = lambda: [ media.GetTagsManager().GetNamespaceSlice( [ 'series' ], ClientTags.TAG_DISPLAY_ACTUAL ) for media in media_list.GetSortedMedia() ]
+            
+            self.assertEqual( get_order(), expected_before )
+            
+            # series a shrinks to one 100 byte file but stays a collection, so its cached key has to go
+            
+            media_list._RemoveMediaByHashes( { a_2.GetHash(), a_3.GetHash() } )
+            
+            media_list.Sort()
+            
+            self.assertEqual( get_order(), expected_after )
+            
+            self.assertEqual( [ media.GetNumFiles() for media in media_list.GetSortedMedia() ], [ 2, 1 ] )
+            
+        
+    
+class TestSortedList( unittest.TestCase ):
+    
+    def test_rank_sort( self ):
+        
+        # lots of ties, and nested keys, so stability matters
+        
+        things = [ SortableThing( str( i ), ( ( i * 7 ) % 5, ( 'a', ( i * 3 ) % 2 ) ) ) for i in range( 100 ) ]
+        
+        sort_key = lambda thing: thing.value
+        
+        for reverse in ( False, True ):
+            
+            sorted_list = ClientMedia.SortedList( things )
+            
+            sorted_list.sort( sort_key = sort_key, reverse = reverse, sort_identifier = 'value' )
+            
+            expected = list( things )
+            
+            expected.sort( key = sort_key, reverse = reverse )
+            
+            self.assertEqual( list( sorted_list ), expected )
+            
+            # and sorting an already sorted list the other way keeps ties in their current order, just like list.sort
+            
+            sorted_list.sort( sort_key = sort_key, reverse = not reverse, sort_identifier = 'value' )
+            
+            expected.sort( key = sort_key, reverse = not reverse )
+            
+            self.assertEqual( list( sorted_list ), expected )
+            
+            self.assertEqual( [ sorted_list.index( thing ) for thing in expected ], list( range( len( expected ) ) ) )
+            
+        
+    
+    def test_sort_key_cache( self ):
+        
+        things = [ SortableThing( str( i ), i ) for i in range( 10 ) ]
+        
+        calls = []
+        
+        def sort_key( thing ):
+            
+            calls.append( thing )
+            
+            return thing.value
+            
+        
+        sorted_list = ClientMedia.SortedList( things )
+        
+        sorted_list.sort( sort_key = sort_key, reverse = True, sort_identifier = 'value' )
+        
+        self.assertEqual( len( calls ), 10 )
+        self.assertEqual( list( sorted_list ), things[::-1] )
+        
+        # a re-sort uses the cached keys
+        
+        del calls[:]
+        
+        sorted_list.sort()
+        
+        self.assertEqual( calls, [] )
+        
+        # so a changed item keeps its old position until it is dirtied
+        
+        things[0].value = 100
+        
+        sorted_list.sort()
+        
+        self.assertEqual( list( sorted_list ), things[::-1] )
+        
+        sorted_list.dirty_sort_keys( [ things[0] ] )
+        
+        sorted_list.sort()
+        
+        self.assertEqual( calls, [ things[0] ] )
+        self.assertEqual( list( sorted_list ), [ things[0] ] + things[1:][::-1] )
+        
+        # clearing (e.g. on a sibling/parent change) regenerates everything
+        
+        del calls[:]
+        
+        for thing in things:
+            
+            thing.value = - thing.value
+            
+        
+        sorted_list.clear_sort_keys()
+        
+        sorted_list.sort()
+        
+        self.assertEqual( len( calls ), 10 )
+        self.assertEqual( list( sorted_list ), things[1:] + [ things[0] ] )
+        
+        # removed items are forgotten
+        
+        sorted_list.remove_items( [ things[5] ] )
+        
+        del calls[:]
+        
+        sorted_list.sort()
+        
+        self.assertEqual( calls, [] )
+        self.assertNotIn( things[5], sorted_list )
+        
+    
@@ -2,6 +2,7 @@ import os
 import unittest
 
 from hydrus.core import HydrusConstants as HC
+from hydrus.core import HydrusVideoHandling
 
 from hydrus.client import ClientConstants as CC
 from hydrus.client import ClientImageHandling
@@ -22,3 +23,48 @@ class TestImageHandling( unittest.TestCase ):
         
         self.assertEqual( perceptual_hashes, set( [ b'\xb4M\xc7\xb2M\xcb8\x1c' ] ) )
         
+    
+    def test_video_keyframes( self ):
+        
+        path = os.path.join( HC.STATIC_DIR, 'testing', 'muh_mpeg.mpeg' )
+        
+        keyframe_timestamps = HydrusVideoHandling.GetVideoKeyframeTimestamps( path )
+        
+        self.assertEqual( keyframe_timestamps[:3], [ 0, 400, 801 ] )
+        
+        lines = [ '[Parsed_showinfo_0 @ 0x55d6c6b7a2c0] n:   1 pts:  12012 pts_time:0.4004  duration:   1001', 'frame=    9 fps=0.0 q=-0.0 Lsize=N/A time=00:00:03.20' ]
+        
+        self.assertEqual( HydrusVideoHandling.ParseFFMPEGKeyframeTimestamps( lines ), [ 400 ] )
+        
+        renderer = HydrusVideoHandling.VideoRendererFFMPEG( path, HC.VIDEO_MPEG, 3490, 105, ( 64, 48 ), keyframe_timestamps = keyframe_timestamps )
+        
+        try:
+            
+            frame = renderer.read_frame()
+            
+            self.assertEqual( frame.shape, ( 48, 64, 3 ) )
+            
+            process = renderer.process
+            
+            # no keyframe between here and frame 5, so we should decode forward
+            
+            renderer.set_position( 5 )
+            
+            self.assertIs( renderer.process, process )
+            
+            # there is a keyframe at ~frame 24, so we should seek
+            
+            renderer.set_position( 30 )
+            
+            self.assertIsNot( renderer.process, process )
+            
+            frame = renderer.read_frame()
+            
+            self.assertEqual( frame.shape, ( 48, 64, 3 ) )
+            
+        finally:
+            
+            renderer.Stop()
+            
+        
+    
@@ -586,10 +586,15 @@ class TestMigration( unittest.TestCase ):
     
     def _test_mappings_list_to_service( self ):
         
-        def run_test( source, tag_service_key, content_action, expected_data ):
+        def run_test( source, tag_service_key, content_action, expected_data, bulk_add_threshold = None ):
             
             destination = ClientMigration.MigrationDestinationTagServiceMappings( self, tag_service_key, content_action )
             
+            if bulk_add_threshold is not None:
+                
+                destination._bulk_add_threshold = bulk_add_threshold
+                
+            
             job = ClientMigration.MigrationJob( self, 'test', source, destination )
             
             job.Run()
@@ -664,6 +669,14 @@ class TestMigration( unittest.TestCase ):
         
         run_test( source, CC.DEFAULT_LOCAL_TAG_SERVICE_KEY, HC.CONTENT_UPDATE_ADD, data )
         
+        # local bulk add
+        
+        data = [ ( hash, { 'bulk migration tag', 'series:bulk migration' } ) for hash in self._hashes_to_current_tags.keys() ]
+        
+        source = ClientMigration.MigrationSourceList( self, data )
+        
+        run_test( source, CC.DEFAULT_LOCAL_TAG_SERVICE_KEY, HC.CONTENT_UPDATE_ADD, data, bulk_add_threshold = 0 )
+        
         # local delete
         
         data = [ ( hash, set( random.sample( tags, 2 ) ) ) for ( hash, tags ) in self._hashes_to_current_tags.items() ]
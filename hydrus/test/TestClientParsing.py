@@ -1,10 +1,16 @@
+import copy
 import os
 import random
 import unittest
 
 from hydrus.core import HydrusConstants as HC
 from hydrus.core import HydrusExceptions
+from hydrus.core import HydrusGlobals as HG
+from hydrus.core import HydrusText
 
+from hydrus.client import ClientCaches
+from hydrus.client import ClientDefaults
+from hydrus.client import ClientParsing
 from hydrus.client import ClientStrings
 
 class TestStringConverter( unittest.TestCase ):
@@ -529,3 +535,347 @@ class TestStringProcessor( unittest.TestCase ):
         self.assertEqual( processor.ProcessStrings( [ '1,a,2,3', 'test', '123' ] ), expected_result )
         
     
+
+HTML_ENGINE_TEST_PAGES = []
+
+HTML_ENGINE_TEST_PAGES.append( '''<!DOCTYPE html>
+<html>
+<head><title>test &amp; page</title><meta property="og:image" content="https://example.com/image.jpg"><link rel="canonical  next" href="https://example.com/post/123"></head>
+<body>
+<!-- a comment at the top -->
+<div id="content" class=" post  main ">
+<ul id="tag-list" class="tag-list">
+<li class="tag-type-artist tag"><a href="/tags/artist_a" class="search-tag">artist a</a> <span class="count">12</span></li>
+<li class="tag-type-character tag"><a href="/tags/char_b">char <b>b</b></a><!-- inner comment --></li>
+<li class="tag-type-general tag"><a href="/tags/tag_c" rel="nofollow  tag">tag c</a></li>
+</ul>
+<section id="image-container" data-file-url="https://example.com/file.png"><img id="image" src="https://example.com/sample.jpg" alt="sample"></section>
+<table><tr><td headers="h1  h2">cell</td><th>head</th></tr></table>
+<p>unclosed paragraph<p>another <i>one
+<div class="thumb"><a href="/post/1"><img src="/t/1.jpg"></a></div>
+<div class="thumb"><a href="/post/2"><img src="/t/2.jpg"></a></div>
+<time datetime="2021-01-01T00:00:00">a date</time>
+<svg><a xlink:href="https://example.com/svg"><text>svg text</text></a></svg>
+<script>var a = "<b>not a tag</b>";</script>
+</div>
+</body>
+</html>''' )
+
+HTML_ENGINE_TEST_PAGES.append( '''<div class="postContainer" id="pc1"><div class="post reply"><blockquote class="postMessage">hello<br>world</blockquote><a class="fileThumb" href="//i.example.com/1.jpg">file</a></div></div>
+<div class="postContainer" id="pc2"><div class="post reply"><blockquote class="postMessage">&gt;quote</blockquote></div></div>''' )
+
+HTML_ENGINE_TEST_PAGES.append( '''<div class="post
+ first"><b><p>mis</b>nested</p><a href="/1">one<div>two<a href="/2
+">three</a></div></a>
+<!-- a comment
+over lines --><pre>
+
+preformatted</pre><p>list<ul><li>x<li>y</ul><span title="multi
+line">text
+more text</span></div>''' )
+
+HTML_ENGINE_TEST_PAGES.append( '''<div class="quotes" title='say "hi"' data-a="it's" data-b="both &quot;'" data-c="a &amp; b &lt; c">1 &lt; 2 &amp;&amp; 3 &gt; 2<br><img src="/x.png" alt=""><input disabled><p></p><span class="">empty class</span><style>a > b { color: red; }</style></div>''' )
+
+class TestHTMLParsingEngines( unittest.TestCase ):
+    
+    def _GetComparableLXMLString( self, document ):
+        
+        # bs4 does not keep attribute order when it renders html, and the parsers do not care about it
+        
+        import lxml.etree
+        
+        document = copy.deepcopy( document )
+        
+        for node in document.iter():
+            
+            attributes = sorted( node.attrib.items() )
+            
+            node.attrib.clear()
+            
+            for ( key, value ) in attributes:
+                
+                node.set( key, value )
+                
+            
+        
+        return lxml.etree.tostring( document )
+        
+    
+    def _GetHTMLFormulae( self, formula ):
+        
+        if isinstance( formula, ClientParsing.ParseFormulaHTML ):
+            
+            return [ formula ]
+            
+        elif isinstance( formula, ClientParsing.ParseFormulaCompound ):
+            
+            return [ html_formula for sub_formula in formula.GetFormulae() for html_formula in self._GetHTMLFormulae( sub_formula ) ]
+            
+        
+        return []
+        
+    
+    def _GetPageParserHTMLFormulae( self, page_parser ):
+        
+        html_formulae = []
+        
+        ( sub_page_parsers, content_parsers ) = page_parser.GetContentParsers()
+        
+        for ( formula, sub_page_parser ) in sub_page_parsers:
+            
+            html_formulae.extend( self._GetHTMLFormulae( formula ) )
+            html_formulae.extend( self._GetPageParserHTMLFormulae( sub_page_parser ) )
+            
+        
+        for content_parser in content_parsers:
+            
+            html_formulae.extend( self._GetHTMLFormulae( content_parser.GetFormula() ) )
+            
+        
+        return html_formulae
+        
+    
+    def _GetSynthesisedPage( self, formula ):
+        
+        # nest tags that satisfy the descending rules, with some decoys, so the formula actually finds something
+        
+        opening = ''
+        closing = ''
+        
+        for tag_rule in formula.GetTagRules():
+            
+            ( rule_type, tag_name, tag_attributes, tag_index, tag_depth, should_test_tag_string, tag_string_string_match ) = tag_rule.ToTuple()
+            
+            if rule_type != ClientParsing.HTML_RULE_TYPE_DESCENDING:
+                
+                continue
+                
+            
+            if tag_name is None:
+                
+                tag_name = 'div'
+                
+            
+            attributes = ''.join( ' {}="{}"'.format( key, value ) for ( key, value ) in tag_attributes.items() )
+            
+            num_decoys = 0 if tag_index is None else tag_index
+            
+            opening += '<{}>decoy</{}>'.format( tag_name, tag_name ) * num_decoys
+            opening += '<{}{} href="https://example.com/{}" content="c" title="t">text '.format( tag_name, attributes, tag_name )
+            closing = '</{}>'.format( tag_name ) + closing
+            
+        
+        return '<html><body><div>' + opening + 'inner text' + closing + '</div></body></html>'
+        
+    
+    def test_default_parsers( self ):
+        
+        if not ClientParsing.LXML_ENGINE_IS_OK:
+            
+            return
+            
+        
+        num_compared = 0
+        
+        for page_parser in ClientDefaults.GetDefaultParsers():
+            
+            for formula in self._GetPageParserHTMLFormulae( page_parser ):
+                
+                if not formula._CanUseLXML():
+                    
+                    continue
+                    
+                
+                pages = list( HTML_ENGINE_TEST_PAGES )
+                
+                pages.append( self._GetSynthesisedPage( formula ) )
+                
+                for page in pages:
+                    
+                    soup_result = formula._ParseRawTextsSoup( page )
+                    lxml_result = formula._ParseRawTextsLXML( ClientParsing.GetLXMLDocument( page ) )
+                    
+                    self.assertEqual( soup_result, lxml_result, msg = '{}: {}'.format( page_parser.GetName(), formula.ToPrettyMultilineString() ) )
+                    
+                    num_compared += 1
+                    
+                
+            
+        
+        self.assertGreater( num_compared, 0 )
+        
+    
+    def test_node_html( self ):
+        
+        if not ClientParsing.LXML_ENGINE_IS_OK:
+            
+            return
+            
+        
+        formula = ClientParsing.ParseFormulaHTML( tag_rules = [ ClientParsing.ParseRuleHTML( rule_type = ClientParsing.HTML_RULE_TYPE_DESCENDING, tag_name = None ) ], content_to_fetch = ClientParsing.HTML_CONTENT_HTML )
+        
+        num_compared = 0
+        
+        for page in HTML_ENGINE_TEST_PAGES:
+            
+            tags = formula._FindHTMLTags( ClientParsing.GetSoup( page ) )
+            nodes = formula._FindLXMLNodes( ClientParsing.GetLXMLDocument( page ) )
+            
+            self.assertEqual( len( tags ), len( nodes ) )
+            
+            for ( tag, node ) in zip( tags, nodes ):
+                
+                node_html = ClientParsing.GetLXMLNodeHTML( node )
+                
+                if node_html is None:
+                    
+                    continue
+                    
+                
+                self.assertEqual( node_html, str( tag ) )
+                
+                num_compared += 1
+                
+            
+        
+        self.assertGreater( num_compared, 0 )
+        
+    
+    def test_post_documents( self ):
+        
+        if not ClientParsing.LXML_ENGINE_IS_OK:
+            
+            return
+            
+        
+        formula = ClientParsing.ParseFormulaHTML( tag_rules = [ ClientParsing.ParseRuleHTML( rule_type = ClientParsing.HTML_RULE_TYPE_DESCENDING, tag_name = None ) ], content_to_fetch = ClientParsing.HTML_CONTENT_HTML )
+        
+        num_compared = 0
+        
+        for page in HTML_ENGINE_TEST_PAGES:
+            
+            tags = formula._FindHTMLTags( ClientParsing.GetSoup( page ) )
+            nodes = formula._FindLXMLNodes( ClientParsing.GetLXMLDocument( page ) )
+            
+            self.assertEqual( len( tags ), len( nodes ) )
+            
+            for ( tag, node ) in zip( tags, nodes ):
+                
+                post_document = ClientParsing.GetLXMLPostDocument( node )
+                
+                if post_document is None:
+                    
+                    continue
+                    
+                
+                post_html = HydrusText.RemoveNewlines( str( tag ) )
+                
+                self.assertEqual( self._GetComparableLXMLString( post_document ), self._GetComparableLXMLString( ClientParsing.GetLXMLDocument( post_html ) ) )
+                
+                num_compared += 1
+                
+            
+        
+        self.assertGreater( num_compared, 0 )
+        
+        # the parse seeds the cache, so the sub-page parse of a post is a hit
+        
+        parsing_cache = ClientCaches.ParsingCache( HG.test_controller )
+        
+        page = HTML_ENGINE_TEST_PAGES[1]
+        
+        post_formula = ClientParsing.ParseFormulaHTML( tag_rules = [ ClientParsing.ParseRuleHTML( rule_type = ClientParsing.HTML_RULE_TYPE_DESCENDING, tag_name = 'div', tag_attributes = { 'class' : 'postContainer' } ) ], content_to_fetch = ClientParsing.HTML_CONTENT_HTML )
+        
+        original_parsing_cache = HG.test_controller.parsing_cache
+        
+        HG.test_controller.parsing_cache = parsing_cache
+        
+        try:
+            
+            posts = post_formula.Parse( {}, page )
+            
+            # the page was only parsed into lxml
+            
+            self.assertEqual( parsing_cache.GetMetrics()[ ClientCaches.PARSING_CACHE_SOUP ], ( 0, 0 ) )
+            
+            self.assertEqual( len( posts ), 2 )
+            
+            self.assertEqual( posts, post_formula._ParseRawTextsSoup( page ) )
+            
+            ( lxml_hits, lxml_misses ) = parsing_cache.GetMetrics()[ ClientCaches.PARSING_CACHE_LXML ]
+            
+            for post in posts:
+                
+                self.assertIsNotNone( parsing_cache.GetLXMLDocument( post ) )
+                
+            
+            self.assertEqual( parsing_cache.GetMetrics()[ ClientCaches.PARSING_CACHE_LXML ], ( lxml_hits + 2, lxml_misses ) )
+            
+        finally:
+            
+            HG.test_controller.parsing_cache = original_parsing_cache
+            
+        
+    
+    def test_rules( self ):
+        
+        if not ClientParsing.LXML_ENGINE_IS_OK:
+            
+            return
+            
+        
+        tag_rules_list = []
+        
+        tag_rules_list.append( [ ClientParsing.ParseRuleHTML( rule_type = ClientParsing.HTML_RULE_TYPE_DESCENDING, tag_name = 'li', tag_attributes = { 'class' : 'tag' } ), ClientParsing.ParseRuleHTML( rule_type = ClientParsing.HTML_RULE_TYPE_DESCENDING, tag_name = 'a' ) ] )
+        tag_rules_list.append( [ ClientParsing.ParseRuleHTML( rule_type = ClientParsing.HTML_RULE_TYPE_DESCENDING, tag_name = 'li', tag_attributes = { 'class' : 'tag-type-general tag' } ) ] )
+        tag_rules_list.append( [ ClientParsing.ParseRuleHTML( rule_type = ClientParsing.HTML_RULE_TYPE_DESCENDING, tag_name = 'div', tag_attributes = { 'class' : 'post main' } ) ] )
+        tag_rules_list.append( [ ClientParsing.ParseRuleHTML( rule_type = ClientParsing.HTML_RULE_TYPE_DESCENDING, tag_name = None, tag_attributes = { 'rel' : 'tag' } ) ] )
+        tag_rules_list.append( [ ClientParsing.ParseRuleHTML( rule_type = ClientParsing.HTML_RULE_TYPE_DESCENDING, tag_name = 'link', tag_attributes = { 'rel' : 'next' } ) ] )
+        tag_rules_list.append( [ ClientParsing.ParseRuleHTML( rule_type = ClientParsing.HTML_RULE_TYPE_DESCENDING, tag_name = 'td', tag_attributes = { 'headers' : 'h2' } ) ] )
+        tag_rules_list.append( [ ClientParsing.ParseRuleHTML( rule_type = ClientParsing.HTML_RULE_TYPE_DESCENDING, tag_name = 'div', tag_attributes = { 'class' : 'thumb' }, tag_index = 1 ), ClientParsing.ParseRuleHTML( rule_type = ClientParsing.HTML_RULE_TYPE_DESCENDING, tag_name = 'a' ) ] )
+        tag_rules_list.append( [ ClientParsing.ParseRuleHTML( rule_type = ClientParsing.HTML_RULE_TYPE_DESCENDING, tag_name = 'img' ), ClientParsing.ParseRuleHTML( rule_type = ClientParsing.HTML_RULE_TYPE_ASCENDING, tag_name = 'div', tag_depth = 1 ) ] )
+        tag_rules_list.append( [ ClientParsing.ParseRuleHTML( rule_type = ClientParsing.HTML_RULE_TYPE_DESCENDING, tag_name = 'b' ), ClientParsing.ParseRuleHTML( rule_type = ClientParsing.HTML_RULE_TYPE_ASCENDING, tag_name = None, tag_depth = 3 ) ] )
+        tag_rules_list.append( [ ClientParsing.ParseRuleHTML( rule_type = ClientParsing.HTML_RULE_TYPE_DESCENDING, tag_name = 'html' ) ] )
+        tag_rules_list.append( [ ClientParsing.ParseRuleHTML( rule_type = ClientParsing.HTML_RULE_TYPE_DESCENDING, tag_name = 'text' ), ClientParsing.ParseRuleHTML( rule_type = ClientParsing.HTML_RULE_TYPE_ASCENDING, tag_name = 'a', tag_depth = 1 ) ] )
+        tag_rules_list.append( [ ClientParsing.ParseRuleHTML( rule_type = ClientParsing.HTML_RULE_TYPE_DESCENDING, tag_name = 'a', should_test_tag_string = True, tag_string_string_match = ClientStrings.StringMatch( match_type = ClientStrings.STRING_MATCH_FIXED, match_value = 'char b' ) ) ] )
+        
+        fetches = []
+        
+        fetches.append( ( ClientParsing.HTML_CONTENT_STRING, None ) )
+        
+        for attribute in ( 'href', 'class', 'rel', 'headers', 'src', 'id' ):
+            
+            fetches.append( ( ClientParsing.HTML_CONTENT_ATTRIBUTE, attribute ) )
+            
+        
+        for tag_rules in tag_rules_list:
+            
+            for ( content_to_fetch, attribute_to_fetch ) in fetches:
+                
+                formula = ClientParsing.ParseFormulaHTML( tag_rules = tag_rules, content_to_fetch = content_to_fetch, attribute_to_fetch = attribute_to_fetch )
+                
+                self.assertTrue( formula._CanUseLXML() )
+                
+                for page in HTML_ENGINE_TEST_PAGES:
+                    
+                    soup_result = formula._ParseRawTextsSoup( page )
+                    lxml_result = formula._ParseRawTextsLXML( ClientParsing.GetLXMLDocument( page ) )
+                    
+                    self.assertEqual( soup_result, lxml_result, msg = formula.ToPrettyMultilineString() )
+                    
+                
+            
+        
+        # stuff lxml cannot hold falls back to the soup
+        
+        for page in ( '<p>form\x0cfeed</p>', '<p>control\x01character</p>', '<!-- double -- dash --><p>x</p>', '<p a"b="1">x</p>' ):
+            
+            with self.assertRaises( HydrusExceptions.ParseException ):
+                
+                ClientParsing.GetLXMLDocument( page )
+                
+            
+            self.assertIsNone( HG.test_controller.parsing_cache.GetLXMLDocument( page ) )
+            
+        
+    
@@ -13,6 +13,7 @@ from qtpy import QtGui as QG
 
 from hydrus.core import HydrusConstants as HC
 from hydrus.core import HydrusData
+from hydrus.core import HydrusDBMetrics
 from hydrus.core import HydrusExceptions
 from hydrus.core import HydrusGlobals as HG
 from hydrus.core import HydrusPaths
@@ -62,6 +63,7 @@ from hydrus.test import TestFunctions
 from hydrus.test import TestHydrusData
 from hydrus.test import TestHydrusNATPunch
 from hydrus.test import TestHydrusNetworking
+from hydrus.test import TestHydrusPubSub
 from hydrus.test import TestHydrusSerialisable
 from hydrus.test import TestHydrusServer
 from hydrus.test import TestHydrusSessions
@@ -178,6 +180,8 @@ class Controller( object ):
         
         self._test_db = None
         
+        self._db_job_metrics = HydrusDBMetrics.DBMetrics()
+        
         self.db_dir = tempfile.mkdtemp()
         
         global DB_DIR
@@ -272,7 +276,7 @@ class Controller( object ):
         self.services_manager = ClientServices.ServicesManager( self )
         self.client_files_manager = ClientFiles.ClientFilesManager( self )
         
-        self.parsing_cache = ClientCaches.ParsingCache()
+        self.parsing_cache = ClientCaches.ParsingCache( self )
         
         bandwidth_manager = ClientNetworkingBandwidth.NetworkBandwidthManager()
         session_manager = ClientNetworkingSessions.NetworkSessionManager()
@@ -295,11 +299,14 @@ class Controller( object ):
         self._caches[ 'images' ] = ClientCaches.ImageRendererCache( self )
         self._caches[ 'image_tiles' ] = ClientCaches.ImageTileCache( self )
         self._caches[ 'thumbnail' ] = ClientCaches.ThumbnailCache( self )
+        self._caches[ 'decorated_thumbnail' ] = ClientCaches.DecoratedThumbnailCache( self )
         
         self.server_session_manager = HydrusSessions.HydrusSessionManagerServer()
         
         self.bitmap_manager = ClientManagers.BitmapManager( self )
         
+        self.known_content_filter_manager = ClientManagers.KnownContentFilterManager( self )
+        
         self.local_booru_manager = ClientCaches.LocalBooruCache( self )
         self.client_api_manager = ClientAPI.APIManager()
         
@@ -353,9 +360,9 @@ class Controller( object ):
         self._pubsub.pubimmediate( topic, *args, **kwargs )
         
     
-    def sub( self, object, method_name, topic ):
+    def sub( self, object, method_name, topic, deliver_on_worker = False ):
         
-        self._pubsub.sub( object, method_name, topic )
+        self._pubsub.sub( object, method_name, topic, deliver_on_worker = deliver_on_worker )
         
     
     def AcquirePageKey( self ):
@@ -488,6 +495,11 @@ class Controller( object ):
         return job
         
     
+    def ClearDBJobMetrics( self ):
+        
+        self._db_job_metrics.Clear()
+        
+    
     def ClearReads( self, name ):
         
         if name in self._read_call_args:
@@ -568,6 +580,11 @@ class Controller( object ):
         }
         
     
+    def GetDBJobMetrics( self ):
+        
+        return self._db_job_metrics.GetSnapshot()
+        
+    
     def GetFilesDir( self ):
         
         return self._server_files_dir
@@ -772,6 +789,7 @@ class Controller( object ):
             TestClientDBTags,
             TestHydrusData,
             TestHydrusNATPunch,
+            TestHydrusPubSub,
             TestClientNetworking,
             TestHydrusNetworking,
             TestClientImportSubscriptions,
@@ -802,6 +820,7 @@ class Controller( object ):
             TestClientThreading,
             TestFunctions,
             TestHydrusData,
+            TestHydrusPubSub,
             TestHydrusSerialisable,
             TestHydrusSessions
         ]
@@ -900,6 +919,11 @@ class Controller( object ):
         test_thread.start()
         
     
+    def SetDBJobMetrics( self, db_job_metrics: HydrusDBMetrics.DBMetrics ):
+        
+        self._db_job_metrics = db_job_metrics
+        
+    
     def SetParamRead( self, name, args, value ):
         
         self._param_read_responses[ ( name, args ) ] = value
@@ -1,8 +1,13 @@
+import random
+import sqlite3
 import unittest
 
 from hydrus.core import HydrusConstants as HC
 from hydrus.core import HydrusData
+from hydrus.core import HydrusDBBase
+from hydrus.core import HydrusDBMetrics
 from hydrus.core import HydrusGlobals as HG
+from hydrus.core import HydrusIntegerSets
 
 from hydrus.client import ClientConstants as CC
 from hydrus.client import ClientData
@@ -10,6 +15,130 @@ from hydrus.client.metadata import ClientTags
 
 class TestHydrusData( unittest.TestCase ):
     
+    def test_db_metrics( self ):
+        
+        histogram = HydrusDBMetrics.LatencyHistogram()
+        
+        self.assertEqual( histogram.GetPercentile( 50 ), 0.0 )
+        
+        for i in range( 98 ):
+            
+            histogram.AddDuration( 0.003 )
+            
+        
+        histogram.AddDuration( 0.2 )
+        histogram.AddDuration( 400.0 )
+        
+        self.assertEqual( histogram.GetCount(), 100 )
+        self.assertEqual( histogram.GetMax(), 400.0 )
+        self.assertAlmostEqual( histogram.GetTotal(), 98 * 0.003 + 0.2 + 400.0 )
+        
+        # percentiles are the upper bound of their bucket, and overflow falls back to the max
+        self.assertEqual( histogram.GetPercentile( 50 ), 0.005 )
+        self.assertEqual( histogram.GetPercentile( 99 ), 0.25 )
+        self.assertEqual( histogram.GetPercentile( 100 ), 400.0 )
+        
+        histogram_dict = histogram.ToDict()
+        
+        self.assertEqual( len( histogram_dict[ 'buckets' ] ), len( HydrusDBMetrics.LATENCY_BUCKET_UPPER_BOUNDS ) + 1 )
+        self.assertEqual( histogram_dict[ 'buckets' ][ -1 ], [ None, 1 ] )
+        
+        # a duration on a bound goes in that bound's bucket
+        
+        histogram = HydrusDBMetrics.LatencyHistogram()
+        
+        histogram.AddDuration( 0.01 )
+        
+        self.assertIn( [ 0.01, 1 ], histogram.ToDict()[ 'buckets' ] )
+        
+        #
+        
+        db_metrics = HydrusDBMetrics.DBMetrics()
+        
+        db_metrics.ReportJob( 'read', 'media_results', 0.001, 0.01, 0, 2, False )
+        db_metrics.ReportJob( 'read', 'media_results', 0.002, 0.02, 0, 1, False )
+        db_metrics.ReportJob( 'write', 'content_updates', 0.5, 1.5, 1000, 0, True )
+        db_metrics.ReportCommit( 0.05 )
+        
+        snapshot = db_metrics.GetSnapshot()
+        
+        self.assertEqual( [ ( job_dict[ 'job_type' ], job_dict[ 'action' ] ) for job_dict in snapshot[ 'jobs' ] ], [ ( 'write', 'content_updates' ), ( 'read', 'media_results' ) ] )
+        
+        ( write_dict, read_dict ) = snapshot[ 'jobs' ]
+        
+        self.assertEqual( read_dict[ 'num_jobs' ], 2 )
+        self.assertEqual( read_dict[ 'temp_tables' ], { 'total' : 3, 'max' : 2 } )
+        self.assertEqual( read_dict[ 'queue_wait' ][ 'max' ], 0.002 )
+        self.assertEqual( write_dict[ 'num_errors' ], 1 )
+        self.assertEqual( write_dict[ 'rows_changed' ], { 'total' : 1000, 'max' : 1000 } )
+        self.assertEqual( snapshot[ 'commits' ][ 'count' ], 1 )
+        
+        db_metrics.Clear()
+        
+        snapshot = db_metrics.GetSnapshot()
+        
+        self.assertEqual( snapshot[ 'jobs' ], [] )
+        self.assertEqual( snapshot[ 'commits' ][ 'count' ], 0 )
+        
+    
+    def test_integer_sets( self ):
+        
+        # sparse and dense chunks, and chunks that change kind as they are combined
+        
+        sparse = set( random.sample( range( 300000 ), 2000 ) )
+        dense = set( range( 50000, 200000 ) )
+        mixed = set( random.sample( range( 200000 ), 20000 ) ).union( random.sample( range( 200000, 5000000 ), 100 ) )
+        
+        for ( a, b ) in [ ( sparse, dense ), ( dense, mixed ), ( mixed, sparse ), ( dense, set() ), ( set(), mixed ) ]:
+            
+            integer_set_a = HydrusIntegerSets.IntegerSet( a )
+            integer_set_b = HydrusIntegerSets.IntegerSet( b )
+            
+            self.assertEqual( len( integer_set_a ), len( a ) )
+            self.assertEqual( list( integer_set_a ), sorted( a ) )
+            self.assertEqual( integer_set_a, a )
+            
+            self.assertEqual( integer_set_a.intersection( integer_set_b ), a.intersection( b ) )
+            self.assertEqual( integer_set_a.union( b ), a.union( b ) )
+            self.assertEqual( integer_set_a.difference( integer_set_b ), a.difference( b ) )
+            self.assertEqual( integer_set_a.isdisjoint( b ), a.isdisjoint( b ) )
+            
+            for integer in random.sample( range( 5000000 ), 100 ) + list( b )[:100]:
+                
+                self.assertEqual( integer in integer_set_a, integer in a )
+                
+            
+            integer_set_c = integer_set_a.copy()
+            
+            integer_set_c.intersection_update( b )
+            integer_set_c.update( integer_set_b )
+            integer_set_c.difference_update( sparse )
+            
+            self.assertEqual( integer_set_c, a.intersection( b ).union( b ).difference( sparse ) )
+            
+            # the copy does not share edits
+            
+            self.assertEqual( integer_set_a, a )
+            
+        
+        integer_set = HydrusIntegerSets.IntegerSet()
+        
+        integer_set.add( 70000 )
+        integer_set.add( 5 )
+        integer_set.discard( 70000 )
+        
+        self.assertEqual( list( integer_set ), [ 5 ] )
+        
+        with self.assertRaises( ValueError ):
+            
+            HydrusIntegerSets.IntegerSet( [ -1, 5 ] )
+            
+        
+        # 3M files is ~100MB as a python set
+        
+        self.assertLess( HydrusIntegerSets.IntegerSet( range( 1, 3000001 ) ).GetMemoryUsage(), 1024 * 1024 )
+        
+    
     def test_ordinals( self ):
         
         self.assertEqual( HydrusData.ConvertIntToPrettyOrdinalString( 1 ), '1st' )
@@ -25,3 +154,83 @@ class TestHydrusData( unittest.TestCase ):
         self.assertEqual( HydrusData.ConvertIntToPrettyOrdinalString( 1011 ), '1,011th' )
         
     
+    def test_synced_temporary_integer_table( self ):
+        
+        db = sqlite3.connect( ':memory:', isolation_level = None )
+        
+        c = db.cursor()
+        
+        c.execute( 'ATTACH ":memory:" AS mem;' )
+        
+        if HydrusDBBase.TemporaryIntegerTableNameCache.my_instance is None:
+            
+            HydrusDBBase.TemporaryIntegerTableNameCache()
+            
+        
+        # a column name the real db never uses, so we get a fresh table name for this connection
+        
+        def get_rows( table_name ):
+            
+            return { i for ( i, ) in c.execute( 'SELECT test_id FROM {};'.format( table_name ) ) }
+            
+        
+        def sync_and_count_changes( synced_table, integers ):
+            
+            total_changes = db.total_changes
+            
+            result = synced_table.Sync( integers )
+            
+            return ( result, db.total_changes - total_changes )
+            
+        
+        with HydrusDBBase.SyncedTemporaryIntegerTable( c, 'test_id' ) as synced_table:
+            
+            table_name = synced_table.GetTableName()
+            
+            self.assertEqual( get_rows( table_name ), set() )
+            
+            # add
+            
+            self.assertEqual( sync_and_count_changes( synced_table, range( 10 ) ), ( True, 10 ) )
+            
+            self.assertEqual( get_rows( table_name ), set( range( 10 ) ) )
+            
+            # no-op, whatever the type
+            
+            self.assertEqual( sync_and_count_changes( synced_table, set( range( 10 ) ) ), ( False, 0 ) )
+            self.assertEqual( sync_and_count_changes( synced_table, HydrusIntegerSets.IntegerSet( range( 10 ) ) ), ( False, 0 ) )
+            
+            # remove, only the difference is written
+            
+            self.assertEqual( sync_and_count_changes( synced_table, range( 2, 10 ) ), ( True, 2 ) )
+            
+            self.assertEqual( get_rows( table_name ), set( range( 2, 10 ) ) )
+            
+            # add and remove at once
+            
+            self.assertEqual( sync_and_count_changes( synced_table, range( 5, 15 ) ), ( True, 3 + 5 ) )
+            
+            self.assertEqual( get_rows( table_name ), set( range( 5, 15 ) ) )
+            
+            # remove nearly everything, which clears the table and starts again
+            
+            ( result, num_changes ) = sync_and_count_changes( synced_table, [ 14, 20 ] )
+            
+            self.assertTrue( result )
+            
+            self.assertEqual( get_rows( table_name ), { 14, 20 } )
+            
+            self.assertEqual( sync_and_count_changes( synced_table, [] ), ( True, 2 ) )
+            
+            self.assertEqual( get_rows( table_name ), set() )
+            
+            self.assertEqual( sync_and_count_changes( synced_table, [] ), ( False, 0 ) )
+            
+            synced_table.Sync( range( 3 ) )
+            
+        
+        # emptied on exit, ready for the next user
+        
+        self.assertEqual( get_rows( table_name ), set() )
+        
+    
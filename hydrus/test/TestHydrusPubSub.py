@@ -0,0 +1,163 @@
+import unittest
+
+from hydrus.core import HydrusPubSub
+
+class FakeController( object ):
+    
+    def __init__( self ):
+        
+        self.calls_to_thread = []
+        
+    
+    def CallToThread( self, callable, *args, **kwargs ):
+        
+        self.calls_to_thread.append( ( callable, args, kwargs ) )
+        
+        callable( *args, **kwargs )
+        
+    
+
+class Subscriber( object ):
+    
+    def __init__( self ):
+        
+        self.calls = []
+        
+    
+    def Catch( self, *args, **kwargs ):
+        
+        self.calls.append( ( args, kwargs ) )
+        
+    
+
+class WorkerSubscriber( object ):
+    
+    def __init__( self ):
+        
+        self.calls = []
+        
+    
+    def CatchOnWorker( self, *args, **kwargs ):
+        
+        self.calls.append( ( args, kwargs ) )
+        
+    
+class TestHydrusPubSub( unittest.TestCase ):
+    
+    def test_plain( self ):
+        
+        pubsub = HydrusPubSub.HydrusPubSub( FakeController(), lambda o: True )
+        
+        subscriber = Subscriber()
+        
+        pubsub.sub( subscriber, 'Catch', 'test_topic' )
+        
+        pubsub.pub( 'test_topic', 1 )
+        pubsub.pub( 'test_topic', 2 )
+        
+        pubsub.Process()
+        
+        self.assertEqual( subscriber.calls, [ ( ( 1, ), {} ), ( ( 2, ), {} ) ] )
+        
+    
+    def test_coalesce( self ):
+        
+        pubsub = HydrusPubSub.HydrusPubSub( FakeController(), lambda o: True )
+        
+        pubsub.SetCoalesceCallable( 'content', HydrusPubSub.CoalesceDictsOfLists )
+        pubsub.SetCoalesceCallable( 'thumbs', HydrusPubSub.CoalesceListsByFirstArg )
+        pubsub.SetCoalesceCallable( 'refresh', HydrusPubSub.CoalesceIdenticalCalls )
+        
+        content_subscriber = Subscriber()
+        thumbs_subscriber = Subscriber()
+        refresh_subscriber = Subscriber()
+        barrier_subscriber = Subscriber()
+        
+        pubsub.sub( content_subscriber, 'Catch', 'content' )
+        pubsub.sub( thumbs_subscriber, 'Catch', 'thumbs' )
+        pubsub.sub( refresh_subscriber, 'Catch', 'refresh' )
+        pubsub.sub( barrier_subscriber, 'Catch', 'barrier' )
+        
+        pubsub.pub( 'content', { 'a' : [ 1 ] } )
+        pubsub.pub( 'thumbs', 'page_1', [ 1 ] )
+        pubsub.pub( 'refresh', 'page_1' )
+        pubsub.pub( 'content', { 'a' : [ 2 ], 'b' : [ 3 ] } )
+        pubsub.pub( 'thumbs', 'page_2', [ 2 ] )
+        pubsub.pub( 'thumbs', 'page_1', [ 3 ] )
+        pubsub.pub( 'refresh', 'page_1' )
+        pubsub.pub( 'refresh' )
+        
+        pubsub.pub( 'barrier' )
+        
+        pubsub.pub( 'content', { 'a' : [ 4 ] } )
+        
+        pubsub.Process()
+        
+        self.assertEqual( content_subscriber.calls, [ ( ( { 'a' : [ 1, 2 ], 'b' : [ 3 ] }, ), {} ), ( ( { 'a' : [ 4 ] }, ), {} ) ] )
+        self.assertEqual( thumbs_subscriber.calls, [ ( ( 'page_1', [ 1, 3 ] ), {} ), ( ( 'page_2', [ 2 ] ), {} ) ] )
+        self.assertEqual( refresh_subscriber.calls, [ ( ( 'page_1', ), {} ), ( (), {} ) ] )
+        self.assertEqual( barrier_subscriber.calls, [ ( (), {} ) ] )
+        
+        ( queue_depth, peak_queue_depth, topics_to_metrics ) = pubsub.GetMetrics()
+        
+        self.assertEqual( queue_depth, 0 )
+        self.assertEqual( peak_queue_depth, 10 )
+        
+        ( num_pubs, num_deliveries, total_time, max_time ) = topics_to_metrics[ 'content' ]
+        
+        self.assertEqual( num_pubs, 3 )
+        self.assertEqual( num_deliveries, 2 )
+        
+    
+    def test_worker( self ):
+        
+        controller = FakeController()
+        
+        pubsub = HydrusPubSub.HydrusPubSub( controller, lambda o: True )
+        
+        main_subscriber = Subscriber()
+        worker_subscriber = WorkerSubscriber()
+        
+        pubsub.sub( main_subscriber, 'Catch', 'test_topic' )
+        pubsub.sub( worker_subscriber, 'CatchOnWorker', 'test_topic', deliver_on_worker = True )
+        
+        pubsub.pub( 'test_topic', 1 )
+        
+        pubsub.Process()
+        
+        self.assertEqual( main_subscriber.calls, [ ( ( 1, ), {} ) ] )
+        self.assertEqual( worker_subscriber.calls, [ ( ( 1, ), {} ) ] )
+        self.assertEqual( len( controller.calls_to_thread ), 1 )
+        
+        # the worker flag belongs to the subscription, so another object subbing the same method name is still delivered in place
+        
+        controller = FakeController()
+        
+        pubsub = HydrusPubSub.HydrusPubSub( controller, lambda o: True )
+        
+        worker_subscriber = Subscriber()
+        main_subscriber = Subscriber()
+        
+        pubsub.sub( worker_subscriber, 'Catch', 'test_topic', deliver_on_worker = True )
+        pubsub.sub( main_subscriber, 'Catch', 'test_topic' )
+        
+        pubsub.pub( 'test_topic', 1 )
+        
+        pubsub.Process()
+        
+        self.assertEqual( main_subscriber.calls, [ ( ( 1, ), {} ) ] )
+        self.assertEqual( worker_subscriber.calls, [ ( ( 1, ), {} ) ] )
+        self.assertEqual( controller.calls_to_thread, [ ( worker_subscriber.Catch, ( 1, ), {} ) ] )
+        
+        # and subbing again without the flag takes it off
+        
+        pubsub.sub( worker_subscriber, 'Catch', 'test_topic' )
+        
+        pubsub.pub( 'test_topic', 2 )
+        
+        pubsub.Process()
+        
+        self.assertEqual( worker_subscriber.calls, [ ( ( 1, ), {} ), ( ( 2, ), {} ) ] )
+        self.assertEqual( len( controller.calls_to_thread ), 1 )
+        
+    
@@ -11,6 +11,7 @@ import twisted.internet.ssl
 
 from hydrus.core import HydrusConstants as HC
 from hydrus.core import HydrusData
+from hydrus.core import HydrusDBMetrics
 from hydrus.core import HydrusEncryption
 from hydrus.core import HydrusExceptions
 from hydrus.core import HydrusGlobals as HG
@@ -658,6 +659,20 @@ class TestServer( unittest.TestCase ):
         
         #
         
+        db_job_metrics = HydrusDBMetrics.DBMetrics()
+        
+        db_job_metrics.ReportJob( 'write', 'update_services', 0.001, 0.3, 12, 0, False )
+        
+        HG.test_controller.SetDBJobMetrics( db_job_metrics )
+        
+        response = service.Request( HC.GET, 'db_job_metrics' )
+        
+        self.assertEqual( response[ 'db_job_metrics' ], db_job_metrics.GetSnapshot() )
+        
+        HG.test_controller.SetDBJobMetrics( HydrusDBMetrics.DBMetrics() )
+        
+        #
+        
         # add some new services info
         
     
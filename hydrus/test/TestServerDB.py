@@ -1,8 +1,10 @@
+import os
 import time
 import unittest
 
 from hydrus.core import HydrusConstants as HC
 from hydrus.core import HydrusData
+from hydrus.core import HydrusDB
 from hydrus.core import HydrusExceptions
 from hydrus.core import HydrusGlobals as HG
 from hydrus.core.networking import HydrusNetwork
@@ -241,6 +243,26 @@ class TestServerDB( unittest.TestCase ):
         self.assertEqual( message, set_message )
         
     
+    def _test_backup( self ):
+        
+        self._write( 'backup' )
+        
+        while HG.server_backup_lock.locked():
+            
+            time.sleep( 0.05 )
+            
+        
+        backup_path = os.path.join( TestController.DB_DIR, 'server_backup' )
+        
+        manifest = HydrusDB.ReadBackupManifest( backup_path )
+        
+        for filename in TestServerDB._db._db_filenames.values():
+            
+            self.assertIn( filename, manifest[ 'db_change_tokens' ] )
+            self.assertTrue( os.path.exists( os.path.join( backup_path, filename ) ) )
+            
+        
+    
     def _test_content_creation( self ):
         
         tag = 'character:samus aran'
@@ -335,4 +357,6 @@ class TestServerDB( unittest.TestCase ):
         
         self._test_account_modification()
         
+        self._test_backup()
+        
 